@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures the round trip time of bursts of events (100-note chords and
+controller sweeps) through the alsa and alsa-batched backends, with and
+without batch processing. Requires a running ALSA sequencer.
+
+To count the system calls made in each configuration, run this under
+"strace -f -c -e trace=read,write,poll".
+
+usage: alsa_batch.py [repeat] [backend ...]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings import setup, patch
+from mididings.event import NoteOnEvent, NoteOffEvent, CtrlEvent
+
+
+def bursts():
+    chord_on = [NoteOnEvent(0, 0, 10 + n, 100) for n in range(100)]
+    chord_off = [NoteOffEvent(0, 0, 10 + n, 0) for n in range(100)]
+    sweep = [CtrlEvent(0, 0, 7, n) for n in range(128)]
+    return [
+        ('chord on', chord_on),
+        ('chord off', chord_off),
+        ('ctrl sweep', sweep),
+    ]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    backends = sys.argv[2:] or ['alsa', 'alsa-batched']
+    benchmark_backend = harness.function('benchmark_backend')
+
+    setup._config_impl(backend='dummy', data_offset=0)
+    p = patch.Patch(Pass())
+
+    for backend in backends:
+        for batch in (False, True):
+            for name, evs in bursts():
+                mean, max_ = benchmark_backend(backend, p, evs, repeat,
+                                               batch)
+                print("%-12s batch=%-5s  %-10s  mean %8.3f ms  "
+                      "max %8.3f ms  %7.3f µs/event" % (
+                        backend, batch, name, mean * 1e3, max_ * 1e3,
+                        mean * 1e6 / len(evs)))
+
+
+if __name__ == '__main__':
+    main()
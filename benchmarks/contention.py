@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures how much the realtime processing of events is slowed down by other
+threads sending events with output_event() at the same time.
+
+usage: contention.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings import setup, patch
+from mididings.event import NoteOnEvent, NoteOffEvent
+
+
+def events():
+    r = []
+    for n in range(32):
+        r.append(NoteOnEvent(0, 0, 40 + n, 100))
+        r.append(NoteOffEvent(0, 0, 40 + n, 0))
+    return r
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    benchmark_contention = harness.function('benchmark_contention')
+
+    setup._config_impl(backend='dummy', data_offset=0)
+
+    p = patch.Patch(Fork([Transpose(n) >> Channel(n) for n in range(8)]))
+    evs = events()
+
+    for threads in (0, 1, 2, 4):
+        mean, max_, num_output = benchmark_contention(
+                                                p, evs, repeat, threads)
+        print("%d threads  mean %8.3f µs  max %10.3f µs  %10d events out" % (
+                threads, mean * 1e6, max_ * 1e6, num_output))
+
+
+if __name__ == '__main__':
+    main()
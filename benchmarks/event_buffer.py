@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Compares the performance of the 'list' and 'arena' event buffers, for
+chain-heavy and fork-heavy patches.
+
+usage: event_buffer.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent, NoteOffEvent, CtrlEvent
+
+
+def chain_heavy():
+    # long chains, interrupted by splits so that not everything gets fused
+    # into a single module
+    p = []
+    for n in range(16):
+        p.append(Transpose(1) >> Velocity(+1) >> Channel(n % 4 + 1))
+        p.append(KeySplit(64, Transpose(-1), Transpose(1)))
+    return Chain(p)
+
+
+def fork_heavy():
+    # nested forks, each input event results in 64 output events
+    return Fork([
+        Transpose(n) >> Fork([Velocity(fixed=v) for v in range(1, 9)])
+        for n in range(8)
+    ])
+
+
+def fork_filter():
+    # forks whose branches mostly discard their events again. the 'list'
+    # buffer can't reuse the memory of these events until the end of the
+    # cycle, and runs out of preallocated memory
+    return Fork([
+        Fork([Transpose(k) for k in range(16)]) >> KeyFilter(40 + n)
+        for n in range(64)
+    ], remove_duplicates=False)
+
+
+def events():
+    r = []
+    for n in range(32):
+        r.append(NoteOnEvent(0, 0, 40 + n, 100))
+        r.append(NoteOffEvent(0, 0, 40 + n, 0))
+        r.append(CtrlEvent(0, 0, 7, n))
+    return r
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    e = harness.dummy_engine()
+
+    evs = events()
+
+    for name, f in [('chain-heavy', chain_heavy),
+                    ('fork-heavy', fork_heavy),
+                    ('fork-filter', fork_filter)]:
+        for event_buffer in ('list', 'arena'):
+            t = harness.time_patch(e, f(), evs, repeat, event_buffer)
+            print("%-12s %-6s %8.3f µs/event" % (
+                    name, event_buffer, t * 1e6 / (repeat * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
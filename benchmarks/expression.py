@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Micro-benchmarks for expression units, comparing Filter() and Transform()
+expressions to equivalent Process() functions, and to the closest
+combination of built-in units where there is one.
+
+usage: expression.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent
+
+
+def chord_filter(ev):
+    return ev if ev.note % 12 in (0, 4, 7) else None
+
+
+def scale_velocity(ev):
+    ev.velocity = int(min(max(ev.velocity * 0.8 + ev.note / 8, 1), 127))
+    return ev
+
+
+TESTS = [
+    ('filter', [
+        ('process', Process(chord_filter)),
+        ('expression', Filter('note % 12 in (0, 4, 7)')),
+        ('builtin', KeyFilter(notes=[n for n in range(128)
+                                     if n % 12 in (0, 4, 7)])),
+    ]),
+    ('transform', [
+        ('process', Process(scale_velocity)),
+        ('expression',
+            Transform('velocity = clamp(velocity * 0.8 + note / 8, 1, 127)')),
+    ]),
+]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    e = harness.dummy_engine()
+
+    evs = [NoteOnEvent(0, 0, 40 + n, 100) for n in range(16)]
+
+    for test, units in TESTS:
+        for name, unit in units:
+            t = harness.time_patch(e, unit, evs, repeat)
+            print("%-10s %-10s %8.3f µs/event" % (
+                    test, name, t * 1e6 / (repeat * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
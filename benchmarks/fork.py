@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures the performance of forks with many (32 and more) branches, with and
+without removal of duplicate events.
+
+usage: fork.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent, NoteOffEvent, CtrlEvent
+
+
+def layers(remove_duplicates):
+    # each event is sent to all 16 channels on two ports
+    return Fork([
+        Channel(n % 16 + 1) >> Port(n // 16 + 1) for n in range(32)
+    ], remove_duplicates=remove_duplicates)
+
+
+def filters(remove_duplicates):
+    # 64 branches, only few of which let each event pass
+    return Fork([
+        KeyFilter(n) >> Transpose(12) for n in range(30, 94)
+    ], remove_duplicates=remove_duplicates)
+
+
+def identical(remove_duplicates):
+    # 32 branches returning the same few events over and over again
+    return Fork([
+        Transpose(n % 4) for n in range(32)
+    ], remove_duplicates=remove_duplicates)
+
+
+def nested(remove_duplicates):
+    # branches that aren't simple units and can't be processed in place
+    return Fork([
+        Fork([Transpose(n), Transpose(-n)]) for n in range(32)
+    ], remove_duplicates=remove_duplicates)
+
+
+def events():
+    r = []
+    for n in range(32):
+        r.append(NoteOnEvent(1, 1, 40 + n, 100))
+        r.append(NoteOffEvent(1, 1, 40 + n, 0))
+        r.append(CtrlEvent(1, 1, 7, n))
+    return r
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    e = harness.dummy_engine(data_offset=1, optimize=False)
+
+    evs = events()
+
+    for name, f in [('layers', layers),
+                    ('filters', filters),
+                    ('identical', identical),
+                    ('nested', nested)]:
+        for remove_duplicates in (True, False):
+            t = harness.time_patch(e, f(remove_duplicates), evs, repeat)
+            print("%-10s %-8s %8.3f µs/event" % (
+                    name, 'dedup' if remove_duplicates else 'no-dedup',
+                    t * 1e6 / (repeat * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
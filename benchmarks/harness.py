@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Shared setup for the benchmark scripts.
+
+The benchmark functions are only part of the _mididings module if it was
+built with benchmark support:
+
+    ./setup.py build --enable-benchmark
+"""
+
+import sys
+
+import _mididings
+
+from mididings import Pass
+from mididings import setup, engine, patch
+
+
+def function(name):
+    """
+    Return the _mididings benchmark function with the given name, or exit
+    if the module was built without benchmark support (or without the
+    backend the benchmark uses).
+    """
+    try:
+        return getattr(_mididings, name)
+    except AttributeError:
+        if hasattr(_mididings, 'benchmark_patch'):
+            # some benchmarks need a backend that may not have been enabled
+            sys.exit("%s() is not available, _mididings was built without "
+                     "support for the backend it uses" % name)
+        sys.exit("_mididings was built without benchmark support, "
+                 "rebuild it with --enable-benchmark")
+
+
+def dummy_engine(**config):
+    """
+    Return an engine on the dummy backend, to be passed to time_patch().
+    """
+    config.setdefault('data_offset', 0)
+    setup._config_impl(backend='dummy', **config)
+    e = engine.Engine()
+    e.setup({setup.get_config('data_offset'): Pass()}, None, None, None)
+    return e
+
+
+def time_patch(e, unit, events, repeat, event_buffer='list'):
+    """
+    Return the time in seconds it takes to run each of the given events
+    through the unit, repeat times.
+    """
+    return function('benchmark_patch')(e, patch.Patch(unit), events,
+                                       event_buffer, repeat)
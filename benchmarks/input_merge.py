@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures the time the JACK backend takes to read the events of one period
+from several input ports, ordered by frame. A second JACK client writes the
+same number of events to each port in every period. Requires a running JACK
+server, e.g. "jackd -d dummy".
+
+usage: input_merge.py [periods]
+"""
+
+import sys
+
+import harness
+
+
+def main():
+    periods = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    benchmark_jack_input = harness.function('benchmark_jack_input')
+
+    for ports in (1, 4, 16, 32, 64):
+        for events in (1, 4, 16):
+            mean, max_, count = benchmark_jack_input(ports, events, periods)
+            print("%2d ports %2d events/port  mean %7.3f µs/period  "
+                  "max %7.3f µs/period  %7.3f µs/event" % (
+                    ports, events, mean * 1e6, max_ * 1e6,
+                    mean * 1e6 / count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Compares Process() calling a Python function once for each event with
+Process(batch=True) calling it once for all events resulting from the same
+input event, for different numbers of events.
+
+usage: process_batch.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent
+
+
+def velocity(ev):
+    ev.velocity = ev.velocity // 2 + 32
+    return ev
+
+
+def velocity_batch(evs):
+    for ev in evs:
+        ev.velocity = ev.velocity // 2 + 32
+    return evs
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    e = harness.dummy_engine()
+
+    evs = [NoteOnEvent(0, 0, 40 + n, 100) for n in range(16)]
+
+    for num in (1, 4, 16):
+        # each input event is turned into num events
+        chord = Fork([Transpose(n) for n in range(num)])
+        for name, p in [
+                ('per-event', chord >> Process(velocity)),
+                ('batch', chord >> Process(velocity_batch, batch=True))]:
+            t = harness.time_patch(e, p, evs, repeat)
+            print("%2d events  %-10s %8.3f µs/event" % (
+                    num, name, t * 1e6 / (repeat * len(evs) * num)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures the throughput of process_file(), compared to processing each event
+individually from Python, as the pysmf-based implementation used to do.
+The latter excludes the time pysmf itself spends reading and writing files,
+so it's only a lower bound.
+
+usage: process_file.py [num_events]
+"""
+
+import sys
+import os
+import struct
+import tempfile
+import time
+
+import _mididings
+
+from mididings import *
+from mididings import setup, engine
+
+
+def patch():
+    return KeyFilter(36, 96) >> Transpose(12) >> Velocity(gamma=0.8)
+
+
+def make_file(filename, num_events, num_tracks=16):
+    buffers = []
+    data = b'MThd' + struct.pack('>LHHH', 6, 1, num_tracks, 480)
+
+    for track in range(num_tracks):
+        t = bytearray()
+        for n in range(num_events // num_tracks // 2):
+            note = 30 + (n * 7 + track) % 70
+            on = [0x90 | track, note, 100]
+            off = [0x80 | track, note, 0]
+            t += bytearray([0x10] + on + [0x10] + off)
+            buffers.append((on, track, n * 32 + 16))
+            buffers.append((off, track, n * 32 + 32))
+        t += bytearray([0x00, 0xff, 0x2f, 0x00])
+        data += b'MTrk' + struct.pack('>L', len(t)) + bytes(t)
+
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+    return buffers
+
+
+def per_event(buffers):
+    setup._config_impl(backend='dummy')
+    e = engine.Engine()
+    e.setup({0: patch()}, None, None, None)
+
+    out = []
+    for buf, track, pulses in buffers:
+        ev = _mididings.buffer_to_midi_event(buf, track, pulses)
+        for out_ev in _mididings.Engine.process_event(e, ev):
+            out.append(_mididings.midi_event_to_buffer(out_ev))
+    return out
+
+
+def main():
+    num_events = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    setup._config_impl(data_offset=0)
+
+    infile = tempfile.NamedTemporaryFile(suffix='.mid', delete=False)
+    outfile = tempfile.NamedTemporaryFile(suffix='.mid', delete=False)
+    infile.close()
+    outfile.close()
+
+    try:
+        buffers = make_file(infile.name, num_events)
+
+        t1 = time.time()
+        per_event(buffers)
+        t2 = time.time()
+        engine.process_file(infile.name, outfile.name, patch())
+        t3 = time.time()
+
+        for name, t in [('per-event', t2 - t1), ('process_file', t3 - t2)]:
+            print("%-13s %8.3f s %10.0f events/s" % (
+                    name, t, len(buffers) / t))
+    finally:
+        os.unlink(infile.name)
+        os.unlink(outfile.name)
+
+
+if __name__ == '__main__':
+    main()
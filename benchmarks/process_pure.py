@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Compares Process() with Process(pure=True), for a velocity curve applied to
+events with a small number of different values (so that almost every event
+is a cache hit), and with more different values than fit into the cache.
+
+usage: process_pure.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent
+
+
+def velocity(ev):
+    ev.velocity = int(127 * (ev.velocity / 127.0) ** 0.7)
+    return ev
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    e = harness.dummy_engine()
+
+    for name, evs in [
+            ('few values', [NoteOnEvent(0, 0, 60 + n % 4, 100)
+                            for n in range(16)]),
+            ('many values', [NoteOnEvent(0, n % 16, n // 16, n % 128)
+                             for n in range(2048)])]:
+        # process the same total number of events in both cases
+        count = max(1, repeat * 16 // len(evs))
+        for mode, p in [
+                ('plain', Process(velocity)),
+                ('pure', Process(velocity, pure=True, cache_size=1024))]:
+            t = harness.time_patch(e, p, evs, count)
+            print("%-12s %-6s %8.3f µs/event" % (
+                    name, mode, t * 1e6 / (count * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Micro-benchmarks for Process(), comparing functions called with a MidiEvent
+object to Process(view=True) calling them with an event view, for functions
+that do nothing, read a field, modify a field, or return a new event.
+
+usage: process_view.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent
+
+
+def identity(ev):
+    return ev
+
+
+def read(ev):
+    if ev.note > 200:
+        return None
+    return ev
+
+
+def modify(ev):
+    ev.velocity = ev.velocity // 2 + 32
+    return ev
+
+
+def new_event(ev):
+    return NoteOnEvent(ev.port, ev.channel, ev.note, 64)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    e = harness.dummy_engine()
+
+    evs = [NoteOnEvent(0, 0, 40 + n, 100) for n in range(16)]
+
+    for f in (identity, read, modify, new_event):
+        for name, view in [('event', False), ('view', True)]:
+            t = harness.time_patch(e, Process(f, view=view), evs, repeat)
+            print("%-10s %-6s %8.3f µs/event" % (
+                    f.__name__, name, t * 1e6 / (repeat * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
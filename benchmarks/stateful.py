@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures the cost of the stateful extras per event, for a sequence of
+overlapping notes played on several channels with the sustain pedal.
+
+usage: stateful.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent, NoteOffEvent, CtrlEvent
+from mididings.extra import (LimitPolyphony, MakeMonophonic, LatchNotes,
+                             PedalToNoteoff, FloatingKeySplit)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    e = harness.dummy_engine()
+
+    evs = []
+    for channel in range(4):
+        evs.append(CtrlEvent(0, channel, 64, 127))
+        for n in range(8):
+            evs.append(NoteOnEvent(0, channel, 48 + n * 3, 100))
+        for n in range(8):
+            evs.append(NoteOffEvent(0, channel, 48 + n * 3, 0))
+        evs.append(CtrlEvent(0, channel, 64, 0))
+
+    tests = [
+        ('LimitPolyphony', LimitPolyphony(4)),
+        ('MakeMonophonic', MakeMonophonic()),
+        ('LatchNotes', LatchNotes(True)),
+        ('PedalToNoteoff', PedalToNoteoff()),
+        ('FloatingKeySplit', FloatingKeySplit('c3', 'c4', Channel(1),
+                                              Channel(2))),
+    ]
+
+    for name, unit in tests:
+        t = harness.time_patch(e, unit, evs, repeat)
+        print("%-16s %8.3f µs/event" % (
+                name, t * 1e6 / (repeat * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
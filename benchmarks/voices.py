@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Measures the cost of VoiceFilter() and VoiceSplit() per note event,
+depending on the number of voices, while a chord of 8 notes is held.
+
+usage: voices.py [repeat]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings.event import NoteOnEvent, NoteOffEvent
+from mididings.extra.voices import VoiceFilter, VoiceSplit
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    e = harness.dummy_engine()
+
+    evs = []
+    for n in range(8):
+        evs.append(NoteOnEvent(0, 0, 48 + n * 3, 100))
+    for n in range(8):
+        evs.append(NoteOffEvent(0, 0, 48 + n * 3, 0))
+
+    tests = [('VoiceFilter', 1, VoiceFilter(1))]
+    for voices in (2, 4, 8):
+        tests.append(('VoiceSplit', voices,
+                      VoiceSplit([Channel(n) for n in range(voices)])))
+
+    for name, voices, unit in tests:
+        t = harness.time_patch(e, unit, evs, repeat)
+        print("%-12s %d voices %8.3f µs/event" % (
+                name, voices, t * 1e6 / (repeat * len(evs))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Counts how often the processing thread of the jack backend is woken up per
+period, with a second JACK client sending a number of events in every
+period. Requires a running JACK server, e.g. "jackd -d dummy".
+
+The same counts are available at runtime from
+mididings.engine.input_stats().
+
+usage: wakeups.py [periods]
+"""
+
+import sys
+
+import harness
+
+from mididings import *
+from mididings import setup, patch
+
+
+def main():
+    periods = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    benchmark_jack_wakeups = harness.function('benchmark_jack_wakeups')
+
+    setup._config_impl(backend='dummy', data_offset=0)
+    p = patch.Patch(Pass())
+
+    for events in (1, 8, 32, 100):
+        n, count, wakeups = benchmark_jack_wakeups(p, events, periods)
+        print("%3d events/period  %8.2f events/period received  "
+              "%6.2f wakeups/period" % (
+                events, float(count) / n, float(wakeups) / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@
 import _mididings
 
 import mididings.patch as _patch
+import mididings.optimize as _optimize
 import mididings.scene as _scene
 import mididings.util as _util
 import mididings.misc as _misc
@@ -20,7 +21,7 @@ import mididings.setup as _setup
 import mididings.constants as _constants
 import mididings.overload as _overload
 import mididings.arguments as _arguments
-from mididings.units.base import _UNIT_TYPES
+from mididings.units.base import _UNIT_TYPES, _Chain
 from mididings.scene import _SCENE_TYPES
 
 import time as _time
@@ -30,10 +31,19 @@ import gc as _gc
 import atexit as _atexit
 import os as _os
 import sys as _sys
+import traceback as _traceback
 
 if _sys.version_info >= (3,):
     raw_input = input
 
+try:
+    import asyncio as _asyncio
+    import concurrent.futures as _futures
+    _all_tasks = getattr(_asyncio, 'all_tasks', None) or \
+                 _asyncio.Task.all_tasks
+except ImportError:
+    _asyncio = None
+
 
 _TheBackend = None
 _TheEngine = None
@@ -51,6 +61,22 @@ def _start_backend():
         if _TheBackend:
             _TheBackend.connect_ports(_setup._in_port_connections,
                                       _setup._out_port_connections)
+            _set_sysex_rates(_TheBackend)
+
+
+def _set_sysex_rates(backend):
+    rates = _setup.get_config('sysex_rate')
+    if rates is None:
+        return
+    if not _misc.issequence(rates):
+        rates = [rates] * len(_setup._out_portnames)
+    elif len(rates) > len(_setup._out_portnames):
+        raise ValueError("sysex_rate specifies more ports than out_ports")
+
+    for port, rate in enumerate(rates):
+        # None keeps the backend's default
+        if rate is not None:
+            backend.set_sysex_rate(port, rate)
 
 
 class Engine(_mididings.Engine):
@@ -58,13 +84,23 @@ class Engine(_mididings.Engine):
         _start_backend()
 
         verbose = not _setup.get_config('silent')
+        arena_buffer = (_setup.get_config('event_buffer') == 'arena')
+        batch = _setup.get_config('batch_processing')
+        async_workers = _setup.get_config('async_workers')
+        async_queue_size = _setup.get_config('async_queue_size')
         # initialize C++ base class
-        _mididings.Engine.__init__(self, _TheBackend, verbose)
+        _mididings.Engine.__init__(self, _TheBackend, verbose, arena_buffer,
+                                   batch, async_workers, async_queue_size)
 
         self._scenes = {}
 
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = _threading.Lock()
+
     def setup(self, scenes, control, pre, post):
-        # build and setup all scenes and scene groups
+        # parse all scenes and scene groups
+        sceneobjs = []
         for number, scene in scenes.items():
             if isinstance(scene, _scene.SceneGroup):
                 self._scenes[number] = (scene.name, [])
@@ -72,25 +108,20 @@ class Engine(_mididings.Engine):
                 for subscene in scene.subscenes:
                     sceneobj = _scene._parse_scene(subscene)
                     self._scenes[number][1].append(sceneobj.name)
-
-                    # build patches
-                    patch = _patch.Patch(sceneobj.patch)
-                    init_patch = _patch.Patch(sceneobj.init_patch)
-                    exit_patch = _patch.Patch(sceneobj.exit_patch)
-                    # add scene to base class object
-                    self.add_scene(_util.actual(number),
-                                   patch, init_patch, exit_patch)
+                    sceneobjs.append((number, sceneobj))
             else:
                 sceneobj = _scene._parse_scene(scene)
                 self._scenes[number] = (sceneobj.name, [])
+                sceneobjs.append((number, sceneobj))
+
+        hybrid = (_setup.get_config('backend') == 'jack-hybrid')
+        shared = (self._shared_offload_types(
+                        [s for n, s in sceneobjs], control, pre, post)
+                  if hybrid else 0)
 
-                # build patches
-                patch = _patch.Patch(sceneobj.patch)
-                init_patch = _patch.Patch(sceneobj.init_patch)
-                exit_patch = _patch.Patch(sceneobj.exit_patch)
-                # add scene to base class object
-                self.add_scene(_util.actual(number),
-                               patch, init_patch, exit_patch)
+        # build and setup all scenes
+        for number, sceneobj in sceneobjs:
+            self._add_scene(number, sceneobj, control, pre, post, shared)
 
         # build and setup control, pre, and post patches
         control_patch = _patch.Patch(control) if control else None
@@ -105,9 +136,84 @@ class Engine(_mididings.Engine):
         _gc.collect()
         _gc.disable()
 
+    def _add_scene(self, number, sceneobj, control, pre, post, shared=0):
+        # build patches
+        hybrid = (_setup.get_config('backend') == 'jack-hybrid')
+        if hybrid:
+            patch = _patch.Patch(sceneobj.patch, shared | self._offload_types(
+                    [pre, sceneobj.patch, post], control))
+            init_patch = _patch.Patch(sceneobj.init_patch,
+                    self._offload_types([sceneobj.init_patch, post],
+                                        types=_constants.DUMMY))
+            exit_patch = _patch.Patch(sceneobj.exit_patch,
+                    self._offload_types([sceneobj.exit_patch, post],
+                                        types=_constants.DUMMY))
+        else:
+            patch = _patch.Patch(sceneobj.patch)
+            init_patch = _patch.Patch(sceneobj.init_patch)
+            exit_patch = _patch.Patch(sceneobj.exit_patch)
+        # add scene to base class object
+        self.add_scene(_util.actual(number), patch, init_patch, exit_patch)
+
+    def _offload_types(self, chain, control=None, types=None):
+        """
+        Return the types of incoming events that may reach Python code when
+        run through the given patches in series (and the control patch).
+        In hybrid mode, the engine processes these events outside the
+        realtime thread.
+        """
+        chain = _Chain([p for p in chain if p is not None])
+        args = (int(types),) if types is not None else ()
+        r = _optimize.python_types(chain, *args)
+        stateful = _optimize.stateful_types(chain, *args)
+        if control:
+            r |= _optimize.python_types(control)
+            stateful |= _optimize.stateful_types(control)
+        if r & _constants.NOTE:
+            # keep note-offs in order with their note-ons
+            r |= _constants.NOTE
+        if r & stateful:
+            # native units that keep state must see all their events in one
+            # thread, and in order
+            r |= stateful
+            if r & _constants.NOTE:
+                r |= _constants.NOTE
+        return int(r)
+
+    def _shared_offload_types(self, sceneobjs, control, pre, post):
+        """
+        Return the types of incoming events that must be offloaded in every
+        scene: the control, pre and post patches are shared by all scenes,
+        and so may be stateful units used in more than one scene. If any
+        scene offloads events that reach a stateful unit, all scenes need to
+        offload the events reaching any stateful unit, so that no unit is
+        run in both threads (e.g. note-offs still going to the previous
+        scene after a scene switch).
+        """
+        python = stateful = 0
+        for sceneobj in sceneobjs:
+            chain = _Chain([p for p in (pre, sceneobj.patch, post)
+                            if p is not None])
+            python |= _optimize.python_types(chain)
+            stateful |= _optimize.stateful_types(chain)
+        if control:
+            python |= _optimize.python_types(control)
+            stateful |= _optimize.stateful_types(control)
+        if python & _constants.NOTE:
+            python |= _constants.NOTE
+        if not python & stateful:
+            return 0
+        if stateful & _constants.NOTE:
+            stateful |= _constants.NOTE
+        return int(stateful)
+
     def run(self):
         self._quit = _threading.Event()
 
+        if _asyncio is not None:
+            # start the event loop for coroutine hooks and Call() functions
+            self._event_loop()
+
         # delay before actually sending any midi data (give qjackctl
         # patchbay time to react...)
         self._start_delay()
@@ -128,10 +234,60 @@ class Engine(_mididings.Engine):
         except KeyboardInterrupt:
             pass
         finally:
-            self._call_hooks('on_exit')
+            self._call_hooks('on_exit', wait=True)
+            self._stop_event_loop()
             global _TheEngine
             _TheEngine = None
 
+    def _event_loop(self):
+        # return the asyncio event loop, starting it in its own thread if
+        # it's not running yet
+        with self._loop_lock:
+            if self._loop is None:
+                if _asyncio is None:
+                    raise RuntimeError("asyncio is not available")
+                self._loop = _asyncio.new_event_loop()
+                self._loop_thread = _threading.Thread(
+                        target=self._run_event_loop, args=(self._loop,))
+                self._loop_thread.daemon = True
+                self._loop_thread.start()
+            return self._loop
+
+    @staticmethod
+    def _run_event_loop(loop):
+        _asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+            # cancel whatever is still running, and give the tasks a chance
+            # to clean up
+            tasks = _all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(
+                    _asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            loop.close()
+
+    def _stop_event_loop(self):
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+    def _run_coroutine(self, coro):
+        # schedule a coroutine on the event loop, from any thread
+        future = _asyncio.run_coroutine_threadsafe(coro, self._event_loop())
+        future.add_done_callback(self._coroutine_done)
+        return future
+
+    @staticmethod
+    def _coroutine_done(future):
+        if not future.cancelled() and future.exception() is not None:
+            e = future.exception()
+            _traceback.print_exception(type(e), e, e.__traceback__)
+
     def _start_delay(self):
         delay = _setup.get_config('start_delay')
         if delay is not None:
@@ -201,11 +357,17 @@ class Engine(_mididings.Engine):
         if found:
             self._call_hooks('on_switch_scene', scene, subscene)
 
-    def _call_hooks(self, name, *args):
+    def _call_hooks(self, name, *args, **kwargs):
+        futures = []
         for hook in _setup.get_hooks():
             if hasattr(hook, name):
                 f = getattr(hook, name)
-                f(*args)
+                ret = f(*args)
+                if _asyncio is not None and _asyncio.iscoroutine(ret):
+                    # hook is a coroutine, run it on the event loop
+                    futures.append(self._run_coroutine(ret))
+        if kwargs.get('wait') and futures:
+            _futures.wait(futures)
 
     def switch_scene(self, scene, subscene=None):
         _mididings.Engine.switch_scene(self,
@@ -229,6 +391,11 @@ class Engine(_mididings.Engine):
         ev._finalize()
         return _mididings.Engine.process_event(self, ev)
 
+    def process_events(self, events):
+        for ev in events:
+            ev._finalize()
+        return _mididings.Engine.process_events(self, events)
+
     def output_event(self, ev):
         ev._finalize()
         _mididings.Engine.output_event(self, ev)
@@ -237,6 +404,15 @@ class Engine(_mididings.Engine):
         ev._finalize()
         return _mididings.Engine.process(self, ev)
 
+    def async_stats(self):
+        return dict(zip(('queued', 'max_queued', 'dropped', 'coalesced',
+                         'blocked'),
+                        _mididings.Engine.async_stats(self)))
+
+    def input_stats(self):
+        return dict(zip(('periods', 'events', 'wakeups'),
+                        _mididings.Engine.input_stats(self)))
+
     def restart(self):
         _atexit.register(self._restart)
         self.quit()
@@ -302,6 +478,8 @@ def run(scenes, control=None, pre=None, post=None):
 def switch_scene(scene, subscene=None):
     """
     Switch to the given scene number.
+    The switch is performed by the event processing thread, so it may not
+    have happened yet when this function returns.
     """
     _TheEngine().switch_scene(scene, subscene)
 
@@ -335,9 +513,53 @@ def output_event(ev):
     """
     Send an event directly to an output port, completely bypassing any other
     event processing.
+    The event is queued and sent by the event processing thread.
     """
     _TheEngine().output_event(ev)
 
+def event_loop():
+    """
+    Return the :mod:`asyncio` event loop on which coroutine :func:`~.Call()`
+    functions and hooks are run. The loop runs in its own thread, so it
+    should only be accessed in a thread-safe manner, e.g. using
+    :func:`asyncio.run_coroutine_threadsafe()`.
+    Requires Python 3.5 or later.
+    """
+    return _TheEngine()._event_loop()
+
+def async_stats():
+    """
+    Return statistics about the queue of pending :func:`~.Call()` functions,
+    as a dictionary with the following keys:
+
+    - ``'queued'``: the number of calls currently waiting to be made.
+    - ``'max_queued'``: the largest number of calls that were waiting at
+      any time.
+    - ``'dropped'``: the number of calls discarded because the queue was
+      full.
+    - ``'coalesced'``: the number of calls replaced by a newer one, see
+      :c:data:`async_overflow`.
+    - ``'blocked'``: the number of times event processing had to wait for
+      space in the queue.
+    """
+    return _TheEngine().async_stats()
+
+def input_stats():
+    """
+    Return statistics about how incoming events are handed to the event
+    processing thread, as a dictionary with the following keys:
+
+    - ``'periods'``: the number of JACK periods in which events were
+      received.
+    - ``'events'``: the number of events received.
+    - ``'wakeups'``: the number of times the processing thread was woken up
+      to read them.
+
+    These are only counted by the ``'jack'`` backend, and are all zero for
+    other backends.
+    """
+    return _TheEngine().input_stats()
+
 def in_ports():
     """
     Return a list of the configured input port names.
@@ -385,38 +607,15 @@ def quit():
 
 def process_file(infile, outfile, patch):
     """
-    Process a MIDI file, using pysmf.
+    Process a standard MIDI file, writing the result to another file.
+    Meta events are copied unmodified. Returns the number of MIDI events read
+    from the input file.
     """
-    import smf
-
     # create dummy engine with no inputs or outputs
     _setup._config_impl(backend='dummy')
     engine = Engine()
     engine.setup({_util.offset(0): patch}, None, None, None)
 
-    # open input file
-    smf_in = smf.SMF(infile)
-
-    # create SMF object with same ppqn and number of tracks as input file
-    smf_out = smf.SMF()
-    smf_out.ppqn = smf_in.ppqn
-    for n in range(len(smf_in.tracks)):
-        smf_out.add_track()
-
-    for smf_ev in smf_in.events:
-        if smf_ev.midi_buffer[0] == 0xff:
-            # event is metadata. copy to output unmodified
-            smf_out.add_event(smf.Event(smf_ev.midi_buffer),
-                              smf_ev.track_number, pulses=smf_ev.time_pulses)
-        else:
-            ev = _mididings.buffer_to_midi_event(smf_ev.midi_buffer,
-                              smf_ev.track_number, smf_ev.time_pulses)
-
-            # use base class version of process_event() to bypass calling
-            # ev._finalize(), which would fail since ev is of type
-            # _mididings.MidiEvent.
-            for out_ev in _mididings.Engine.process_event(engine, ev):
-                buf, track, pulses = _mididings.midi_event_to_buffer(out_ev)
-                smf_out.add_event(smf.Event(buf), track, pulses=pulses)
-
-    smf_out.save(outfile)
+    # the file is read, processed and written entirely in C++, with events
+    # passed to the engine in batches
+    return _mididings.process_file(engine, infile, outfile)
@@ -280,6 +280,17 @@ class MidiEvent(_mididings.MidiEvent):
     sysex = property(_sysex_getter, _sysex_setter)
 
 
+def _event_view_copy(self):
+    """
+    Return a copy of the event the view currently refers to, as a
+    :class:`MidiEvent` object.
+    """
+    ev = self._copy()
+    ev.__class__ = MidiEvent
+    return ev
+
+_mididings.EventView.copy = _event_view_copy
+
 
 @_arguments.accept(_util.port_number, _util.channel_number,
                    _util.note_number, int)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Compiles restricted Python expressions, as used by :func:`Filter()` and
+:func:`Transform()`, to the bytecode evaluated by the native expression
+units.
+
+Only a small subset of Python is accepted: numbers, event attributes,
+arithmetic, comparisons, boolean operators, conditional expressions,
+membership tests against constant sequences, and a few built-in functions.
+Anything else raises a ValueError when the unit is created, so that no
+Python code is ever called while processing events.
+"""
+
+import _mididings
+
+import mididings.constants as _constants
+import mididings.setup as _setup
+
+import ast as _ast
+import sys as _sys
+import functools as _functools
+import operator as _operator
+
+
+_OP = _mididings.ExpressionOp
+
+# all literals are ast.Constant nodes since Python 3.8
+_NEW_AST = _sys.version_info >= (3, 8)
+
+# all event types that actually exist
+_ANY = _functools.reduce(_operator.or_, _constants._EVENT_TYPES.keys())
+
+# event attributes that can be used in expressions, and the event types
+# that have them
+_ATTRIBUTES = {
+    'port':     _ANY,
+    'channel':  int(~(_constants.SYSTEM | _constants.DUMMY)) & _ANY,
+    'data1':    int(~(_constants.SYSEX | _constants.DUMMY)) & _ANY,
+    'data2':    int(~(_constants.SYSEX | _constants.DUMMY)) & _ANY,
+    'note':     int(_constants.NOTE | _constants.POLY_AFTERTOUCH),
+    'velocity': int(_constants.NOTE),
+    'ctrl':     int(_constants.CTRL),
+    'value':    int(_constants.CTRL | _constants.PITCHBEND |
+                    _constants.AFTERTOUCH | _constants.POLY_AFTERTOUCH),
+    'program':  int(_constants.PROGRAM),
+}
+
+# attributes that observe the data_offset setting
+_OFFSET_ATTRIBUTES = ('port', 'channel', 'program')
+
+_BINARY_OPS = {
+    _ast.Add:       _OP.ADD,
+    _ast.Sub:       _OP.SUB,
+    _ast.Mult:      _OP.MUL,
+    _ast.Div:       _OP.DIV,
+    _ast.FloorDiv:  _OP.FLOORDIV,
+    _ast.Mod:       _OP.MOD,
+    _ast.Pow:       _OP.POW,
+}
+
+_COMPARE_OPS = {
+    _ast.Lt:    _OP.LT,
+    _ast.LtE:   _OP.LE,
+    _ast.Gt:    _OP.GT,
+    _ast.GtE:   _OP.GE,
+    _ast.Eq:    _OP.EQ,
+    _ast.NotEq: _OP.NE,
+}
+
+# functions: (opcode, minimum number of arguments, maximum number of
+# arguments or None). functions with more arguments than the opcode
+# consumes are applied repeatedly
+_FUNCTIONS = {
+    'abs':      (_OP.ABS, 1, 1),
+    'int':      (_OP.INT, 1, 1),
+    'round':    (_OP.ROUND, 1, 1),
+    'min':      (_OP.MIN, 2, None),
+    'max':      (_OP.MAX, 2, None),
+    'clamp':    (_OP.CLAMP, 3, 3),
+}
+
+
+class _Compiler(object):
+    def __init__(self, source):
+        self.source = source
+        self.code = []
+        self.consts = []
+        self.types = _ANY
+
+    def error(self, node, message):
+        raise ValueError("%s in expression %r (column %d)" %
+                         (message, self.source, node.col_offset + 1))
+
+    def emit(self, op, *operands):
+        self.code.append(int(op))
+        self.code.extend(operands)
+
+    def const(self, value):
+        if value not in self.consts:
+            self.consts.append(value)
+        self.emit(_OP.CONST, self.consts.index(value))
+
+    def attribute(self, node, name):
+        if name not in _ATTRIBUTES:
+            self.error(node, "unknown name '%s'" % name)
+        self.types &= _ATTRIBUTES[name]
+        return int(getattr(_mididings.EventAttribute, name.upper()))
+
+    def number(self, node):
+        """
+        Return the value of a numeric literal, or None if node isn't one.
+        """
+        if _NEW_AST:
+            if not isinstance(node, _ast.Constant):
+                return self.negated_number(node)
+            value = node.value
+        elif isinstance(node, _ast.Num):
+            value = node.n
+        elif isinstance(node, getattr(_ast, 'NameConstant', ())):
+            value = node.value
+        elif isinstance(node, _ast.Name) and node.id in ('True', 'False'):
+            value = node.id == 'True'
+        else:
+            return self.negated_number(node)
+
+        if isinstance(value, bool):
+            return int(value)
+        elif isinstance(value, (int, float)):
+            return value
+        else:
+            self.error(node, "unsupported constant %r" % (value,))
+
+    def negated_number(self, node):
+        if (isinstance(node, _ast.UnaryOp) and
+                isinstance(node.op, (_ast.USub, _ast.UAdd))):
+            value = self.number(node.operand)
+            if value is not None and isinstance(node.op, _ast.USub):
+                value = -value
+            return value
+        return None
+
+    def expr(self, node):
+        value = self.number(node)
+        if value is not None:
+            self.const(float(value))
+
+        elif isinstance(node, _ast.Name):
+            attr = self.attribute(node, node.id)
+            self.emit(_OP.LOAD, attr)
+            if node.id in _OFFSET_ATTRIBUTES and _offset():
+                self.const(float(_offset()))
+                self.emit(_OP.ADD)
+
+        elif isinstance(node, _ast.BinOp):
+            if type(node.op) not in _BINARY_OPS:
+                self.error(node, "unsupported operator")
+            self.expr(node.left)
+            self.expr(node.right)
+            self.emit(_BINARY_OPS[type(node.op)])
+
+        elif isinstance(node, _ast.UnaryOp):
+            self.expr(node.operand)
+            if isinstance(node.op, _ast.USub):
+                self.emit(_OP.NEG)
+            elif isinstance(node.op, _ast.Not):
+                self.emit(_OP.NOT)
+            elif not isinstance(node.op, _ast.UAdd):
+                self.error(node, "unsupported operator")
+
+        elif isinstance(node, _ast.BoolOp):
+            op = _OP.AND if isinstance(node.op, _ast.And) else _OP.OR
+            self.expr(node.values[0])
+            for v in node.values[1:]:
+                self.expr(v)
+                self.emit(op)
+
+        elif isinstance(node, _ast.Compare):
+            # a < b < c is evaluated as (a < b) and (b < c). evaluating b
+            # twice is fine, since expressions have no side effects
+            left = node.left
+            for n, (op, right) in enumerate(zip(node.ops, node.comparators)):
+                self.compare(left, op, right)
+                if n:
+                    self.emit(_OP.AND)
+                left = right
+
+        elif isinstance(node, _ast.IfExp):
+            self.expr(node.test)
+            self.expr(node.body)
+            self.expr(node.orelse)
+            self.emit(_OP.SELECT)
+
+        elif isinstance(node, _ast.Call):
+            self.call(node)
+
+        else:
+            self.error(node, "unsupported syntax")
+
+    def compare(self, left, op, right):
+        if isinstance(op, (_ast.In, _ast.NotIn)):
+            if not isinstance(right, (_ast.Tuple, _ast.List, _ast.Set)):
+                self.error(right, "'in' requires a tuple, list or set")
+            values = [self.number(v) for v in right.elts]
+            if None in values:
+                self.error(right, "'in' requires constant values")
+
+            self.expr(left)
+            start = len(self.consts)
+            self.consts.extend(float(v) for v in values)
+            self.emit(_OP.IN, start, len(values))
+            if isinstance(op, _ast.NotIn):
+                self.emit(_OP.NOT)
+        elif type(op) in _COMPARE_OPS:
+            self.expr(left)
+            self.expr(right)
+            self.emit(_COMPARE_OPS[type(op)])
+        else:
+            self.error(left, "unsupported comparison")
+
+    def call(self, node):
+        name = node.func.id if isinstance(node.func, _ast.Name) else None
+        if name not in _FUNCTIONS:
+            self.error(node, "unsupported function call")
+        if (node.keywords or getattr(node, 'starargs', None) or
+                getattr(node, 'kwargs', None) or
+                any(type(a).__name__ == 'Starred' for a in node.args)):
+            self.error(node, "unsupported arguments to %s()" % name)
+
+        op, min_args, max_args = _FUNCTIONS[name]
+        nargs = len(node.args)
+        if nargs < min_args or (max_args is not None and nargs > max_args):
+            self.error(node, "wrong number of arguments to %s()" % name)
+
+        self.expr(node.args[0])
+        for a in node.args[1:min_args]:
+            self.expr(a)
+        self.emit(op)
+        for a in node.args[min_args:]:
+            self.expr(a)
+            self.emit(op)
+
+    def assign(self, target, value, op=None):
+        if not isinstance(target, _ast.Name):
+            self.error(target, "can only assign to event attributes")
+        if op is not None:
+            self.expr(_ast.BinOp(left=_ast.Name(id=target.id, ctx=_ast.Load(),
+                                                col_offset=target.col_offset),
+                                 op=op, right=value,
+                                 col_offset=target.col_offset))
+        else:
+            self.expr(value)
+
+        attr = self.attribute(target, target.id)
+        if target.id in _OFFSET_ATTRIBUTES and _offset():
+            self.const(float(_offset()))
+            self.emit(_OP.SUB)
+        self.emit(_OP.STORE, attr)
+
+    def statement(self, node):
+        if isinstance(node, _ast.Assign):
+            if len(node.targets) != 1:
+                self.error(node, "chained assignments are not supported")
+            self.assign(node.targets[0], node.value)
+        elif isinstance(node, _ast.AugAssign):
+            if type(node.op) not in _BINARY_OPS:
+                self.error(node, "unsupported operator")
+            self.assign(node.target, node.value, node.op)
+        else:
+            self.error(node, "expected an assignment")
+
+
+def _offset():
+    return _setup.get_config('data_offset')
+
+
+def _parse(source, mode):
+    try:
+        return _ast.parse(source.strip(), mode=mode)
+    except SyntaxError as ex:
+        raise ValueError("invalid syntax in expression %r: %s" %
+                         (source, ex.msg))
+
+
+def _check_types(compiler):
+    if not compiler.types:
+        raise ValueError("expression %r uses attributes that no event type "
+                         "has in common" % compiler.source)
+
+
+def compile_filter(source):
+    """
+    Compile a boolean expression to a native filter unit.
+    """
+    tree = _parse(source, 'eval')
+    c = _Compiler(source)
+    c.expr(tree.body)
+    _check_types(c)
+    return _mididings.ExpressionFilter(c.types, c.code, c.consts)
+
+
+def compile_transform(source):
+    """
+    Compile one or more assignments, separated by semicolons or newlines,
+    to a native unit.
+    """
+    tree = _parse(source, 'exec')
+    c = _Compiler(source)
+    if not tree.body:
+        raise ValueError("empty expression")
+    for node in tree.body:
+        c.statement(node)
+    _check_types(c)
+    return _mididings.Transform(c.types, c.code, c.consts)
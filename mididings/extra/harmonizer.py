@@ -14,9 +14,6 @@ import mididings as _m
 import mididings.util as _util
 import mididings.misc as _misc
 
-import itertools as _itertools
-from operator import itemgetter as _itemgetter
-
 
 _MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]
 _HARMONIC_MINOR_SCALE = [0, 2, 3, 5, 7, 8, 11]
@@ -39,7 +36,7 @@ class _Harmonizer(object):
             l = len(scale)
             i = scale.index(x) + interval
 
-            hx = scale[i % l] + ((i / l) * 12)
+            hx = scale[i % l] + ((i // l) * 12)
 
             self.lookup[x] = hx - x
 
@@ -130,23 +127,14 @@ def Harmonize(tonic, scale, interval, non_harmonic='below'):
     # convert all interval names to numbers
     iv = [(_INTERVALS.index(x) if x in _INTERVALS else x) for x in interval]
 
-    # python version:
-#    f = [ _m.Process(_Harmonizer(t, s, i, non_harmonic)) for i in iv ]
-
-    # pure mididings version:
     f = []
     for i in iv:
         h = _Harmonizer(t, s, i, non_harmonic)
-        # get offset for each key
-        offsets = [(x, h.note_offset(x)) for x in range(128)]
-        # group by offset
-        groups = _itertools.groupby(sorted(offsets, key=_itemgetter(1)),
-                                    key=_itemgetter(1))
-
-        # create one KeyFilter()/Transpose() pair for each offset
-        for off, keys in groups:
-            if off is not None:
-                f.append(_m.KeyFilter(notes=[k[0] for k in keys]) >>
-                         _m.Transpose(off))
+        # look up the offset of each note only once, when the patch is built
+        table = []
+        for x in range(128):
+            off = h.note_offset(x)
+            table.append(x + off if off is not None else None)
+        f.append(_m.NoteMap(table))
 
     return _m.Filter(_m.NOTE) % f
@@ -10,93 +10,29 @@
 # (at your option) any later version.
 #
 
+import _mididings
+
 import mididings as _m
-import mididings.event as _event
-import mididings.engine as _engine
-from mididings.extra.per_channel import PerChannel as _PerChannel
-
-
-class _VoiceFilter(object):
-    def __init__(self, voice, time, retrigger):
-        self.voice = voice
-        self.time = time
-        self.retrigger = retrigger
-
-        # all notes currently being played
-        self.notes = {}
-        # note number this voice is playing
-        self.current_note = None
-        # if we had to fall back to a different voice
-        self.diverted = False
-
-    def __call__(self, ev):
-        t = _engine.time()
-
-        if ev.type == _m.NOTEON:
-            # store new note, its velocity, and its time
-            self.notes[ev.note] = (ev.velocity, t)
-        elif ev.type == _m.NOTEOFF:
-            # delete released note
-            try:
-                del self.notes[ev.note]
-            except KeyError:
-                # ignore unmatched note-offs (just in case...)
-                pass
-
-        sorted_notes = sorted(self.notes.keys())
-
-        if len(sorted_notes):
-            try:
-                n = sorted_notes[self.voice]
-                d = False
-            except IndexError:
-                # use the next best note:
-                # lowest for negative index, otherwise highest
-                n = sorted_notes[0 if self.voice < 0 else -1]
-                d = True
-        else:
-            n = None
-            d = False
-
-        dt = ((t - self.notes[self.current_note][1])
-                if self.current_note in self.notes else 0.0)
-
-        # change current note if...
-        if (
-            # note number changed and...
-            n != self.current_note and (
-                # we're always retriggering notes
-                self.retrigger or
-                # lowest/heighest voice are a bit of a special case
-                self.voice in (0, -1) or
-                # current note is no longer held
-                self.current_note not in self.notes or
-                # our previous note is very recent
-                (ev.type == _m.NOTEON and dt < self.time) or
-                # the new note is "better" than previous one
-                self.diverted and not d
-        )):
-            # yield note-off for previous note (if any)
-            if self.current_note:
-                yield _event.NoteOffEvent(
-                            ev.port, ev.channel, self.current_note, 0)
-                self.current_note = None
-
-            dt = (t - self.notes[n][1]) if n in self.notes else 0.0
-
-            # yield note-on for new note (if any)
-            if n is not None and (
-                # this is the note being played right now
-                ev.note == n or
-                # we're retriggering whenever a key is pressed or released
-                self.retrigger or
-                # our previous note is very recent
-                dt < self.time
-            ):
-                yield _event.NoteOnEvent(
-                            ev.port, ev.channel, n, self.notes[n][0])
-                self.current_note = n
-                self.diverted = d
+import mididings.setup as _setup
+from mididings.units.base import _Unit
+
+
+def _voice_index(voice):
+    if voice == 'highest':
+        return -1
+    elif voice == 'lowest':
+        return 0
+    return voice
+
+
+def _tracker(state):
+    return _m.Filter(_m.NOTE) % _Unit(_mididings.VoiceTracker(state))
+
+
+def _voice(state, voice, time, retrigger):
+    return _m.Filter(_m.NOTE) % _Unit(
+        _mididings.VoiceFilter(state, voice, time, retrigger,
+                               _setup._num_ports()))
 
 
 def VoiceFilter(voice='highest', time=0.1, retrigger=False):
@@ -118,14 +54,9 @@ def VoiceFilter(voice='highest', time=0.1, retrigger=False):
         If true, a new note-on event will be sent when a note is reassigned
         to the selected voice as a result of another note being released.
     """
-    if voice == 'highest':
-        voice = -1
-    elif voice == 'lowest':
-        voice = 0
-
-    return _m.Filter(_m.NOTE) % _m.Process(_PerChannel(
-        lambda: _VoiceFilter(voice, time, retrigger))
-    )
+    state = _mididings.VoiceState(_setup._num_ports())
+    return (_tracker(state) >>
+            _voice(state, _voice_index(voice), time, retrigger))
 
 
 def VoiceSplit(patches, fallback='highest', time=0.1, retrigger=False):
@@ -144,15 +75,18 @@ def VoiceSplit(patches, fallback='highest', time=0.1, retrigger=False):
     note played will always be routed to the first and last patch in
     the list, respectively.
     """
-    vf = lambda n: VoiceFilter(n, time, retrigger)
+    # all voices share the same set of held notes, which is updated only
+    # once for each event
+    state = _mididings.VoiceState(_setup._num_ports())
+    vf = lambda n: _voice(state, n, time, retrigger)
 
     if fallback == 'lowest':
-        return _m.Fork(
+        return _tracker(state) >> _m.Fork(
             [ vf( 0) >> patches[ 0] ] +
             [ vf( n) >> patches[ n] for n in range(-len(patches) + 1, 0) ]
         )
     else: # highest
-        return _m.Fork(
+        return _tracker(state) >> _m.Fork(
             [ vf( n) >> patches[ n] for n in range(len(patches) - 1) ] +
             [ vf(-1) >> patches[-1] ]
         )
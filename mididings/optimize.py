@@ -0,0 +1,547 @@
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+"""
+Rewrites patches into equivalent, but usually smaller ones before they are
+built.
+
+While optimizing, the set of event types that can possibly reach each unit
+is tracked, so that filters which can never match (or always match) can be
+removed. Units backed by a native (non-extended) unit are stateless and
+deterministic, which allows identical ones to be merged.
+"""
+
+import _mididings
+
+import mididings.units as _units
+import mididings.constants as _constants
+
+import functools as _functools
+import operator as _operator
+
+
+# all event types that actually exist
+_ANY = _functools.reduce(_operator.or_, _constants._EVENT_TYPES.keys())
+
+# event types acted on by each filter, and whether other events are let
+# through
+_FILTER_TYPES = {
+    _mididings.PortFilter:      (_ANY, False),
+    _mididings.ChannelFilter:   (int(~(_constants.SYSTEM | _constants.DUMMY)),
+                                 False),
+    _mididings.KeyFilter:       (int(_constants.NOTE |
+                                     _constants.POLY_AFTERTOUCH), True),
+    _mididings.VelocityFilter:  (int(_constants.NOTEON), True),
+    _mididings.CtrlFilter:      (int(_constants.CTRL), False),
+    _mididings.CtrlValueFilter: (int(_constants.CTRL), False),
+    _mididings.ProgramFilter:   (int(_constants.PROGRAM), False),
+    _mididings.SysExFilter:     (int(_constants.SYSEX), False),
+}
+
+
+def optimize(patch):
+    """
+    Return an optimized version of the given patch.
+    """
+    return _optimize(patch, _ANY)[0]
+
+
+# native units that keep state between events, possibly shared with other
+# units
+_STATEFUL_UNITS = (
+    _mididings.VoiceTracker,
+    _mididings.VoiceFilter,
+    _mididings.LimitPolyphony,
+    _mididings.MakeMonophonic,
+    _mididings.LatchNotes,
+    _mididings.PedalToNoteoff,
+    _mididings.FloatingSplitAnalyzer,
+    _mididings.FloatingSplitFilter,
+)
+
+
+def python_types(patch, types=_ANY):
+    """
+    Return the types of events which, when coming in as one of the given
+    types, may reach a unit that calls Python code.
+    """
+    return _reach_types(patch, types, _is_python)[0]
+
+
+def stateful_types(patch, types=_ANY):
+    """
+    Return the types of events which, when coming in as one of the given
+    types, may reach a native unit that keeps state between events.
+    """
+    return _reach_types(patch, types, _is_stateful)[0]
+
+
+def count_modules(patch):
+    """
+    Return the number of modules the given patch will be built from.
+    """
+    if isinstance(patch, _units.base._Chain):
+        # consecutive native units are fused into a single module, and a
+        # chain of only one module is replaced by that module
+        counts = []
+        single = False
+        for p in _chain_units_flat(patch):
+            if not _is_single(p):
+                counts.append(count_modules(p))
+            elif not single:
+                counts.append(1)
+            single = _is_single(p)
+        return sum(counts) + (len(counts) != 1)
+    elif isinstance(patch, _units.splits._SplitFork) and patch.unmodified():
+        return 1 + sum(count_modules(p) for p in patch.patches)
+    elif isinstance(patch, list):
+        return 1 + sum(count_modules(p) for p in patch)
+    elif isinstance(patch, dict):
+        return count_modules(_make_type_split(patch))
+    else:
+        return 1
+
+
+def _optimize(p, types):
+    """
+    Optimize p, assuming that only events of the given types reach it.
+    Returns the optimized patch, and the types of events it may return.
+    """
+    if not types:
+        # no event ever gets here
+        return _discard(), 0
+
+    if isinstance(p, _units.base._Chain):
+        return _optimize_chain(p, types)
+    elif isinstance(p, _units.splits._SplitFork) and p.unmodified():
+        return _optimize_split(p, types)
+    elif isinstance(p, list):
+        return _optimize_fork(p, types)
+    elif isinstance(p, dict):
+        return _optimize_split(_make_type_split(p), types)
+    else:
+        return _optimize_unit(p, types)
+
+
+def _reach_types(p, types, match):
+    """
+    Returns the types of events that may reach a unit in p for which
+    match() is true, and the types of events p may return.
+    """
+    if not types:
+        return 0, 0
+
+    if isinstance(p, _units.base._Chain):
+        reach = 0
+        # the incoming types events at this point of the chain may have
+        # originated from. once a unit changed their types, this can't be
+        # narrowed down any further
+        origin = types
+        changed = False
+        for unit in p:
+            r, t = _reach_types(unit, types, match)
+            reach |= origin if (changed and r) else r
+            if t & ~types:
+                changed = True
+            elif not changed:
+                origin = t
+            types = t
+        return reach, types
+    elif isinstance(p, _units.splits._SplitFork) and p.unmodified():
+        branch_types = zip(p.patches, _split_types(p, types))
+    elif isinstance(p, list):
+        branch_types = [(u, types) for u in p]
+    elif isinstance(p, dict):
+        return _reach_types(_make_type_split(p), types, match)
+    elif _is_python(p):
+        # there's no telling what a Python function returns
+        return (types if match(p) else 0), _ANY
+    else:
+        return (types if match(p) else 0), _optimize_unit(p, types)[1]
+
+    reach = out = 0
+    for unit, t in branch_types:
+        r, t = _reach_types(unit, t, match)
+        reach |= r
+        out |= t
+    return reach, out
+
+
+def _optimize_chain(p, types):
+    r = []
+
+    for unit in p:
+        u, types = _optimize(unit, types)
+
+        if _is_discard(u):
+            # nothing gets past this unit. units with side effects before
+            # it still need to run, though
+            if all(_is_pure(x) for x in r):
+                return u, 0
+            r.append(u)
+            break
+        elif isinstance(u, _units.base._Chain):
+            # flatten nested chains (this also drops empty ones)
+            r.extend(u)
+        elif (r and _type_mask(u) is not None and
+                    _type_mask(r[-1]) is not None):
+            # merge consecutive type filters
+            r[-1] = _type_filter(_type_mask(r[-1]) & _type_mask(u))
+        else:
+            r.append(u)
+
+    if len(r) == 1:
+        return r[0], types
+    return _units.base._Chain(r), types
+
+
+def _optimize_fork(p, types):
+    remove_duplicates = getattr(p, 'remove_duplicates', None)
+
+    r = []
+    out = 0
+
+    for unit in p:
+        u, t = _optimize(unit, types)
+        r.append(u)
+        out |= t
+
+    r = _hoist_prefixes(_merge_branches(r, remove_duplicates),
+                        remove_duplicates)
+
+    if not r:
+        return _discard(), 0
+    elif len(r) == 1:
+        return r[0], out
+    return _units.base._Fork(r, remove_duplicates), out
+
+
+def _merge_branches(branches, remove_duplicates):
+    """
+    Remove dead and duplicate branches, and flatten nested forks.
+    """
+    dedup = (remove_duplicates != False)
+    r = []
+
+    for u in branches:
+        if _is_discard(u) and _is_pure(u):
+            # dead branch
+            continue
+        if (_is_fork(u) and
+                (getattr(u, 'remove_duplicates', None) != False) == dedup):
+            # flatten nested forks of the same kind
+            nested = list(u)
+        else:
+            nested = [u]
+
+        for b in nested:
+            if dedup and _is_pure(b) and any(_same(b, x) for x in r):
+                # identical branch, all its events would be removed as
+                # duplicates anyway
+                continue
+            r.append(b)
+
+    return r
+
+
+def _hoist_prefixes(branches, remove_duplicates):
+    """
+    Move identical pure units at the beginning of adjacent branches out of
+    the fork.
+    """
+    r = []
+    n = 0
+    while n < len(branches):
+        first = _first_unit(branches[n])
+        m = n + 1
+        if first is not None and _is_pure(first):
+            while (m < len(branches) and
+                    _same(_first_unit(branches[m]), first)):
+                m += 1
+
+        if m - n > 1:
+            rest = _merge_branches([_without_first_unit(b)
+                                        for b in branches[n:m]],
+                                   remove_duplicates)
+            rest = _hoist_prefixes(rest, remove_duplicates)
+            if not rest:
+                # none of the branches returns anything
+                pass
+            elif len(rest) == 1:
+                r.append(_units.base._Chain([first] + _chain_units(rest[0])))
+            else:
+                r.append(_units.base._Chain([
+                    first, _units.base._Fork(rest, remove_duplicates)]))
+        else:
+            r.append(branches[n])
+        n = m
+    return r
+
+
+def _optimize_split(p, types):
+    patches = []
+    out = 0
+    for patch, t in zip(p.patches, _split_types(p, types)):
+        u, t = _optimize(patch, t)
+        patches.append(u)
+        out |= t
+
+    if all(_is_discard(u) and _is_pure(u) for u in patches):
+        return _discard(), 0
+    return p.with_patches(patches), out
+
+
+def _split_types(p, types):
+    """
+    Return the event types reaching each of the split's branches.
+    """
+    dispatch = p.dispatch
+    key_types = []
+
+    if dispatch.key == _mididings.Patch.SplitKey.TYPE:
+        # each branch only ever sees events of the types in its key
+        masks = [_functools.reduce(_operator.or_, [1 << n for n in
+                                   _units.splits._type_bits(k)], 0)
+                 for k in p.keys]
+        key_types = [types & m for m in masks]
+        if p.has_else:
+            if p.keys:
+                key_types.append(types & ~_functools.reduce(
+                                                _operator.or_, masks))
+            else:
+                key_types.append(types)
+    else:
+        t = types if dispatch.pass_other else types & int(dispatch.types)
+        key_types = [t] * len(p.keys)
+        if p.has_else:
+            key_types.append(t if p.keys else types)
+
+    return key_types
+
+
+def _optimize_unit(p, types):
+    mask = _type_mask(p)
+    if mask is not None:
+        t = types & mask
+        if not t:
+            return _discard(), 0
+        elif t == types:
+            # filter lets everything through
+            return _units.base._Chain([]), types
+        else:
+            return p, t
+
+    if not isinstance(p, _units.base._Unit) or not _is_native(p):
+        # we know nothing about this unit
+        return p, _ANY
+
+    if _is_named(p, 'Pass'):
+        return _units.base._Chain([]), types
+    elif _is_discard(p):
+        return p, 0
+    elif isinstance(p, _units.base._Filter):
+        return _optimize_filter(p, types)
+    elif isinstance(p.unit, (_mididings.Generator,
+                             _mididings.SysExGenerator)):
+        return p, _ANY
+    else:
+        # all other native units leave the event type alone
+        return p, types
+
+
+def _optimize_filter(p, types):
+    negate = False
+    f = p
+    if isinstance(p, _units.base._InvertedFilter):
+        negate = p.negate
+        f = p.filt
+
+    if type(f.unit) not in _FILTER_TYPES:
+        return p, types
+
+    filter_types, pass_other = _FILTER_TYPES[type(f.unit)]
+    if negate:
+        pass_other = not pass_other
+
+    if not types & filter_types:
+        # none of the incoming events is affected by this filter
+        if pass_other:
+            return _units.base._Chain([]), types
+        else:
+            return _discard(), 0
+    elif not pass_other:
+        return p, types & filter_types
+    else:
+        return p, types
+
+
+def _make_type_split(d):
+    return _units.splits._make_split(_units.base.Filter, d, unpack=True,
+                                     dispatch=_units.splits._TYPE_DISPATCH)
+
+
+def _discard():
+    return _units.base.Discard()
+
+
+def _type_filter(mask):
+    if not mask:
+        return _discard()
+    types = [t for m, t in sorted(_constants._EVENT_TYPES.items())
+             if mask & m]
+    return _units.base.Filter(_functools.reduce(_operator.or_, types))
+
+
+def _type_mask(p):
+    """
+    Return the event types let through by p if it's a type filter, otherwise
+    None.
+    """
+    if isinstance(p, _constants._EventType):
+        return int(p) & _ANY
+    elif isinstance(p, _units.base._InvertedFilter):
+        mask = _type_mask(p.filt)
+        return _ANY & ~mask if mask is not None else None
+    elif (isinstance(p, _units.base._Filter) and
+            isinstance(p.unit, _mididings.TypeFilter) and
+            _is_named(p, 'Filter')):
+        return int(p._args[0]) & _ANY
+    else:
+        return None
+
+
+def _is_named(p, name):
+    return getattr(p, '_name', None) == name
+
+
+def _is_native(p):
+    return (isinstance(p.unit, _mididings.Unit) and
+            not isinstance(p, _units.init._InitExit))
+
+
+def _is_python(p):
+    return (isinstance(p, _units.base._Unit) and
+            isinstance(getattr(p, 'unit', None), (_mididings.Call,
+                                                  _mididings.CallView,
+                                                  _mididings.CallCached)))
+
+
+def _is_stateful(p):
+    return (isinstance(p, _units.base._Unit) and
+            isinstance(getattr(p, 'unit', None), _STATEFUL_UNITS))
+
+
+def _is_single(p):
+    """
+    Return whether p is built as a single native unit.
+    """
+    return (isinstance(p, (_constants._EventType, _units.init._InitExit)) or
+            (isinstance(p, _units.base._Unit) and
+             not isinstance(p, (list, dict)) and
+             isinstance(p.unit, _mididings.Unit)))
+
+
+def _is_discard(p):
+    return isinstance(p, _units.base._Unit) and _is_named(p, 'Discard')
+
+
+def _is_pure(p):
+    """
+    Return whether p consists only of native units. These have no side
+    effects, and always return the same output for the same input.
+    """
+    if isinstance(p, _constants._EventType):
+        return True
+    elif isinstance(p, _units.splits._SplitFork) and p.unmodified():
+        return all(_is_pure(u) for u in p.patches)
+    elif isinstance(p, dict):
+        return all(_is_pure(u) for u in p.values())
+    elif isinstance(p, list):
+        return all(_is_pure(u) for u in p)
+    elif isinstance(p, _units.base._Unit):
+        return _is_native(p)
+    else:
+        return False
+
+
+def _same(a, b):
+    """
+    Return whether a and b are known to be identical.
+    """
+    if a is b:
+        return True
+    ka = _key(a)
+    return ka is not None and ka == _key(b)
+
+
+def _key(p):
+    """
+    Return a hashable object identifying p, or None if p can't be compared.
+    """
+    if isinstance(p, _constants._EventType):
+        return ('Filter', int(p))
+    elif isinstance(p, _units.base._InvertedFilter):
+        k = _key(p.filt)
+        return ('Invert', p.negate, k) if k is not None else None
+    elif isinstance(p, list) and not isinstance(p, _units.splits._SplitFork):
+        keys = tuple(_key(u) for u in p)
+        if None in keys:
+            return None
+        if isinstance(p, _units.base._Chain):
+            return ('Chain', keys)
+        return ('Fork', getattr(p, 'remove_duplicates', None) != False, keys)
+    elif (isinstance(p, _units.base._Unit) and hasattr(p, '_name') and
+            not isinstance(p, list)):
+        return (p._name, type(p.unit), repr(p))
+    else:
+        return None
+
+
+def _is_fork(p):
+    return (isinstance(p, list) and
+            not isinstance(p, _units.base._Chain) and
+            not isinstance(p, _units.splits._SplitFork))
+
+
+def _first_unit(p):
+    """
+    Return the first unit in p, if that's a single unit.
+    """
+    if isinstance(p, _units.base._Chain):
+        p = p[0] if len(p) else None
+    if isinstance(p, (list, dict)):
+        return None
+    return p
+
+
+def _without_first_unit(p):
+    if isinstance(p, _units.base._Chain):
+        return p[1] if len(p) == 2 else _units.base._Chain(p[1:])
+    else:
+        return _units.base._Chain([])
+
+
+def _chain_units_flat(p):
+    r = []
+    for u in p:
+        if isinstance(u, _units.base._Chain):
+            r.extend(_chain_units_flat(u))
+        else:
+            r.append(u)
+    return r
+
+
+def _chain_units(p):
+    if isinstance(p, _units.base._Chain):
+        return list(p)
+    else:
+        return [p]
@@ -14,15 +14,28 @@ import _mididings
 
 import mididings.units as _units
 import mididings.constants as _constants
+import mididings.optimize as _optimize
+import mididings.setup as _setup
 
 
 class Patch(_mididings.Patch):
-    def __init__(self, p):
-        _mididings.Patch.__init__(self, self.build(p))
+    def __init__(self, p, offload_types=0):
+        optimize = _setup.get_config('optimize')
+        if optimize:
+            q = _optimize.optimize(p)
+            if optimize == 'debug':
+                print("optimized patch: %d -> %d modules" % (
+                        _optimize.count_modules(p),
+                        _optimize.count_modules(q)))
+            p = q
+        _mididings.Patch.__init__(self, self.build(p), offload_types)
 
     def build(self, p):
         if isinstance(p, _units.base._Chain):
-            return Patch.Chain(self.build(i) for i in p)
+            return self.build_chain(p)
+
+        elif (isinstance(p, _units.splits._SplitFork) and p.unmodified()):
+            return self.build_split(p)
 
         elif isinstance(p, list):
             gen = (self.build(i) for i in p)
@@ -35,25 +48,81 @@ class Patch(_mididings.Patch):
 
         elif isinstance(p, dict):
             return self.build(
-                _units.splits._make_split(_units.base.Filter, p, unpack=True)
+                _units.splits._make_split(_units.base.Filter, p, unpack=True,
+                                          dispatch=_units.splits._TYPE_DISPATCH)
             )
 
-        elif isinstance(p, _units.init._InitExit):
-            return Patch.Single(_mididings.Pass(False))
-
-        elif isinstance(p, _units.base._Unit):
-            if isinstance(p.unit, _mididings.Unit):
-                return Patch.Single(p.unit)
-            elif isinstance(p.unit, _mididings.UnitEx):
-                return Patch.Extended(p.unit)
+        elif self.native_unit(p) is not None:
+            return Patch.Single(self.native_unit(p))
 
-        elif isinstance(p, _constants._EventType):
-            return Patch.Single(_mididings.TypeFilter(p))
+        elif (isinstance(p, _units.base._Unit) and
+                isinstance(p.unit, _mididings.UnitEx)):
+            return Patch.Extended(p.unit)
 
         raise TypeError(
                 "type '%s' not allowed in patch. offending object is: %r" %
                 (type(p).__name__, p))
 
+    def native_unit(self, p):
+        """
+        Return the native unit p can be built from, or None if p doesn't
+        consist of a single native unit.
+        """
+        if isinstance(p, _units.init._InitExit):
+            return _mididings.Pass(False)
+        elif (isinstance(p, _units.base._Unit) and
+                not isinstance(p, (list, dict)) and
+                isinstance(p.unit, _mididings.Unit)):
+            return p.unit
+        elif isinstance(p, _constants._EventType):
+            return _mididings.TypeFilter(p)
+        else:
+            return None
+
+    def build_chain(self, p):
+        modules = []
+        # consecutive native units, to be fused into a single module
+        units = []
+
+        for i in _flatten_chain(p):
+            unit = self.native_unit(i)
+            if unit is not None:
+                units.append(unit)
+            else:
+                modules.extend(self.build_units(units))
+                units = []
+                modules.append(self.build(i))
+
+        modules.extend(self.build_units(units))
+
+        if len(modules) == 1:
+            return modules[0]
+        return Patch.Chain(modules)
+
+    def build_units(self, units):
+        if not units:
+            return []
+        elif len(units) == 1:
+            return [Patch.Single(units[0])]
+        else:
+            return [Patch.SingleChain(units)]
+
+    def build_split(self, p):
+        table, other = p.dispatch.build_table(p.keys, p.has_else)
+        gen = (self.build(i) for i in p.patches)
+
+        return Patch.Split(p.dispatch.key, p.dispatch.types, table, other,
+                           gen, p.remove_duplicates != False)
+
+
+def _flatten_chain(p):
+    for i in p:
+        if isinstance(i, _units.base._Chain):
+            for j in _flatten_chain(i):
+                yield j
+        else:
+            yield i
+
 
 def get_init_patches(patch):
     if isinstance(patch, _units.base._Chain):
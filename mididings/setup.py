@@ -27,6 +27,13 @@ _DEFAULT_CONFIG = {
     'initial_scene':    None,
     'start_delay':      None,
     'silent':           False,
+    'optimize':         True,
+    'event_buffer':     'list',
+    'batch_processing': False,
+    'async_workers':    1,
+    'async_queue_size': 256,
+    'async_overflow':   'drop-oldest',
+    'sysex_rate':       None,
 }
 
 
@@ -98,6 +105,21 @@ def reset():
                         ),
     'start_delay':      (int, float, type(None)),
     'silent':           bool,
+    'optimize':         (True, False, 'debug'),
+    'event_buffer':     ('list', 'arena'),
+    'batch_processing': bool,
+    'async_workers':    _arguments.each(int,
+                            _arguments.condition(lambda x: x >= 1)),
+    'async_queue_size': _arguments.each(int,
+                            _arguments.condition(lambda x: x >= 1)),
+    'async_overflow':   ('drop-oldest', 'drop-newest', 'coalesce', 'block'),
+    'sysex_rate':       _arguments.nullable(_arguments.either(
+                            _arguments.each((int, float),
+                                _arguments.condition(lambda x: x >= 0)),
+                            _arguments.sequenceof(_arguments.nullable(
+                                _arguments.each((int, float),
+                                    _arguments.condition(lambda x: x >= 0)))),
+                        )),
 })
 def config(**kwargs):
     """
@@ -123,6 +145,13 @@ def _config_impl(override=False, **kwargs):
     _config_updated()
 
 
+def _num_ports():
+    """
+    Return the number of ports events may be received on or sent to.
+    """
+    return max(len(_in_portnames), len(_out_portnames))
+
+
 def _config_updated():
     global _in_portnames, _out_portnames
     global _in_port_connections, _out_port_connections
@@ -147,6 +176,11 @@ def hook(*args):
     Hook classes that ship with mididings are described in section
     :ref:`extra-hooks`.
 
+    Hook methods (such as ``on_start()``, ``on_switch_scene()`` and
+    ``on_exit()``) may also be coroutines (``async def``), which are run on
+    the engine's :mod:`asyncio` event loop. mididings waits for coroutine
+    ``on_exit()`` hooks to finish before shutting down.
+
     :param \*args: an arbitrary number of hook objects.
     """
     _hooks.extend(args)
@@ -15,6 +15,7 @@ import _mididings
 import mididings.constants as _constants
 import mididings.arguments as _arguments
 import mididings.unitrepr as _unitrepr
+import mididings.expression as _expression
 
 
 class _Unit(object):
@@ -298,15 +299,32 @@ AndSelector = And
 OrSelector = Or
 
 
-@_unitrepr.accept(_arguments.reduce_bitmask([_constants._EventType]),
-                  add_varargs=True)
+_filter_types = _arguments.reduce_bitmask([_constants._EventType])
+
+def _filter_types_or_expression(types):
+    # a single string is an expression, anything else is reduced to a
+    # bitmask of event types
+    if len(types) == 1 and isinstance(types[0], str):
+        return types[0]
+    return _filter_types(types)
+
+
+@_unitrepr.accept(_filter_types_or_expression, add_varargs=True)
 def Filter(types):
     """
     Filter(types, ...)
+    Filter(expression)
 
     Filter by event type. Multiple types can be given as bitmasks, lists, or
     separate parameters.
+
+    The second form filters events by evaluating an expression given as a
+    string, which is compiled to native code rather than calling Python
+    for each event.
+    See :ref:`expressions` for the supported syntax.
     """
+    if isinstance(types, str):
+        return _Filter(_expression.compile_filter(types))
     return _Filter(_mididings.TypeFilter(types))
 
 
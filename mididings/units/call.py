@@ -32,8 +32,17 @@ import collections as _collections
 import inspect as _inspect
 
 
+_OVERFLOW_POLICIES = {
+    'drop-oldest':  _mididings.OverflowPolicy.DROP_OLDEST,
+    'drop-newest':  _mididings.OverflowPolicy.DROP_NEWEST,
+    'coalesce':     _mididings.OverflowPolicy.COALESCE,
+    'block':        _mididings.OverflowPolicy.BLOCK,
+}
+
+
 class _CallBase(_Unit):
-    def __init__(self, function, async, cont):
+    def __init__(self, function, async, cont, batch=False, view=False,
+                 overflow=None, cache_size=None):
         def do_call(ev):
             # add additional properties that don't exist on the C++ side
             ev.__class__ = _event.MidiEvent
@@ -53,7 +62,80 @@ class _CallBase(_Unit):
                 ev._finalize()
             return ret
 
-        _Unit.__init__(self, _mididings.Call(do_call, async, cont))
+        def do_call_batch(evs):
+            for ev in evs:
+                ev.__class__ = _event.MidiEvent
+
+            # call the function once with all events
+            ret = function(evs)
+
+            if ret is None:
+                return None
+            elif not isinstance(ret, list):
+                # function is a generator, or returned some other sequence
+                ret = list(ret)
+
+            for ev in ret:
+                ev._finalize()
+            return ret
+
+        def convert_view(ret):
+            # function returned something other than the event view itself
+            if isinstance(ret, _types.GeneratorType):
+                ret = list(ret)
+            elif not _misc.issequence(ret):
+                ret = [ret]
+
+            r = []
+            for ev in ret:
+                if isinstance(ev, _mididings.EventView):
+                    # the view only remains valid until the function returns
+                    ev = ev.copy()
+                    ev.__class__ = _event.MidiEvent
+                else:
+                    ev._finalize()
+                r.append(ev)
+            return r
+
+        if overflow is None:
+            overflow = _get_config('async_overflow')
+
+        if view:
+            unit = _mididings.CallView(function, convert_view)
+        elif cache_size is not None:
+            unit = _mididings.CallCached(do_call, cache_size)
+        else:
+            unit = _mididings.Call(do_call_batch if batch else do_call,
+                                   async, cont, batch,
+                                   _OVERFLOW_POLICIES[overflow])
+        _Unit.__init__(self, unit)
+
+
+class _CallCached(_CallBase):
+    def __init__(self, function, cache_size):
+        _CallBase.__init__(self, function, False, False,
+                           cache_size=cache_size)
+
+    def cache_stats(self):
+        """
+        Return the number of cache hits and misses, and the hit rate, as a
+        dictionary.
+        """
+        hits = self.unit.hits()
+        misses = self.unit.misses()
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / total if total else 0.0,
+        }
+
+    def invalidate(self):
+        """
+        Clear the cache, e.g. after changing some setting the function
+        depends on.
+        """
+        self.unit.invalidate()
 
 
 class _CallThread(_CallBase):
@@ -67,6 +149,19 @@ class _CallThread(_CallBase):
         _CallBase.__init__(self, do_thread, True, False)
 
 
+class _CallCoroutine(_CallBase):
+    def __init__(self, function, overflow):
+        from mididings import engine as _engine
+
+        def do_schedule(ev):
+            # need to make a copy of the event, the coroutine will only run
+            # after this function has returned
+            ev_copy = _event.MidiEvent(*ev.__getinitargs__())
+            _engine._TheEngine()._run_coroutine(function(ev_copy))
+
+        _CallBase.__init__(self, do_schedule, True, False, overflow=overflow)
+
+
 class _System(_CallBase):
     def __init__(self, command):
         def do_system(ev):
@@ -105,15 +200,58 @@ def _call_partial(function, args, kwargs, require_event=False):
         return function
 
 
+def _iscoroutinefunction(function):
+    """
+    Return whether function (or the __call__ method of a callable object) is
+    a coroutine function.
+    """
+    iscoroutinefunction = getattr(_inspect, 'iscoroutinefunction', None)
+    if iscoroutinefunction is None:
+        return False
+    return (iscoroutinefunction(function) or
+            iscoroutinefunction(getattr(function, '__call__', None)))
+
+
 @_unitrepr.accept(_collections.Callable, None, kwargs={ None: None })
 def Process(function, *args, **kwargs):
     """
-    Process(function, *args, **kwargs)
+    Process(function, *args, batch=False, view=False, pure=False, cache_size=1024, **kwargs)
 
     Process the incoming MIDI event using a Python function, then continue
     executing the mididings patch with the events returned from that
     function.
 
+    If *batch* is true, *function* is called only once with a list of all
+    events that arrive at this unit at the same time, i.e. that resulted
+    from the same incoming event (for example the output of a :func:`Fork()`
+    or :func:`Harmonize()`). It must return a list of events (or be a
+    generator), which replaces the incoming events. This avoids much of the
+    overhead of calling into Python for each event.
+
+    If *view* is true, *function* is called with a lightweight
+    :class:`_mididings.EventView` instead of a :class:`~.MidiEvent` object.
+    The view gives direct access to the event being processed, without
+    copying it, and the same view object is reused for every call.
+    Its attributes :attr:`type`, :attr:`port`, :attr:`channel`,
+    :attr:`data1`, :attr:`data2` (and their aliases :attr:`note`,
+    :attr:`velocity`, :attr:`ctrl`, :attr:`value`, :attr:`program`) as well
+    as :attr:`sysex` can be read and modified, but are plain integers that
+    are neither checked against the event type nor adjusted by the
+    :c:data:`data_offset` setting. Returning the view itself keeps the
+    (possibly modified) event without any further conversion.
+    The view must not be stored, use its :meth:`copy()` method to get an
+    independent :class:`~.MidiEvent`.
+
+    If *pure* is true, *function* is assumed to depend on nothing but the
+    type, port, channel and data values of the incoming event. The events it
+    returns are remembered for up to *cache_size* different incoming
+    events, and reused without calling *function* again when the same
+    event arrives. The unit returned by :func:`Process()` then has two
+    additional methods: ``cache_stats()`` returns a dictionary with the
+    number of cache ``'hits'`` and ``'misses'`` and the ``'hit_rate'``,
+    and ``invalidate()`` clears the cache, e.g. after changing some value
+    that *function* depends on.
+
     :param function:
         a function, or any other callable object, that will be called with
         a :class:`~.MidiEvent` object as its first argument.
@@ -132,6 +270,8 @@ def Process(function, *args, **kwargs):
 
     :param \*\*kwargs:
         optional keyword arguments that will be passed to *function*.
+        The keyword arguments *batch*, *view*, *pure* and *cache_size* are
+        reserved, see above.
 
 
     Any other MIDI processing will be stalled until *function* returns,
@@ -142,17 +282,36 @@ def Process(function, *args, **kwargs):
     if _get_config('backend') == 'jack-rt' and not _get_config('silent'):
         print("WARNING: using Process() with the 'jack-rt' backend"
               " is probably a bad idea")
-    return _CallBase(_call_partial(function, args, kwargs, True), False, False)
+    batch = kwargs.pop('batch', False)
+    view = kwargs.pop('view', False)
+    pure = kwargs.pop('pure', False)
+    cache_size = kwargs.pop('cache_size', 1024)
+    if batch + view + pure > 1:
+        raise ValueError("Process() can only use one of batch, view and "
+                         "pure")
+    if pure:
+        if cache_size < 1:
+            raise ValueError("cache_size must be at least 1")
+        return _CallCached(_call_partial(function, args, kwargs, True),
+                           cache_size)
+    return _CallBase(_call_partial(function, args, kwargs, True),
+                     False, False, batch, view)
 
 
 @_overload.mark(
     """
-    Call(function, *args, **kwargs)
+    Call(function, *args, overflow=None, **kwargs)
     Call(thread=..., **kwargs)
 
     Schedule a Python function for execution.
     The incoming event is discarded.
 
+    Functions are run by a pool of :c:data:`async_workers` threads. Calls to
+    the same function are always made in the order the events arrived, and
+    never concurrently. If more than :c:data:`async_queue_size` calls are
+    pending, *overflow* determines what happens, see
+    :c:data:`async_overflow`. The default is the globally configured value.
+
     :param function:
         a function, or any other callable object.
         If the function accepts arguments, its first argument will be a copy
@@ -160,6 +319,11 @@ def Process(function, *args, **kwargs):
 
         The function's return value is ignored.
 
+        If *function* is a coroutine function (``async def``), it's run on
+        the engine's :mod:`asyncio` event loop (see
+        :func:`mididings.engine.event_loop()`), so that many calls can wait
+        for I/O at the same time, without a thread for each of them.
+
     :param thread:
         like *function*, but causes the function to be run in its own thread.
 
@@ -168,11 +332,18 @@ def Process(function, *args, **kwargs):
 
     :param \*\*kwargs:
         optional keyword arguments that will be passed to *function*.
+        The keyword argument *overflow* is reserved, see above.
     """
 )
 @_unitrepr.accept(_collections.Callable, None, kwargs={ None: None })
 def Call(function, *args, **kwargs):
-    return _CallBase(_call_partial(function, args, kwargs), True, False)
+    overflow = kwargs.pop('overflow', None)
+    if overflow is not None and overflow not in _OVERFLOW_POLICIES:
+        raise ValueError("invalid overflow policy: %r" % (overflow,))
+    if _iscoroutinefunction(function):
+        return _CallCoroutine(_call_partial(function, args, kwargs), overflow)
+    return _CallBase(_call_partial(function, args, kwargs), True, False,
+                     overflow=overflow)
 
 @_overload.mark
 @_unitrepr.accept(_collections.Callable, kwargs={ None: None })
@@ -22,6 +22,7 @@ import mididings.overload as _overload
 import mididings.constants as _constants
 import mididings.arguments as _arguments
 import mididings.unitrepr as _unitrepr
+import mididings.expression as _expression
 
 
 @_unitrepr.accept(_util.port_number)
@@ -329,3 +330,103 @@ def PitchbendRange(min, max, in_min=-8192, in_max=8191):
 def PitchbendRange(down, up, range):
     return PitchbendRange(int(float(down)/range*8192),
                           int(float(up)/range*8191))
+
+
+# event types and the range of values covered by the table, for each
+# attribute ValueMap() can change
+_VALUE_MAP_ATTRIBUTES = {
+    'velocity':     (_constants.NOTEON, 0, 128),
+    'value':        (_constants.CTRL | _constants.AFTERTOUCH |
+                     _constants.POLY_AFTERTOUCH, 0, 128),
+    'pitchbend':    (_constants.PITCHBEND, -8192, 8192),
+}
+
+
+def _lookup_table(mapping, lower, upper):
+    """
+    Return a list containing the mapped value for each value from lower to
+    upper - 1. Values not covered by mapping are mapped to themselves.
+    """
+    if isinstance(mapping, dict):
+        table = [mapping.get(n, n) for n in range(lower, upper)]
+    else:
+        table = list(mapping)
+        if len(table) > upper - lower:
+            raise ValueError("table has more than %d entries" %
+                             (upper - lower))
+        table += range(lower + len(table), upper)
+    return table
+
+
+def _table_value(value):
+    if not isinstance(value, (int, float)):
+        raise TypeError("table entries must be numbers")
+    return int(round(value))
+
+
+@_unitrepr.accept(_arguments.either(dict, [None]))
+def NoteMap(mapping):
+    """
+    NoteMap(mapping)
+
+    Change the note number of note events (and polyphonic aftertouch) by
+    looking it up in a table, which is computed once when the unit is
+    created.
+
+    The *mapping* can be a sequence of up to 128 note numbers, indexed by
+    the incoming note number, or a dictionary mapping note numbers to note
+    numbers.
+    Notes not covered by a sequence or dictionary are left unchanged.
+    If the resulting note number is ``None``, the event is discarded.
+    """
+    table = _lookup_table(mapping, 0, 128)
+    table = [-1 if n is None else max(_table_value(n), -1) for n in table]
+    return _Unit(_mididings.NoteMap(table))
+
+
+@_unitrepr.accept(tuple(_VALUE_MAP_ATTRIBUTES.keys()),
+                  _arguments.either(dict, [None]))
+def ValueMap(attr, mapping):
+    """
+    ValueMap(attr, mapping)
+
+    Change an event attribute by looking up its value in a table, which is
+    computed once when the unit is created.
+
+    :param attr:
+        The attribute to change, one of:
+
+        - ``'velocity'``: the velocity of note-on events, from 1 to 127.
+          Note-ons with a velocity of 0 are left unchanged.
+        - ``'value'``: the value of control change and aftertouch events,
+          from 0 to 127.
+        - ``'pitchbend'``: the value of pitch bend events, from -8192 to
+          8191.
+
+    :param mapping:
+        A sequence of values, indexed by the incoming value (starting at
+        -8192 for pitch bend), or a dictionary mapping values to values.
+        Values not covered by a sequence or dictionary are left unchanged.
+        Non-integer values are rounded.
+    """
+    types, lower, upper = _VALUE_MAP_ATTRIBUTES[attr]
+    table = [_table_value(v) for v in _lookup_table(mapping, lower, upper)]
+    if attr == 'velocity':
+        table[0] = 0
+    return _Unit(_mididings.ValueMap(types, table, lower))
+
+
+@_unitrepr.accept(str)
+def Transform(expression):
+    """
+    Transform(expression)
+
+    Modify events by assigning to their attributes. The *expression* is a
+    string containing one or more assignments, separated by semicolons or
+    newlines, which is compiled to native code rather than calling Python
+    for each event.
+    Only events that have all of the attributes used are modified, all other
+    events are left unchanged.
+    See :ref:`expressions` for the supported syntax.
+    """
+    return _Unit(_expression.compile_transform(expression))
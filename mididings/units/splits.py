@@ -10,37 +10,191 @@
 # (at your option) any later version.
 #
 
-from mididings.units.base import Chain, Fork, _UNIT_TYPES
+import _mididings
+
+from mididings.units.base import Chain, Fork, _Fork, _UNIT_TYPES
 from mididings.units.filters import (
         PortFilter, ChannelFilter, KeyFilter, VelocityFilter,
         CtrlFilter, CtrlValueFilter, ProgramFilter, SysExFilter)
 
+import mididings.constants as _constants
 import mididings.overload as _overload
 import mididings.arguments as _arguments
 import mididings.util as _util
+import mididings.misc as _misc
 
 
-def _make_split(t, d, unpack=False):
+class _Dispatch(object):
+    """
+    Describes how the filters used by a split select events, so that the
+    split can be built as a single lookup table instead of a fork of filters.
+
+    key:        the event attribute to look up, a Patch.SplitKey value
+    types:      the event types the filters act on
+    pass_other: whether events of other types pass the filters
+    values:     function returning the attribute values matched by a key
+    ranges:     if true, keys are (lower, upper) tuples instead, with 0
+                meaning unbounded
+    unbounded:  whether a range with neither bound set matches all values
+    """
+    def __init__(self, key, types, pass_other, values=None, ranges=False,
+                 unbounded=True):
+        self.key = key
+        self.types = types
+        self.pass_other = pass_other
+        self.values = values
+        self.ranges = ranges
+        self.unbounded = unbounded
+
+    def _matcher(self, k):
+        """
+        Return a predicate for the given key, and a limit beyond which all
+        values are treated the same.
+        """
+        if self.ranges:
+            lower, upper = k
+            if not (lower or upper or self.unbounded):
+                return (lambda v: False), 0
+            return (lambda v: ((v >= lower or lower == 0) and
+                               (v < upper or upper == 0)),
+                    max(lower, upper))
+        else:
+            values = set(self.values(k))
+            return (lambda v: v in values), max([0] + [v + 1 for v in values])
+
+    def build_table(self, keys, has_else):
+        """
+        Return a list of branch indices for each attribute value (with
+        additional entries for values below/beyond the table's range),
+        and a list of branch indices for events of other types.
+        """
+        matchers = [self._matcher(k) for k in keys]
+        size = max([0] + [limit for match, limit in matchers])
+        else_branch = [len(keys)] if has_else else []
+
+        table = []
+        for value in range(-1, size + 1):
+            r = [n for n, (match, limit) in enumerate(matchers) if match(value)]
+            table.append(r or else_branch)
+
+        if self.pass_other:
+            other = list(range(len(keys))) + else_branch
+        elif not keys:
+            # an else-rule without any inverted filters lets everything pass
+            other = else_branch
+        else:
+            other = []
+
+        return table, other
+
+
+class _SplitFork(_Fork):
+    """
+    The fork of filters built by a split. Additionally keeps the split's keys
+    and patches, so Patch.build() can turn it into a native split module.
+    """
+    def __init__(self, dispatch, keys, filters, else_filter, patches):
+        units = [f >> w for f, w in zip(filters, patches)]
+        if else_filter is not None:
+            units.append(else_filter >> patches[-1])
+        _Fork.__init__(self, units)
+
+        self.dispatch = dispatch
+        self.keys = keys
+        self.filters = filters
+        self.else_filter = else_filter
+        self.patches = patches
+        self.has_else = else_filter is not None
+        self._units = units
+
+    def unmodified(self):
+        """
+        Return whether the fork still contains exactly the units it was built
+        from.
+        """
+        return (len(self) == len(self._units) and
+                all(a is b for a, b in zip(self, self._units)))
+
+    def with_patches(self, patches):
+        """
+        Return a copy of this split with its patches replaced.
+        """
+        return _SplitFork(self.dispatch, self.keys, self.filters,
+                          self.else_filter, patches)
+
+
+def _actual_values(k):
+    return [_util.actual(x) for x in k]
+
+
+def _type_bits(k):
+    mask = 0
+    for t in _misc.flatten(k):
+        mask |= int(t)
+    return [n for n in range(30) if mask & (1 << n)]
+
+
+_SplitKey = _mididings.Patch.SplitKey
+
+_PORT_DISPATCH = _Dispatch(_SplitKey.PORT, _constants.ANY, False,
+                           values=_actual_values)
+_CHANNEL_DISPATCH = _Dispatch(_SplitKey.CHANNEL,
+                              ~(_constants.SYSTEM | _constants.DUMMY), False,
+                              values=_actual_values)
+_KEY_DISPATCH = _Dispatch(_SplitKey.DATA1,
+                          _constants.NOTE | _constants.POLY_AFTERTOUCH, True,
+                          ranges=True, unbounded=False)
+_VELOCITY_DISPATCH = _Dispatch(_SplitKey.DATA2, _constants.NOTEON, True,
+                               ranges=True)
+_CTRL_DISPATCH = _Dispatch(_SplitKey.DATA1, _constants.CTRL, False,
+                           values=list)
+_CTRL_VALUE_DISPATCH = _Dispatch(_SplitKey.DATA2, _constants.CTRL, False,
+                                 ranges=True)
+_PROGRAM_DISPATCH = _Dispatch(_SplitKey.DATA2, _constants.PROGRAM, False,
+                              values=_actual_values)
+_TYPE_DISPATCH = _Dispatch(_SplitKey.TYPE, _constants.ANY, False,
+                           values=_type_bits)
+
+
+def _make_split(t, d, unpack=False, dispatch=None):
     if unpack:
         # if dictionary key is a tuple, unpack and pass as individual
         # parameters to ctor
         t = lambda p, t=t: t(*(p if isinstance(p, tuple) else (p,)))
 
-    # build dict with all items from d, except d[None]
-    dd = dict((k, v) for k, v in d.items() if k is not None)
+    # build list with all items from d, except d[None]
+    items = [(k, v) for k, v in d.items() if k is not None]
+
+    # filters for all normal items
+    filters = [t(k) for k, w in items]
+    patches = [w for k, w in items]
+
+    # filter for the else-rule, if any
+    else_filter = None
+    if None in d:
+        else_filter = Chain(~t(k) for k, w in items)
+        patches.append(d[None])
+
+    if dispatch is not None:
+        return _SplitFork(dispatch, [k for k, w in items],
+                          filters, else_filter, patches)
 
     # build fork from all normal items
-    r = Fork((t(k) >> w) for k, w in dd.items())
+    r = [(f >> w) for f, w in zip(filters, patches)]
 
     # add else-rule, if any
-    if None in d:
-        f = Chain(~t(k) for k in dd.keys())
-        r.append(f >> d[None])
+    if else_filter is not None:
+        r.append(else_filter >> d[None])
+
+    return Fork(r)
 
-    return r
 
+def _make_threshold(f, patch_lower, patch_upper, dispatch=None,
+                    threshold=None):
+    if dispatch is not None:
+        return _SplitFork(dispatch, [(0, threshold)], [f], ~f,
+                          [patch_lower, patch_upper])
 
-def _make_threshold(f, patch_lower, patch_upper):
     return Fork([
         f >> patch_lower,
         ~f >> patch_upper,
@@ -59,7 +213,8 @@ def PortSplit(mapping):
     Split events by input port, with *mapping* being a dictionary of the form
     ``{ports: patch, ...}``.
     """
-    return _make_split(PortFilter, mapping)
+    return _make_split(PortFilter, mapping,
+                       dispatch=_PORT_DISPATCH)
 
 
 @_arguments.accept({
@@ -73,7 +228,8 @@ def ChannelSplit(mapping):
     Split events by input channel, with *mapping* being a dictionary of
     the form ``{channels: patch, ...}``.
     """
-    return _make_split(ChannelFilter, mapping)
+    return _make_split(ChannelFilter, mapping,
+                       dispatch=_CHANNEL_DISPATCH)
 
 
 @_overload.mark(
@@ -91,12 +247,14 @@ def ChannelSplit(mapping):
 @_arguments.accept(_util.note_limit, _UNIT_TYPES, _UNIT_TYPES)
 def KeySplit(threshold, patch_lower, patch_upper):
     return _make_threshold(KeyFilter(0, threshold),
-                           patch_lower, patch_upper)
+                           patch_lower, patch_upper,
+                           dispatch=_KEY_DISPATCH, threshold=threshold)
 
 @_overload.mark
 @_arguments.accept({_arguments.nullable(_util.note_range): _UNIT_TYPES})
 def KeySplit(mapping):
-    return _make_split(KeyFilter, mapping)
+    return _make_split(KeyFilter, mapping,
+                       dispatch=_KEY_DISPATCH)
 
 
 @_overload.mark(
@@ -114,12 +272,14 @@ def KeySplit(mapping):
 @_arguments.accept(_util.velocity_limit, _UNIT_TYPES, _UNIT_TYPES)
 def VelocitySplit(threshold, patch_lower, patch_upper):
     return _make_threshold(VelocityFilter(0, threshold),
-                           patch_lower, patch_upper)
+                           patch_lower, patch_upper,
+                           dispatch=_VELOCITY_DISPATCH, threshold=threshold)
 
 @_overload.mark
 @_arguments.accept({_arguments.nullable(_util.velocity_range): _UNIT_TYPES})
 def VelocitySplit(mapping):
-    return _make_split(VelocityFilter, mapping, unpack=True)
+    return _make_split(VelocityFilter, mapping, unpack=True,
+                       dispatch=_VELOCITY_DISPATCH)
 
 
 @_arguments.accept({
@@ -134,7 +294,8 @@ def CtrlSplit(mapping):
     the form ``{ctrls: patch, ...}``.
     Non-control-change events are discarded.
     """
-    return _make_split(CtrlFilter, mapping)
+    return _make_split(CtrlFilter, mapping,
+                       dispatch=_CTRL_DISPATCH)
 
 
 @_overload.mark(
@@ -156,12 +317,14 @@ def CtrlSplit(mapping):
 @_arguments.accept(_util.ctrl_limit, _UNIT_TYPES, _UNIT_TYPES)
 def CtrlValueSplit(threshold, patch_lower, patch_upper):
     return _make_threshold(CtrlValueFilter(0, threshold),
-                           patch_lower, patch_upper)
+                           patch_lower, patch_upper,
+                           dispatch=_CTRL_VALUE_DISPATCH, threshold=threshold)
 
 @_overload.mark
 @_arguments.accept({_arguments.nullable(_util.ctrl_range): _UNIT_TYPES})
 def CtrlValueSplit(mapping):
-    return _make_split(CtrlValueFilter, mapping, unpack=True)
+    return _make_split(CtrlValueFilter, mapping, unpack=True,
+                       dispatch=_CTRL_VALUE_DISPATCH)
 
 
 @_arguments.accept({
@@ -176,7 +339,8 @@ def ProgramSplit(mapping):
     form ``{programs: patch, ...}``.
     Non-program-change events are discarded.
     """
-    return _make_split(ProgramFilter, mapping)
+    return _make_split(ProgramFilter, mapping,
+                       dispatch=_PROGRAM_DISPATCH)
 
 
 @_overload.mark(
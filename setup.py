@@ -29,6 +29,7 @@ config = {
     'jack-midi':    True,
     'c++11':        False,
     'debug':        True,
+    'benchmark':    False,
 }
 
 include_dirs = []
@@ -50,6 +51,10 @@ for opt in config.keys():
             sys.argv.remove(arg)
             config[opt] = False
 
+# the engine's cycle timing uses std::chrono
+if config['benchmark']:
+    config['c++11'] = True
+
 
 # hack to modify the compiler flags from the distutils default
 distutils_customize_compiler = sysconfig.customize_compiler
@@ -142,8 +147,11 @@ sources = [
     'src/patch.cc',
     'src/python_caller.cc',
     'src/send_midi.cc',
+    'src/smf.cc',
+    'src/sysex_pool.cc',
     'src/python_module.cc',
     'src/backend/base.cc',
+    'src/backend/sysex_transmitter.cc',
 ]
 
 include_dirs.append('src')
@@ -169,6 +177,10 @@ if config['jack-midi']:
                     'src/backend/jack_realtime.cc'])
     pkgconfig('jack')
 
+if config['benchmark']:
+    define_macros.append(('ENABLE_BENCHMARK', 1))
+    sources.append('src/benchmark.cc')
+
 if config['c++11']:
     extra_compile_args.append('-std=c++0x')
 else:
@@ -12,14 +12,16 @@
 #include "config.hh"
 #include "backend/alsa.hh"
 #include "midi_event.hh"
+#include "sysex_pool.hh"
 
 #include <alsa/asoundlib.h>
 
 #include <iostream>
-#include <unistd.h>
+#include <cerrno>
 
 #include <boost/foreach.hpp>
 #include <boost/lexical_cast.hpp>
+#include <boost/bind.hpp>
 
 #include "util/string.hh"
 #include "util/debug.hh"
@@ -32,7 +34,10 @@ namespace backend {
 ALSABackend::ALSABackend(
         std::string const & client_name,
         PortNameVector const & in_port_names,
-        PortNameVector const & out_port_names)
+        PortNameVector const & out_port_names,
+        bool batched)
+  : _batched(batched)
+  , _quit(false)
 {
     ASSERT(!client_name.empty());
 
@@ -43,6 +48,13 @@ ALSABackend::ALSABackend(
 
     snd_seq_set_client_name(_seq, client_name.c_str());
 
+    if (snd_seq_open(&_self_seq, "hw", SND_SEQ_OPEN_OUTPUT, 0) < 0) {
+        snd_seq_close(_seq);
+        throw Error("error opening alsa sequencer");
+    }
+
+    snd_seq_set_client_name(_self_seq, (client_name + "-wakeup").c_str());
+
     // create input ports
     BOOST_FOREACH (std::string const & port_name, in_port_names) {
         int id = snd_seq_create_simple_port(_seq, port_name.c_str(),
@@ -76,6 +88,26 @@ ALSABackend::ALSABackend(
         _out_ports.push_back(id);
     }
 
+    // one sysex buffer per input port
+    _sysex_buffer.resize(_in_ports.size());
+
+    _sysex_transmitter.reset(new SysExTransmitter(
+            _out_ports.size(), config::ALSA_SYSEX_CHUNK_SIZE,
+            config::ALSA_SYSEX_RATE,
+            boost::bind(&ALSABackend::send_sysex_chunk, this, _1, _2, _3)));
+
+    if (_batched) {
+        // make room for entire bursts of events in both directions
+        std::size_t size = config::ALSA_BATCH_BUFFER_EVENTS
+                                * sizeof(snd_seq_event_t);
+        snd_seq_set_input_buffer_size(_seq, size);
+        snd_seq_set_output_buffer_size(_seq, size);
+
+        int count = snd_seq_poll_descriptors_count(_seq, POLLIN);
+        _poll_fds.resize(count);
+        snd_seq_poll_descriptors(_seq, &_poll_fds[0], count, POLLIN);
+    }
+
     // initialize MIDI event parser.
     // we don't use the parser for sysex, so a 12 byte buffer will do
     if (snd_midi_event_new(12, &_parser)) {
@@ -88,6 +120,9 @@ ALSABackend::ALSABackend(
 
 ALSABackend::~ALSABackend()
 {
+    // stop sending sysex before the ports are gone
+    _sysex_transmitter.reset();
+
     snd_midi_event_free(_parser);
 
     BOOST_FOREACH (int i, _in_ports) {
@@ -98,6 +133,7 @@ ALSABackend::~ALSABackend()
         snd_seq_delete_port(_seq, i);
     }
 
+    snd_seq_close(_self_seq);
     snd_seq_close(_seq);
 }
 
@@ -292,15 +328,8 @@ void ALSABackend::start(InitFunction init, CycleFunction cycle)
 void ALSABackend::stop()
 {
     if (_thread) {
-        // send event to ourselves to make snd_seq_event_input() return
-        snd_seq_event_t ev;
-        snd_seq_ev_clear(&ev);
-
-        snd_seq_ev_set_direct(&ev);
-        ev.type = SND_SEQ_EVENT_USR0;
-        ev.dest.client = snd_seq_client_id(_seq);
-        ev.dest.port = _in_ports[0];
-        snd_seq_event_output_direct(_seq, &ev);
+        // makes the processing thread quit
+        send_to_self(SND_SEQ_EVENT_USR0);
 
         // wait for event processing thread to terminate
         _thread->join();
@@ -308,6 +337,28 @@ void ALSABackend::stop()
 }
 
 
+void ALSABackend::wakeup()
+{
+    send_to_self(SND_SEQ_EVENT_USR1);
+}
+
+
+void ALSABackend::send_to_self(snd_seq_event_type_t type)
+{
+    // send event to ourselves to make snd_seq_event_input() return
+    snd_seq_event_t ev;
+    snd_seq_ev_clear(&ev);
+
+    snd_seq_ev_set_direct(&ev);
+    ev.type = type;
+    ev.dest.client = snd_seq_client_id(_seq);
+    ev.dest.port = _in_ports[0];
+
+    boost::mutex::scoped_lock lock(_self_mutex);
+    snd_seq_event_output_direct(_self_seq, &ev);
+}
+
+
 void ALSABackend::process_thread(InitFunction init, CycleFunction cycle)
 {
     init();
@@ -400,16 +451,15 @@ void ALSABackend::alsa_to_midi_event_sysex(
     unsigned char *ptr = static_cast<unsigned char *>(alsa_ev.data.ext.ptr);
     std::size_t len = alsa_ev.data.ext.len;
 
+    SysExDataPtr & buffer = _sysex_buffer[ev.port];
+
     if (ptr[0] == 0xf0) {
-        // new sysex started, insert into buffer
-        _sysex_buffer.erase(ev.port);
-        _sysex_buffer.insert(std::make_pair(ev.port,
-                                SysExDataPtr(new SysExData(ptr, ptr + len))));
+        // new sysex started, replace buffer
+        buffer = sysex_pool::create(ptr, ptr + len);
     }
-    else if (_sysex_buffer.find(ev.port) != _sysex_buffer.end()) {
+    else if (buffer) {
         // previous sysex continued, append to buffer
-        _sysex_buffer[ev.port]->insert(_sysex_buffer[ev.port]->end(),
-                                       ptr, ptr + len);
+        sysex_pool::append(buffer, ptr, ptr + len);
     }
     else {
         // sysex didn't start with 0xf0, ignore it
@@ -417,15 +467,15 @@ void ALSABackend::alsa_to_midi_event_sysex(
         return;
     }
 
-    if (_sysex_buffer[ev.port]->back() == 0xf7) {
+    if (buffer->back() == 0xf7) {
         // end of sysex, assign complete event
         ev.type = MIDI_EVENT_SYSEX;
         ev.channel = 0;
         ev.data1 = 0;
         ev.data2 = 0;
-        ev.sysex = _sysex_buffer[ev.port];
-        // delete from buffer
-        _sysex_buffer.erase(ev.port);
+        ev.sysex = buffer;
+        // remove from buffer
+        buffer.reset();
     } else {
         // sysex still incomplete
         ev.type = MIDI_EVENT_NONE;
@@ -449,9 +499,10 @@ void ALSABackend::alsa_to_midi_event_generic(
 
 void ALSABackend::midi_event_to_alsa(
         snd_seq_event_t & alsa_ev,
-        MidiEvent const & ev, std::size_t & count)
+        MidiEvent const & ev)
 {
     ASSERT(ev.type != MIDI_EVENT_NONE);
+    ASSERT(ev.type != MIDI_EVENT_SYSEX);
     ASSERT((uint)ev.port < _out_ports.size());
     if (ev.type != MIDI_EVENT_PITCHBEND) {
         ASSERT(ev.data1 >= 0x0 && ev.data1 <= 0x7f);
@@ -491,10 +542,6 @@ void ALSABackend::midi_event_to_alsa(
         snd_seq_ev_set_pgmchange(&alsa_ev, ev.channel, ev.ctrl.value);
         break;
 
-      case MIDI_EVENT_SYSEX:
-        midi_event_to_alsa_sysex(alsa_ev, ev, count);
-        break;
-
       default:
         // use generic encoder for other event types
         midi_event_to_alsa_generic(alsa_ev, ev);
@@ -503,29 +550,6 @@ void ALSABackend::midi_event_to_alsa(
 }
 
 
-void ALSABackend::midi_event_to_alsa_sysex(
-        snd_seq_event_t & alsa_ev,
-        MidiEvent const & ev, std::size_t & count)
-{
-    unsigned char const * data = &ev.sysex->front();
-    std::size_t size = ev.sysex->size();
-
-    // number of bytes that will be sent in this chunk
-    std::size_t len = std::min(size - count, config::ALSA_SYSEX_CHUNK_SIZE);
-
-    // let's hope the alsa guys just "forgot" that little const keyword...
-    snd_seq_ev_set_sysex(&alsa_ev, len,
-                const_cast<void *>(static_cast<void const *>(data + count)));
-
-    count += len;
-
-    if (count >= size) {
-        // done, this was the last chunk
-        count = 0;
-    }
-}
-
-
 void ALSABackend::midi_event_to_alsa_generic(
         snd_seq_event_t & alsa_ev, MidiEvent const & ev)
 {
@@ -542,12 +566,39 @@ void ALSABackend::midi_event_to_alsa_generic(
 }
 
 
-bool ALSABackend::input_event(MidiEvent & ev)
+bool ALSABackend::input_available(bool block)
+{
+    if (!_batched) {
+        // snd_seq_event_input() blocks until input is available
+        return block || snd_seq_event_input_pending(_seq, 0) > 0;
+    }
+
+    if (snd_seq_event_input_pending(_seq, 0) > 0) {
+        // events left over from the last read
+        return true;
+    }
+
+    // wait for input, then read all pending events with a single syscall
+    if (::poll(&_poll_fds[0], _poll_fds.size(), block ? -1 : 0) <= 0) {
+        return false;
+    }
+    return snd_seq_event_input_pending(_seq, 1) > 0;
+}
+
+
+bool ALSABackend::read_event(MidiEvent & ev, bool block)
 {
     snd_seq_event_t *alsa_ev;
 
     // loop until we've received an event we're interested in
-    for (;;) {
+    while (!_quit) {
+        if (!input_available(block)) {
+            if (block) {
+                continue;
+            }
+            return false;
+        }
+
         if (snd_seq_event_input(_seq, &alsa_ev) < 0 || !alsa_ev) {
             DEBUG_PRINT("couldn't retrieve ALSA sequencer event");
             continue;
@@ -555,7 +606,19 @@ bool ALSABackend::input_event(MidiEvent & ev)
 
         // check for program termination
         if (alsa_ev->type == SND_SEQ_EVENT_USR0) {
-            return false;
+            _quit = true;
+            break;
+        }
+
+        // check for wakeup from another thread
+        if (alsa_ev->type == SND_SEQ_EVENT_USR1) {
+            if (block) {
+                ev.type = MIDI_EVENT_NONE;
+                return true;
+            }
+            // when polling, the engine handles requests after each event
+            // anyway
+            continue;
         }
 
         // convert event from alsa
@@ -565,35 +628,123 @@ bool ALSABackend::input_event(MidiEvent & ev)
             return true;
         }
     }
+
+    return false;
 }
 
 
-void ALSABackend::output_event(MidiEvent const & ev)
+bool ALSABackend::input_event(MidiEvent & ev)
 {
-    snd_seq_event_t alsa_ev;
+    return read_event(ev, true);
+}
 
-    // number of bytes already sent (for sysex), or zero if the whole event
-    // was sent
-    std::size_t count = 0;
 
-    do {
-        midi_event_to_alsa(alsa_ev, ev, count);
+bool ALSABackend::poll_input_event(MidiEvent & ev)
+{
+    return read_event(ev, false);
+}
+
 
-        snd_seq_ev_set_subs(&alsa_ev);
-        snd_seq_ev_set_direct(&alsa_ev);
-        snd_seq_ev_set_source(&alsa_ev, _out_ports[ev.port]);
+void ALSABackend::write_event(snd_seq_event_t & alsa_ev)
+{
+    boost::mutex::scoped_lock lock(_output_mutex);
 
+    if (!_batched) {
         if (snd_seq_event_output_direct(_seq, &alsa_ev) < 0) {
-            DEBUG_PRINT("couldn't output event to ALSA sequencer buffer");
+            DEBUG_PRINT("couldn't output event to ALSA sequencer");
         }
+        return;
+    }
 
-        if (count) {
-            // wait as long as it takes for one chunk to be transmitted at
-            // MIDI baud rate.
-            // constant copied from Simple Sysexxer by Christoph Eckert.
-            ::usleep(config::ALSA_SYSEX_CHUNK_SIZE * 352);
+    int err;
+
+    // if the output buffer is full, send what's already in there first
+    while ((err = snd_seq_event_output_buffer(_seq, &alsa_ev)) == -EAGAIN) {
+        if (snd_seq_drain_output(_seq) < 0) {
+            break;
         }
-    } while (count);
+    }
+
+    if (err < 0) {
+        DEBUG_PRINT("couldn't output event to ALSA sequencer buffer");
+    }
+}
+
+
+void ALSABackend::output_event(MidiEvent const & ev)
+{
+    if (ev.type == MIDI_EVENT_SYSEX) {
+        // sent in chunks from a separate thread, so that other events don't
+        // have to wait
+        ASSERT((uint)ev.port < _out_ports.size());
+        _sysex_transmitter->send(ev.port, ev.sysex);
+        return;
+    }
+
+    snd_seq_event_t alsa_ev;
+
+    midi_event_to_alsa(alsa_ev, ev);
+
+    snd_seq_ev_set_subs(&alsa_ev);
+    snd_seq_ev_set_direct(&alsa_ev);
+    snd_seq_ev_set_source(&alsa_ev, _out_ports[ev.port]);
+
+    write_event(alsa_ev);
+}
+
+
+void ALSABackend::send_sysex_chunk(int port, unsigned char const *data,
+                                   std::size_t len)
+{
+    // called from the sysex transmitter's thread. the chunk is always
+    // written directly, as the output buffer belongs to the processing
+    // thread. other threads may be writing to _seq at the same time
+    snd_seq_event_t alsa_ev;
+    snd_seq_ev_clear(&alsa_ev);
+
+    // let's hope the alsa guys just "forgot" that little const keyword...
+    snd_seq_ev_set_sysex(&alsa_ev, len,
+                const_cast<void *>(static_cast<void const *>(data)));
+
+    snd_seq_ev_set_subs(&alsa_ev);
+    snd_seq_ev_set_direct(&alsa_ev);
+    snd_seq_ev_set_source(&alsa_ev, _out_ports[port]);
+
+    boost::mutex::scoped_lock lock(_output_mutex);
+
+    if (snd_seq_event_output_direct(_seq, &alsa_ev) < 0) {
+        DEBUG_PRINT("couldn't output sysex to ALSA sequencer");
+    }
+}
+
+
+void ALSABackend::flush_output()
+{
+    if (!_batched) {
+        return;
+    }
+
+    boost::mutex::scoped_lock lock(_output_mutex);
+
+    if (snd_seq_drain_output(_seq) < 0) {
+        DEBUG_PRINT("couldn't drain ALSA sequencer output");
+    }
+}
+
+
+void ALSABackend::finish()
+{
+    flush_output();
+    _sysex_transmitter->wait();
+}
+
+
+void ALSABackend::set_sysex_rate(std::size_t port, double rate)
+{
+    if (port >= _out_ports.size()) {
+        throw std::out_of_range("invalid output port");
+    }
+    _sysex_transmitter->set_rate(port, rate);
 }
 
 
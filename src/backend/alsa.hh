@@ -13,14 +13,17 @@
 #define MIDIDINGS_BACKEND_ALSA_HH
 
 #include "backend/base.hh"
+#include "backend/sysex_transmitter.hh"
 
 #include <alsa/asoundlib.h>
+#include <poll.h>
 
 #include <string>
 #include <vector>
 #include <map>
 #include <boost/scoped_ptr.hpp>
 #include <boost/thread/thread.hpp>
+#include <boost/thread/mutex.hpp>
 
 
 namespace mididings {
@@ -31,19 +34,32 @@ class ALSABackend
   : public BackendBase
 {
   public:
+    /**
+     * In batched mode, all events pending in the sequencer are read with a
+     * single syscall, and output events are buffered until flush_output()
+     * is called, instead of writing each event separately.
+     */
     ALSABackend(std::string const & client_name,
                 PortNameVector const & in_port_names,
-                PortNameVector const & out_port_names);
+                PortNameVector const & out_port_names,
+                bool batched = false);
     virtual ~ALSABackend();
 
     virtual void start(InitFunction init, CycleFunction cycle);
     virtual void stop();
 
     virtual bool input_event(MidiEvent & ev);
+    virtual bool poll_input_event(MidiEvent & ev);
+    virtual void wakeup();
     virtual void output_event(MidiEvent const & ev);
+    virtual void flush_output();
+
+    virtual void finish();
 
-    virtual void finish() {
-        // nothing to do
+    virtual void set_sysex_rate(std::size_t port, double rate);
+
+    virtual std::size_t num_in_ports() const {
+        return _in_ports.size();
     }
 
     virtual std::size_t num_out_ports() const {
@@ -102,6 +118,11 @@ class ALSABackend
     ClientPortInfoVector get_external_ports(bool out);
 
     void process_thread(InitFunction init, CycleFunction cycle);
+    void send_to_self(snd_seq_event_type_t type);
+
+    bool input_available(bool block);
+    bool read_event(MidiEvent & ev, bool block);
+    void write_event(snd_seq_event_t & alsa_ev);
 
     void alsa_to_midi_event(MidiEvent & ev,
                             snd_seq_event_t const & alsa_ev);
@@ -111,13 +132,31 @@ class ALSABackend
                             snd_seq_event_t const & alsa_ev);
 
     void midi_event_to_alsa(snd_seq_event_t & alsa_ev,
-                            MidiEvent const & ev, std::size_t & count);
-    void midi_event_to_alsa_sysex(snd_seq_event_t & alsa_ev,
-                            MidiEvent const & ev, std::size_t & count);
+                            MidiEvent const & ev);
     void midi_event_to_alsa_generic(snd_seq_event_t & alsa_ev,
                             MidiEvent const & ev);
 
+    void send_sysex_chunk(int port, unsigned char const *data,
+                          std::size_t len);
+
     snd_seq_t *_seq;
+    bool const _batched;
+
+    // serializes output to _seq from the processing thread and the sysex
+    // transmitter's thread
+    boost::mutex _output_mutex;
+
+    // a separate sequencer handle, used only to send events to ourselves
+    // from threads calling wakeup() or stop(). this way these never contend
+    // with the processing thread for _output_mutex
+    snd_seq_t *_self_seq;
+    boost::mutex _self_mutex;
+
+    // set once the termination event has been received
+    bool _quit;
+
+    // file descriptors to poll for input (batched mode only)
+    std::vector<pollfd> _poll_fds;
 
     PortIdVector _in_ports;     // alsa input port IDs
     RevPortIdMap _in_ports_rev; // reverse mapping (input port ID -> port #)
@@ -126,7 +165,10 @@ class ALSABackend
     snd_midi_event_t *_parser;
 
     // per-port buffers of incoming sysex data
-    std::map<int, SysExDataPtr> _sysex_buffer;
+    std::vector<SysExDataPtr> _sysex_buffer;
+
+    // paces outgoing sysex data
+    boost::scoped_ptr<SysExTransmitter> _sysex_transmitter;
 
     boost::scoped_ptr<boost::thread> _thread;
 };
@@ -11,6 +11,7 @@
 
 #include "config.hh"
 #include "backend/base.hh"
+#include "sysex_pool.hh"
 #ifdef ENABLE_ALSA_SEQ
   #include "backend/alsa.hh"
 #endif
@@ -32,10 +33,12 @@ namespace {
     bool init_available() {
 #ifdef ENABLE_ALSA_SEQ
         AVAILABLE.push_back("alsa");
+        AVAILABLE.push_back("alsa-batched");
 #endif
 #ifdef ENABLE_JACK_MIDI
         AVAILABLE.push_back("jack");
         AVAILABLE.push_back("jack-rt");
+        AVAILABLE.push_back("jack-hybrid");
 #endif
         return false;
     }
@@ -65,6 +68,10 @@ BackendPtr create(
         return BackendPtr(
                     new ALSABackend(client_name, in_ports, out_ports));
     }
+    else if (backend_name == "alsa-batched") {
+        return BackendPtr(
+                    new ALSABackend(client_name, in_ports, out_ports, true));
+    }
 #endif
 #ifdef ENABLE_JACK_MIDI
     else if (backend_name == "jack") {
@@ -75,6 +82,11 @@ BackendPtr create(
         return BackendPtr(
                     new JACKRealtimeBackend(client_name, in_ports, out_ports));
     }
+    else if (backend_name == "jack-hybrid") {
+        return BackendPtr(
+                    new JACKRealtimeBackend(client_name, in_ports, out_ports,
+                                            true));
+    }
 #endif
     else {
         throw Error("invalid backend selected: " + backend_name);
@@ -87,9 +99,22 @@ MidiEvent buffer_to_midi_event(
         std::size_t len, int port, uint64_t frame)
 {
     MidiEvent ev;
+    buffer_to_midi_event(ev, data, len, port, frame);
+    return ev;
+}
+
 
+void buffer_to_midi_event(
+        MidiEvent & ev, unsigned char const *data,
+        std::size_t len, int port, uint64_t frame)
+{
     ev.frame = frame;
     ev.port = port;
+    ev.data1 = 0;
+    ev.data2 = 0;
+    if (ev.sysex) {
+        ev.sysex.reset();
+    }
 
     if ((data[0] & 0xf0) != 0xf0)
     {
@@ -145,8 +170,7 @@ MidiEvent buffer_to_midi_event(
         {
           case 0xf0:
             ev.type = MIDI_EVENT_SYSEX;
-            // FIXME: come up with a realtime-safe way to do this
-            ev.sysex.reset(new SysExData(data, data + len));
+            ev.sysex = sysex_pool::create(data, data + len);
             break;
           case 0xf1:
             ev.type = MIDI_EVENT_SYSCM_QFRAME;
@@ -187,8 +211,6 @@ MidiEvent buffer_to_midi_event(
             break;
         }
     }
-
-    return ev;
 }
 
 
@@ -303,5 +325,37 @@ std::size_t midi_event_to_buffer(
 }
 
 
+std::size_t midi_event_size(MidiEvent const & ev)
+{
+    switch (ev.type)
+    {
+      case MIDI_EVENT_NOTEON:
+      case MIDI_EVENT_NOTEOFF:
+      case MIDI_EVENT_CTRL:
+      case MIDI_EVENT_PITCHBEND:
+      case MIDI_EVENT_POLY_AFTERTOUCH:
+      case MIDI_EVENT_SYSCM_SONGPOS:
+        return 3;
+      case MIDI_EVENT_AFTERTOUCH:
+      case MIDI_EVENT_PROGRAM:
+      case MIDI_EVENT_SYSCM_QFRAME:
+      case MIDI_EVENT_SYSCM_SONGSEL:
+        return 2;
+      case MIDI_EVENT_SYSCM_TUNEREQ:
+      case MIDI_EVENT_SYSRT_CLOCK:
+      case MIDI_EVENT_SYSRT_START:
+      case MIDI_EVENT_SYSRT_CONTINUE:
+      case MIDI_EVENT_SYSRT_STOP:
+      case MIDI_EVENT_SYSRT_SENSING:
+      case MIDI_EVENT_SYSRT_RESET:
+        return 1;
+      case MIDI_EVENT_SYSEX:
+        return ev.sysex->size();
+      default:
+        return 0;
+    }
+}
+
+
 } // backend
 } // mididings
@@ -57,12 +57,21 @@ MidiEvent buffer_to_midi_event(
         unsigned char const *data, std::size_t len,
         int port, uint64_t frame);
 
+// same as above, overwriting an existing MidiEvent
+void buffer_to_midi_event(
+        MidiEvent & ev, unsigned char const *data, std::size_t len,
+        int port, uint64_t frame);
+
 // convert MidiEvent object to normalized MIDI data
 std::size_t midi_event_to_buffer(
         MidiEvent const & ev, unsigned char *data,
         std::size_t & len, int & port,
         uint64_t & frame);
 
+// the number of bytes midi_event_to_buffer() needs for the given event,
+// or 0 if the event can't be converted
+std::size_t midi_event_size(MidiEvent const & ev);
+
 
 
 class BackendBase
@@ -72,6 +81,15 @@ class BackendBase
     typedef boost::function<void()> InitFunction;
     typedef boost::function<void()> CycleFunction;
 
+    struct InputStats {
+        // number of periods in which input events were received
+        std::size_t periods;
+        // number of input events received
+        std::size_t events;
+        // number of times the processing thread was woken up to read input
+        std::size_t wakeups;
+    };
+
     BackendBase() { }
     virtual ~BackendBase() { }
 
@@ -89,6 +107,28 @@ class BackendBase
     // depending on the backend, this may block until an event is available.
     virtual bool input_event(MidiEvent & ev) = 0;
 
+    // get one event from input if one is immediately available, without
+    // ever blocking. return false if there are no more pending events.
+    // backends that can't tell simply never return any events here.
+    virtual bool poll_input_event(MidiEvent & /*ev*/) {
+        return false;
+    }
+
+    // make a blocking input_event() return as soon as possible, with an
+    // event of type MIDI_EVENT_NONE. this allows the engine to act on
+    // requests from other threads. not needed for backends that call the
+    // cycle function periodically.
+    virtual void wakeup() { }
+
+    // return true if events are processed in a realtime thread, which must
+    // never block.
+    virtual bool realtime() const { return false; }
+
+    // return true if events are processed in a realtime thread, except for
+    // those that need to pass through Python code, which the engine should
+    // process in a separate thread.
+    virtual bool hybrid() const { return false; }
+
     // send one event to the output.
     virtual void output_event(MidiEvent const & ev) = 0;
 
@@ -100,9 +140,29 @@ class BackendBase
         }
     }
 
+    // actually send all events passed to output_event() so far. called by
+    // the engine after each batch of events, for backends that buffer
+    // their output.
+    virtual void flush_output() { }
+
     // wait for all pending event output to be completed.
     virtual void finish() = 0;
 
+    // set the maximum number of SysEx bytes per second sent on the given
+    // output port, or zero for no limit. backends that don't need to pace
+    // their SysEx output ignore this.
+    virtual void set_sysex_rate(std::size_t /*port*/, double /*rate*/) { }
+
+    // return statistics about how input events are handed to the
+    // processing thread. backends that don't receive input in a separate
+    // thread return all zeros.
+    virtual InputStats input_stats() const {
+        return InputStats();
+    }
+
+    // return the number of input ports
+    virtual std::size_t num_in_ports() const = 0;
+
     // return the number of output ports
     virtual std::size_t num_out_ports() const = 0;
 };
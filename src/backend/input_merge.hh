@@ -0,0 +1,140 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_BACKEND_INPUT_MERGE_HH
+#define MIDIDINGS_BACKEND_INPUT_MERGE_HH
+
+#include <vector>
+#include <algorithm>
+#include <cstddef>
+
+#include <boost/cstdint.hpp>
+
+
+namespace mididings {
+namespace backend {
+
+
+/*
+ * raw MIDI data of one input event, still in the backend's buffer.
+ */
+struct RawMidiEvent
+{
+    // frame relative to the start of the current period
+    uint32_t time;
+    unsigned char const *data;
+    std::size_t size;
+};
+
+
+/*
+ * merges the events from several input ports, each of which is already
+ * sorted by time, into a single stream. events are only read from the
+ * ports' buffers as they're needed, and nothing is copied.
+ *
+ * Buffer is a handle to one port's buffer, with the member functions
+ *   std::size_t size() const
+ *   void get(std::size_t n, RawMidiEvent & ev) const
+ */
+template <typename Buffer>
+class InputMerge
+{
+  public:
+    InputMerge(std::size_t num_ports)
+      : _cursors(num_ports)
+      , _later(_cursors)
+    {
+        _active.reserve(num_ports);
+    }
+
+    // starts reading from new buffers
+    void clear() {
+        _active.clear();
+    }
+
+    void add(std::size_t port, Buffer const & buffer)
+    {
+        Cursor & c = _cursors[port];
+        c.buffer = buffer;
+        c.index = 0;
+        c.count = buffer.size();
+
+        if (c.count) {
+            c.buffer.get(0, c.next);
+            _active.push_back(port);
+            std::push_heap(_active.begin(), _active.end(), _later);
+        }
+    }
+
+    // returns the earliest remaining event, and the port it came from.
+    // events at the same time are returned in order of their port number
+    bool next(RawMidiEvent & ev, int & port)
+    {
+        if (_active.empty()) {
+            return false;
+        }
+
+        // the port with the earliest event is at the top of the heap
+        std::pop_heap(_active.begin(), _active.end(), _later);
+        port = _active.back();
+        Cursor & c = _cursors[port];
+        ev = c.next;
+
+        if (++c.index != c.count) {
+            // put the port back with its next event
+            c.buffer.get(c.index, c.next);
+            std::push_heap(_active.begin(), _active.end(), _later);
+        } else {
+            // this port is done
+            _active.pop_back();
+        }
+
+        return true;
+    }
+
+  private:
+    struct Cursor
+    {
+        Buffer buffer;
+        std::size_t index;
+        std::size_t count;
+        // the event at index
+        RawMidiEvent next;
+    };
+
+    // orders ports by the time of their next event, then by port number
+    struct Later
+    {
+        Later(std::vector<Cursor> const & cursors)
+          : cursors(cursors)
+        { }
+
+        bool operator()(std::size_t a, std::size_t b) const {
+            uint32_t ta = cursors[a].next.time;
+            uint32_t tb = cursors[b].next.time;
+            return ta > tb || (ta == tb && a > b);
+        }
+
+        std::vector<Cursor> const & cursors;
+    };
+
+    std::vector<Cursor> _cursors;
+    Later const _later;
+    // heap of the ports that have events left
+    std::vector<std::size_t> _active;
+};
+
+
+} // backend
+} // mididings
+
+
+#endif // MIDIDINGS_BACKEND_INPUT_MERGE_HH
@@ -32,11 +32,16 @@ JACKBackend::JACKBackend(std::string const & client_name,
                          PortNameVector const & in_port_names,
                          PortNameVector const & out_port_names)
   : _current_frame(0)
-  , _input_queue(config::JACK_MAX_EVENTS)
-  , _last_written_frame(out_port_names.size())
+  , _input_merge(in_port_names.size())
+  , _out_buffers(out_port_names.size())
+  , _out_space(out_port_names.size())
+  , _last_output_frame(out_port_names.size())
+  , _output_sorted(true)
 {
     ASSERT(!client_name.empty());
 
+    _output.reserve(config::JACK_MAX_OUTPUT_EVENTS);
+
     // create JACK client
     _client = jack_client_open(client_name.c_str(), JackNoStartServer, NULL);
     if (_client == NULL) {
@@ -181,106 +186,167 @@ int JACKBackend::process_(jack_nframes_t nframes, void *arg)
 {
     JACKBackend *that = static_cast<JACKBackend*>(arg);
 
-    // read events from all input ports, and order them by frame
-    that->fill_input_queue(nframes);
+    // prepare to read events from all input ports, ordered by frame
+    that->init_input_merge(nframes);
 
-    std::fill(that->_last_written_frame.begin(),
-              that->_last_written_frame.end(), 0);
+    // clear all output ports
+    that->init_output(nframes);
 
     int r = that->process(nframes);
 
+    // write all events queued during this period
+    that->write_output();
+
     that->_current_frame += nframes;
     return r;
 }
 
 
-void JACKBackend::fill_input_queue(jack_nframes_t nframes)
+std::size_t JACKBackend::InputBuffer::size() const
+{
+    return jack_midi_get_event_count(buffer);
+}
+
+
+void JACKBackend::InputBuffer::get(std::size_t n, RawMidiEvent & ev) const
 {
-    ASSERT(_input_queue.empty());
+    jack_midi_event_t jack_ev;
+    VERIFY(!jack_midi_event_get(&jack_ev, buffer, n));
+
+    ev.time = jack_ev.time;
+    ev.data = jack_ev.buffer;
+    ev.size = jack_ev.size;
+}
+
+
+void JACKBackend::init_input_merge(jack_nframes_t nframes)
+{
+    // events not read during the previous period are dropped
+    _input_merge.clear();
 
     for (unsigned int port = 0; port != _in_ports.size(); ++port) {
-        void *port_buffer = jack_port_get_buffer(_in_ports[port], nframes);
+        _input_merge.add(port, InputBuffer(
+                jack_port_get_buffer(_in_ports[port], nframes)));
+    }
+}
 
-        for (unsigned int n = 0;
-                n != jack_midi_get_event_count(port_buffer); ++n) {
-            jack_midi_event_t jack_ev;
-            VERIFY(!jack_midi_event_get(&jack_ev, port_buffer, n));
 
-            MidiEvent ev = buffer_to_midi_event(
-                                    jack_ev.buffer, jack_ev.size,
-                                    port, _current_frame + jack_ev.time);
-            _input_queue.push(ev);
-        }
+void JACKBackend::init_output(jack_nframes_t nframes)
+{
+    for (unsigned int port = 0; port != _out_ports.size(); ++port) {
+        _out_buffers[port] = jack_port_get_buffer(_out_ports[port], nframes);
+        jack_midi_clear_buffer(_out_buffers[port]);
+        _out_space[port] = jack_midi_max_event_size(_out_buffers[port]);
     }
+
+    _output.clear();
+    std::fill(_last_output_frame.begin(), _last_output_frame.end(), 0);
+    _output_sorted = true;
 }
 
 
-void JACKBackend::clear_buffers(jack_nframes_t nframes)
+void JACKBackend::write_output()
 {
-    for (unsigned int n = 0; n < _out_ports.size(); ++n) {
-        void *port_buffer = jack_port_get_buffer(_out_ports[n], nframes);
-        jack_midi_clear_buffer(port_buffer);
+    // JACK requires the events on each port to be written in order.
+    // events are usually queued in order anyway, so this is rarely needed
+    if (!_output_sorted) {
+        std::sort(_output.begin(), _output.end());
+    }
+
+    BOOST_FOREACH (OutputEvent const & out, _output) {
+        std::size_t len = midi_event_size(out.ev);
+        int port;
+        uint64_t frame;
+
+        // encode the event straight into the JACK buffer
+        jack_midi_data_t *data = jack_midi_event_reserve(
+                        _out_buffers[out.ev.port], out.frame, len);
+        if (!data) {
+            // shouldn't happen, write_event() makes sure there's enough
+            // space
+            DEBUG_PRINT("couldn't write event to output buffer");
+            continue;
+        }
+
+        VERIFY(midi_event_to_buffer(out.ev, data, len, port, frame));
     }
+
+    // don't keep references to sysex data until the next period
+    _output.clear();
 }
 
 
 bool JACKBackend::read_event(MidiEvent & ev, jack_nframes_t /*nframes*/)
 {
-    if (!_input_queue.empty()) {
-        ev = _input_queue.top();
-        _input_queue.pop();
-        return true;
-    } else {
-        return false;
+    RawMidiEvent raw;
+    int port;
+
+    while (_input_merge.next(raw, port)) {
+        if (!raw.size) {
+            continue;
+        }
+
+        // decode the event straight from the JACK buffer
+        buffer_to_midi_event(ev, raw.data, raw.size,
+                             port, _current_frame + raw.time);
+
+        if (ev.type != MIDI_EVENT_NONE) {
+            return true;
+        }
     }
+
+    return false;
 }
 
 
 bool JACKBackend::write_event(MidiEvent const & ev, jack_nframes_t nframes)
 {
-    unsigned char data[config::JACK_MAX_EVENT_SIZE];
-    std::size_t len = sizeof(data);
-    int port;
-    uint64_t frame;
-
-    VERIFY(midi_event_to_buffer(ev, data, len, port, frame));
+    std::size_t len = midi_event_size(ev);
 
-    void *port_buffer = jack_port_get_buffer(_out_ports[port], nframes);
+    if (!len || len > config::JACK_MAX_EVENT_SIZE ||
+            ev.port < 0 || ev.port >= static_cast<int>(_out_ports.size()) ||
+            _output.size() == _output.capacity()) {
+        return false;
+    }
 
-    if (!len || len > jack_midi_max_event_size(port_buffer)) {
+    // the event must still fit into the port's buffer once all events
+    // queued before it have been written
+    std::size_t const space = len + config::JACK_MIDI_EVENT_OVERHEAD;
+    if (space > _out_space[ev.port]) {
         return false;
     }
 
     // the frame within the current period at which the event will be written
     jack_nframes_t write_at_frame;
 
-    if (frame >= _current_frame) {
+    if (ev.frame >= _current_frame) {
         // event received within current period, zero delay
-        write_at_frame = frame - _current_frame;
-    } else if (frame >= _current_frame - nframes) {
+        write_at_frame = ev.frame - _current_frame;
+    } else if (ev.frame >= _current_frame - nframes) {
         // event received during last period, exactly one period delay
         // (minimize jitter)
-        write_at_frame = frame - _current_frame + nframes;
+        write_at_frame = ev.frame - _current_frame + nframes;
     } else {
         // event is older, send as soon as possible (minimize latency)
         write_at_frame = 0;
     }
 
-    // if events would be out of order, simply increase this event's frame
-    // to be equal to that of the most recently written event.
+    // events that would be out of order are sorted before being written.
     // this should only happen in the rare cases where output_event() is
-    // called directly from Python.
-    if (jack_midi_get_event_count(port_buffer) &&
-            write_at_frame < _last_written_frame[port]) {
-        write_at_frame = _last_written_frame[port];
+    // called directly from Python
+    if (write_at_frame < _last_output_frame[ev.port]) {
+        _output_sorted = false;
     }
+    _last_output_frame[ev.port] = write_at_frame;
 
-    if (!jack_midi_event_write(port_buffer, write_at_frame, data, len)) {
-        _last_written_frame[port] = write_at_frame;
-        return true;
-    } else {
-        return false;
-    }
+    OutputEvent out;
+    out.frame = write_at_frame;
+    out.index = _output.size();
+    out.ev = ev;
+    _output.push_back(out);
+    _out_space[ev.port] -= space;
+
+    return true;
 }
 
 
@@ -13,11 +13,11 @@
 #define MIDIDINGS_BACKEND_JACK_HH
 
 #include "backend/base.hh"
+#include "backend/input_merge.hh"
 #include "midi_event.hh"
 
 #include <string>
 #include <vector>
-#include <queue>
 
 #include <jack/types.h>
 
@@ -38,6 +38,10 @@ class JACKBackend
                 PortNameVector const & out_port_names);
     virtual ~JACKBackend();
 
+    virtual std::size_t num_in_ports() const {
+        return _in_ports.size();
+    }
+
     virtual std::size_t num_out_ports() const {
         return _out_ports.size();
     }
@@ -52,8 +56,9 @@ class JACKBackend
         return 0;
     }
 
-    void clear_buffers(jack_nframes_t nframes);
     bool read_event(MidiEvent & ev, jack_nframes_t nframes);
+    // queues the event to be written to its output port at the end of the
+    // current period
     bool write_event(MidiEvent const & ev, jack_nframes_t nframes);
 
     jack_client_t *_client;
@@ -65,7 +70,9 @@ class JACKBackend
   private:
     static int process_(jack_nframes_t nframes, void *arg);
 
-    void fill_input_queue(jack_nframes_t nframes);
+    void init_input_merge(jack_nframes_t nframes);
+    void init_output(jack_nframes_t nframes);
+    void write_output();
 
     void connect_ports_impl(PortConnectionMap const & port_connections,
                             std::vector<jack_port_t *> const & ports,
@@ -76,39 +83,56 @@ class JACKBackend
                             bool out);
 
 
-    template <typename T, typename Container, typename Compare>
-    class reservable_priority_queue
-      : public std::priority_queue<T, Container, Compare>
+    /*
+     * handle to the buffer of one input port during the current period.
+     */
+    struct InputBuffer
     {
-    public:
-        typedef typename std::priority_queue<
-            T, Container, Compare
-        >::size_type size_type;
-
-        reservable_priority_queue(size_type capacity = 0) {
-            reserve(capacity);
-        };
-        void reserve(size_type capacity) {
-            this->c.reserve(capacity);
-        }
-        size_type capacity() const {
-            return this->c.capacity();
-        }
+        InputBuffer(void *buffer = NULL)
+          : buffer(buffer)
+        { }
+
+        std::size_t size() const;
+        void get(std::size_t n, RawMidiEvent & ev) const;
+
+        void *buffer;
     };
 
-    struct compare_frame {
-        bool operator() (MidiEvent const & lhs, MidiEvent const & rhs) const {
-            return lhs.frame > rhs.frame;
+    // merges the events from all input ports, ordered by frame
+    InputMerge<InputBuffer> _input_merge;
+
+
+    /*
+     * an event to be written to an output port during the current period.
+     */
+    struct OutputEvent
+    {
+        jack_nframes_t frame;
+        // the order in which events were queued, to keep events with the
+        // same frame in order
+        std::size_t index;
+        MidiEvent ev;
+
+        bool operator<(OutputEvent const & other) const {
+            if (ev.port != other.ev.port) return ev.port < other.ev.port;
+            if (frame != other.frame) return frame < other.frame;
+            return index < other.index;
         }
     };
 
-    // queue of incoming MIDI events, ordered by frame
-    reservable_priority_queue<
-        MidiEvent, std::vector<MidiEvent>, compare_frame
-    > _input_queue;
-
-    // the frame at which the last event during each period was written
-    std::vector<jack_nframes_t> _last_written_frame;
+    // the buffers of all output ports during the current period
+    std::vector<void *> _out_buffers;
+    // the number of bytes still available in each output buffer, after
+    // writing the events queued so far
+    std::vector<std::size_t> _out_space;
+
+    // events queued during the current period, and the frame of the most
+    // recent event queued for each port
+    std::vector<OutputEvent> _output;
+    std::vector<jack_nframes_t> _last_output_frame;
+    // false if any event was queued for an earlier frame than the previous
+    // event on the same port
+    bool _output_sorted;
 };
 
 
@@ -33,8 +33,15 @@ JACKBufferedBackend::JACKBufferedBackend(
   : JACKBackend(client_name, in_port_names, out_port_names)
   , _in_rb(config::JACK_MAX_EVENTS)
   , _out_rb(config::JACK_MAX_EVENTS)
+  , _in_events(config::JACK_MAX_EVENTS)
+  , _in_events_pos(0)
+  , _in_events_count(0)
   , _quit(false)
+  , _wakeup(false)
 {
+    _num_periods = 0;
+    _num_events = 0;
+    _num_wakeups = 0;
 }
 
 
@@ -43,6 +50,7 @@ void JACKBufferedBackend::start(InitFunction init, CycleFunction cycle)
     // clear event buffers
     _in_rb.reset();
     _out_rb.reset();
+    _in_events_pos = _in_events_count = 0;
 
     _quit = false;
 
@@ -74,7 +82,7 @@ void JACKBufferedBackend::stop()
 {
     if (_thread) {
         _quit = true;
-        _cond.notify_one();
+        _sem.post();
 
         _thread->join();
     }
@@ -92,19 +100,25 @@ void JACKBufferedBackend::process_thread(InitFunction init,
 int JACKBufferedBackend::process(jack_nframes_t nframes)
 {
     MidiEvent ev;
+    std::size_t received = 0;
 
     // store all incoming events in the input ringbuffer
     while (read_event(ev, nframes)) {
         if (!_in_rb.write(ev)) {
             DEBUG_PRINT("couldn't write event to input ringbuffer");
         }
-        _cond.notify_one();
+        ++received;
     }
 
-    // clear all JACK output buffers
-    clear_buffers(nframes);
+    // wake up the processing thread only once per period
+    if (received) {
+        _num_periods = _num_periods + 1;
+        _num_events = _num_events + received;
+        _sem.post();
+    }
 
-    // read all events from output ringbuffer, write to JACK output buffers
+    // read all events from output ringbuffer, queue them to be written to
+    // JACK output buffers
     while (_out_rb.read_space()) {
         _out_rb.read(ev);
         if (!write_event(ev, nframes)) {
@@ -116,12 +130,39 @@ int JACKBufferedBackend::process(jack_nframes_t nframes)
 }
 
 
+bool JACKBufferedBackend::read_input_event(MidiEvent & ev)
+{
+    if (_in_events_pos == _in_events_count) {
+        // take all events that are currently available
+        _in_events_count = _in_rb.read(_in_events.begin(), _in_events.size());
+        _in_events_pos = 0;
+
+        if (!_in_events_count) {
+            return false;
+        }
+    }
+
+    ev = _in_events[_in_events_pos++];
+
+    return true;
+}
+
+
 bool JACKBufferedBackend::input_event(MidiEvent & ev)
 {
-    // wait until there are events to be read from the ringbuffer
-    while (!_in_rb.read_space()) {
-        boost::mutex::scoped_lock lock(_mutex);
-        _cond.wait(lock);
+    // wait until there are events to be read from the ringbuffer.
+    // the semaphore may also have been posted for events we've already
+    // read, so this may loop more than once
+    while (!read_input_event(ev)) {
+        // check if we were woken up without any new events
+        if (_wakeup) {
+            _wakeup = false;
+            ev.type = MIDI_EVENT_NONE;
+            return true;
+        }
+
+        _sem.wait();
+        _num_wakeups = _num_wakeups + 1;
 
         // check for program termination
         if (_quit) {
@@ -129,12 +170,25 @@ bool JACKBufferedBackend::input_event(MidiEvent & ev)
         }
     }
 
-    VERIFY(_in_rb.read(ev));
-
     return true;
 }
 
 
+bool JACKBufferedBackend::poll_input_event(MidiEvent & ev)
+{
+    return read_input_event(ev);
+}
+
+
+void JACKBufferedBackend::wakeup()
+{
+    // the flag must be set before posting the semaphore, so that it's
+    // visible to the processing thread as soon as that wakes up
+    _wakeup = true;
+    _sem.post();
+}
+
+
 void JACKBufferedBackend::output_event(MidiEvent const & ev)
 {
     if (!_out_rb.write(ev)) {
@@ -143,5 +197,15 @@ void JACKBufferedBackend::output_event(MidiEvent const & ev)
 }
 
 
+BackendBase::InputStats JACKBufferedBackend::input_stats() const
+{
+    InputStats stats;
+    stats.periods = _num_periods;
+    stats.events = _num_events;
+    stats.wakeups = _num_wakeups;
+    return stats;
+}
+
+
 } // backend
 } // mididings
@@ -17,10 +17,11 @@
 #include <boost/scoped_ptr.hpp>
 
 #include <boost/thread/thread.hpp>
-#include <boost/thread/condition.hpp>
-#include <boost/thread/mutex.hpp>
+
+#include <vector>
 
 #include "util/ringbuffer.hh"
+#include "util/semaphore.hh"
 
 
 namespace mididings {
@@ -43,8 +44,12 @@ class JACKBufferedBackend
     virtual void stop();
 
     virtual bool input_event(MidiEvent & ev);
+    virtual bool poll_input_event(MidiEvent & ev);
+    virtual void wakeup();
     virtual void output_event(MidiEvent const & ev);
 
+    virtual InputStats input_stats() const;
+
     // not implemented
     virtual void finish() { }
 
@@ -53,15 +58,31 @@ class JACKBufferedBackend
 
     void process_thread(InitFunction init, CycleFunction cycle);
 
+    bool read_input_event(MidiEvent & ev);
+
     das::ringbuffer<MidiEvent> _in_rb;
     das::ringbuffer<MidiEvent> _out_rb;
 
+    // events taken from the input ringbuffer all at once, to be returned
+    // one by one by input_event()
+    std::vector<MidiEvent> _in_events;
+    std::size_t _in_events_pos;
+    std::size_t _in_events_count;
+
     boost::scoped_ptr<boost::thread> _thread;
 
-    boost::condition _cond;
-    boost::mutex _mutex;
+    // posted once per period with new input events, and to wake up the
+    // processing thread in order to quit or to return a dummy event
+    das::semaphore _sem;
 
     volatile bool _quit;
+    volatile bool _wakeup;
+
+    // each of these is only written by one thread: the periods and events
+    // by the JACK thread, the wakeups by the processing thread
+    das::atomic_size_t _num_periods;
+    das::atomic_size_t _num_events;
+    das::atomic_size_t _num_wakeups;
 };
 
 
@@ -27,8 +27,10 @@ namespace backend {
 JACKRealtimeBackend::JACKRealtimeBackend(
         std::string const & client_name,
         PortNameVector const & in_port_names,
-        PortNameVector const & out_port_names)
+        PortNameVector const & out_port_names,
+        bool hybrid)
   : JACKBackend(client_name, in_port_names, out_port_names)
+  , _hybrid(hybrid)
   , _out_rb(config::JACK_MAX_EVENTS)
 {
 }
@@ -52,8 +54,6 @@ int JACKRealtimeBackend::process(jack_nframes_t nframes)
 {
     _nframes = nframes;
 
-    clear_buffers(nframes);
-
     if (_run_init) {
         _run_init();
         _run_init.clear();  // RT-safe?
@@ -85,6 +85,13 @@ bool JACKRealtimeBackend::input_event(MidiEvent & ev)
 }
 
 
+bool JACKRealtimeBackend::poll_input_event(MidiEvent & ev)
+{
+    // input_event() never blocks anyway
+    return read_event(ev, _nframes);
+}
+
+
 void JACKRealtimeBackend::output_event(MidiEvent const & ev)
 {
     if (pthread_self() == jack_client_thread_id(_client)) {
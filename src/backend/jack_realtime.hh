@@ -33,19 +33,27 @@ class JACKRealtimeBackend
   public:
     JACKRealtimeBackend(std::string const & client_name,
                         PortNameVector const & in_port_names,
-                        PortNameVector const & out_port_names);
+                        PortNameVector const & out_port_names,
+                        bool hybrid = false);
 
     virtual void start(InitFunction init, CycleFunction cycle);
     virtual void stop();
 
     virtual bool input_event(MidiEvent & ev);
+    virtual bool poll_input_event(MidiEvent & ev);
     virtual void output_event(MidiEvent const & ev);
 
     virtual void finish();
 
+    // in hybrid mode, Python code is never called from the JACK thread
+    virtual bool realtime() const { return !_hybrid; }
+    virtual bool hybrid() const { return _hybrid; }
+
   private:
     virtual int process(jack_nframes_t nframes);
 
+    bool const _hybrid;
+
     InitFunction _run_init;
     CycleFunction _run_cycle;
 
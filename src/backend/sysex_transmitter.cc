@@ -0,0 +1,165 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#include "config.hh"
+#include "backend/sysex_transmitter.hh"
+
+#include <algorithm>
+#include <ctime>
+
+#include <boost/bind.hpp>
+
+#include "util/debug.hh"
+
+
+namespace mididings {
+namespace backend {
+
+
+SysExTransmitter::SysExTransmitter(std::size_t num_ports,
+                                   std::size_t chunk_size, double rate,
+                                   SendFunction send)
+  : _chunk_size(chunk_size)
+  , _send(send)
+  , _ports(num_ports)
+  , _sending(0)
+  , _quit(false)
+{
+    ASSERT(chunk_size > 0);
+
+    for (std::size_t n = 0; n != _ports.size(); ++n) {
+        _ports[n].rate = rate;
+    }
+
+    _thread.reset(new boost::thread(
+            boost::bind(&SysExTransmitter::thread_func, this)));
+}
+
+
+SysExTransmitter::~SysExTransmitter()
+{
+    {
+        boost::mutex::scoped_lock lock(_mutex);
+        _quit = true;
+        _cond.notify_one();
+    }
+    _thread->join();
+}
+
+
+void SysExTransmitter::set_rate(int port, double rate)
+{
+    boost::mutex::scoped_lock lock(_mutex);
+    ASSERT(static_cast<std::size_t>(port) < _ports.size());
+    _ports[port].rate = rate;
+    _cond.notify_one();
+}
+
+
+void SysExTransmitter::send(int port, SysExDataConstPtr const & sysex)
+{
+    if (sysex->empty()) {
+        return;
+    }
+
+    boost::mutex::scoped_lock lock(_mutex);
+    ASSERT(static_cast<std::size_t>(port) < _ports.size());
+    _ports[port].queue.push_back(sysex);
+    _cond.notify_one();
+}
+
+
+void SysExTransmitter::wait()
+{
+    boost::mutex::scoped_lock lock(_mutex);
+
+    for (;;) {
+        bool pending = _sending;
+        for (std::size_t n = 0; n != _ports.size(); ++n) {
+            pending = pending || !_ports[n].queue.empty();
+        }
+        if (!pending) {
+            break;
+        }
+        _idle_cond.wait(lock);
+    }
+}
+
+
+void SysExTransmitter::thread_func()
+{
+    boost::mutex::scoped_lock lock(_mutex);
+
+    while (!_quit) {
+        double const t = now();
+
+        // the port that may send its next chunk the soonest
+        Port *port = NULL;
+        for (std::size_t n = 0; n != _ports.size(); ++n) {
+            Port & p = _ports[n];
+            if (!p.queue.empty() && (!port || p.next < port->next)) {
+                port = &p;
+            }
+        }
+
+        if (!port) {
+            // nothing to send
+            _idle_cond.notify_all();
+            _cond.wait(lock);
+            continue;
+        }
+
+        if (port->next > t) {
+            // wait until the chunk is due, or something else changes
+            double const dt = port->next - t;
+            _cond.timed_wait(lock, boost::posix_time::microseconds(
+                    static_cast<long>(dt * 1e6) + 1));
+            continue;
+        }
+
+        // take the next chunk of the first message in the queue
+        SysExDataConstPtr sysex = port->queue.front();
+        std::size_t const offset = port->offset;
+        std::size_t const len = std::min(sysex->size() - offset, _chunk_size);
+
+        port->offset += len;
+        if (port->offset == sysex->size()) {
+            port->queue.pop_front();
+            port->offset = 0;
+        }
+
+        // schedule the following chunk once this one has been transmitted.
+        // if the port has been idle, start counting from now
+        if (port->rate > 0.0) {
+            port->next = std::max(port->next, t) + len / port->rate;
+        }
+
+        int const index = port - &_ports[0];
+
+        ++_sending;
+        lock.unlock();
+        _send(index, &(*sysex)[0] + offset, len);
+        lock.lock();
+        --_sending;
+    }
+}
+
+
+double SysExTransmitter::now()
+{
+    ::timespec t;
+    ::clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + 1e-9 * t.tv_nsec;
+}
+
+
+} // backend
+} // mididings
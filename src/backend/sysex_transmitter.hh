@@ -0,0 +1,101 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_BACKEND_SYSEX_TRANSMITTER_HH
+#define MIDIDINGS_BACKEND_SYSEX_TRANSMITTER_HH
+
+#include "midi_event.hh"
+
+#include <vector>
+#include <deque>
+#include <cstddef>
+
+#include <boost/function.hpp>
+#include <boost/noncopyable.hpp>
+#include <boost/scoped_ptr.hpp>
+#include <boost/thread/thread.hpp>
+#include <boost/thread/mutex.hpp>
+#include <boost/thread/condition.hpp>
+
+
+namespace mididings {
+namespace backend {
+
+
+/*
+ * sends SysEx messages in chunks from a separate thread, pausing between
+ * chunks so that no more than the given number of bytes per second are sent
+ * on each port. this keeps the processing thread from blocking while long
+ * messages are being transmitted.
+ */
+class SysExTransmitter
+  : boost::noncopyable
+{
+  public:
+    typedef boost::function<void (int port, unsigned char const *data,
+                                  std::size_t len)> SendFunction;
+
+    // rate is the default number of bytes per second, or zero to send
+    // all chunks immediately
+    SysExTransmitter(std::size_t num_ports, std::size_t chunk_size,
+                     double rate, SendFunction send);
+    ~SysExTransmitter();
+
+    void set_rate(int port, double rate);
+
+    // queues a SysEx message for output on the given port, and returns
+    // immediately
+    void send(int port, SysExDataConstPtr const & sysex);
+
+    // blocks until all queued messages have been sent
+    void wait();
+
+  private:
+    struct Port
+    {
+        Port()
+          : offset(0)
+          , rate(0.0)
+          , next(0.0)
+        { }
+
+        std::deque<SysExDataConstPtr> queue;
+        // number of bytes of the first message already sent
+        std::size_t offset;
+        double rate;
+        // earliest time at which the next chunk may be sent
+        double next;
+    };
+
+    void thread_func();
+
+    static double now();
+
+    std::size_t const _chunk_size;
+    SendFunction const _send;
+
+    std::vector<Port> _ports;
+    // number of chunks being sent right now, outside the lock
+    int _sending;
+    bool _quit;
+
+    boost::mutex _mutex;
+    boost::condition _cond;
+    boost::condition _idle_cond;
+    boost::scoped_ptr<boost::thread> _thread;
+};
+
+
+} // backend
+} // mididings
+
+
+#endif // MIDIDINGS_BACKEND_SYSEX_TRANSMITTER_HH
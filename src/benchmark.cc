@@ -0,0 +1,535 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#include "config.hh"
+#include "benchmark.hh"
+#include "engine.hh"
+#include "patch.hh"
+#include "midi_event.hh"
+#include "backend/base.hh"
+
+#ifdef ENABLE_JACK_MIDI
+  #include "backend/jack.hh"
+#endif
+
+#include "util/python.hh"
+
+#include <boost/python/def.hpp>
+#include <boost/python/tuple.hpp>
+
+#include <vector>
+#include <string>
+#include <stdexcept>
+#include <algorithm>
+#include <atomic>
+
+#include <boost/thread/thread.hpp>
+#include <boost/thread/thread_time.hpp>
+#include <boost/scoped_ptr.hpp>
+#include <boost/shared_ptr.hpp>
+#include <boost/bind.hpp>
+#include <boost/lexical_cast.hpp>
+
+#include <time.h>
+
+
+namespace mididings {
+
+
+namespace {
+
+
+double now()
+{
+    ::timespec t;
+    ::clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + 1e-9 * t.tv_nsec;
+}
+
+
+template <typename B>
+double time_patch(Engine & engine, Patch const & patch,
+                  std::vector<MidiEvent> const & events, int repeat)
+{
+    B buffer(engine);
+
+    double t = engine.time();
+
+    for (int n = 0; n < repeat; ++n) {
+        for (std::vector<MidiEvent>::const_iterator ev = events.begin();
+                ev != events.end(); ++ev) {
+            buffer.clear();
+            buffer.insert(buffer.end(), *ev);
+            patch.process(buffer);
+        }
+    }
+
+    return engine.time() - t;
+}
+
+double benchmark_patch(Engine & engine, Engine::PatchPtr patch,
+                       std::vector<MidiEvent> const & events,
+                       std::string const & event_buffer, int repeat)
+{
+    if (event_buffer == "arena") {
+        return time_patch<Patch::EventBufferArena>(engine, *patch,
+                                                   events, repeat);
+    } else if (event_buffer == "list") {
+        return time_patch<Patch::EventBufferRT>(engine, *patch,
+                                                events, repeat);
+    } else {
+        throw std::invalid_argument("unknown event buffer type");
+    }
+}
+
+
+/*
+ * an engine that can run without a python object to call back into.
+ */
+class BenchmarkEngine
+  : public Engine
+{
+  public:
+    BenchmarkEngine(backend::BackendPtr backend, bool batch = false)
+      : Engine(backend, false, false, batch)
+    { }
+
+    virtual void scene_switch_callback(int, int) { }
+};
+
+
+/*
+ * a backend that reads input events from a list, and measures the time it
+ * takes the engine to process each of them.
+ */
+class BenchmarkBackend
+  : public backend::BackendBase
+{
+  public:
+    BenchmarkBackend(std::vector<MidiEvent> const & events, std::size_t count)
+      : _events(events)
+      , _count(count)
+      , _num_input(0)
+      , _num_output(0)
+      , _time_total(0.0)
+      , _time_max(0.0)
+    { }
+
+    virtual void start(InitFunction init, CycleFunction cycle) {
+        _thread.reset(new boost::thread(
+                boost::bind(&BenchmarkBackend::process_thread,
+                            this, init, cycle)));
+    }
+
+    virtual void stop() {
+        if (_thread) {
+            _thread->join();
+            _thread.reset();
+        }
+    }
+
+    virtual bool input_event(MidiEvent & ev) {
+        double t = now();
+        if (_num_input) {
+            // the previous event has been processed
+            _time_total += t - _time_last;
+            _time_max = std::max(_time_max, t - _time_last);
+        }
+        if (_num_input == _count) {
+            return false;
+        }
+        ev = _events[_num_input++ % _events.size()];
+        _time_last = now();
+        return true;
+    }
+
+    virtual void output_event(MidiEvent const &) {
+        ++_num_output;
+    }
+
+    virtual void finish() { }
+
+    virtual std::size_t num_in_ports() const {
+        return 1;
+    }
+
+    virtual std::size_t num_out_ports() const {
+        return 16;
+    }
+
+    double time_mean() const { return _time_total / _num_input; }
+    double time_max() const { return _time_max; }
+    std::size_t num_output() const { return _num_output; }
+
+  private:
+    void process_thread(InitFunction init, CycleFunction cycle) {
+        init();
+        cycle();
+    }
+
+    std::vector<MidiEvent> const & _events;
+    std::size_t const _count;
+    std::size_t _num_input;
+    std::size_t _num_output;
+    double _time_last;
+    double _time_total;
+    double _time_max;
+    boost::scoped_ptr<boost::thread> _thread;
+};
+
+
+void output_loop(Engine & engine, MidiEvent const & ev,
+                 bool volatile const & done)
+{
+    while (!done) {
+        engine.output_event(ev);
+    }
+}
+
+/*
+ * runs events through the engine's realtime processing path, while other
+ * threads keep sending events using Engine::output_event().
+ * returns the mean and maximum processing time per event, and the total
+ * number of events sent to the backend.
+ */
+boost::python::tuple benchmark_contention(
+        Engine::PatchPtr patch, std::vector<MidiEvent> const & events,
+        int repeat, int num_threads)
+{
+    boost::shared_ptr<BenchmarkBackend> backend(
+            new BenchmarkBackend(events, events.size() * repeat));
+    BenchmarkEngine engine(backend);
+    engine.add_scene(0, patch, Engine::PatchPtr(), Engine::PatchPtr());
+
+    {
+        // none of the threads involved need the GIL
+        das::python::scoped_gil_release release;
+
+        MidiEvent ev;
+        ev.type = MIDI_EVENT_CTRL;
+        bool volatile done = false;
+
+        boost::thread_group threads;
+        for (int n = 0; n < num_threads; ++n) {
+            threads.create_thread(boost::bind(&output_loop,
+                    boost::ref(engine), boost::cref(ev), boost::cref(done)));
+        }
+
+        engine.start(-1, -1);
+        backend->stop();
+
+        done = true;
+        threads.join_all();
+    }
+
+    return boost::python::make_tuple(backend->time_mean(),
+                                     backend->time_max(),
+                                     backend->num_output());
+}
+
+
+/*
+ * sends bursts of events through an engine running on a real backend, using
+ * a second client of the same backend that's connected to the engine's input
+ * and output. the patch must output exactly one event for each input event.
+ * returns the mean and maximum time from sending a burst until all events
+ * have been received back.
+ */
+boost::python::tuple benchmark_backend(
+        std::string const & backend_name, Engine::PatchPtr patch,
+        std::vector<MidiEvent> const & events, int repeat, bool batch)
+{
+    backend::PortNameVector in_ports(1, "in");
+    backend::PortNameVector out_ports(1, "out");
+
+    backend::BackendPtr backend = backend::create(
+            backend_name, "benchmark", in_ports, out_ports);
+    backend::BackendPtr sender = backend::create(
+            backend_name, "benchmark_send", in_ports, out_ports);
+
+    backend::PortConnectionMap in_port_connections;
+    backend::PortConnectionMap out_port_connections;
+    in_port_connections["in"].push_back("benchmark_send:out");
+    out_port_connections["out"].push_back("benchmark_send:in");
+    backend->connect_ports(in_port_connections, out_port_connections);
+
+    BenchmarkEngine engine(backend, batch);
+    engine.add_scene(0, patch, Engine::PatchPtr(), Engine::PatchPtr());
+
+    double time_total = 0.0;
+    double time_max = 0.0;
+
+    {
+        das::python::scoped_gil_release release;
+
+        engine.start(-1, -1);
+
+        for (int n = 0; n < repeat; ++n) {
+            double t = engine.time();
+
+            sender->output_events(events.begin(), events.end());
+            sender->flush_output();
+
+            std::size_t received = 0;
+            MidiEvent ev;
+            while (received < events.size() && sender->input_event(ev)) {
+                if (ev.type != MIDI_EVENT_NONE) {
+                    ++received;
+                }
+            }
+
+            t = engine.time() - t;
+            time_total += t;
+            time_max = std::max(time_max, t);
+        }
+    }
+
+    return boost::python::make_tuple(time_total / repeat, time_max);
+}
+
+
+#ifdef ENABLE_JACK_MIDI
+
+/*
+ * a JACK client that writes the same number of note events to each of its
+ * output ports in every period, at different frames on each port.
+ */
+class BenchmarkJACKSender
+  : public backend::JACKBackend
+{
+  public:
+    BenchmarkJACKSender(backend::PortNameVector const & out_ports,
+                        std::size_t events_per_port)
+      : JACKBackend("benchmark_send", backend::PortNameVector(), out_ports)
+      , _events_per_port(events_per_port)
+      , _sending(false)
+    { }
+
+    virtual void start(InitFunction, CycleFunction) { _sending = true; }
+    virtual void stop() { _sending = false; }
+
+    virtual bool input_event(MidiEvent &) { return false; }
+    virtual void output_event(MidiEvent const &) { }
+    virtual void finish() { }
+
+  private:
+    virtual int process(jack_nframes_t nframes) {
+        if (!_sending) {
+            return 0;
+        }
+
+        MidiEvent ev;
+        ev.type = MIDI_EVENT_NOTEON;
+        ev.channel = 0;
+        ev.note.note = 60;
+        ev.note.velocity = 100;
+
+        for (std::size_t port = 0; port != _out_ports.size(); ++port) {
+            ev.port = port;
+            for (std::size_t n = 0; n != _events_per_port; ++n) {
+                // spread evenly over the period, offset by the port number
+                ev.frame = _current_frame +
+                        (n * nframes + port % nframes) / _events_per_port;
+                write_event(ev, nframes);
+            }
+        }
+
+        return 0;
+    }
+
+    std::size_t const _events_per_port;
+    std::atomic<bool> _sending;
+};
+
+
+/*
+ * a JACK client that reads all events from its input ports in every period,
+ * the same way the JACK backends do, and measures the time it takes.
+ */
+class BenchmarkJACKReceiver
+  : public backend::JACKBackend
+{
+  public:
+    BenchmarkJACKReceiver(backend::PortNameVector const & in_ports,
+                          std::size_t periods)
+      : JACKBackend("benchmark", in_ports, backend::PortNameVector())
+      , _periods(periods)
+      , _num_periods(0)
+      , _num_events(0)
+      , _time_total(0.0)
+      , _time_max(0.0)
+    { }
+
+    virtual void start(InitFunction, CycleFunction) { }
+    virtual void stop() { }
+
+    virtual bool input_event(MidiEvent &) { return false; }
+    virtual void output_event(MidiEvent const &) { }
+    virtual void finish() { }
+
+    // true once the given number of periods with input have been measured.
+    // the results don't change after that
+    bool done() const { return _num_periods == _periods; }
+
+    double time_mean() const { return _time_total / _num_periods; }
+    double time_max() const { return _time_max; }
+    std::size_t num_events() const { return _num_events; }
+
+  private:
+    virtual int process(jack_nframes_t nframes) {
+        if (done()) {
+            return 0;
+        }
+
+        double t = now();
+
+        MidiEvent ev;
+        std::size_t count = 0;
+        while (read_event(ev, nframes)) {
+            ++count;
+        }
+
+        t = now() - t;
+
+        if (count) {
+            _num_events += count;
+            _time_total += t;
+            _time_max = std::max(_time_max, t);
+            ++_num_periods;
+        }
+
+        return 0;
+    }
+
+    std::size_t const _periods;
+    std::atomic<std::size_t> _num_periods;
+    std::size_t _num_events;
+    double _time_total;
+    double _time_max;
+};
+
+
+/*
+ * sends events_per_port events per period to each of num_ports input ports
+ * of a JACK client, which reads them the way the JACK backends do.
+ * returns the mean and maximum time per period it takes to read all input
+ * events, and the mean number of events read per period.
+ */
+boost::python::tuple benchmark_jack_input(
+        int num_ports, int events_per_port, int periods)
+{
+    backend::PortNameVector in_ports, out_ports;
+    backend::PortConnectionMap in_port_connections;
+
+    for (int port = 0; port < num_ports; ++port) {
+        std::string n = boost::lexical_cast<std::string>(port);
+        in_ports.push_back("in_" + n);
+        out_ports.push_back("out_" + n);
+        in_port_connections["in_" + n].push_back("benchmark_send:out_" + n);
+    }
+
+    BenchmarkJACKReceiver receiver(in_ports, periods);
+    BenchmarkJACKSender sender(out_ports, events_per_port);
+
+    receiver.connect_ports(in_port_connections,
+                           backend::PortConnectionMap());
+
+    {
+        das::python::scoped_gil_release release;
+
+        sender.start(backend::BackendBase::InitFunction(),
+                     backend::BackendBase::CycleFunction());
+        while (!receiver.done()) {
+            boost::this_thread::sleep(boost::posix_time::milliseconds(10));
+        }
+        sender.stop();
+    }
+
+    return boost::python::make_tuple(
+            receiver.time_mean(), receiver.time_max(),
+            static_cast<double>(receiver.num_events()) / periods);
+}
+
+
+/*
+ * sends events_per_period events per period to an engine running on the
+ * buffered JACK backend, until input has been received in the given number
+ * of periods. returns the backend's input statistics: the number of periods
+ * with input, the number of events, and the number of times the processing
+ * thread was woken up.
+ */
+boost::python::tuple benchmark_jack_wakeups(
+        Engine::PatchPtr patch, int events_per_period, int periods)
+{
+    backend::PortNameVector in_ports(1, "in");
+    backend::PortNameVector out_ports(1, "out");
+
+    backend::BackendPtr backend = backend::create(
+            "jack", "benchmark", in_ports, out_ports);
+    BenchmarkJACKSender sender(out_ports, events_per_period);
+
+    backend::PortConnectionMap in_port_connections;
+    in_port_connections["in"].push_back("benchmark_send:out");
+    backend->connect_ports(in_port_connections,
+                           backend::PortConnectionMap());
+
+    BenchmarkEngine engine(backend);
+    engine.add_scene(0, patch, Engine::PatchPtr(), Engine::PatchPtr());
+
+    backend::BackendBase::InputStats stats;
+
+    {
+        das::python::scoped_gil_release release;
+
+        engine.start(-1, -1);
+        sender.start(backend::BackendBase::InitFunction(),
+                     backend::BackendBase::CycleFunction());
+        while (backend->input_stats().periods <
+                    static_cast<std::size_t>(periods)) {
+            boost::this_thread::sleep(boost::posix_time::milliseconds(10));
+        }
+        sender.stop();
+
+        stats = backend->input_stats();
+    }
+
+    return boost::python::make_tuple(stats.periods, stats.events,
+                                     stats.wakeups);
+}
+
+#endif // ENABLE_JACK_MIDI
+
+
+} // anonymous namespace
+
+
+void export_benchmarks()
+{
+    using boost::python::def;
+
+    // time the processing of events by a patch, without any backend
+    def("benchmark_patch", &benchmark_patch);
+    // time the realtime processing of events, while other threads are
+    // sending events at the same time
+    def("benchmark_contention", &benchmark_contention);
+    // time the round trip of events through an engine running on the
+    // given backend
+    def("benchmark_backend", &benchmark_backend);
+#ifdef ENABLE_JACK_MIDI
+    // time the reading of events from several JACK input ports
+    def("benchmark_jack_input", &benchmark_jack_input);
+    // count the wakeups of the processing thread per JACK period
+    def("benchmark_jack_wakeups", &benchmark_jack_wakeups);
+#endif
+}
+
+
+} // mididings
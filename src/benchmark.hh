@@ -0,0 +1,29 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_BENCHMARK_HH
+#define MIDIDINGS_BENCHMARK_HH
+
+
+namespace mididings {
+
+
+/*
+ * adds the benchmark functions to the _mididings module. these are only
+ * available in builds configured with --enable-benchmark.
+ */
+void export_benchmarks();
+
+
+} // mididings
+
+
+#endif // MIDIDINGS_BENCHMARK_HH
@@ -31,18 +31,40 @@ namespace config
     // list during each process cycle
     std::size_t const MAX_EVENTS = 1024;
 
-    // Maximum number of notes that can be remembered in case of a scene switch
-    // (so note-offs can be routed accordingly). This is more of a soft limit,
-    // additional memory will be allocated if necessary (but not RT-safe!)
-    std::size_t const MAX_SIMULTANEOUS_NOTES = 64;
-    // Maximum number of sustain pedal states that can be remembered in case
-    // of a scene switch
-    std::size_t const MAX_SUSTAIN_PEDALS = 4;
+    // Number of input ports for which note and sustain pedal states are
+    // remembered in case of a scene switch, if there's no backend to ask.
+    // Events from higher ports grow the tables as needed (not RT-safe, but
+    // without a backend there's no realtime processing anyway)
+    std::size_t const DEFAULT_NUM_IN_PORTS = 16;
+
+    // Maximum number of scene switches that can be requested from outside
+    // the processing thread before being handled
+    std::size_t const MAX_SCENE_REQUESTS = 16;
+    // Maximum number of events sent from outside the processing thread that
+    // can be queued for output
+    std::size_t const MAX_QUEUED_OUTPUT_EVENTS = 1024;
+
+    // Size in bytes of the smallest SysEx pool blocks. Each further size
+    // class is four times as large as the previous one
+    std::size_t const SYSEX_POOL_MIN_SIZE = 256;
+    // Number of SysEx pool size classes (256, 1K, 4K, 16K bytes)
+    std::size_t const SYSEX_POOL_NUM_CLASSES = 4;
+    // Number of preallocated SysEx pool blocks per size class
+    std::size_t const SYSEX_POOL_BLOCKS = 16;
+
+    // Maximum stack depth of the bytecode used by expression units
+    std::size_t const MAX_EXPRESSION_STACK = 32;
 
     // Stack size of the asynchronous Python caller thread
     std::size_t const ASYNC_THREAD_STACK_SIZE = 262144;
-    // Maximum number of asynchronous calls that can be queued
+    // Default number of asynchronous calls that can be queued
     std::size_t const MAX_ASYNC_CALLS = 256;
+    // Minimum number of asynchronous calls that can be handed to the worker
+    // threads at once, before the queue's overflow policy is applied
+    std::size_t const ASYNC_HANDOFF_CALLS = 1024;
+    // Maximum time in milliseconds to wait for space in the async queue,
+    // when using the 'block' overflow policy
+    int const ASYNC_BLOCK_TIMEOUT = 1000;
     // Time in milliseconds to wait for the async thread to exit on engine
     // shutdown
     int const ASYNC_JOIN_TIMEOUT = 3000;
@@ -52,11 +74,27 @@ namespace config
     // Maximum number of bytes that may be sent to ALSA at once
     std::size_t const ALSA_SYSEX_CHUNK_SIZE = 256;
 
+    // Default number of SysEx bytes per second sent on each ALSA output
+    // port, slightly below MIDI's 3125 bytes per second.
+    // (352 µs per byte, as used by Simple Sysexxer by Christoph Eckert)
+    double const ALSA_SYSEX_RATE = 2841.0;
+
+    // Number of events that fit into the ALSA sequencer's input and output
+    // buffers in batched mode
+    std::size_t const ALSA_BATCH_BUFFER_EVENTS = 1024;
+
     // Size of the JACK backend's input and output queues
     std::size_t const JACK_MAX_EVENTS = 128;
+    // Maximum number of events the JACK backend can write to all output
+    // ports during one period
+    std::size_t const JACK_MAX_OUTPUT_EVENTS = 1024;
     // Maximum size of JACK MIDI events. in reality this depends on the JACK
     // period size...
     std::size_t const JACK_MAX_EVENT_SIZE = 4096;
+    // Space in a JACK MIDI buffer taken up by each event in addition to its
+    // data. this is an upper bound for both JACK 1 and JACK 2, used to tell
+    // whether events will fit into the output buffers
+    std::size_t const JACK_MIDI_EVENT_OVERHEAD = 16;
 
     // Realtime priority offset for buffered JACK backend, subtracted from
     // JACK's own priority
@@ -66,6 +104,15 @@ namespace config
 
     // Time in milliseconds to wait for the current JACK period to complete.
     int const JACK_REALTIME_FINISH_TIMEOUT = 200;
+
+    // Maximum number of events that can be handed from the JACK thread to
+    // the non-realtime processing thread in hybrid mode
+    std::size_t const HYBRID_MAX_OFFLOADED_EVENTS = 1024;
+    // Stack size of the non-realtime processing thread in hybrid mode
+    std::size_t const HYBRID_THREAD_STACK_SIZE = 262144;
+    // Maximum time in milliseconds for which the non-realtime processing
+    // thread sleeps before checking for new events
+    int const HYBRID_POLL_INTERVAL = 10;
 }
 
 
@@ -18,6 +18,7 @@
 
 #include <boost/thread/thread.hpp>
 #include <boost/bind.hpp>
+#include <boost/version.hpp>
 
 #include <iostream>
 #include <algorithm>
@@ -38,19 +39,31 @@ int Engine::num_cycles_(0);
 #endif
 
 
-Engine::Engine(backend::BackendPtr backend, bool verbose)
+Engine::Engine(backend::BackendPtr backend, bool verbose, bool arena_buffer,
+               bool batch, int async_workers, std::size_t async_queue_size)
   : _verbose(verbose)
+  , _batch(batch)
   , _backend(backend)
   , _current_patch(NULL)
   , _current_scene(-1)
   , _current_subscene(-1)
   , _new_scene(-1)
   , _new_subscene(-1)
-  , _noteon_patches(config::MAX_SIMULTANEOUS_NOTES)
-  , _sustain_patches(config::MAX_SUSTAIN_PEDALS)
+  , _num_in_ports(backend ? backend->num_in_ports()
+                           : config::DEFAULT_NUM_IN_PORTS)
+  , _noteon_patches(_num_in_ports * 16 * 128)
+  , _sustain_patches(_num_in_ports * 16)
   , _buffer(*this)
-  , _python_caller(new PythonCaller(boost::bind(&Engine::run_async, this)))
+  , _arena_buffer(arena_buffer ? new Patch::EventBufferArena(*this) : NULL)
+  , _scene_requests(config::MAX_SCENE_REQUESTS)
+  , _output_queue(config::MAX_QUEUED_OUTPUT_EVENTS)
+  , _python_caller(new PythonCaller(boost::bind(&Engine::run_async, this),
+                                    async_workers, async_queue_size,
+                                    backend && backend->realtime()))
+  , _offload_quit(false)
 {
+    _published_scene = 0;
+
     // construct a patch with a single sanitize unit
     Patch::UnitExPtr sani(new units::Sanitize);
     Patch::ModulePtr mod(new Patch::Extended(sani));
@@ -64,6 +77,8 @@ Engine::~Engine()
         _backend->stop();
     }
 
+    stop_offload();
+
     // this needs to be gone before the engine can safely be destroyed
     _python_caller.reset();
 }
@@ -94,6 +109,11 @@ void Engine::set_processing(PatchPtr ctrl_patch,
 
 void Engine::start(int initial_scene, int initial_subscene)
 {
+    if (_backend->hybrid()) {
+        // the init patches may already need the offload thread
+        start_offload();
+    }
+
     _backend->start(
         boost::bind(&Engine::run_init, this, initial_scene, initial_subscene),
         boost::bind(&Engine::run_cycle, this)
@@ -103,25 +123,163 @@ void Engine::start(int initial_scene, int initial_subscene)
 
 void Engine::run_init(int initial_scene, int initial_subscene)
 {
-    boost::mutex::scoped_lock lock(_process_mutex);
+    if (_arena_buffer) {
+        run_init_impl(*_arena_buffer, initial_scene, initial_subscene);
+    } else {
+        run_init_impl(_buffer, initial_scene, initial_subscene);
+    }
+}
+
+
+void Engine::run_cycle()
+{
+    if (_arena_buffer) {
+        run_cycle_impl(*_arena_buffer);
+    } else {
+        run_cycle_impl(_buffer);
+    }
+}
+
+
+void Engine::run_async()
+{
+    if (!_backend) {
+        // backend already destroyed
+        return;
+    }
+
+    // normally the processing thread is woken up as soon as something is
+    // queued, but make sure nothing gets stuck in the queues
+    if (_scene_requests.read_space() || _output_queue.read_space()) {
+        _backend->wakeup();
+    }
+}
+
+
+void Engine::start_offload()
+{
+    _offload_queue.reset(new das::ringbuffer<Offloaded>(
+                                config::HYBRID_MAX_OFFLOADED_EVENTS));
+    _offload_quit = false;
+
+    boost::function<void()> func = boost::bind(&Engine::run_offload, this);
+
+#if BOOST_VERSION >= 105000
+    boost::thread::attributes attr;
+    attr.set_stack_size(config::HYBRID_THREAD_STACK_SIZE);
+    _offload_thread.reset(new boost::thread(attr, func));
+#else
+    _offload_thread.reset(new boost::thread(func));
+#endif
+}
+
+
+void Engine::stop_offload()
+{
+    if (!_offload_thread) {
+        return;
+    }
+
+    // the offload thread may be waiting for the GIL
+    PyThreadState *state = das::python::gil_held() ? PyEval_SaveThread()
+                                                   : NULL;
+    {
+        boost::mutex::scoped_lock lock(_offload_mutex);
+        _offload_quit = true;
+    }
+    _offload_cond.notify_one();
+
+    _offload_thread->timed_join(boost::posix_time::milliseconds(
+                                    config::ASYNC_JOIN_TIMEOUT));
+    if (state) {
+        PyEval_RestoreThread(state);
+    }
+}
+
+
+void Engine::offload(Offloaded const & o)
+{
+    if (!_offload_queue->write(o)) {
+        DEBUG_PRINT("couldn't write event to offload queue");
+        return;
+    }
+
+    // like JACKBufferedBackend, signal the condition without locking the
+    // mutex. a wakeup lost to a race is caught up on by the thread's
+    // periodic polling
+    _offload_cond.notify_one();
+}
+
+
+bool Engine::in_offload_thread() const
+{
+    return _offload_thread &&
+           boost::this_thread::get_id() == _offload_thread->get_id();
+}
+
 
+void Engine::run_offload()
+{
+    // the realtime thread's buffers are not shared, and this one isn't
+    // subject to any realtime constraints
+    Patch::EventBuffer buffer(*this);
+    Offloaded o;
+
+    while (!_offload_quit) {
+        while (_offload_queue->read(o)) {
+            buffer.clear();
+
+            switch (o.kind) {
+              case Offloaded::OFFLOAD_EVENT:
+                process_patch(buffer, o.ev, o.patch);
+                break;
+              case Offloaded::OFFLOAD_INIT_EXIT:
+                process_init_exit(buffer, o.patch);
+                break;
+              case Offloaded::OFFLOAD_SCENE_SWITCH:
+                scene_switch_callback(o.scene, o.subscene);
+                break;
+            }
+
+            // events output from outside the realtime thread are sent
+            // by the backend during the next period
+            _backend->output_events(buffer.begin(), buffer.end());
+        }
+
+        boost::mutex::scoped_lock lock(_offload_mutex);
+        if (!_offload_queue->read_space() && !_offload_quit) {
+            _offload_cond.timed_wait(lock, boost::posix_time::milliseconds(
+                                            config::HYBRID_POLL_INTERVAL));
+        }
+    }
+}
+
+
+template <typename B>
+void Engine::run_init_impl(B & buffer,
+                           int initial_scene, int initial_subscene)
+{
     // if no initial scene is specified, use the first one
     if (initial_scene == -1) {
         initial_scene = _scenes.begin()->first;
     }
     ASSERT(has_scene(initial_scene));
 
-    _buffer.clear();
+    buffer.clear();
 
     _new_scene = initial_scene;
     _new_subscene = initial_subscene;
-    process_scene_switch(_buffer);
+    process_scene_switch(buffer);
+
+    _backend->output_events(buffer.begin(), buffer.end());
 
-    _backend->output_events(_buffer.begin(), _buffer.end());
+    output_queued_events();
+    _backend->flush_output();
 }
 
 
-void Engine::run_cycle()
+template <typename B>
+void Engine::run_cycle_impl(B & buffer)
 {
     MidiEvent ev;
 
@@ -131,15 +289,25 @@ void Engine::run_cycle()
         hrclock::time_point t1 = hrclock::now();
 #endif
 
-        boost::mutex::scoped_lock lock(_process_mutex);
+        buffer.clear();
+
+        // handle scene switches requested by other threads
+        process_requests(buffer);
 
-        _buffer.clear();
+        // events of type MIDI_EVENT_NONE only wake us up
+        if (ev.type != MIDI_EVENT_NONE) {
+            do {
+                // process the event
+                process(buffer, ev);
 
-        // process the event
-        process(_buffer, ev);
+                // handle scene switches
+                process_requests(buffer);
 
-        // handle scene switches
-        process_scene_switch(_buffer);
+                // in batch mode, continue with all other events that are
+                // already available, appending their output to the same
+                // buffer
+            } while (_batch && _backend->poll_input_event(ev));
+        }
 
 #ifdef ENABLE_BENCHMARK
         hrclock::time_point t2 = hrclock::now();
@@ -151,44 +319,77 @@ void Engine::run_cycle()
         ++num_cycles_;
 #endif
 
-        _backend->output_events(_buffer.begin(), _buffer.end());
+        _backend->output_events(buffer.begin(), buffer.end());
+
+        output_queued_events();
+        _backend->flush_output();
     }
-}
 
+    // backends that call this function periodically return without waiting
+    // for input, so this is where requests from other threads get handled
+    if (_scene_requests.read_space() || _output_queue.read_space()) {
+        buffer.clear();
+        process_requests(buffer);
+        _backend->output_events(buffer.begin(), buffer.end());
 
-void Engine::run_async()
-{
-    if (!_backend) {
-        // backend already destroyed
-        return;
+        output_queued_events();
+        _backend->flush_output();
     }
+}
 
-    if (_new_scene != -1 || _new_subscene != -1) {
-        boost::mutex::scoped_lock lock(_process_mutex);
 
-        _buffer.clear();
+std::vector<MidiEvent> Engine::process_event(MidiEvent const & ev)
+{
+    if (!_current_patch) {
+        _current_patch = &*_scenes.find(0)->second[0]->patch;
+    }
 
-        process_scene_switch(_buffer);
+    resize_patch_tables(&ev, &ev + 1);
 
-        _backend->output_events(_buffer.begin(), _buffer.end());
+    // use the same kind of buffer as the realtime processing does, but not
+    // the same buffer
+    if (_arena_buffer) {
+        Patch::EventBufferArena buffer(*this);
+        return process_events_impl(buffer, &ev, &ev + 1);
+    } else {
+        Patch::EventBuffer buffer(*this);
+        return process_events_impl(buffer, &ev, &ev + 1);
     }
 }
 
 
-std::vector<MidiEvent> Engine::process_event(MidiEvent const & ev)
+std::vector<MidiEvent> Engine::process_events(
+                                std::vector<MidiEvent> const & evs)
 {
-    boost::mutex::scoped_lock lock(_process_mutex);
-
-    std::vector<MidiEvent> v;
-    Patch::EventBuffer buffer(*this);
-
     if (!_current_patch) {
         _current_patch = &*_scenes.find(0)->second[0]->patch;
     }
 
-    process(buffer, ev);
+    resize_patch_tables(evs.begin(), evs.end());
 
-    process_scene_switch(buffer);
+    // same as process_event(), but process all events in one go, just like
+    // run_cycle() does in batch mode
+    if (_arena_buffer) {
+        Patch::EventBufferArena buffer(*this);
+        return process_events_impl(buffer, evs.begin(), evs.end());
+    } else {
+        Patch::EventBuffer buffer(*this);
+        return process_events_impl(buffer, evs.begin(), evs.end());
+    }
+}
+
+
+template <typename B, typename IterT>
+std::vector<MidiEvent> Engine::process_events_impl(B & buffer,
+                                                   IterT begin, IterT end)
+{
+    std::vector<MidiEvent> v;
+
+    for (IterT it = begin; it != end; ++it) {
+        process(buffer, *it);
+
+        process_requests(buffer);
+    }
 
     v.insert(v.end(), buffer.begin(), buffer.end());
     return v;
@@ -198,13 +399,34 @@ std::vector<MidiEvent> Engine::process_event(MidiEvent const & ev)
 template <typename B>
 void Engine::process(B & buffer, MidiEvent const & ev)
 {
-    ASSERT(buffer.empty());
-
     Patch * patch = get_matching_patch(ev);
 
+    if (_offload_queue && (ev.type & patch->offload_types())) {
+        // hybrid mode: this event may reach Python code, leave it to the
+        // offload thread. the patch has already been chosen, so note-offs
+        // still go where their note-ons went
+        Offloaded o;
+        o.kind = Offloaded::OFFLOAD_EVENT;
+        o.ev = ev;
+        o.patch = patch;
+        offload(o);
+        return;
+    }
+
+    process_patch(buffer, ev, patch);
+}
+
+
+template <typename B>
+void Engine::process_patch(B & buffer, MidiEvent const & ev, Patch * patch)
+{
+    // the buffer may already contain the output of previous events. all
+    // events are appended, and only the new ones are processed
+
     if (_ctrl_patch) {
-        buffer.insert(buffer.end(), ev);
-        _ctrl_patch->process(buffer);
+        typename B::Iterator it = buffer.insert(buffer.end(), ev);
+        typename B::Range r(it, buffer.end());
+        _ctrl_patch->process(buffer, r);
     }
 
     typename B::Iterator it = buffer.insert(buffer.end(), ev);
@@ -220,46 +442,74 @@ void Engine::process(B & buffer, MidiEvent const & ev)
         _post_patch->process(buffer, r);
     }
 
-    _sanitize_patch->process(_buffer, r);
+    _sanitize_patch->process(buffer, r);
+}
+
+
+template <typename IterT>
+void Engine::resize_patch_tables(IterT begin, IterT end)
+{
+    int num_ports = _num_in_ports;
+
+    for (IterT it = begin; it != end; ++it) {
+        num_ports = std::max(num_ports, it->port + 1);
+    }
+
+    if (num_ports > _num_in_ports) {
+        _num_in_ports = num_ports;
+        _noteon_patches.resize(num_ports * 16 * 128);
+        _sustain_patches.resize(num_ports * 16);
+    }
 }
 
 
 Patch * Engine::get_matching_patch(MidiEvent const & ev)
 {
-    // note on: store current patch
-    if (ev.type == MIDI_EVENT_NOTEON) {
-        _noteon_patches.insert(std::make_pair(make_notekey(ev),
-                                              _current_patch));
-        return _current_patch;
-    }
-    // note off: retrieve and remove stored patch
-    else if (ev.type == MIDI_EVENT_NOTEOFF) {
-        NotePatchMap::const_iterator i =
-                            _noteon_patches.find(make_notekey(ev));
-        if (i != _noteon_patches.end()) {
-            Patch *p = i->second;
-            _noteon_patches.erase(i);
-            return p;
+    if (ev.type == MIDI_EVENT_NOTEON || ev.type == MIDI_EVENT_NOTEOFF) {
+        int i = note_index(ev);
+        if (i == -1) {
+            return _current_patch;
+        }
+
+        Patch * & p = _noteon_patches[i];
+
+        if (ev.type == MIDI_EVENT_NOTEON) {
+            // note on: store current patch, unless the note is already held
+            if (!p) {
+                p = _current_patch;
+            }
+            return _current_patch;
+        }
+        else if (p) {
+            // note off: retrieve and remove stored patch
+            Patch *r = p;
+            p = NULL;
+            return r;
         }
     }
-    // sustain pressed
-    // TODO: handle half-pedal correctly
-    else if (ev.type == MIDI_EVENT_CTRL &&
-             ev.ctrl.param == 64 && ev.ctrl.value == 127) {
-        _sustain_patches.insert(std::make_pair(make_sustainkey(ev),
-                                               _current_patch));
-        return _current_patch;
-    }
-    // sustain released
-    else if (ev.type == MIDI_EVENT_CTRL &&
-            ev.ctrl.param == 64 && ev.ctrl.value == 0) {
-        SustainPatchMap::const_iterator i =
-                                _sustain_patches.find(make_sustainkey(ev));
-        if (i != _sustain_patches.end()) {
-            Patch *p = i->second;
-            _sustain_patches.erase(i);
+    else if (ev.type == MIDI_EVENT_CTRL && ev.ctrl.param == 64) {
+        int i = sustain_index(ev);
+        if (i == -1) {
+            return _current_patch;
+        }
+
+        Patch * & p = _sustain_patches[i];
+
+        if (ev.ctrl.value) {
+            // sustain pressed, fully or partially: the first event stores
+            // the current patch, any further (half-pedal) movements are
+            // routed to the same patch
+            if (!p) {
+                p = _current_patch;
+            }
             return p;
         }
+        else if (p) {
+            // sustain released: retrieve and remove stored patch
+            Patch *r = p;
+            p = NULL;
+            return r;
+        }
     }
 
     // anything else: just use current patch
@@ -269,6 +519,13 @@ Patch * Engine::get_matching_patch(MidiEvent const & ev)
 
 void Engine::switch_scene(int scene, int subscene)
 {
+    if (in_offload_thread()) {
+        // a unit processed in hybrid mode's offload thread. scene switches
+        // are handled by the realtime thread only
+        request_scene_switch(scene, subscene);
+        return;
+    }
+
     if (scene != -1) {
         _new_scene = scene;
     }
@@ -278,6 +535,35 @@ void Engine::switch_scene(int scene, int subscene)
 }
 
 
+void Engine::request_scene_switch(int scene, int subscene)
+{
+    boost::mutex::scoped_lock lock(_request_mutex);
+
+    if (!_scene_requests.write(std::make_pair(scene, subscene))) {
+        DEBUG_PRINT("couldn't write scene switch to request queue");
+    }
+
+    if (_backend) {
+        _backend->wakeup();
+    }
+}
+
+
+template <typename B>
+void Engine::process_requests(B & buffer)
+{
+    std::pair<int, int> r;
+
+    // a scene switch requested while another one is pending overrides the
+    // pending one, just like calling switch_scene() twice does
+    while (_scene_requests.read(r)) {
+        switch_scene(r.first, r.second);
+    }
+
+    process_scene_switch(buffer);
+}
+
+
 template <typename B>
 void Engine::process_scene_switch(B & buffer)
 {
@@ -286,19 +572,23 @@ void Engine::process_scene_switch(B & buffer)
         return;
     }
 
-    // call python scene switch handler if we have more than one scene
-    if (_scenes.size() > 1) {
-        scene_switch_callback(_new_scene, _new_subscene);
-    }
-
-    // create dummy event to trigger init and exit patches
-    MidiEvent dummy_ev;
-    dummy_ev.type = MIDI_EVENT_DUMMY;
-
     // determine the actual scene and subscene number we're switching to
     int scene_num = _new_scene != -1 ? _new_scene : _current_scene;
     int subscene_num = _new_subscene != -1 ? _new_subscene : 0;
 
+    // call python scene switch handler if we have more than one scene
+    if (_scenes.size() > 1) {
+        if (_offload_queue) {
+            Offloaded o;
+            o.kind = Offloaded::OFFLOAD_SCENE_SWITCH;
+            o.scene = scene_num;
+            o.subscene = subscene_num;
+            offload(o);
+        } else {
+            scene_switch_callback(scene_num, subscene_num);
+        }
+    }
+
     SceneMap::const_iterator scene_it = _scenes.find(scene_num);
 
     // check if scene and subscene exist
@@ -315,33 +605,13 @@ void Engine::process_scene_switch(B & buffer)
                                                 ->second[_current_subscene];
 
             if (prev_scene->exit_patch) {
-                typename B::Iterator it = buffer.insert(buffer.end(),
-                                                        dummy_ev);
-                typename B::Range r(it, buffer.end());
-
-                // run event through exit patch
-                prev_scene->exit_patch->process(buffer, r);
-
-                if (_post_patch) {
-                    _post_patch->process(buffer, r);
-                }
-                _sanitize_patch->process(buffer, r);
+                process_init_exit(buffer, &*prev_scene->exit_patch);
             }
         }
 
         // check if the scene has an init patch
         if (scene->init_patch) {
-            typename B::Iterator it = buffer.insert(buffer.end(),
-                                                    dummy_ev);
-            typename B::Range r(it, buffer.end());
-
-            // run event through init patch
-            scene->init_patch->process(buffer, r);
-
-            if (_post_patch) {
-                _post_patch->process(buffer, r);
-            }
-            _sanitize_patch->process(buffer, r);
+            process_init_exit(buffer, &*scene->init_patch);
         }
 
         // store pointer to patch
@@ -350,6 +620,8 @@ void Engine::process_scene_switch(B & buffer)
         // store scene and subscene numbers
         _current_scene = scene_num;
         _current_subscene = subscene_num;
+
+        _published_scene = (scene_num + 1) << 16 | (subscene_num + 1);
     }
 
     // mark as done
@@ -358,6 +630,35 @@ void Engine::process_scene_switch(B & buffer)
 }
 
 
+template <typename B>
+void Engine::process_init_exit(B & buffer, Patch * patch)
+{
+    // create dummy event to trigger init and exit patches
+    MidiEvent dummy_ev;
+    dummy_ev.type = MIDI_EVENT_DUMMY;
+
+    if (_offload_queue && !in_offload_thread() &&
+            (dummy_ev.type & patch->offload_types())) {
+        Offloaded o;
+        o.kind = Offloaded::OFFLOAD_INIT_EXIT;
+        o.patch = patch;
+        offload(o);
+        return;
+    }
+
+    typename B::Iterator it = buffer.insert(buffer.end(), dummy_ev);
+    typename B::Range r(it, buffer.end());
+
+    // run event through init or exit patch
+    patch->process(buffer, r);
+
+    if (_post_patch) {
+        _post_patch->process(buffer, r);
+    }
+    _sanitize_patch->process(buffer, r);
+}
+
+
 bool Engine::sanitize_event(MidiEvent & ev) const
 {
     // FIXME: std::cout is not RT-safe!
@@ -457,9 +758,24 @@ bool Engine::sanitize_event(MidiEvent & ev) const
 
 void Engine::output_event(MidiEvent const & ev)
 {
-    boost::mutex::scoped_lock lock(_process_mutex);
+    boost::mutex::scoped_lock lock(_request_mutex);
+
+    if (!_output_queue.write(ev)) {
+        DEBUG_PRINT("couldn't write event to output queue");
+        return;
+    }
+
+    _backend->wakeup();
+}
+
+
+void Engine::output_queued_events()
+{
+    MidiEvent ev;
 
-    _backend->output_event(ev);
+    while (_output_queue.read(ev)) {
+        _backend->output_event(ev);
+    }
 }
 
 
@@ -12,6 +12,7 @@
 #ifndef MIDIDINGS_ENGINE_HH
 #define MIDIDINGS_ENGINE_HH
 
+#include "config.hh"
 #include "patch.hh"
 #include "backend/base.hh"
 #include "python_caller.hh"
@@ -27,9 +28,11 @@
 #include <boost/shared_ptr.hpp>
 #include <boost/scoped_ptr.hpp>
 #include <boost/noncopyable.hpp>
+#include <boost/thread/thread.hpp>
 #include <boost/thread/mutex.hpp>
-#include <boost/unordered/unordered_map.hpp>
+#include <boost/thread/condition.hpp>
 
+#include "util/ringbuffer.hh"
 #include "util/counted_objects.hh"
 
 
@@ -59,12 +62,11 @@ class Engine
     typedef boost::shared_ptr<Scene> ScenePtr;
     typedef std::map<int, std::vector<ScenePtr> > SceneMap;
 
-    typedef unsigned int EventKey;
-    typedef boost::unordered_map<EventKey, Patch *> NotePatchMap;
-    typedef boost::unordered_map<EventKey, Patch *> SustainPatchMap;
 
-
-    Engine(backend::BackendPtr backend, bool verbose);
+    Engine(backend::BackendPtr backend, bool verbose,
+           bool arena_buffer = false, bool batch = false,
+           int async_workers = 1,
+           std::size_t async_queue_size = config::MAX_ASYNC_CALLS);
 
     virtual ~Engine();
 
@@ -75,15 +77,19 @@ class Engine
 
     void start(int initial_scene, int initial_subscene);
 
+    // switch scenes from within the processing thread (used by units)
     void switch_scene(int scene, int subscene = -1);
+    // switch scenes from any other thread. the switch is handled by the
+    // processing thread as soon as possible
+    void request_scene_switch(int scene, int subscene = -1);
 
     bool sanitize_event(MidiEvent & ev) const;
 
     int current_scene() const {
-        return _current_scene;
+        return static_cast<int>(_published_scene >> 16) - 1;
     }
     int current_subscene() const {
-        return _current_subscene;
+        return static_cast<int>(_published_scene & 0xffff) - 1;
     }
     bool has_scene(int n) const {
         return _scenes.find(n) != _scenes.end();
@@ -92,45 +98,112 @@ class Engine
         return num_subscenes() > n;
     }
     int num_subscenes() const {
-        SceneMap::const_iterator i = _scenes.find(_current_scene);
+        SceneMap::const_iterator i = _scenes.find(current_scene());
         return i != _scenes.end() ? i->second.size() : 0;
     }
 
     std::vector<MidiEvent> process_event(MidiEvent const & ev);
+    std::vector<MidiEvent> process_events(std::vector<MidiEvent> const & evs);
 
+    // send an event from outside the processing thread. the event is queued
+    // and sent by the processing thread
     void output_event(MidiEvent const & ev);
 
     double time();
 
     PythonCaller & python_caller() const { return *_python_caller; }
+    backend::BackendPtr backend() const { return _backend; }
 
   protected:
     virtual void scene_switch_callback(int scene, int subscene) = 0;
 
   private:
 
+    // an event or scene switch handed from the realtime thread to the
+    // non-realtime thread in hybrid mode
+    struct Offloaded {
+        enum Kind {
+            // run the event through the patch, as process() would
+            OFFLOAD_EVENT,
+            // run a dummy event through an init or exit patch
+            OFFLOAD_INIT_EXIT,
+            // call the scene switch callback
+            OFFLOAD_SCENE_SWITCH,
+        };
+
+        Kind kind;
+        MidiEvent ev;
+        Patch * patch;
+        int scene;
+        int subscene;
+    };
+
     void run_init(int initial_scene, int initial_subscene);
     void run_cycle();
     void run_async();
+    void run_offload();
+
+    void start_offload();
+    void stop_offload();
+    void offload(Offloaded const & o);
+    bool in_offload_thread() const;
+
+    template <typename B>
+    void run_init_impl(B & buffer, int initial_scene, int initial_subscene);
+    template <typename B>
+    void run_cycle_impl(B & buffer);
+
+    template <typename B, typename IterT>
+    std::vector<MidiEvent> process_events_impl(B & buffer,
+                                               IterT begin, IterT end);
 
     template <typename B>
     void process(B & buffer, MidiEvent const & ev);
 
+    template <typename B>
+    void process_patch(B & buffer, MidiEvent const & ev, Patch * patch);
+
+    template <typename B>
+    void process_init_exit(B & buffer, Patch * patch);
+
+    template <typename B>
+    void process_requests(B & buffer);
+
     template <typename B>
     void process_scene_switch(B & buffer);
 
+    void output_queued_events();
 
-    Patch * get_matching_patch(MidiEvent const & ev);
 
+    Patch * get_matching_patch(MidiEvent const & ev);
 
-    EventKey make_notekey(MidiEvent const & ev) const {
-        return ev.port | ev.channel << 16 | ev.note.note << 24;
+    // make sure the note and sustain tables cover all ports of the given
+    // events. not RT-safe
+    template <typename IterT>
+    void resize_patch_tables(IterT begin, IterT end);
+
+    // index into the sustain table, or -1 if the event's port or channel is
+    // out of range
+    int sustain_index(MidiEvent const & ev) const {
+        if (ev.port < 0 || ev.port >= _num_in_ports ||
+                ev.channel < 0 || ev.channel > 15) {
+            return -1;
+        }
+        return ev.port << 4 | ev.channel;
     }
-    EventKey make_sustainkey(MidiEvent const & ev) const {
-        return ev.port | ev.channel << 16;
+    // index into the note table, or -1 if the event's port, channel or note
+    // number is out of range
+    int note_index(MidiEvent const & ev) const {
+        int i = sustain_index(ev);
+        if (i == -1 || ev.note.note < 0 || ev.note.note > 127) {
+            return -1;
+        }
+        return i << 7 | ev.note.note;
     }
 
     bool _verbose;
+    // process all pending input events at once
+    bool _batch;
 
     backend::BackendPtr _backend;
 
@@ -149,15 +222,39 @@ class Engine
     int _new_scene;
     int _new_subscene;
 
-    NotePatchMap _noteon_patches;
-    SustainPatchMap _sustain_patches;
+    // the patch each note-on and sustain pedal press was routed to, by port,
+    // channel and note number, so that the corresponding note-offs and pedal
+    // releases can be routed accordingly. NULL if there's none
+    int _num_in_ports;
+    std::vector<Patch *> _noteon_patches;
+    std::vector<Patch *> _sustain_patches;
 
     Patch::EventBufferRT _buffer;
+    // alternative event buffer, used instead of _buffer if not null
+    boost::scoped_ptr<Patch::EventBufferArena> _arena_buffer;
 
-    boost::mutex _process_mutex;
+    // scene switches and output events coming from other threads. only the
+    // processing thread reads from these queues
+    das::ringbuffer<std::pair<int, int> > _scene_requests;
+    das::ringbuffer<MidiEvent> _output_queue;
+    // serializes writers to the queues above
+    boost::mutex _request_mutex;
+
+    // current scene and subscene (plus one) in the upper and lower 16 bits,
+    // for other threads to read
+    das::atomic_size_t _published_scene;
 
     boost::scoped_ptr<PythonCaller> _python_caller;
 
+    // hybrid mode: events that may reach Python code are passed to a
+    // separate thread instead of being processed in the realtime thread.
+    // all of this is only set up if the backend asks for it
+    boost::scoped_ptr<das::ringbuffer<Offloaded> > _offload_queue;
+    boost::scoped_ptr<boost::thread> _offload_thread;
+    boost::mutex _offload_mutex;
+    boost::condition _offload_cond;
+    volatile bool _offload_quit;
+
 #ifdef ENABLE_BENCHMARK
   public:
     typedef std::chrono::high_resolution_clock hrclock;
@@ -169,23 +169,40 @@ struct MidiEvent
 };
 
 
-inline bool operator==(MidiEvent const & lhs, MidiEvent const & rhs)
+// check which fields are relevant for the given event type
+inline bool event_has_channel(MidiEventType type)
 {
-    // the obvious case: events of different types are never equal
-    if (lhs.type != rhs.type) {
-        return false;
-    }
+    return !(type & (MIDI_EVENT_SYSTEM | MIDI_EVENT_DUMMY));
+}
 
-    // check which fields are relevant for the given event type
-    bool have_channel = !(lhs.type & (MIDI_EVENT_SYSTEM | MIDI_EVENT_DUMMY));
-    bool have_data1 = (lhs.type & (
+inline bool event_has_data1(MidiEventType type)
+{
+    return (type & (
             MIDI_EVENT_NOTE | MIDI_EVENT_CTRL |
             MIDI_EVENT_POLY_AFTERTOUCH | MIDI_EVENT_SYSCM_QFRAME |
             MIDI_EVENT_SYSCM_SONGPOS | MIDI_EVENT_SYSCM_SONGSEL));
-    bool have_data2 = (lhs.type & (
+}
+
+inline bool event_has_data2(MidiEventType type)
+{
+    return (type & (
             MIDI_EVENT_NOTE | MIDI_EVENT_CTRL | MIDI_EVENT_PITCHBEND |
             MIDI_EVENT_AFTERTOUCH | MIDI_EVENT_POLY_AFTERTOUCH |
             MIDI_EVENT_PROGRAM | MIDI_EVENT_SYSCM_SONGPOS));
+}
+
+
+inline bool operator==(MidiEvent const & lhs, MidiEvent const & rhs)
+{
+    // the obvious case: events of different types are never equal
+    if (lhs.type != rhs.type) {
+        return false;
+    }
+
+    // check which fields are relevant for the given event type
+    bool have_channel = event_has_channel(lhs.type);
+    bool have_data1 = event_has_data1(lhs.type);
+    bool have_data2 = event_has_data2(lhs.type);
     bool have_sysex = (lhs.type & MIDI_EVENT_SYSEX);
 
     // return true if each field is either identical or irrelevant
@@ -206,6 +223,28 @@ inline bool operator!=(MidiEvent const & lhs, MidiEvent const & rhs)
 }
 
 
+/**
+ * Returns a hash value for the given event. Events that compare equal
+ * always have the same hash value.
+ */
+inline std::size_t hash_value(MidiEvent const & ev)
+{
+    std::size_t h = ev.type;
+    h = h * 31 + ev.port;
+    if (event_has_channel(ev.type)) {
+        h = h * 31 + ev.channel;
+    }
+    if (event_has_data1(ev.type)) {
+        h = h * 131 + ev.data1;
+    }
+    if (event_has_data2(ev.type)) {
+        h = h * 131 + ev.data2;
+    }
+    h = h * 31 + static_cast<std::size_t>(ev.frame);
+    return h;
+}
+
+
 } // mididings
 
 
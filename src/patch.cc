@@ -15,7 +15,9 @@
 
 #include <algorithm>
 #include <sstream>
-#include <alloca.h>
+#include <stdexcept>
+
+#include <boost/cstdint.hpp>
 
 #include "util/debug.hh"
 
@@ -23,6 +25,44 @@
 namespace mididings {
 
 
+namespace {
+
+/*
+ * a fixed-size bitset of event hashes. may report false positives, but
+ * never false negatives, so an event whose hash isn't in the set is
+ * guaranteed not to have been seen before.
+ */
+class EventHashSet
+{
+  public:
+    EventHashSet() {
+        std::fill(_bits, _bits + WORDS, 0);
+    }
+
+    void insert(std::size_t hash) {
+        std::size_t n = index(hash);
+        _bits[n / 64] |= (boost::uint64_t(1) << (n % 64));
+    }
+
+    bool may_contain(std::size_t hash) const {
+        std::size_t n = index(hash);
+        return _bits[n / 64] & (boost::uint64_t(1) << (n % 64));
+    }
+
+  private:
+    static std::size_t const BITS = 1024;
+    static std::size_t const WORDS = BITS / 64;
+
+    static std::size_t index(std::size_t hash) {
+        return (hash ^ (hash >> 10) ^ (hash >> 20)) % BITS;
+    }
+
+    boost::uint64_t _bits[WORDS];
+};
+
+} // anonymous namespace
+
+
 template <typename B>
 void Patch::Chain::process(B & buf, typename B::Range & range) const
 {
@@ -50,72 +90,163 @@ void Patch::Fork::process(B & buffer, typename B::Range & range) const
 {
     DEBUG_PRINT(Patch::debug_range("Fork in", buffer, range));
 
-    // make a copy of all incoming events, allocated on the stack
-    std::size_t num_events = range.size();
-    MidiEvent *in_events = static_cast<MidiEvent*>(
-                                ::alloca(num_events * sizeof(MidiEvent)));
-    MidiEvent *p = in_events;
-    for (typename B::iterator it = range.begin();
-            it != range.end(); ++it, ++p) {
-        new (p) MidiEvent(*it);
+    // make a copy of the input range
+    typename B::Range in_range(range);
+    // clear range, no events to return so far
+    range.set_begin(range.end());
+
+    // iterate over all input events
+    for (typename B::Iterator it = in_range.begin(); it != in_range.end(); )
+    {
+        // run the event through all modules in this fork, inserting the
+        // results in front of the input event itself
+        typename B::Range ev_range = Patch::fork_event(
+                buffer, it, *it, _modules, _remove_duplicates);
+
+        if (range.empty() && !ev_range.empty()) {
+            // the first event returned marks the beginning of our output range
+            range.set_begin(ev_range.begin());
+        }
+
+        // remove the input event, no copy of it is needed anymore
+        it = buffer.erase(it);
+    }
+
+    DEBUG_PRINT(Patch::debug_range("Fork out", buffer, range));
+}
+
+
+Patch::Split::Split(Key key, MidiEventType types,
+                    std::vector<std::vector<int> > const & table,
+                    std::vector<int> const & other,
+                    ModuleVector const & modules, bool remove_duplicates)
+  : _key(key)
+  , _types(types)
+  , _remove_duplicates(remove_duplicates)
+{
+    // the table needs at least one entry each for values below and beyond
+    // its actual range
+    if (table.size() < 2) {
+        throw std::range_error("split table too small");
+    }
+
+    _table.reserve(table.size());
+    for (std::vector<std::vector<int> >::const_iterator it = table.begin();
+            it != table.end(); ++it) {
+        _table.push_back(add_slot(*it, modules));
+    }
+    _other = add_slot(other, modules);
+}
+
+
+std::size_t Patch::Split::add_slot(std::vector<int> const & indices,
+                                   ModuleVector const & modules)
+{
+    ModuleVector slot;
+    for (std::vector<int>::const_iterator it = indices.begin();
+            it != indices.end(); ++it) {
+        slot.push_back(modules.at(*it));
+    }
+
+    // share slots between table entries that select the same modules
+    std::vector<ModuleVector>::iterator it =
+        std::find(_slots.begin(), _slots.end(), slot);
+    if (it != _slots.end()) {
+        return it - _slots.begin();
+    }
+
+    _slots.push_back(slot);
+    return _slots.size() - 1;
+}
+
+
+Patch::ModuleVector const & Patch::Split::lookup(MidiEvent const & ev) const
+{
+    if (!(ev.type & _types)) {
+        return _slots[_other];
     }
 
-    // remove all incoming events from the buffer
-    buffer.erase(range.begin(), range.end());
+    int value;
+    switch (_key) {
+      case KEY_TYPE:
+        // events always have exactly one type bit set
+        value = __builtin_ctz(ev.type);
+        break;
+      case KEY_PORT:
+        value = ev.port;
+        break;
+      case KEY_CHANNEL:
+        value = ev.channel;
+        break;
+      case KEY_DATA1:
+        value = ev.data1;
+        break;
+      case KEY_DATA2:
+      default:
+        value = ev.data2;
+        break;
+    }
+
+    // the first and last table entries cover everything out of range
+    std::size_t size = _table.size() - 2;
+    std::size_t index = value < 0 ? 0
+                      : static_cast<std::size_t>(value) >= size ? size + 1
+                      : value + 1;
+
+    return _slots[_table[index]];
+}
+
+
+template <typename B>
+void Patch::Split::process(B & buffer, typename B::Range & range) const
+{
+    DEBUG_PRINT(Patch::debug_range("Split in", buffer, range));
 
+    // make a copy of the input range
+    typename B::Range in_range(range);
     // clear range, no events to return so far
     range.set_begin(range.end());
 
-    // iterate over all input events
-    for (MidiEvent *ev = in_events; ev != in_events + num_events; ++ev)
+    // iterate over all events in the input range
+    for (typename B::Iterator it = in_range.begin(); it != in_range.end(); )
     {
-        // the range of events returned for the current input event,
-        // empty so far
-        typename B::Range ev_range(range.end());
-
-        // iterate over all modules in this fork
-        for (ModuleVector::const_iterator module = _modules.begin();
-                module != _modules.end(); ++module)
-        {
-            // insert one event
-            typename B::Iterator it = buffer.insert(ev_range.end(), *ev);
-            // the single-event range to be processed in this iteration
-            typename B::Range proc_range(it, 1);
-            // process event
-            (*module)->process(buffer, proc_range);
-
-            if (!proc_range.empty() && ev_range.empty()) {
-                // at least one event was returned, we can now set the
-                // beginning of range and ev_range if they were empty so far
-                if (range.empty()) {
-                    range.set_begin(proc_range.begin());
-                }
-                ev_range.set_begin(proc_range.begin());
-            }
+        ModuleVector const & modules = lookup(*it);
 
-            if (_remove_duplicates) {
-                // for all events returned in this iteration...
-                for (typename B::Iterator it = proc_range.begin();
-                        it != proc_range.end(); ) {
-                    // look for previous occurrences that were returned for the
-                    // same input event, but from a different module
-                    if (std::find(ev_range.begin(), proc_range.begin(), *it)
-                            != proc_range.begin()) {
-                        // found previous identical event, remove latest one
-                        it = buffer.erase(it);
-                    } else {
-                        ++it;
-                    }
-                }
+        typename B::Range ev_range(it);
+
+        if (modules.empty()) {
+            // event doesn't go anywhere
+            it = buffer.erase(it);
+            continue;
+        }
+        else if (modules.size() == 1) {
+            // only one module to process this event, so there's no need
+            // to make any copies
+            ev_range.advance_end(1);
+            modules.front()->process(buffer, ev_range);
+        }
+        else {
+            // replace the event with the output of all selected modules
+            ev_range = Patch::fork_event(
+                    buffer, it, *it, modules, _remove_duplicates);
+            it = buffer.erase(it);
+            // ev_range ended at the event we just erased
+            if (ev_range.empty()) {
+                ev_range.set_begin(it);
             }
+            ev_range.set_end(it);
         }
 
-        // destroy the event that was previously placement-constructed
-        // on the stack
-        ev->~MidiEvent();
+        if (range.empty() && !ev_range.empty()) {
+            // the first event returned marks the beginning of our output range
+            range.set_begin(ev_range.begin());
+        }
+
+        // the next event to be processed is adjacent to those we just got back
+        it = ev_range.end();
     }
 
-    DEBUG_PRINT(Patch::debug_range("Fork out", buffer, range));
+    DEBUG_PRINT(Patch::debug_range("Split out", buffer, range));
 }
 
 
@@ -146,11 +277,86 @@ void Patch::Single::process(B & buffer, typename B::Range & range) const
 }
 
 
+bool Patch::Single::process_in_place(MidiEvent & ev) const
+{
+    return _unit->process(ev);
+}
+
+
+Patch::SingleChain::SingleChain(UnitVector const & units)
+  : ModuleImpl<SingleChain>(true)
+  , _units(units)
+{
+    _unit_ptrs.reserve(_units.size());
+    for (UnitVector::const_iterator it = _units.begin();
+            it != _units.end(); ++it) {
+        _unit_ptrs.push_back(it->get());
+    }
+}
+
+
+template <typename B>
+void Patch::SingleChain::process(B & buffer, typename B::Range & range) const
+{
+    DEBUG_PRINT(Patch::debug_range("SingleChain in", buffer, range));
+
+    typedef std::vector<units::Unit const *>::const_iterator UnitIterator;
+    UnitIterator const first = _unit_ptrs.begin();
+    UnitIterator const last = _unit_ptrs.end();
+
+    // iterate over all events in the input range
+    for (typename B::Iterator it = range.begin(); it != range.end(); )
+    {
+        // run event through all units, stop as soon as one discards it
+        UnitIterator unit = first;
+        while (unit != last && (*unit)->process(*it)) {
+            ++unit;
+        }
+
+        if (unit == last) {
+            // keep this event, continue with next one
+            ++it;
+        } else {
+            if (it == range.begin()) {
+                // we're going to erase at the beginning of the event range,
+                // so we need to adjust the range to keep it valid
+                range.advance_begin(1);
+            }
+            // remove this event
+            it = buffer.erase(it);
+        }
+    }
+
+    DEBUG_PRINT(Patch::debug_range("SingleChain out", buffer, range));
+}
+
+
+bool Patch::SingleChain::process_in_place(MidiEvent & ev) const
+{
+    for (std::vector<units::Unit const *>::const_iterator unit =
+            _unit_ptrs.begin(); unit != _unit_ptrs.end(); ++unit) {
+        if (!(*unit)->process(ev)) {
+            return false;
+        }
+    }
+    return true;
+}
+
+
 template <typename B>
 void Patch::Extended::process(B & buffer, typename B::Range & range) const
 {
     DEBUG_PRINT(Patch::debug_range("Extended in", buffer, range));
 
+    if (_unit->batch()) {
+        // let the unit process all events at once
+        if (!range.empty()) {
+            range = _unit->process_range(buffer, range);
+        }
+        DEBUG_PRINT(Patch::debug_range("Extended out", buffer, range));
+        return;
+    }
+
     // make a copy of the input range
     typename B::Range in_range(range);
     // clear range, no events to return so far
@@ -187,6 +393,102 @@ void Patch::process(B & buffer, typename B::Range & range) const
 }
 
 
+template <typename B>
+typename B::Range Patch::fork_event(B & buffer, typename B::Iterator pos,
+                                    MidiEvent const & ev,
+                                    ModuleVector const & modules,
+                                    bool remove_duplicates)
+{
+    // the range of events returned for the input event, empty so far
+    typename B::Range ev_range(pos);
+
+    // hashes of all events returned so far, used to rule out duplicates
+    // without comparing against each previous event
+    EventHashSet seen;
+
+    // scratch event for modules that can process events in place. assigned
+    // to in each iteration rather than constructed, which would update the
+    // global (atomic) object counters every time
+    MidiEvent tmp;
+
+    // iterate over all modules
+    for (ModuleVector::const_iterator module = modules.begin();
+            module != modules.end(); ++module)
+    {
+        if ((*module)->in_place()) {
+            // process a copy of the event outside the buffer, and only
+            // insert it if it's actually returned
+            tmp = ev;
+            if (!(*module)->process_in_place(tmp)) {
+                continue;
+            }
+
+            if (remove_duplicates) {
+                std::size_t hash = hash_value(tmp);
+                if (seen.may_contain(hash) &&
+                        std::find(ev_range.begin(), ev_range.end(), tmp)
+                            != ev_range.end()) {
+                    // found previous identical event
+                    continue;
+                }
+                seen.insert(hash);
+            }
+
+            typename B::Iterator it = buffer.insert(ev_range.end(), tmp);
+            if (ev_range.empty()) {
+                ev_range.set_begin(it);
+            }
+            continue;
+        }
+
+        // insert one event
+        typename B::Iterator it = buffer.insert(ev_range.end(), ev);
+        // the single-event range to be processed in this iteration
+        typename B::Range proc_range(it, 1);
+        // process event
+        (*module)->process(buffer, proc_range);
+
+        if (!proc_range.empty() && ev_range.empty()) {
+            // at least one event was returned, we can now set the
+            // beginning of ev_range if it was empty so far
+            ev_range.set_begin(proc_range.begin());
+        }
+
+        if (remove_duplicates) {
+            // for all events returned in this iteration...
+            for (typename B::Iterator it = proc_range.begin();
+                    it != proc_range.end(); ) {
+                // look for previous occurrences that were returned for the
+                // same input event, but from a different module
+                if (seen.may_contain(hash_value(*it)) &&
+                        std::find(ev_range.begin(), proc_range.begin(), *it)
+                            != proc_range.begin()) {
+                    // found previous identical event, remove latest one.
+                    // keep proc_range valid, it marks the end of the events
+                    // to compare against
+                    bool first = (it == proc_range.begin());
+                    it = buffer.erase(it);
+                    if (first) {
+                        proc_range.set_begin(it);
+                    }
+                } else {
+                    ++it;
+                }
+            }
+
+            // only now add this module's events to the set, events returned
+            // by the same module are never considered duplicates
+            for (typename B::Iterator it = proc_range.begin();
+                    it != proc_range.end(); ++it) {
+                seen.insert(hash_value(*it));
+            }
+        }
+    }
+
+    return ev_range;
+}
+
+
 template <typename B>
 std::string Patch::debug_range(std::string const & str, B const & buffer,
                                typename B::Range const & range)
@@ -209,21 +511,43 @@ template void Patch::Chain::process<Patch::EventBufferRT>(
                                 EventBufferRT &, EventBufferRT::Range &) const;
 template void Patch::Chain::process<Patch::EventBuffer>(
                                 EventBuffer &, EventBuffer::Range &) const;
+template void Patch::Chain::process<Patch::EventBufferArena>(
+                        EventBufferArena &, EventBufferArena::Range &) const;
 template void Patch::Fork::process<Patch::EventBufferRT>(
                                 EventBufferRT &, EventBufferRT::Range &) const;
 template void Patch::Fork::process<Patch::EventBuffer>(
                                 EventBuffer &, EventBuffer::Range &) const;
+template void Patch::Fork::process<Patch::EventBufferArena>(
+                        EventBufferArena &, EventBufferArena::Range &) const;
+template void Patch::Split::process<Patch::EventBufferRT>(
+                                EventBufferRT &, EventBufferRT::Range &) const;
+template void Patch::Split::process<Patch::EventBuffer>(
+                                EventBuffer &, EventBuffer::Range &) const;
+template void Patch::Split::process<Patch::EventBufferArena>(
+                        EventBufferArena &, EventBufferArena::Range &) const;
 template void Patch::Single::process<Patch::EventBufferRT>(
                                 EventBufferRT &, EventBufferRT::Range &) const;
 template void Patch::Single::process<Patch::EventBuffer>(
                                 EventBuffer &, EventBuffer::Range &) const;
+template void Patch::Single::process<Patch::EventBufferArena>(
+                        EventBufferArena &, EventBufferArena::Range &) const;
+template void Patch::SingleChain::process<Patch::EventBufferRT>(
+                                EventBufferRT &, EventBufferRT::Range &) const;
+template void Patch::SingleChain::process<Patch::EventBuffer>(
+                                EventBuffer &, EventBuffer::Range &) const;
+template void Patch::SingleChain::process<Patch::EventBufferArena>(
+                        EventBufferArena &, EventBufferArena::Range &) const;
 template void Patch::Extended::process<Patch::EventBufferRT>(
                                 EventBufferRT &, EventBufferRT::Range &) const;
 template void Patch::Extended::process<Patch::EventBuffer>(
                                 EventBuffer &, EventBuffer::Range &) const;
+template void Patch::Extended::process<Patch::EventBufferArena>(
+                        EventBufferArena &, EventBufferArena::Range &) const;
 
 template void Patch::process(EventBufferRT &, EventBufferRT::Range &) const;
 template void Patch::process(EventBuffer &, EventBuffer::Range &) const;
+template void Patch::process(EventBufferArena &,
+                             EventBufferArena::Range &) const;
 
 
 } // mididings
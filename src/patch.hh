@@ -24,6 +24,7 @@
 #include <boost/noncopyable.hpp>
 
 #include "util/iterator_range.hh"
+#include "util/arena_list.hh"
 #include "util/counted_objects.hh"
 #include "util/debug.hh"
 
@@ -51,6 +52,8 @@ class Patch
 
     typedef std::list<MidiEvent> EventList;
 
+    typedef das::arena_list<MidiEvent, config::MAX_EVENTS> EventListArena;
+
     // deriving from a standard container. get over it.
     template <typename T>
     class EventBufferType
@@ -87,9 +90,16 @@ class Patch
      */
     typedef EventBufferType<EventList> EventBuffer;
 
+    /**
+     * The alternative buffer type for RT-safe event processing, storing
+     * events in a contiguous arena.
+     */
+    typedef EventBufferType<EventListArena> EventBufferArena;
+
 
     typedef boost::shared_ptr<units::Unit> UnitPtr;
     typedef boost::shared_ptr<units::UnitEx> UnitExPtr;
+    typedef std::vector<UnitPtr> UnitVector;
 
 
     /**
@@ -100,13 +110,37 @@ class Patch
       , das::counted_objects<Module>
     {
       public:
-        Module() { }
+        Module(bool in_place = false)
+          : _in_place(in_place)
+        { }
         virtual ~Module() { }
 
         virtual void process(EventBufferRT & buffer,
                              EventBufferRT::Range & range) const = 0;
         virtual void process(EventBuffer & buffer,
                              EventBuffer::Range & range) const = 0;
+        virtual void process(EventBufferArena & buffer,
+                             EventBufferArena::Range & range) const = 0;
+
+        /**
+         * Returns true if this module never returns more than one event for
+         * each input event, and can thus process events outside of any
+         * event buffer using process_in_place().
+         */
+        bool in_place() const {
+            return _in_place;
+        }
+
+        /**
+         * Processes a single event in place. Returns false if the event
+         * was discarded. Only supported if in_place() returns true.
+         */
+        virtual bool process_in_place(MidiEvent & /*ev*/) const {
+            return true;
+        }
+
+      private:
+        bool const _in_place;
     };
 
     typedef boost::shared_ptr<Module> ModulePtr;
@@ -124,6 +158,10 @@ class Patch
       : public Module
     {
       public:
+        ModuleImpl(bool in_place = false)
+          : Module(in_place)
+        { }
+
         virtual void process(EventBufferRT & buffer,
                              EventBufferRT::Range & range) const {
             Derived const & d = *static_cast<Derived const*>(this);
@@ -135,6 +173,12 @@ class Patch
             Derived const & d = *static_cast<Derived const*>(this);
             d.template process<EventBuffer>(buffer, range);
         }
+
+        virtual void process(EventBufferArena & buffer,
+                             EventBufferArena::Range & range) const {
+            Derived const & d = *static_cast<Derived const*>(this);
+            d.template process<EventBufferArena>(buffer, range);
+        }
     };
 
 
@@ -180,6 +224,54 @@ class Patch
     };
 
 
+    /**
+     * A split, units connected in parallel, with each event being sent only
+     * to the modules selected by a lookup table indexed by one of the event's
+     * attributes.
+     */
+    class Split
+      : public ModuleImpl<Split>
+    {
+      public:
+        enum Key {
+            KEY_TYPE,
+            KEY_PORT,
+            KEY_CHANNEL,
+            KEY_DATA1,
+            KEY_DATA2,
+        };
+
+        /**
+         * \param key       the event attribute to dispatch on
+         * \param types     the event types affected by the split
+         * \param table     a list of module indices for each value of the
+         *                  event attribute. the first and last entries are
+         *                  used for values below and beyond the table's range
+         * \param other     module indices for events of other types
+         */
+        Split(Key key, MidiEventType types,
+              std::vector<std::vector<int> > const & table,
+              std::vector<int> const & other,
+              ModuleVector const & modules, bool remove_duplicates);
+
+        template <typename B>
+        void process(B & buffer, typename B::Range & range) const;
+
+      private:
+        std::size_t add_slot(std::vector<int> const & indices,
+                             ModuleVector const & modules);
+
+        ModuleVector const & lookup(MidiEvent const & ev) const;
+
+        Key const _key;
+        MidiEventType const _types;
+        std::vector<ModuleVector> _slots;
+        std::vector<std::size_t> _table;
+        std::size_t _other;
+        bool const _remove_duplicates;
+    };
+
+
     /**
      * A single unit.
      */
@@ -188,17 +280,44 @@ class Patch
     {
       public:
         Single(UnitPtr const & unit)
-          : _unit(unit)
+          : ModuleImpl<Single>(true)
+          , _unit(unit)
         { }
 
         template <typename B>
         void process(B & buffer, typename B::Range & range) const;
 
+        virtual bool process_in_place(MidiEvent & ev) const;
+
       private:
         UnitPtr const _unit;
     };
 
 
+    /**
+     * A chain of single units, fused into one module. Each event is run
+     * through all units in one go, rather than running all events through
+     * one unit after the other.
+     */
+    class SingleChain
+      : public ModuleImpl<SingleChain>
+    {
+      public:
+        SingleChain(UnitVector const & units);
+
+        template <typename B>
+        void process(B & buffer, typename B::Range & range) const;
+
+        virtual bool process_in_place(MidiEvent & ev) const;
+
+      private:
+        UnitVector const _units;
+        // plain pointers to the same units, avoiding an extra indirection
+        // in the inner loop
+        std::vector<units::Unit const *> _unit_ptrs;
+    };
+
+
     /**
      * A single extended unit.
      */
@@ -223,12 +342,26 @@ class Patch
     /**
      * Creates a new patch.
      *
-     * \param module    the root module of the patch
+     * \param module            the root module of the patch
+     * \param offload_types     the types of events that may reach a unit
+     *                          calling Python code, see offload_types()
      */
-    Patch(ModulePtr const & module)
+    Patch(ModulePtr const & module,
+          MidiEventType offload_types = MIDI_EVENT_NONE)
       : _module(module)
+      , _offload_types(offload_types)
     { }
 
+    /**
+     * The types of incoming events for which the engine may call Python
+     * code when processing them through this patch (including the control,
+     * pre and post patches). In hybrid mode, these events are processed
+     * outside the realtime thread.
+     */
+    MidiEventType offload_types() const {
+        return _offload_types;
+    }
+
     /**
      * Processes events.
      *
@@ -291,12 +424,25 @@ class Patch
 
   private:
 
+    /**
+     * Runs a copy of the given event through each of the modules, inserting
+     * the results before pos. Returns the range of events returned by all
+     * modules. The event itself may be part of the buffer, as long as it's
+     * not within the range being processed.
+     */
+    template <typename B>
+    static typename B::Range fork_event(B & buffer, typename B::Iterator pos,
+                                        MidiEvent const & ev,
+                                        ModuleVector const & modules,
+                                        bool remove_duplicates);
+
     template <typename B>
     static std::string debug_range(std::string const & str, B const & buffer,
                                    typename B::Range const & range);
 
 
     ModulePtr const _module;
+    MidiEventType const _offload_types;
 };
 
 
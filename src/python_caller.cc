@@ -17,6 +17,9 @@
 #include <boost/bind.hpp>
 
 #include <boost/thread/mutex.hpp>
+#include <boost/thread/thread_time.hpp>
+
+#include <algorithm>
 
 #include <boost/python/object.hpp>
 #include <boost/python/ptr.hpp>
@@ -33,40 +36,68 @@ namespace bp = boost::python;
 namespace mididings {
 
 
-PythonCaller::PythonCaller(EngineCallback engine_callback)
-  : _rb(new das::ringbuffer<AsyncCallInfo>(config::MAX_ASYNC_CALLS))
+PythonCaller::PythonCaller(EngineCallback engine_callback,
+                           int num_workers, std::size_t queue_size,
+                           bool realtime)
+  : _queue_size(queue_size)
+  , _realtime(realtime)
+  , _incoming(std::max(queue_size, config::ASYNC_HANDOFF_CALLS) + 1)
+  , _has_pending(false)
+  , _free(queue_size + num_workers)
   , _engine_callback(engine_callback)
   , _quit(false)
 {
-    // start async thread
+    _running.reserve(num_workers);
+    _incoming_dropped = 0;
+
+    _stats.queued = 0;
+    _stats.max_queued = 0;
+    _stats.dropped = 0;
+    _stats.coalesced = 0;
+    _stats.blocked = 0;
+
+    // start async threads
+    for (int n = 0; n < num_workers; ++n) {
 #if BOOST_VERSION >= 105000
-    boost::thread::attributes attr;
-    attr.set_stack_size(config::ASYNC_THREAD_STACK_SIZE);
-    _thread.reset(new boost::thread(attr,
-                        boost::bind(&PythonCaller::async_thread, this)));
+        boost::thread::attributes attr;
+        attr.set_stack_size(config::ASYNC_THREAD_STACK_SIZE);
+        _threads.push_back(boost::shared_ptr<boost::thread>(
+                new boost::thread(attr,
+                        boost::bind(&PythonCaller::async_thread, this))));
 #else
-    _thread.reset(new boost::thread(
-                        boost::bind(&PythonCaller::async_thread, this)));
+        _threads.push_back(boost::shared_ptr<boost::thread>(
+                new boost::thread(
+                        boost::bind(&PythonCaller::async_thread, this))));
 #endif
+    }
 }
 
 
 PythonCaller::~PythonCaller()
 {
-    // release the GIL to ensure that we don't block the async thread
+    // release the GIL to ensure that we don't block the async threads
     das::python::scoped_gil_release release;
 
-    _quit = true;
-    _cond.notify_one();
+    {
+        boost::mutex::scoped_lock lock(_mutex);
+        _quit = true;
+    }
+    _cond.notify_all();
+    _space_cond.notify_all();
+
+    boost::system_time const timeout = boost::get_system_time() +
+        boost::posix_time::milliseconds(config::ASYNC_JOIN_TIMEOUT);
 
-    _thread->timed_join(
-        boost::posix_time::milliseconds(config::ASYNC_JOIN_TIMEOUT));
+    for (std::vector<boost::shared_ptr<boost::thread> >::iterator
+            it = _threads.begin(); it != _threads.end(); ++it) {
+        (*it)->timed_join(timeout);
+    }
 }
 
 
 template <typename B>
 typename B::Range PythonCaller::call_now(B & buffer, typename B::Iterator it,
-                                         bp::object const & fun)
+                                         bp::object const & fun, bool * failed)
 {
     das::python::scoped_gil_lock gil;
 
@@ -75,28 +106,56 @@ typename B::Range PythonCaller::call_now(B & buffer, typename B::Iterator it,
         // call the python function
         bp::object ret = fun(*it);
 
-        if (ret.ptr() == Py_None) {
-            // returned None
-            return Patch::delete_event(buffer, it);
+        return return_events(buffer, it, ret);
+    }
+    catch (bp::error_already_set const &)
+    {
+        PyErr_Print();
+        if (failed) {
+            *failed = true;
         }
+        return Patch::delete_event(buffer, it);
+    }
+}
 
-        bp::list ret_list = bp::extract<bp::list>(ret);
-        bp::ssize_t len = bp::len(ret_list);
 
-        if (len == 0) {
-            return Patch::delete_event(buffer, it);
-        }
-        else if (len == 1) {
-            *it = bp::extract<MidiEvent>(ret_list[0]);
+template <typename B>
+typename B::Range PythonCaller::call_now_view(B & buffer,
+                typename B::Iterator it, bp::object const & fun,
+                bp::object const & convert, bp::object const & view_obj,
+                EventView & view)
+{
+    das::python::scoped_gil_lock gil;
+
+    // the same unit may be used again while the function is running, so
+    // restore the previous event afterwards rather than clearing it
+    MidiEvent * prev = view.reset(&*it);
+
+    try
+    {
+        // call the python function
+        bp::object ret = fun(view_obj);
+
+        if (ret.ptr() == view_obj.ptr()) {
+            // returned the view, the event has been modified in place
+            view.reset(prev);
             return Patch::keep_event(buffer, it);
         }
-        else {
-            bp::stl_input_iterator<MidiEvent> begin(ret_list), end;
-            return Patch::replace_event(buffer, it, begin, end);
+
+        if (ret.ptr() != Py_None) {
+            // the view must remain valid while converting, in case the
+            // function is a generator
+            ret = convert(ret);
         }
+
+        view.reset(prev);
+
+        return return_events(buffer, it, ret);
     }
     catch (bp::error_already_set const &)
     {
+        view.reset(prev);
+
         PyErr_Print();
         return Patch::delete_event(buffer, it);
     }
@@ -104,14 +163,97 @@ typename B::Range PythonCaller::call_now(B & buffer, typename B::Iterator it,
 
 
 template <typename B>
-typename B::Range PythonCaller::call_deferred(B & buffer,
-                typename B::Iterator it, bp::object const & fun, bool keep)
+typename B::Range PythonCaller::return_events(B & buffer,
+                typename B::Iterator it, bp::object const & ret)
 {
-    AsyncCallInfo c = { &fun, *it };
+    if (ret.ptr() == Py_None) {
+        // returned None
+        return Patch::delete_event(buffer, it);
+    }
 
-    // queue function/event, notify async thread
-    VERIFY(_rb->write(c));
-    _cond.notify_one();
+    bp::list ret_list = bp::extract<bp::list>(ret);
+    bp::ssize_t len = bp::len(ret_list);
+
+    if (len == 0) {
+        return Patch::delete_event(buffer, it);
+    }
+    else if (len == 1) {
+        *it = bp::extract<MidiEvent>(ret_list[0]);
+        return Patch::keep_event(buffer, it);
+    }
+    else {
+        bp::stl_input_iterator<MidiEvent> begin(ret_list), end;
+        return Patch::replace_event(buffer, it, begin, end);
+    }
+}
+
+
+template <typename B>
+typename B::Range PythonCaller::call_now_batch(B & buffer,
+                typename B::Range const & range, bp::object const & fun)
+{
+    das::python::scoped_gil_lock gil;
+
+    try
+    {
+        bp::list events;
+        for (typename B::Iterator it = range.begin();
+                it != range.end(); ++it) {
+            events.append(*it);
+        }
+
+        // call the python function
+        bp::object ret = fun(events);
+
+        bp::ssize_t len = 0;
+        if (ret.ptr() != Py_None) {
+            len = bp::len(ret);
+        }
+
+        typename B::Iterator it = range.begin();
+
+        if (len == 0) {
+            // returned None or an empty list
+            while (it != range.end()) {
+                it = buffer.erase(it);
+            }
+            return typename B::Range(it);
+        }
+
+        // overwrite the original events, then remove or insert any
+        // events if the number of events changed
+        bp::list ret_list = bp::extract<bp::list>(ret);
+        bp::stl_input_iterator<MidiEvent> ret_it(ret_list), ret_end;
+
+        for ( ; it != range.end() && ret_it != ret_end; ++it, ++ret_it) {
+            *it = *ret_it;
+        }
+        while (it != range.end()) {
+            it = buffer.erase(it);
+        }
+        buffer.insert(range.end(), ret_it, ret_end);
+
+        return typename B::Range(range.begin(), range.end());
+    }
+    catch (bp::error_already_set const &)
+    {
+        PyErr_Print();
+
+        typename B::Iterator it = range.begin();
+        while (it != range.end()) {
+            it = buffer.erase(it);
+        }
+        return typename B::Range(it);
+    }
+}
+
+
+template <typename B>
+typename B::Range PythonCaller::call_deferred(B & buffer,
+                typename B::Iterator it, bp::object const & fun, bool keep,
+                OverflowPolicy overflow)
+{
+    queue_call(fun, *it, overflow);
 
     if (keep) {
         return Patch::keep_event(buffer, it);
@@ -121,36 +263,231 @@ typename B::Range PythonCaller::call_deferred(B & buffer,
 }
 
 
+void PythonCaller::queue_call(bp::object const & fun, MidiEvent const & ev,
+                              OverflowPolicy overflow)
+{
+    if (overflow == OVERFLOW_BLOCK && !_realtime) {
+        // wait until the call fits into the queue
+        boost::mutex::scoped_lock lock(_mutex);
+
+        if (_stats.queued + _incoming.read_space() >= _queue_size) {
+            ++_stats.blocked;
+            if (!wait_for_space(lock)) {
+                ++_stats.dropped;
+                return;
+            }
+        }
+    }
+
+    AsyncCallInfo c = { &fun, ev, overflow };
+
+    if (!_incoming.write(c)) {
+        // the workers haven't taken any calls in a long time
+        _incoming_dropped = _incoming_dropped + 1;
+        return;
+    }
+
+    _cond.notify_one();
+}
+
+
+bool PythonCaller::wait_for_space(boost::mutex::scoped_lock & lock)
+{
+    // the workers need the GIL to make any progress
+    PyThreadState *state = das::python::gil_held() ? PyEval_SaveThread()
+                                                   : NULL;
+
+    boost::system_time const timeout = boost::get_system_time() +
+        boost::posix_time::milliseconds(config::ASYNC_BLOCK_TIMEOUT);
+
+    while (_stats.queued + _incoming.read_space() >= _queue_size && !_quit) {
+        if (!_space_cond.timed_wait(lock, timeout)) {
+            break;
+        }
+    }
+
+    if (state) {
+        // anyone holding the GIL may be waiting for the mutex, so it can
+        // only be reacquired after unlocking
+        lock.unlock();
+        PyEval_RestoreThread(state);
+        lock.lock();
+    }
+
+    return _stats.queued + _incoming.read_space() < _queue_size;
+}
+
+
+void PythonCaller::take_incoming()
+{
+    bool taken = false;
+
+    while (_has_pending || _incoming.read(_pending)) {
+        _has_pending = false;
+        taken = true;
+
+        if (_pending.overflow == OVERFLOW_COALESCE &&
+                coalesce_call(_pending)) {
+            ++_stats.coalesced;
+            _pending.ev.sysex.reset();
+            continue;
+        }
+
+        if (_stats.queued == _queue_size) {
+            if (_pending.overflow == OVERFLOW_DROP_OLDEST) {
+                _queue.front().ev.sysex.reset();
+                _free.splice(_free.end(), _queue, _queue.begin());
+                --_stats.queued;
+                ++_stats.dropped;
+            }
+            else if (_pending.overflow == OVERFLOW_BLOCK) {
+                // keep the call (and all later ones) until there's space
+                _has_pending = true;
+                break;
+            }
+            else {
+                ++_stats.dropped;
+                _pending.ev.sysex.reset();
+                continue;
+            }
+        }
+
+        // move an unused entry to the end of the queue
+        CallList::iterator c = _free.begin();
+        c->fun = _pending.fun;
+        c->ev = _pending.ev;
+        _queue.splice(_queue.end(), _free, c);
+        _pending.ev.sysex.reset();
+
+        ++_stats.queued;
+        _stats.max_queued = std::max(_stats.max_queued, _stats.queued);
+    }
+
+    if (taken) {
+        _space_cond.notify_one();
+    }
+}
+
+
+bool PythonCaller::coalesce_call(AsyncCallInfo const & call)
+{
+    MidiEvent const & ev = call.ev;
+
+    // only events that represent the current value of something can replace
+    // each other
+    MidiEventType const value_types = MIDI_EVENT_CTRL |
+                                      MIDI_EVENT_PITCHBEND |
+                                      MIDI_EVENT_AFTERTOUCH |
+                                      MIDI_EVENT_POLY_AFTERTOUCH |
+                                      MIDI_EVENT_PROGRAM;
+    if (!(ev.type & value_types)) {
+        return false;
+    }
+
+    bool const has_key = ev.type & (MIDI_EVENT_CTRL |
+                                    MIDI_EVENT_POLY_AFTERTOUCH);
+
+    for (CallList::iterator c = _queue.begin(); c != _queue.end(); ++c) {
+        if (c->fun == call.fun && c->ev.type == ev.type &&
+                c->ev.port == ev.port && c->ev.channel == ev.channel &&
+                (!has_key || c->ev.data1 == ev.data1)) {
+            // move the call to the end of the queue, so the order relative
+            // to other calls to the same function is preserved
+            c->ev = ev;
+            _queue.splice(_queue.end(), _queue, c);
+            return true;
+        }
+    }
+
+    return false;
+}
+
+
+PythonCaller::CallList::iterator PythonCaller::next_call()
+{
+    CallList::iterator c = _queue.begin();
+
+    while (c != _queue.end() &&
+            std::find(_running.begin(), _running.end(), c->fun)
+                != _running.end()) {
+        ++c;
+    }
+
+    return c;
+}
+
+
+PythonCaller::AsyncStats PythonCaller::async_stats()
+{
+    boost::mutex::scoped_lock lock(_mutex);
+
+    AsyncStats stats = _stats;
+    stats.queued += _incoming.read_space() + _has_pending;
+    stats.dropped += _incoming_dropped;
+    return stats;
+}
+
+
 void PythonCaller::async_thread()
 {
-    boost::mutex mutex;
+    // the call currently being made by this thread
+    CallList current;
 
     for (;;)
     {
-        if (_rb->read_space()) {
-            das::python::scoped_gil_lock gil;
+        {
+            boost::mutex::scoped_lock lock(_mutex);
+
+            take_incoming();
+
+            CallList::iterator c = next_call();
 
-            // read event from ringbuffer
-            AsyncCallInfo c;
-            _rb->read(c);
+            if (c != _queue.end()) {
+                // take the call out of the queue
+                _running.push_back(c->fun);
+                current.splice(current.end(), _queue, c);
+                --_stats.queued;
 
-            try {
-                // call python function
-                (*c.fun)(bp::ptr(&c.ev));
+                if (next_call() != _queue.end()) {
+                    // there's more work for other workers
+                    _cond.notify_one();
+                }
             }
-            catch (bp::error_already_set &) {
-                PyErr_Print();
+            else if (_quit) {
+                // program termination
+                return;
             }
-        }
-        else if (_quit) {
-            // program termination
-            return;
-        }
-        else {
-            // wait until woken up again
-            boost::mutex::scoped_lock lock(mutex);
-            _cond.timed_wait(lock, boost::posix_time::milliseconds(
+            else {
+                // wait until woken up again
+                _cond.timed_wait(lock, boost::posix_time::milliseconds(
                                         config::ASYNC_CALLBACK_INTERVAL));
+            }
+        }
+
+        if (!current.empty()) {
+            AsyncCallInfo & c = current.front();
+
+            {
+                das::python::scoped_gil_lock gil;
+
+                try {
+                    // call python function
+                    (*c.fun)(bp::ptr(&c.ev));
+                }
+                catch (bp::error_already_set &) {
+                    PyErr_Print();
+                }
+            }
+
+            c.ev.sysex.reset();
+
+            boost::mutex::scoped_lock lock(_mutex);
+
+            _running.erase(std::find(_running.begin(), _running.end(),
+                                     c.fun));
+            _free.splice(_free.end(), current);
+
+            _space_cond.notify_one();
         }
 
         _engine_callback();
@@ -162,16 +499,55 @@ void PythonCaller::async_thread()
 // force template instantiations
 template Patch::EventBufferRT::Range PythonCaller::call_now(
                         Patch::EventBufferRT &, Patch::EventBufferRT::Iterator,
-                        boost::python::object const &);
+                        boost::python::object const &, bool *);
 template Patch::EventBuffer::Range PythonCaller::call_now(
                         Patch::EventBuffer &, Patch::EventBuffer::Iterator,
+                        boost::python::object const &, bool *);
+template Patch::EventBufferArena::Range PythonCaller::call_now(
+                        Patch::EventBufferArena &,
+                        Patch::EventBufferArena::Iterator,
+                        boost::python::object const &, bool *);
+template Patch::EventBufferRT::Range PythonCaller::call_now_view(
+                        Patch::EventBufferRT &, Patch::EventBufferRT::Iterator,
+                        boost::python::object const &,
+                        boost::python::object const &,
+                        boost::python::object const &, EventView &);
+template Patch::EventBuffer::Range PythonCaller::call_now_view(
+                        Patch::EventBuffer &, Patch::EventBuffer::Iterator,
+                        boost::python::object const &,
+                        boost::python::object const &,
+                        boost::python::object const &, EventView &);
+template Patch::EventBufferArena::Range PythonCaller::call_now_view(
+                        Patch::EventBufferArena &,
+                        Patch::EventBufferArena::Iterator,
+                        boost::python::object const &,
+                        boost::python::object const &,
+                        boost::python::object const &, EventView &);
+template Patch::EventBufferRT::Range PythonCaller::call_now_batch(
+                        Patch::EventBufferRT &,
+                        Patch::EventBufferRT::Range const &,
+                        boost::python::object const &);
+template Patch::EventBuffer::Range PythonCaller::call_now_batch(
+                        Patch::EventBuffer &,
+                        Patch::EventBuffer::Range const &,
+                        boost::python::object const &);
+template Patch::EventBufferArena::Range PythonCaller::call_now_batch(
+                        Patch::EventBufferArena &,
+                        Patch::EventBufferArena::Range const &,
                         boost::python::object const &);
 template Patch::EventBufferRT::Range PythonCaller::call_deferred(
                         Patch::EventBufferRT &, Patch::EventBufferRT::Iterator,
-                        boost::python::object const &, bool);
+                        boost::python::object const &, bool,
+                        PythonCaller::OverflowPolicy);
 template Patch::EventBuffer::Range PythonCaller::call_deferred(
                         Patch::EventBuffer &, Patch::EventBuffer::Iterator,
-                        boost::python::object const &, bool);
+                        boost::python::object const &, bool,
+                        PythonCaller::OverflowPolicy);
+template Patch::EventBufferArena::Range PythonCaller::call_deferred(
+                        Patch::EventBufferArena &,
+                        Patch::EventBufferArena::Iterator,
+                        boost::python::object const &, bool,
+                        PythonCaller::OverflowPolicy);
 
 
 } // mididings
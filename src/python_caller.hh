@@ -14,21 +14,58 @@
 
 #include "midi_event.hh"
 #include "patch.hh"
+#include "util/ringbuffer.hh"
 
 #include <boost/scoped_ptr.hpp>
+#include <boost/shared_ptr.hpp>
 #include <boost/function.hpp>
 
 #include <boost/python/object_fwd.hpp>
 #include <boost/thread/thread.hpp>
 #include <boost/thread/condition.hpp>
+#include <boost/thread/mutex.hpp>
 #include <boost/noncopyable.hpp>
 
-#include "util/ringbuffer.hh"
+#include <list>
+#include <vector>
+#include <stdexcept>
 
 
 namespace mididings {
 
 
+/*
+ * gives python functions direct access to an event in the event buffer,
+ * without copying or converting it. a view is only valid during the function
+ * call it was passed to.
+ */
+class EventView
+{
+  public:
+    EventView()
+      : _ev(NULL)
+    { }
+
+    MidiEvent & event() const {
+        if (!_ev) {
+            throw std::runtime_error("event view used outside of the "
+                                     "function it was passed to");
+        }
+        return *_ev;
+    }
+
+    // points the view to a different event, returns the previous one
+    MidiEvent * reset(MidiEvent * ev) {
+        MidiEvent * prev = _ev;
+        _ev = ev;
+        return prev;
+    }
+
+  private:
+    MidiEvent * _ev;
+};
+
+
 class PythonCaller
   : boost::noncopyable
 {
@@ -36,36 +73,141 @@ class PythonCaller
 
     typedef boost::function<void()> EngineCallback;
 
-    PythonCaller(EngineCallback engine_callback);
+    // what to do when an asynchronous call can't be queued because the
+    // queue is full
+    enum OverflowPolicy {
+        // discard the oldest queued call
+        OVERFLOW_DROP_OLDEST,
+        // discard the new call
+        OVERFLOW_DROP_NEWEST,
+        // replace a queued call to the same function with an event of the
+        // same kind (controller, program change, etc.), even if the queue
+        // isn't full. otherwise discard the new call
+        OVERFLOW_COALESCE,
+        // wait until there is space in the queue, unless called from a
+        // realtime thread. discard the new call if there is still no space
+        // after config::ASYNC_BLOCK_TIMEOUT milliseconds
+        OVERFLOW_BLOCK,
+    };
+
+    struct AsyncStats {
+        // number of calls currently queued
+        std::size_t queued;
+        // maximum number of calls queued at any time
+        std::size_t max_queued;
+        // number of calls discarded because the queue was full
+        std::size_t dropped;
+        // number of calls replaced by a newer one
+        std::size_t coalesced;
+        // number of times a caller had to wait for space in the queue
+        std::size_t blocked;
+    };
+
+    // realtime indicates that calls are queued from a thread that must
+    // never block
+    PythonCaller(EngineCallback engine_callback,
+                 int num_workers, std::size_t queue_size, bool realtime);
     ~PythonCaller();
 
-    // call python function immediately
+    // call python function immediately. if failed is given, it's set to
+    // true if the function raised an exception
     template <typename B>
     typename B::Range call_now(B & buf, typename B::Iterator it,
+                               boost::python::object const & fun,
+                               bool * failed = NULL);
+
+    // call python function immediately, passing an event view instead of a
+    // copy of the event. if the function returns anything other than the
+    // view itself or None, convert is called to turn it into a list of
+    // events
+    template <typename B>
+    typename B::Range call_now_view(B & buf, typename B::Iterator it,
+                               boost::python::object const & fun,
+                               boost::python::object const & convert,
+                               boost::python::object const & view_obj,
+                               EventView & view);
+
+    // call python function immediately, passing all events in range at once
+    template <typename B>
+    typename B::Range call_now_batch(B & buf, typename B::Range const & range,
                                boost::python::object const & fun);
 
-    // queue python function to be called asynchronously
+    // queue python function to be called asynchronously. calls to the same
+    // function are always made in order, and never concurrently
     template <typename B>
     typename B::Range call_deferred(B & buf, typename B::Iterator it,
-                               boost::python::object const & fun, bool keep);
+                               boost::python::object const & fun, bool keep,
+                               OverflowPolicy overflow = OVERFLOW_DROP_OLDEST);
+
+    AsyncStats async_stats();
 
   private:
 
-    void async_thread();
+    // replace the event with those returned by a python function
+    template <typename B>
+    static typename B::Range return_events(B & buf, typename B::Iterator it,
+                               boost::python::object const & ret);
 
     struct AsyncCallInfo {
         boost::python::object const * fun;
         MidiEvent ev;
+        OverflowPolicy overflow;
     };
 
-    boost::scoped_ptr<das::ringbuffer<AsyncCallInfo> > _rb;
+    typedef std::list<AsyncCallInfo> CallList;
+
+    // hands a call to the worker threads. never locks unless the overflow
+    // policy is OVERFLOW_BLOCK and we're not called from a realtime thread
+    void queue_call(boost::python::object const & fun, MidiEvent const & ev,
+                    OverflowPolicy overflow);
+    bool wait_for_space(boost::mutex::scoped_lock & lock);
+
+    // moves calls handed over by queue_call() to the queue, applying their
+    // overflow policies. must be called with the mutex held
+    void take_incoming();
+    bool coalesce_call(AsyncCallInfo const & call);
+
+    // returns an iterator to the oldest queued call whose function is not
+    // currently being called by another worker
+    CallList::iterator next_call();
+
+    void async_thread();
+
+    std::size_t const _queue_size;
+    bool const _realtime;
+
+    // calls handed over by queue_call(), not yet moved to the queue. only
+    // written to by the thread processing events
+    das::ringbuffer<AsyncCallInfo> _incoming;
+    // the oldest call taken from _incoming that couldn't be queued yet
+    // because of its overflow policy
+    AsyncCallInfo _pending;
+    bool _has_pending;
+    // number of calls discarded because _incoming was full. only written
+    // to by the thread processing events
+    das::atomic_size_t _incoming_dropped;
+
+    // queued calls, oldest first. all entries (including those for calls
+    // currently being made) are preallocated and moved between the queue
+    // and the free list, so queueing a call never allocates memory
+    CallList _queue;
+    CallList _free;
+
+    // functions currently being called by a worker
+    std::vector<boost::python::object const *> _running;
+
+    AsyncStats _stats;
 
-    boost::scoped_ptr<boost::thread> _thread;
+    std::vector<boost::shared_ptr<boost::thread> > _threads;
 
     EngineCallback _engine_callback;
 
+    boost::mutex _mutex;
+    // signalled when a call is queued, or a worker becomes available
     boost::condition _cond;
-    volatile bool _quit;
+    // signalled when space becomes available in the queue
+    boost::condition _space_cond;
+    bool _quit;
 };
 
 
@@ -13,16 +13,26 @@
 #include "engine.hh"
 #include "patch.hh"
 #include "send_midi.hh"
+#include "smf.hh"
+#include "sysex_pool.hh"
 #include "midi_event.hh"
 #include "backend/base.hh"
+#include "backend/sysex_transmitter.hh"
 #include "units/base.hh"
 #include "units/engine.hh"
 #include "units/filters.hh"
 #include "units/modifiers.hh"
 #include "units/generators.hh"
 #include "units/call.hh"
+#include "units/expression.hh"
+#include "units/voices.hh"
+#include "units/stateful.hh"
 #include "curious_alloc.hh"
 
+#ifdef ENABLE_BENCHMARK
+#include "benchmark.hh"
+#endif
+
 #include "util/python.hh"
 #include "util/python_sequence_converters.hh"
 #include "util/python_bytes_converters.hh"
@@ -45,6 +55,10 @@
 #include <map>
 #include <string>
 #include <cstdlib>
+#include <stdexcept>
+
+#include <boost/scoped_ptr.hpp>
+#include <boost/bind.hpp>
 
 #ifdef ENABLE_DEBUG_STATS
 #include <iostream>
@@ -77,6 +91,16 @@ std::string curious_alloc_stats(std::string const & name)
                               << curious_alloc_base<T>::fallback_count();
 }
 
+template <typename T>
+std::string arena_list_stats(std::string const & name)
+{
+    return das::make_string() << std::left << std::setw(20) << (name + ": ")
+                              << std::setw(8)
+                              << das::arena_list_base<T>::max_utilization()
+                              << " "
+                              << das::arena_list_base<T>::fallback_count();
+}
+
 void unload()
 {
 #ifdef ENABLE_BENCHMARK
@@ -97,7 +121,11 @@ void unload()
               << alloc_stats<units::UnitEx>("units::UnitEx") << '\n'
               << alloc_stats<MidiEvent>("MidiEvent") << '\n'
               << alloc_stats<SysExData>("SysExData") << '\n'
-              << curious_alloc_stats<MidiEvent>("MidiEvent alloc")
+              << curious_alloc_stats<MidiEvent>("MidiEvent alloc") << '\n'
+              << arena_list_stats<MidiEvent>("MidiEvent arena") << '\n'
+              << std::left << std::setw(20) << "SysEx pool:"
+              << std::setw(8) << sysex_pool::allocated_count() << " "
+              << sysex_pool::fallback_count()
               << std::endl;
 }
 
@@ -108,8 +136,11 @@ class EngineWrap
   : public Engine
 {
   public:
-    EngineWrap(PyObject *self, backend::BackendPtr backend, bool verbose)
-      : Engine(backend, verbose)
+    EngineWrap(PyObject *self, backend::BackendPtr backend, bool verbose,
+               bool arena_buffer, bool batch,
+               int async_workers, std::size_t async_queue_size)
+      : Engine(backend, verbose, arena_buffer, batch,
+               async_workers, async_queue_size)
       , _self(self)
     { }
 
@@ -129,6 +160,71 @@ class EngineWrap
 };
 
 
+/*
+ * sysex transmitter that passes its chunks to a python function instead of
+ * a backend.
+ */
+class SysExTransmitterWrap
+  : boost::noncopyable
+{
+  public:
+    SysExTransmitterWrap(std::size_t num_ports, std::size_t chunk_size,
+                         double rate, boost::python::object send)
+      : _num_ports(num_ports)
+      , _send(send)
+      , _transmitter(new backend::SysExTransmitter(num_ports, chunk_size,
+            rate, boost::bind(&SysExTransmitterWrap::send_chunk,
+                              this, _1, _2, _3)))
+    { }
+
+    ~SysExTransmitterWrap()
+    {
+        // the transmitter's thread may be waiting for the GIL
+        das::python::scoped_gil_release release;
+        _transmitter.reset();
+    }
+
+    void send(int port, SysExDataConstPtr const & sysex) {
+        check_port(port);
+        _transmitter->send(port, sysex);
+    }
+
+    void set_rate(int port, double rate) {
+        check_port(port);
+        _transmitter->set_rate(port, rate);
+    }
+
+    void wait() {
+        das::python::scoped_gil_release release;
+        _transmitter->wait();
+    }
+
+  private:
+    void check_port(int port) const {
+        if (port < 0 || static_cast<std::size_t>(port) >= _num_ports) {
+            throw std::out_of_range("invalid port");
+        }
+    }
+
+    void send_chunk(int port, unsigned char const *data, std::size_t len)
+    {
+        das::python::scoped_gil_lock gil;
+        try {
+            boost::python::object chunk(boost::python::handle<>(
+                    PyByteArray_FromStringAndSize(
+                        reinterpret_cast<char const *>(data), len)));
+            _send(port, chunk);
+        } catch (boost::python::error_already_set &) {
+            PyErr_Print();
+        }
+    }
+
+    std::size_t const _num_ports;
+    boost::python::object _send;
+    boost::scoped_ptr<backend::SysExTransmitter> _transmitter;
+};
+
+
 MidiEvent buffer_to_midi_event(std::vector<unsigned char> const & buffer,
                                int port, uint64_t frame)
 {
@@ -148,6 +244,51 @@ boost::python::tuple midi_event_to_buffer(MidiEvent const & ev)
 }
 
 
+boost::python::tuple async_stats(Engine & engine)
+{
+    PythonCaller::AsyncStats s = engine.python_caller().async_stats();
+    return boost::python::make_tuple(s.queued, s.max_queued, s.dropped,
+                                     s.coalesced, s.blocked);
+}
+
+
+boost::python::tuple input_stats(Engine & engine)
+{
+    // the dummy backend is no backend at all
+    backend::BackendBase::InputStats s = backend::BackendBase::InputStats();
+    if (engine.backend()) {
+        s = engine.backend()->input_stats();
+    }
+    return boost::python::make_tuple(s.periods, s.events, s.wakeups);
+}
+
+
+boost::python::tuple sysex_pool_stats()
+{
+    return boost::python::make_tuple(sysex_pool::allocated_count(),
+                                     sysex_pool::fallback_count());
+}
+
+
+// event view accessors, one instantiation per field
+template <typename T, T MidiEvent::*M>
+T event_view_get(EventView const & view)
+{
+    return view.event().*M;
+}
+
+template <typename T, T MidiEvent::*M>
+void event_view_set(EventView & view, T value)
+{
+    view.event().*M = value;
+}
+
+MidiEvent event_view_copy(EventView const & view)
+{
+    return view.event();
+}
+
+
 
 BOOST_PYTHON_MODULE(_mididings)
 {
@@ -177,6 +318,7 @@ BOOST_PYTHON_MODULE(_mididings)
     class_<backend::BackendBase, backend::BackendPtr, noncopyable>(
         "BackendBase", bp::no_init)
         .def("connect_ports", &backend::BackendBase::connect_ports)
+        .def("set_sysex_rate", &backend::BackendBase::set_sysex_rate)
     ;
 
     // backend creation
@@ -186,30 +328,56 @@ BOOST_PYTHON_MODULE(_mididings)
     def("buffer_to_midi_event", buffer_to_midi_event);
     def("midi_event_to_buffer", midi_event_to_buffer);
 
+    // number of sysex objects allocated from the pool, and on the heap
+    // because the pool was exhausted
+    def("sysex_pool_stats", sysex_pool_stats);
+
+
+    // paced sysex output, sending chunks to a python function (used only
+    // by the test suite, the backends use SysExTransmitter directly)
+    class_<SysExTransmitterWrap, noncopyable>("SysExTransmitter",
+            init<std::size_t, std::size_t, double, bp::object>())
+        .def("send", &SysExTransmitterWrap::send)
+        .def("set_rate", &SysExTransmitterWrap::set_rate)
+        .def("wait", &SysExTransmitterWrap::wait)
+    ;
+
 
     // simple MIDI send function, works with no engine running
     def("send_midi", &send_midi);
 
+    // process a standard MIDI file
+    def("process_file", &smf::process_file);
+
+#ifdef ENABLE_BENCHMARK
+    export_benchmarks();
+#endif
+
 
     // main engine class, derived from in python
     class_<Engine, EngineWrap, noncopyable>(
-        "Engine", init<backend::BackendPtr, bool>())
+        "Engine", init<backend::BackendPtr, bool, bool, bool,
+                       int, std::size_t>())
         .def("add_scene", &Engine::add_scene)
         .def("set_processing", &Engine::set_processing)
         .def("start", &Engine::start)
-        .def("switch_scene", &Engine::switch_scene)
+        .def("switch_scene", &Engine::request_scene_switch)
         .def("current_scene", &Engine::current_scene)
         .def("current_subscene", &Engine::current_subscene)
         .def("process_event", &Engine::process_event)
+        .def("process_events", &Engine::process_events)
         .def("output_event", &Engine::output_event)
         .def("time", &Engine::time)
+        .def("async_stats", &async_stats)
+        .def("input_stats", &input_stats)
     ;
 
 
     // patch class, derived from in python
     {
         bp::scope patch_scope = class_<Patch, noncopyable>(
-            "Patch", init<Patch::ModulePtr>());
+            "Patch", init<Patch::ModulePtr, bp::optional<MidiEventType> >())
+            .def("offload_types", &Patch::offload_types);
 
         class_<Patch::Module, noncopyable>(
             "Module", bp::no_init);
@@ -217,10 +385,25 @@ BOOST_PYTHON_MODULE(_mididings)
             "Chain", init<Patch::ModuleVector>());
         class_<Patch::Fork, bases<Patch::Module>, noncopyable>(
             "Fork", init<Patch::ModuleVector, bool>());
+        class_<Patch::Split, bases<Patch::Module>, noncopyable>(
+            "Split", init<Patch::Split::Key, MidiEventType,
+                          std::vector<std::vector<int> > const &,
+                          std::vector<int> const &,
+                          Patch::ModuleVector, bool>());
         class_<Patch::Single, bases<Patch::Module>, noncopyable>(
             "Single", init<boost::shared_ptr<Unit> >());
+        class_<Patch::SingleChain, bases<Patch::Module>, noncopyable>(
+            "SingleChain", init<Patch::UnitVector>());
         class_<Patch::Extended, bases<Patch::Module>, noncopyable>(
             "Extended", init<boost::shared_ptr<UnitEx> >());
+
+        enum_<Patch::Split::Key>("SplitKey")
+            .value("TYPE", Patch::Split::KEY_TYPE)
+            .value("PORT", Patch::Split::KEY_PORT)
+            .value("CHANNEL", Patch::Split::KEY_CHANNEL)
+            .value("DATA1", Patch::Split::KEY_DATA1)
+            .value("DATA2", Patch::Split::KEY_DATA2)
+        ;
     }
 
 
@@ -266,6 +449,28 @@ BOOST_PYTHON_MODULE(_mididings)
         .enable_pickling()
     ;
 
+    // view of an event being processed, passed to Process(view=True)
+#define MIDIDINGS_EVENT_VIEW_FIELD(name, type, member) \
+        .add_property(name, &event_view_get<type, &MidiEvent::member>, \
+                            &event_view_set<type, &MidiEvent::member>)
+
+    class_<EventView>("EventView", bp::no_init)
+        MIDIDINGS_EVENT_VIEW_FIELD("type", MidiEventType, type)
+        MIDIDINGS_EVENT_VIEW_FIELD("port", int, port)
+        MIDIDINGS_EVENT_VIEW_FIELD("channel", int, channel)
+        MIDIDINGS_EVENT_VIEW_FIELD("data1", int, data1)
+        MIDIDINGS_EVENT_VIEW_FIELD("data2", int, data2)
+        MIDIDINGS_EVENT_VIEW_FIELD("note", int, data1)
+        MIDIDINGS_EVENT_VIEW_FIELD("velocity", int, data2)
+        MIDIDINGS_EVENT_VIEW_FIELD("ctrl", int, data1)
+        MIDIDINGS_EVENT_VIEW_FIELD("value", int, data2)
+        MIDIDINGS_EVENT_VIEW_FIELD("program", int, data2)
+        MIDIDINGS_EVENT_VIEW_FIELD("sysex", SysExDataConstPtr, sysex)
+        .def("_copy", &event_view_copy)
+    ;
+
+#undef MIDIDINGS_EVENT_VIEW_FIELD
+
 
     // unit base classes
     class_<Unit, noncopyable>("Unit", bp::no_init);
@@ -305,6 +510,10 @@ BOOST_PYTHON_MODULE(_mididings)
         "Channel", init<int>());
     class_<Transpose, bases<Unit>, noncopyable>(
         "Transpose", init<int>());
+    class_<NoteMap, bases<Unit>, noncopyable>(
+        "NoteMap", init<std::vector<int> const &>());
+    class_<ValueMap, bases<Unit>, noncopyable>(
+        "ValueMap", init<MidiEventType, std::vector<int> const &, int>());
     class_<Key, bases<Unit>, noncopyable>(
         "Key", init<int>());
     class_<Velocity, bases<Unit>, noncopyable>(
@@ -321,6 +530,14 @@ BOOST_PYTHON_MODULE(_mididings)
     class_<PitchbendRange, bases<Unit>, noncopyable>(
         "PitchbendRange", init<int, int, int, int>());
 
+    // expressions
+    class_<ExpressionFilter, bases<Filter>, noncopyable>(
+        "ExpressionFilter", init<MidiEventType, std::vector<int> const &,
+                                 std::vector<double> const &>());
+    class_<Transform, bases<Unit>, noncopyable>(
+        "Transform", init<MidiEventType, std::vector<int> const &,
+                          std::vector<double> const &>());
+
     // generators
     class_<Generator, bases<Unit>, noncopyable>(
         "Generator", init<MidiEventType, int, int, int, int>());
@@ -335,9 +552,58 @@ BOOST_PYTHON_MODULE(_mididings)
     class_<SubSceneSwitch, bases<UnitEx>, noncopyable>(
         "SubSceneSwitch", init<int, int, bool>());
 
+    // voices
+    class_<VoiceState, boost::shared_ptr<VoiceState>, noncopyable>(
+        "VoiceState", init<int>());
+    class_<VoiceTracker, bases<UnitEx>, noncopyable>(
+        "VoiceTracker", init<boost::shared_ptr<VoiceState> >());
+    class_<VoiceFilter, bases<UnitEx>, noncopyable>(
+        "VoiceFilter", init<boost::shared_ptr<VoiceState>,
+                            int, double, bool, int>());
+
+    // stateful
+    class_<LimitPolyphony, bases<UnitEx>, noncopyable>(
+        "LimitPolyphony", init<int, bool, int>());
+    enum_<MakeMonophonic::Priority>("MonoPriority")
+        .value("LAST", MakeMonophonic::PRIORITY_LAST)
+        .value("LOW", MakeMonophonic::PRIORITY_LOW)
+        .value("HIGH", MakeMonophonic::PRIORITY_HIGH)
+    ;
+    class_<MakeMonophonic, bases<UnitEx>, noncopyable>(
+        "MakeMonophonic", init<MakeMonophonic::Priority, int>());
+    class_<LatchNotes, bases<UnitEx>, noncopyable>(
+        "LatchNotes", init<bool, int, int>());
+    class_<PedalToNoteoff, bases<UnitEx>, noncopyable>(
+        "PedalToNoteoff", init<int, bool, int>());
+    class_<FloatingSplitState, boost::shared_ptr<FloatingSplitState>,
+           noncopyable>(
+        "FloatingSplitState", init<int, int, double, int, int>());
+    class_<FloatingSplitAnalyzer, bases<UnitEx>, noncopyable>(
+        "FloatingSplitAnalyzer",
+        init<boost::shared_ptr<FloatingSplitState> >());
+    class_<FloatingSplitFilter, bases<UnitEx>, noncopyable>(
+        "FloatingSplitFilter",
+        init<boost::shared_ptr<FloatingSplitState>, bool>());
+
     // call
+    enum_<PythonCaller::OverflowPolicy>("OverflowPolicy")
+        .value("DROP_OLDEST", PythonCaller::OVERFLOW_DROP_OLDEST)
+        .value("DROP_NEWEST", PythonCaller::OVERFLOW_DROP_NEWEST)
+        .value("COALESCE", PythonCaller::OVERFLOW_COALESCE)
+        .value("BLOCK", PythonCaller::OVERFLOW_BLOCK)
+    ;
+
     class_<Call, bases<UnitEx>, noncopyable>(
-        "Call", init<bp::object, bool, bool>());
+        "Call", init<bp::object, bool, bool, bool,
+                     PythonCaller::OverflowPolicy>());
+    class_<CallView, bases<UnitEx>, noncopyable>(
+        "CallView", init<bp::object, bp::object>());
+    class_<CallCached, bases<UnitEx>, noncopyable>(
+        "CallCached", init<bp::object, std::size_t>())
+        .def("hits", &CallCached::hits)
+        .def("misses", &CallCached::misses)
+        .def("invalidate", &CallCached::invalidate)
+    ;
 
 
     enum_<TransformMode>("TransformMode")
@@ -348,6 +614,37 @@ BOOST_PYTHON_MODULE(_mididings)
         .value("CURVE", TRANSFORM_MODE_CURVE)
     ;
 
+    enum_<ExpressionOp>("ExpressionOp")
+        .value("CONST", EXPRESSION_OP_CONST)
+        .value("LOAD", EXPRESSION_OP_LOAD)
+        .value("STORE", EXPRESSION_OP_STORE)
+        .value("IN", EXPRESSION_OP_IN)
+        .value("ADD", EXPRESSION_OP_ADD)
+        .value("SUB", EXPRESSION_OP_SUB)
+        .value("MUL", EXPRESSION_OP_MUL)
+        .value("DIV", EXPRESSION_OP_DIV)
+        .value("FLOORDIV", EXPRESSION_OP_FLOORDIV)
+        .value("MOD", EXPRESSION_OP_MOD)
+        .value("POW", EXPRESSION_OP_POW)
+        .value("NEG", EXPRESSION_OP_NEG)
+        .value("NOT", EXPRESSION_OP_NOT)
+        .value("AND", EXPRESSION_OP_AND)
+        .value("OR", EXPRESSION_OP_OR)
+        .value("LT", EXPRESSION_OP_LT)
+        .value("LE", EXPRESSION_OP_LE)
+        .value("GT", EXPRESSION_OP_GT)
+        .value("GE", EXPRESSION_OP_GE)
+        .value("EQ", EXPRESSION_OP_EQ)
+        .value("NE", EXPRESSION_OP_NE)
+        .value("SELECT", EXPRESSION_OP_SELECT)
+        .value("ABS", EXPRESSION_OP_ABS)
+        .value("MIN", EXPRESSION_OP_MIN)
+        .value("MAX", EXPRESSION_OP_MAX)
+        .value("CLAMP", EXPRESSION_OP_CLAMP)
+        .value("INT", EXPRESSION_OP_INT)
+        .value("ROUND", EXPRESSION_OP_ROUND)
+    ;
+
     enum_<EventAttribute>("EventAttribute")
         .value("PORT", EVENT_ATTRIBUTE_PORT)
         .value("CHANNEL", EVENT_ATTRIBUTE_CHANNEL)
@@ -363,7 +660,9 @@ BOOST_PYTHON_MODULE(_mididings)
 
     // register to/from-python converters for various types
     das::python::from_sequence_converter<std::vector<int> >();
+    das::python::from_sequence_converter<std::vector<std::vector<int> > >();
     das::python::from_sequence_converter<std::vector<float> >();
+    das::python::from_sequence_converter<std::vector<double> >();
     das::python::from_sequence_converter<std::vector<unsigned char> >();
     das::python::to_list_converter<std::vector<unsigned char> >();
 
@@ -374,6 +673,7 @@ BOOST_PYTHON_MODULE(_mididings)
     das::python::to_list_converter<std::vector<MidiEvent> >();
 
     das::python::from_sequence_converter<std::vector<Patch::ModulePtr> >();
+    das::python::from_sequence_converter<Patch::UnitVector>();
 
     das::python::from_bytearray_converter<SysExData, SysExDataConstPtr>();
     das::python::to_bytearray_converter<SysExData, SysExDataConstPtr>();
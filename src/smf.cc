@@ -0,0 +1,472 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#include "config.hh"
+#include "smf.hh"
+#include "engine.hh"
+#include "backend/base.hh"
+
+#include <algorithm>
+#include <fstream>
+#include <cstring>
+#include <cerrno>
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+
+namespace mididings {
+namespace smf {
+
+
+namespace {
+
+// number of MIDI events passed to the engine at once
+std::size_t const BATCH_SIZE = 1024;
+
+
+uint32_t read_be(unsigned char const *p, std::size_t n)
+{
+    uint32_t v = 0;
+    for (std::size_t i = 0; i != n; ++i) {
+        v = v << 8 | p[i];
+    }
+    return v;
+}
+
+
+void write_be(std::vector<unsigned char> & buf, uint32_t v, std::size_t n)
+{
+    for (std::size_t i = n; i != 0; --i) {
+        buf.push_back((v >> ((i - 1) * 8)) & 0xff);
+    }
+}
+
+
+void write_varlen(std::vector<unsigned char> & buf, uint32_t v)
+{
+    unsigned char tmp[5];
+    std::size_t n = 0;
+    do {
+        tmp[n++] = v & 0x7f;
+        v >>= 7;
+    } while (v);
+
+    while (n > 1) {
+        buf.push_back(tmp[--n] | 0x80);
+    }
+    buf.push_back(tmp[0]);
+}
+
+
+// number of data bytes following the given channel message status byte
+std::size_t channel_message_length(unsigned char status)
+{
+    switch (status & 0xf0) {
+      case 0xc0:
+      case 0xd0:
+        return 1;
+      default:
+        return 2;
+    }
+}
+
+} // anonymous namespace
+
+
+Reader::Reader(std::string const & filename)
+  : _filename(filename)
+  , _data(NULL)
+  , _size(0)
+{
+    int fd = ::open(filename.c_str(), O_RDONLY);
+    if (fd == -1) {
+        throw Error(filename + ": " + std::strerror(errno));
+    }
+
+    struct stat st;
+    if (::fstat(fd, &st) == -1 || st.st_size < 14) {
+        ::close(fd);
+        throw Error(filename + ": not a standard MIDI file");
+    }
+    _size = st.st_size;
+
+    void *p = ::mmap(NULL, _size, PROT_READ, MAP_PRIVATE, fd, 0);
+    ::close(fd);
+    if (p == MAP_FAILED) {
+        throw Error(filename + ": " + std::strerror(errno));
+    }
+    _data = static_cast<unsigned char const *>(p);
+    ::madvise(p, _size, MADV_SEQUENTIAL);
+
+    unsigned char const *end = _data + _size;
+
+    if (std::memcmp(_data, "MThd", 4) != 0 || read_be(_data + 4, 4) < 6) {
+        ::munmap(p, _size);
+        throw Error(filename + ": not a standard MIDI file");
+    }
+
+    _format = read_be(_data + 8, 2);
+    std::size_t num_tracks = read_be(_data + 10, 2);
+    _division = read_be(_data + 12, 2);
+
+    // locate all track chunks, skipping unknown chunk types
+    unsigned char const *pos = _data + 8 + read_be(_data + 4, 4);
+
+    while (_tracks.size() < num_tracks && end - pos >= 8) {
+        std::size_t len = read_be(pos + 4, 4);
+        unsigned char const *chunk = pos + 8;
+
+        if (static_cast<std::size_t>(end - chunk) < len) {
+            // truncated file, use whatever is there
+            len = end - chunk;
+        }
+
+        if (std::memcmp(pos, "MTrk", 4) == 0) {
+            Track t;
+            t.pos = chunk;
+            t.end = chunk + len;
+            t.tick = 0;
+            t.running_status = 0;
+            t.done = false;
+            read_delta(t);
+            _tracks.push_back(t);
+        }
+
+        pos = chunk + len;
+    }
+}
+
+
+Reader::~Reader()
+{
+    ::munmap(const_cast<unsigned char *>(_data), _size);
+}
+
+
+void Reader::read_delta(Track & t)
+{
+    uint32_t delta = 0;
+    for (;;) {
+        if (t.pos == t.end) {
+            t.done = true;
+            return;
+        }
+        unsigned char c = *t.pos++;
+        delta = delta << 7 | (c & 0x7f);
+        if (!(c & 0x80)) {
+            break;
+        }
+    }
+    t.tick += delta;
+
+    if (t.pos == t.end) {
+        // truncated track, a delta time without an event
+        t.done = true;
+    }
+}
+
+
+bool Reader::read(Event & ev)
+{
+    // find the track with the earliest next event. the number of tracks is
+    // usually small enough that a linear search beats anything smarter
+    std::vector<Track>::iterator t = _tracks.end();
+
+    for (std::vector<Track>::iterator it = _tracks.begin();
+            it != _tracks.end(); ++it) {
+        if (!it->done && (t == _tracks.end() || it->tick < t->tick)) {
+            t = it;
+        }
+    }
+
+    if (t == _tracks.end()) {
+        return false;
+    }
+
+    ev.track = t - _tracks.begin();
+    ev.tick = t->tick;
+
+    unsigned char const *start = t->pos;
+    unsigned char status = *t->pos;
+
+    if (status & 0x80) {
+        ++t->pos;
+    } else {
+        // running status
+        status = t->running_status;
+        if (!status) {
+            throw Error(_filename + ": invalid event data");
+        }
+    }
+
+    if (status < 0xf0) {
+        // channel message
+        std::size_t len = channel_message_length(status);
+        if (static_cast<std::size_t>(t->end - t->pos) < len) {
+            throw Error(_filename + ": unexpected end of track");
+        }
+
+        unsigned char buf[3] = { status, t->pos[0], 0 };
+        if (len == 2) {
+            buf[2] = t->pos[1];
+        }
+        t->pos += len;
+        t->running_status = status;
+
+        ev.kind = Event::KIND_MIDI;
+        ev.ev = backend::buffer_to_midi_event(buf, len + 1,
+                                              ev.track, ev.tick);
+    }
+    else {
+        // meta events and sysex cancel running status
+        t->running_status = 0;
+
+        if (status == 0xff) {
+            // skip meta event type
+            if (t->pos == t->end) {
+                throw Error(_filename + ": unexpected end of track");
+            }
+            ++t->pos;
+        }
+
+        // length of the event data
+        uint32_t len = 0;
+        for (;;) {
+            if (t->pos == t->end) {
+                throw Error(_filename + ": unexpected end of track");
+            }
+            unsigned char c = *t->pos++;
+            len = len << 7 | (c & 0x7f);
+            if (!(c & 0x80)) {
+                break;
+            }
+        }
+        if (static_cast<std::size_t>(t->end - t->pos) < len) {
+            throw Error(_filename + ": unexpected end of track");
+        }
+
+        if (status == 0xf0) {
+            // sysex, stored in the file without the leading F0
+            SysExData sysex;
+            sysex.reserve(len + 1);
+            sysex.push_back(0xf0);
+            sysex.insert(sysex.end(), t->pos, t->pos + len);
+
+            ev.kind = Event::KIND_MIDI;
+            ev.ev = backend::buffer_to_midi_event(&sysex[0], sysex.size(),
+                                                  ev.track, ev.tick);
+        }
+        else if (status == 0xff && start[1] == 0x2f) {
+            ev.kind = Event::KIND_END_OF_TRACK;
+        }
+        else {
+            // meta events and escaped data, returned as they are
+            ev.kind = Event::KIND_RAW;
+        }
+
+        t->pos += len;
+    }
+
+    ev.data = start;
+    ev.len = t->pos - start;
+
+    read_delta(*t);
+
+    return true;
+}
+
+
+Writer::Writer(int format, int division, int num_tracks)
+  : _format(format)
+  , _division(division)
+  , _tracks(num_tracks)
+{
+}
+
+
+Writer::Track & Writer::track(int n)
+{
+    if (n >= static_cast<int>(_tracks.size())) {
+        _tracks.resize(n + 1);
+    }
+    return _tracks[n];
+}
+
+
+void Writer::add(MidiEvent const & ev)
+{
+    if (ev.port < 0) {
+        return;
+    }
+
+    Track & t = track(ev.port);
+
+    Entry e;
+    e.tick = ev.frame;
+    e.offset = _data.size();
+
+    if (ev.type == MIDI_EVENT_SYSEX) {
+        SysExData const & sysex = *ev.sysex;
+        if (sysex.empty()) {
+            return;
+        }
+        // leading F0, followed by the length of the remaining data
+        _data.push_back(0xf0);
+        write_varlen(_data, sysex.size() - 1);
+        _data.insert(_data.end(), sysex.begin() + 1, sysex.end());
+    } else {
+        unsigned char buf[3];
+        std::size_t len = sizeof(buf);
+        int port;
+        uint64_t frame;
+        backend::midi_event_to_buffer(ev, buf, len, port, frame);
+        if (!len) {
+            return;
+        }
+        _data.insert(_data.end(), buf, buf + len);
+    }
+
+    e.len = _data.size() - e.offset;
+    t.entries.push_back(e);
+}
+
+
+void Writer::add(int track, uint64_t tick,
+                 unsigned char const *data, std::size_t len)
+{
+    Entry e;
+    e.tick = tick;
+    e.offset = _data.size();
+    e.len = len;
+
+    _data.insert(_data.end(), data, data + len);
+    this->track(track).entries.push_back(e);
+}
+
+
+void Writer::set_end(int track, uint64_t tick)
+{
+    Track & t = this->track(track);
+    t.end = std::max(t.end, tick);
+}
+
+
+void Writer::save(std::string const & filename)
+{
+    std::vector<unsigned char> buf;
+
+    // format 0 can only have a single track
+    int format = _format == 0 && _tracks.size() > 1 ? 1 : _format;
+
+    buf.insert(buf.end(), "MThd", "MThd" + 4);
+    write_be(buf, 6, 4);
+    write_be(buf, format, 2);
+    write_be(buf, _tracks.size(), 2);
+    write_be(buf, _division, 2);
+
+    for (std::vector<Track>::iterator t = _tracks.begin();
+            t != _tracks.end(); ++t)
+    {
+        // events are usually added in order, but those routed from other
+        // tracks may not be
+        std::stable_sort(t->entries.begin(), t->entries.end());
+
+        buf.insert(buf.end(), "MTrk", "MTrk" + 4);
+        std::size_t len_pos = buf.size();
+        write_be(buf, 0, 4);
+
+        uint64_t tick = 0;
+        for (std::vector<Entry>::const_iterator e = t->entries.begin();
+                e != t->entries.end(); ++e) {
+            write_varlen(buf, e->tick - tick);
+            tick = e->tick;
+            buf.insert(buf.end(), _data.begin() + e->offset,
+                                  _data.begin() + e->offset + e->len);
+        }
+
+        // end of track
+        write_varlen(buf, std::max(t->end, tick) - tick);
+        buf.push_back(0xff);
+        buf.push_back(0x2f);
+        buf.push_back(0x00);
+
+        std::size_t len = buf.size() - len_pos - 4;
+        for (std::size_t i = 0; i != 4; ++i) {
+            buf[len_pos + i] = (len >> ((3 - i) * 8)) & 0xff;
+        }
+    }
+
+    std::ofstream file(filename.c_str(), std::ios::out | std::ios::binary);
+    file.write(reinterpret_cast<char const *>(&buf[0]), buf.size());
+    if (!file) {
+        throw Error(filename + ": couldn't write file");
+    }
+}
+
+
+std::size_t process_file(Engine & engine, std::string const & infile,
+                         std::string const & outfile)
+{
+    Reader reader(infile);
+    Writer writer(reader.format(), reader.division(), reader.num_tracks());
+
+    std::vector<MidiEvent> batch;
+    batch.reserve(BATCH_SIZE);
+
+    std::size_t count = 0;
+    Event ev;
+
+    for (;;) {
+        bool more = reader.read(ev);
+
+        if (more && ev.kind == Event::KIND_MIDI) {
+            batch.push_back(ev.ev);
+            ++count;
+            if (batch.size() < BATCH_SIZE) {
+                continue;
+            }
+        }
+
+        // run all MIDI events collected so far through the engine. this
+        // needs to be done before writing any other events, to preserve
+        // the order of events with the same time
+        if (!batch.empty()) {
+            std::vector<MidiEvent> out = engine.process_events(batch);
+            for (std::vector<MidiEvent>::const_iterator it = out.begin();
+                    it != out.end(); ++it) {
+                writer.add(*it);
+            }
+            batch.clear();
+        }
+
+        if (!more) {
+            break;
+        }
+
+        if (ev.kind == Event::KIND_RAW) {
+            writer.add(ev.track, ev.tick, ev.data, ev.len);
+        }
+        else if (ev.kind == Event::KIND_END_OF_TRACK) {
+            writer.set_end(ev.track, ev.tick);
+        }
+    }
+
+    writer.save(outfile);
+
+    return count;
+}
+
+
+} // smf
+} // mididings
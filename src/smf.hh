@@ -0,0 +1,184 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_SMF_HH
+#define MIDIDINGS_SMF_HH
+
+#include "midi_event.hh"
+
+#include <string>
+#include <vector>
+#include <stdexcept>
+
+#include <boost/noncopyable.hpp>
+
+
+namespace mididings {
+
+
+class Engine;
+
+
+namespace smf {
+
+
+struct Error
+  : public std::runtime_error
+{
+    Error(std::string const & w)
+      : std::runtime_error(w)
+    {
+    }
+};
+
+
+/**
+ * A single event read from a standard MIDI file. For regular MIDI and SysEx
+ * events, ev contains the converted event. Everything else (meta events and
+ * escaped data) is returned as raw bytes, pointing into the file.
+ */
+struct Event
+{
+    enum Kind {
+        KIND_MIDI,
+        KIND_RAW,
+        KIND_END_OF_TRACK,
+    };
+
+    Kind kind;
+    int track;
+    uint64_t tick;
+
+    MidiEvent ev;
+
+    unsigned char const *data;
+    std::size_t len;
+};
+
+
+/**
+ * Reads a standard MIDI file, returning the events of all tracks in a single
+ * stream ordered by time. The file is memory-mapped and parsed on the fly.
+ */
+class Reader
+  : boost::noncopyable
+{
+  public:
+    Reader(std::string const & filename);
+    ~Reader();
+
+    int format() const { return _format; }
+    int num_tracks() const { return _tracks.size(); }
+    int division() const { return _division; }
+
+    /**
+     * Reads the next event. Returns false if there are no events left.
+     */
+    bool read(Event & ev);
+
+  private:
+    struct Track {
+        unsigned char const *pos;
+        unsigned char const *end;
+        uint64_t tick;
+        unsigned char running_status;
+        bool done;
+    };
+
+    void read_delta(Track & t);
+
+    std::string _filename;
+
+    unsigned char const *_data;
+    std::size_t _size;
+
+    int _format;
+    int _division;
+
+    std::vector<Track> _tracks;
+};
+
+
+/**
+ * Writes a standard MIDI file. Events can be added in any order, they are
+ * sorted by time (per track) when the file is saved.
+ */
+class Writer
+  : boost::noncopyable
+{
+  public:
+    Writer(int format, int division, int num_tracks);
+
+    /**
+     * Adds a MIDI event, using its port as track number and its frame as
+     * time in ticks.
+     */
+    void add(MidiEvent const & ev);
+
+    /**
+     * Adds an event given as raw bytes, starting with its status byte.
+     */
+    void add(int track, uint64_t tick,
+             unsigned char const *data, std::size_t len);
+
+    /**
+     * Sets the time of the given track's end-of-track event. The actual
+     * time may be later if there are events beyond that.
+     */
+    void set_end(int track, uint64_t tick);
+
+    void save(std::string const & filename);
+
+  private:
+    struct Entry {
+        uint64_t tick;
+        std::size_t offset;
+        std::size_t len;
+
+        bool operator<(Entry const & other) const {
+            return tick < other.tick;
+        }
+    };
+
+    struct Track {
+        Track()
+          : end(0)
+        { }
+
+        std::vector<Entry> entries;
+        uint64_t end;
+    };
+
+    Track & track(int n);
+
+    int _format;
+    int _division;
+
+    std::vector<Track> _tracks;
+    // the data of all events, in the order they were added
+    std::vector<unsigned char> _data;
+};
+
+
+/**
+ * Runs all events in infile through the engine's current patch, and writes
+ * the results to outfile. Meta events are copied unmodified.
+ * Returns the number of MIDI events read.
+ */
+std::size_t process_file(Engine & engine, std::string const & infile,
+                         std::string const & outfile);
+
+
+} // smf
+} // mididings
+
+
+#endif // MIDIDINGS_SMF_HH
@@ -0,0 +1,282 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#include "config.hh"
+#include "sysex_pool.hh"
+
+#include <new>
+#include <memory>
+#include <utility>
+
+#include <boost/noncopyable.hpp>
+#include <boost/scoped_array.hpp>
+#include <boost/scoped_ptr.hpp>
+#include <boost/detail/atomic_count.hpp>
+#include <boost/type_traits/aligned_storage.hpp>
+#include <boost/type_traits/alignment_of.hpp>
+
+#include "util/index_freelist.hh"
+#include "util/debug.hh"
+
+
+namespace mididings {
+namespace sysex_pool {
+
+
+namespace {
+
+// enough for the reference count block boost::shared_ptr allocates along
+// with each object
+std::size_t const CONTROL_BLOCK_SIZE = 64;
+
+
+class Pool;
+
+
+/*
+ * a preallocated SysEx object, plus the memory for the reference count
+ * block of the shared_ptr owning it.
+ */
+struct Block
+{
+    Pool * pool;
+    std::size_t size_class;
+    std::size_t index;
+
+    SysExData data;
+
+    boost::aligned_storage<
+        CONTROL_BLOCK_SIZE,
+        boost::alignment_of<long double>::value
+    >::type control;
+};
+
+
+/*
+ * allocator used for the shared_ptr's reference count block. the block's
+ * memory is provided by the pool block itself, and once it's freed, the
+ * pool block is recycled.
+ */
+template <typename T>
+class BlockAllocator
+{
+  public:
+    typedef std::size_t size_type;
+    typedef std::ptrdiff_t difference_type;
+    typedef T * pointer;
+    typedef T const * const_pointer;
+    typedef T & reference;
+    typedef T const & const_reference;
+    typedef T value_type;
+
+    template <class U>
+    struct rebind {
+        typedef BlockAllocator<U> other;
+    };
+
+    BlockAllocator(Block * block)
+      : _block(block)
+    { }
+    template <class U>
+    BlockAllocator(BlockAllocator<U> const & other)
+      : _block(other.block())
+    { }
+
+    bool operator==(BlockAllocator<T> const & other) const {
+        return _block == other._block;
+    }
+    bool operator!=(BlockAllocator<T> const & other) const {
+        return _block != other._block;
+    }
+
+    pointer address(reference x) const { return &x; }
+    const_pointer address(const_reference x) const { return &x; }
+
+    pointer allocate(size_type n, void const * = 0) {
+        if (n * sizeof(T) <= sizeof(_block->control)) {
+            return reinterpret_cast<pointer>(&_block->control);
+        }
+        // shouldn't happen, unless shared_ptr's internals change
+        return static_cast<pointer>(::operator new(n * sizeof(T)));
+    }
+
+    // the last thing shared_ptr does with the block, so it's safe to
+    // recycle it now
+    void deallocate(pointer p, size_type);
+
+    size_type max_size() const throw() {
+        return CONTROL_BLOCK_SIZE / sizeof(T);
+    }
+
+#if __cplusplus >= 201103L || defined(__GXX_EXPERIMENTAL_CXX0X__)
+    template <class U, class... Args>
+    void construct(U *p, Args &&... args) {
+        ::new (static_cast<void *>(p)) U(std::forward<Args>(args)...);
+    }
+
+    template <class U>
+    void destroy(U *p) {
+        p->~U();
+    }
+#else
+    void construct(pointer p, T const & val) {
+        ::new (static_cast<void *>(p)) T(val);
+    }
+
+    void destroy(pointer p) {
+        p->~T();
+    }
+#endif
+
+    Block * block() const { return _block; }
+
+  private:
+    Block * _block;
+};
+
+
+/*
+ * the object itself lives as long as the pool, so there's nothing to do
+ * when the last reference to it goes away.
+ */
+struct NullDeleter
+{
+    void operator()(SysExData const *) const { }
+};
+
+
+/*
+ * a number of preallocated SysEx objects for each of several size classes,
+ * each class four times as large as the previous one.
+ */
+class Pool
+  : boost::noncopyable
+{
+  public:
+    Pool()
+      : _allocated(0)
+      , _fallback(0)
+    {
+        for (std::size_t c = 0; c != config::SYSEX_POOL_NUM_CLASSES; ++c) {
+            _blocks[c].reset(new Block[config::SYSEX_POOL_BLOCKS]);
+            _free[c].reset(
+                    new das::index_freelist(config::SYSEX_POOL_BLOCKS));
+
+            for (std::size_t i = 0; i != config::SYSEX_POOL_BLOCKS; ++i) {
+                Block & b = _blocks[c][i];
+                b.pool = this;
+                b.size_class = c;
+                b.index = i;
+                b.data.reserve(class_size(c));
+            }
+        }
+    }
+
+    // returns an empty SysEx object with room for at least size bytes
+    SysExDataPtr acquire(std::size_t size) {
+        std::size_t index;
+
+        // use the smallest free block that's large enough
+        for (std::size_t c = 0; c != config::SYSEX_POOL_NUM_CLASSES; ++c) {
+            if (class_size(c) >= size && _free[c]->pop(index)) {
+                ++_allocated;
+
+                Block * b = &_blocks[c][index];
+                b->data.clear();
+                return SysExDataPtr(&b->data, NullDeleter(),
+                                    BlockAllocator<SysExData>(b));
+            }
+        }
+
+        ++_fallback;
+
+        SysExDataPtr p(new SysExData);
+        p->reserve(size);
+        return p;
+    }
+
+    void release(Block * b) {
+        _free[b->size_class]->push(b->index);
+    }
+
+    std::size_t allocated() const { return _allocated; }
+    std::size_t fallback() const { return _fallback; }
+
+  private:
+    static std::size_t class_size(std::size_t c) {
+        return config::SYSEX_POOL_MIN_SIZE << (2 * c);
+    }
+
+    boost::scoped_array<Block> _blocks[config::SYSEX_POOL_NUM_CLASSES];
+    boost::scoped_ptr<das::index_freelist>
+                                _free[config::SYSEX_POOL_NUM_CLASSES];
+
+    boost::detail::atomic_count _allocated;
+    boost::detail::atomic_count _fallback;
+};
+
+
+template <typename T>
+void BlockAllocator<T>::deallocate(pointer p, size_type)
+{
+    if (reinterpret_cast<void *>(p) != &_block->control) {
+        ::operator delete(p);
+    }
+    _block->pool->release(_block);
+}
+
+
+// allocated when the module is loaded, never in a realtime thread
+Pool pool;
+
+} // anonymous namespace
+
+
+SysExDataPtr create(unsigned char const *first, unsigned char const *last)
+{
+    SysExDataPtr p = pool.acquire(last - first);
+    p->insert(p->end(), first, last);
+    return p;
+}
+
+
+void append(SysExDataPtr & sysex,
+            unsigned char const *first, unsigned char const *last)
+{
+    ASSERT(sysex.unique());
+
+    std::size_t size = sysex->size() + (last - first);
+
+    if (size > sysex->capacity()) {
+        // move everything into a larger object
+        SysExDataPtr p = pool.acquire(size);
+        p->insert(p->end(), sysex->begin(), sysex->end());
+        sysex = p;
+    }
+
+    sysex->insert(sysex->end(), first, last);
+}
+
+
+std::size_t allocated_count()
+{
+    return pool.allocated();
+}
+
+
+std::size_t fallback_count()
+{
+    return pool.fallback();
+}
+
+
+} // sysex_pool
+} // mididings
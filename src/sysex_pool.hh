@@ -0,0 +1,56 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_SYSEX_POOL_HH
+#define MIDIDINGS_SYSEX_POOL_HH
+
+#include "midi_event.hh"
+
+#include <cstddef>
+
+
+namespace mididings {
+namespace sysex_pool {
+
+
+/**
+ * Returns a new SysEx object containing the given data. The memory is taken
+ * from a preallocated pool, so this is realtime-safe unless the pool is
+ * exhausted or the data doesn't fit into any of the pool's blocks, in which
+ * case the object is allocated on the heap.
+ */
+SysExDataPtr create(unsigned char const *first, unsigned char const *last);
+
+/**
+ * Appends data to a SysEx object that's not shared with anyone else. If the
+ * object's memory is too small, it's replaced by a larger one, again taken
+ * from the pool if possible.
+ */
+void append(SysExDataPtr & sysex,
+            unsigned char const *first, unsigned char const *last);
+
+/**
+ * Number of SysEx objects taken from the pool so far.
+ */
+std::size_t allocated_count();
+
+/**
+ * Number of SysEx objects that had to be allocated on the heap because the
+ * pool was exhausted.
+ */
+std::size_t fallback_count();
+
+
+} // sysex_pool
+} // mididings
+
+
+#endif // MIDIDINGS_SYSEX_POOL_HH
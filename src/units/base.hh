@@ -41,9 +41,17 @@ class UnitEx
   : das::counted_objects<UnitEx>
 {
   public:
-    UnitEx() { }
+    UnitEx(bool batch = false)
+      : _batch(batch)
+    { }
     virtual ~UnitEx() { }
 
+    // if true, all events are processed at once using process_range(),
+    // instead of calling process() for each event
+    bool batch() const {
+        return _batch;
+    }
+
     virtual Patch::EventBufferRT::Range
     process(Patch::EventBufferRT & buffer,
             Patch::EventBufferRT::Iterator it) const = 0;
@@ -51,6 +59,36 @@ class UnitEx
     virtual Patch::EventBuffer::Range
     process(Patch::EventBuffer & buffer,
             Patch::EventBuffer::Iterator it) const = 0;
+
+    virtual Patch::EventBufferArena::Range
+    process(Patch::EventBufferArena & buffer,
+            Patch::EventBufferArena::Iterator it) const = 0;
+
+    // process all events in range, returning the range of resulting events.
+    // only needs to be implemented by units that support batch processing
+    virtual Patch::EventBufferRT::Range
+    process_range(Patch::EventBufferRT & /*buffer*/,
+                  Patch::EventBufferRT::Range const & range) const {
+        ASSERT(false);
+        return range;
+    }
+
+    virtual Patch::EventBuffer::Range
+    process_range(Patch::EventBuffer & /*buffer*/,
+                  Patch::EventBuffer::Range const & range) const {
+        ASSERT(false);
+        return range;
+    }
+
+    virtual Patch::EventBufferArena::Range
+    process_range(Patch::EventBufferArena & /*buffer*/,
+                  Patch::EventBufferArena::Range const & range) const {
+        ASSERT(false);
+        return range;
+    }
+
+  private:
+    bool const _batch;
 };
 
 
@@ -59,6 +97,10 @@ class UnitExImpl
   : public UnitEx
 {
   public:
+    UnitExImpl(bool batch = false)
+      : UnitEx(batch)
+    { }
+
     virtual Patch::EventBufferRT::Range
     process(Patch::EventBufferRT & buffer,
             Patch::EventBufferRT::Iterator it) const {
@@ -72,6 +114,13 @@ class UnitExImpl
         Derived const & d = *static_cast<Derived const*>(this);
         return d.template process<Patch::EventBuffer>(buffer, it);
     }
+
+    virtual Patch::EventBufferArena::Range
+    process(Patch::EventBufferArena & buffer,
+            Patch::EventBufferArena::Iterator it) const {
+        Derived const & d = *static_cast<Derived const*>(this);
+        return d.template process<Patch::EventBufferArena>(buffer, it);
+    }
 };
 
 
@@ -13,8 +13,16 @@
 #define MIDIDINGS_UNITS_CALL_HH
 
 #include "units/base.hh"
+#include "util/ringbuffer.hh"
+
+#include <list>
+#include <vector>
+
+#include <boost/unordered_map.hpp>
+#include <boost/functional/hash.hpp>
 
 #include <boost/python/object.hpp>
+#include <boost/python/extract.hpp>
 
 
 namespace mididings {
@@ -25,10 +33,13 @@ class Call
   : public UnitExImpl<Call>
 {
   public:
-    Call(boost::python::object fun, bool async, bool cont)
-      : _fun(fun)
+    Call(boost::python::object fun, bool async, bool cont, bool batch,
+         PythonCaller::OverflowPolicy overflow)
+      : UnitExImpl<Call>(batch)
+      , _fun(fun)
       , _async(async)
       , _cont(cont)
+      , _overflow(overflow)
     { }
 
     template <typename B>
@@ -37,16 +48,230 @@ class Call
         PythonCaller & c = buffer.engine().python_caller();
 
         if (_async) {
-            return c.call_deferred(buffer, it, _fun, _cont);
+            return c.call_deferred(buffer, it, _fun, _cont, _overflow);
         } else {
             return c.call_now(buffer, it, _fun);
         }
     }
 
+    virtual Patch::EventBufferRT::Range
+    process_range(Patch::EventBufferRT & buffer,
+                  Patch::EventBufferRT::Range const & range) const {
+        return buffer.engine().python_caller().call_now_batch(
+                                                    buffer, range, _fun);
+    }
+
+    virtual Patch::EventBuffer::Range
+    process_range(Patch::EventBuffer & buffer,
+                  Patch::EventBuffer::Range const & range) const {
+        return buffer.engine().python_caller().call_now_batch(
+                                                    buffer, range, _fun);
+    }
+
+    virtual Patch::EventBufferArena::Range
+    process_range(Patch::EventBufferArena & buffer,
+                  Patch::EventBufferArena::Range const & range) const {
+        return buffer.engine().python_caller().call_now_batch(
+                                                    buffer, range, _fun);
+    }
+
   private:
     boost::python::object const _fun;
     bool const _async;
     bool const _cont;
+    PythonCaller::OverflowPolicy const _overflow;
+};
+
+
+/*
+ * calls a python function with a view of the event, which is reused for
+ * each call.
+ */
+class CallView
+  : public UnitExImpl<CallView>
+{
+  public:
+    CallView(boost::python::object fun, boost::python::object convert)
+      : _fun(fun)
+      , _convert(convert)
+      , _view_obj(EventView())
+      , _view(boost::python::extract<EventView &>(_view_obj))
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        PythonCaller & c = buffer.engine().python_caller();
+
+        return c.call_now_view(buffer, it, _fun, _convert, _view_obj, _view);
+    }
+
+  private:
+    boost::python::object const _fun;
+    boost::python::object const _convert;
+    boost::python::object const _view_obj;
+    EventView & _view;
+};
+
+
+/*
+ * calls a python function whose results depend on nothing but the event's
+ * type, port, channel and data, and remembers the results for the most
+ * recently seen events. sysex events are always passed to the function.
+ */
+class CallCached
+  : public UnitExImpl<CallCached>
+{
+  public:
+    CallCached(boost::python::object fun, std::size_t cache_size)
+      : _fun(fun)
+      , _cache_size(cache_size)
+    {
+        _hits = 0;
+        _misses = 0;
+        _generation = 0;
+        _cleared_generation = 0;
+    }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        PythonCaller & c = buffer.engine().python_caller();
+
+        if (it->type & MIDI_EVENT_SYSEX) {
+            return c.call_now(buffer, it, _fun);
+        }
+
+        std::size_t generation = _generation;
+        if (generation != _cleared_generation) {
+            // invalidated from another thread
+            _map.clear();
+            _lru.clear();
+            _cleared_generation = generation;
+        }
+
+        Key key(*it);
+        uint64_t frame = it->frame;
+
+        typename Map::iterator m = _map.find(key);
+
+        if (m != _map.end()) {
+            _hits = _hits + 1;
+
+            // move entry to the front of the list
+            _lru.splice(_lru.begin(), _lru, m->second);
+
+            std::vector<MidiEvent> const & events = m->second->events;
+
+            if (events.empty()) {
+                return Patch::delete_event(buffer, it);
+            }
+            typename B::Range r = Patch::replace_event(buffer, it,
+                                            events.begin(), events.end());
+            set_frame<B>(r, frame);
+            return r;
+        }
+
+        _misses = _misses + 1;
+
+        bool failed = false;
+        typename B::Range r = c.call_now(buffer, it, _fun, &failed);
+        set_frame<B>(r, frame);
+
+        if (failed) {
+            // don't remember the result of a function that didn't return
+            return r;
+        }
+
+        if (_lru.size() >= _cache_size) {
+            // evict least recently used entry
+            _map.erase(_lru.back().key);
+            _lru.pop_back();
+        }
+
+        _lru.push_front(Entry(key, r.begin(), r.end()));
+        _map[key] = _lru.begin();
+
+        return r;
+    }
+
+    std::size_t hits() const { return _hits; }
+    std::size_t misses() const { return _misses; }
+
+    // clear the cache. this can be called from any thread, the cache is
+    // actually cleared by the processing thread when the next event arrives
+    void invalidate() {
+        _generation = _generation + 1;
+    }
+
+  private:
+    struct Key {
+        explicit Key(MidiEvent const & ev)
+          : type(ev.type)
+          , port(ev.port)
+          , channel(event_has_channel(ev.type) ? ev.channel : 0)
+          , data1(event_has_data1(ev.type) ? ev.data1 : 0)
+          , data2(event_has_data2(ev.type) ? ev.data2 : 0)
+        { }
+
+        bool operator==(Key const & other) const {
+            return type == other.type && port == other.port &&
+                   channel == other.channel && data1 == other.data1 &&
+                   data2 == other.data2;
+        }
+
+        friend std::size_t hash_value(Key const & k) {
+            std::size_t h = 0;
+            boost::hash_combine(h, k.type);
+            boost::hash_combine(h, k.port);
+            boost::hash_combine(h, k.channel);
+            boost::hash_combine(h, k.data1);
+            boost::hash_combine(h, k.data2);
+            return h;
+        }
+
+        MidiEventType type;
+        int port;
+        int channel;
+        int data1;
+        int data2;
+    };
+
+    struct Entry {
+        template <typename IterT>
+        Entry(Key const & key_, IterT begin, IterT end)
+          : key(key_)
+          , events(begin, end)
+        { }
+
+        Key key;
+        std::vector<MidiEvent> events;
+    };
+
+    typedef std::list<Entry> EntryList;
+    typedef boost::unordered_map<Key, EntryList::iterator,
+                                 boost::hash<Key> > Map;
+
+    template <typename B>
+    static void set_frame(typename B::Range const & range, uint64_t frame) {
+        // replayed events are sent at the time of the incoming event, even
+        // if they were originally created for a different one
+        for (typename B::Iterator i = range.begin(); i != range.end(); ++i) {
+            i->frame = frame;
+        }
+    }
+
+    boost::python::object const _fun;
+    std::size_t const _cache_size;
+
+    // cache entries, most recently used first
+    mutable EntryList _lru;
+    mutable Map _map;
+
+    mutable das::atomic_size_t _hits;
+    mutable das::atomic_size_t _misses;
+    das::atomic_size_t _generation;
+    mutable std::size_t _cleared_generation;
 };
 
 
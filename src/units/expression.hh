@@ -0,0 +1,374 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_UNITS_EXPRESSION_HH
+#define MIDIDINGS_UNITS_EXPRESSION_HH
+
+#include "config.hh"
+#include "units/base.hh"
+#include "units/util.hh"
+
+#include <vector>
+#include <limits>
+#include <stdexcept>
+#include <cmath>
+
+
+namespace mididings {
+namespace units {
+
+
+/*
+ * opcodes of the stack-based bytecode expression units are compiled to.
+ * CONST, LOAD and STORE take one operand (constant index or event
+ * attribute), IN takes two (index of the first constant and the number of
+ * constants to compare to), all others take none.
+ */
+enum ExpressionOp {
+    EXPRESSION_OP_CONST,
+    EXPRESSION_OP_LOAD,
+    EXPRESSION_OP_STORE,
+    EXPRESSION_OP_IN,
+    EXPRESSION_OP_ADD,
+    EXPRESSION_OP_SUB,
+    EXPRESSION_OP_MUL,
+    EXPRESSION_OP_DIV,
+    EXPRESSION_OP_FLOORDIV,
+    EXPRESSION_OP_MOD,
+    EXPRESSION_OP_POW,
+    EXPRESSION_OP_NEG,
+    EXPRESSION_OP_NOT,
+    EXPRESSION_OP_AND,
+    EXPRESSION_OP_OR,
+    EXPRESSION_OP_LT,
+    EXPRESSION_OP_LE,
+    EXPRESSION_OP_GT,
+    EXPRESSION_OP_GE,
+    EXPRESSION_OP_EQ,
+    EXPRESSION_OP_NE,
+    EXPRESSION_OP_SELECT,
+    EXPRESSION_OP_ABS,
+    EXPRESSION_OP_MIN,
+    EXPRESSION_OP_MAX,
+    EXPRESSION_OP_CLAMP,
+    EXPRESSION_OP_INT,
+    EXPRESSION_OP_ROUND,
+};
+
+
+/*
+ * interpreter for compiled expressions. the bytecode is verified once on
+ * construction, so that running it never needs to check anything.
+ */
+class Expression
+{
+  public:
+    Expression(std::vector<int> const & code,
+               std::vector<double> const & consts, int results)
+      : _code(code)
+      , _consts(consts)
+    {
+        verify(results);
+    }
+
+    // runs the program, returning the value left on the stack (if any)
+    double run(MidiEvent & ev) const
+    {
+        double stack[config::MAX_EXPRESSION_STACK];
+        double *sp = stack;
+
+        std::vector<int>::const_iterator pc = _code.begin();
+        std::vector<int>::const_iterator const end = _code.end();
+
+        while (pc != end) {
+            switch (*pc++) {
+              case EXPRESSION_OP_CONST:
+                *sp++ = _consts[*pc++];
+                break;
+              case EXPRESSION_OP_LOAD:
+                *sp++ = get_parameter(*pc++, ev);
+                break;
+              case EXPRESSION_OP_STORE:
+                set_parameter(*pc++, ev, to_int(*--sp));
+                break;
+              case EXPRESSION_OP_IN: {
+                std::vector<double>::const_iterator first
+                        = _consts.begin() + *pc++;
+                std::vector<double>::const_iterator last = first + *pc++;
+                sp[-1] = std::find(first, last, sp[-1]) != last;
+                break;
+              }
+              case EXPRESSION_OP_ADD:
+                --sp; sp[-1] += sp[0];
+                break;
+              case EXPRESSION_OP_SUB:
+                --sp; sp[-1] -= sp[0];
+                break;
+              case EXPRESSION_OP_MUL:
+                --sp; sp[-1] *= sp[0];
+                break;
+              case EXPRESSION_OP_DIV:
+                --sp; sp[-1] = sp[0] ? sp[-1] / sp[0] : 0.0;
+                break;
+              case EXPRESSION_OP_FLOORDIV:
+                --sp; sp[-1] = sp[0] ? std::floor(sp[-1] / sp[0]) : 0.0;
+                break;
+              case EXPRESSION_OP_MOD:
+                --sp; sp[-1] = modulo(sp[-1], sp[0]);
+                break;
+              case EXPRESSION_OP_POW:
+                --sp; sp[-1] = std::pow(sp[-1], sp[0]);
+                break;
+              case EXPRESSION_OP_NEG:
+                sp[-1] = -sp[-1];
+                break;
+              case EXPRESSION_OP_NOT:
+                sp[-1] = !sp[-1];
+                break;
+              case EXPRESSION_OP_AND:
+                --sp; sp[-1] = sp[-1] && sp[0];
+                break;
+              case EXPRESSION_OP_OR:
+                --sp; sp[-1] = sp[-1] || sp[0];
+                break;
+              case EXPRESSION_OP_LT:
+                --sp; sp[-1] = sp[-1] < sp[0];
+                break;
+              case EXPRESSION_OP_LE:
+                --sp; sp[-1] = sp[-1] <= sp[0];
+                break;
+              case EXPRESSION_OP_GT:
+                --sp; sp[-1] = sp[-1] > sp[0];
+                break;
+              case EXPRESSION_OP_GE:
+                --sp; sp[-1] = sp[-1] >= sp[0];
+                break;
+              case EXPRESSION_OP_EQ:
+                --sp; sp[-1] = sp[-1] == sp[0];
+                break;
+              case EXPRESSION_OP_NE:
+                --sp; sp[-1] = sp[-1] != sp[0];
+                break;
+              case EXPRESSION_OP_SELECT:
+                // condition, value if true, value if false
+                sp -= 2; sp[-1] = sp[-1] ? sp[0] : sp[1];
+                break;
+              case EXPRESSION_OP_ABS:
+                sp[-1] = std::fabs(sp[-1]);
+                break;
+              case EXPRESSION_OP_MIN:
+                --sp; sp[-1] = std::min(sp[-1], sp[0]);
+                break;
+              case EXPRESSION_OP_MAX:
+                --sp; sp[-1] = std::max(sp[-1], sp[0]);
+                break;
+              case EXPRESSION_OP_CLAMP:
+                sp -= 2; sp[-1] = std::min(std::max(sp[-1], sp[0]), sp[1]);
+                break;
+              case EXPRESSION_OP_INT:
+                sp[-1] = truncate(sp[-1]);
+                break;
+              case EXPRESSION_OP_ROUND:
+                sp[-1] = std::floor(sp[-1] + 0.5);
+                break;
+              default:
+                FAIL();
+            }
+        }
+
+        return sp != stack ? sp[-1] : 0.0;
+    }
+
+  private:
+    void verify(int results) const
+    {
+        std::size_t depth = 0;
+
+        for (std::size_t pc = 0; pc != _code.size(); ) {
+            int op = _code[pc++];
+            int pops, pushes, operands;
+
+            switch (op) {
+              case EXPRESSION_OP_CONST:
+              case EXPRESSION_OP_LOAD:
+                pops = 0; pushes = 1; operands = 1;
+                break;
+              case EXPRESSION_OP_STORE:
+                pops = 1; pushes = 0; operands = 1;
+                break;
+              case EXPRESSION_OP_IN:
+                pops = 1; pushes = 1; operands = 2;
+                break;
+              case EXPRESSION_OP_NEG:
+              case EXPRESSION_OP_NOT:
+              case EXPRESSION_OP_ABS:
+              case EXPRESSION_OP_INT:
+              case EXPRESSION_OP_ROUND:
+                pops = 1; pushes = 1; operands = 0;
+                break;
+              case EXPRESSION_OP_SELECT:
+              case EXPRESSION_OP_CLAMP:
+                pops = 3; pushes = 1; operands = 0;
+                break;
+              default:
+                if (op < EXPRESSION_OP_ADD || op > EXPRESSION_OP_ROUND) {
+                    throw std::invalid_argument("invalid expression opcode");
+                }
+                pops = 2; pushes = 1; operands = 0;
+                break;
+            }
+
+            if (_code.size() - pc < static_cast<std::size_t>(operands)) {
+                throw std::invalid_argument("truncated expression bytecode");
+            }
+            if (op == EXPRESSION_OP_CONST &&
+                    !valid_const(_code[pc], 1)) {
+                throw std::invalid_argument("invalid expression constant");
+            }
+            if (op == EXPRESSION_OP_IN &&
+                    !valid_const(_code[pc], _code[pc + 1])) {
+                throw std::invalid_argument("invalid expression constant");
+            }
+            if ((op == EXPRESSION_OP_LOAD || op == EXPRESSION_OP_STORE) &&
+                    !valid_attribute(_code[pc])) {
+                throw std::invalid_argument("invalid expression attribute");
+            }
+            pc += operands;
+
+            if (depth < static_cast<std::size_t>(pops)) {
+                throw std::invalid_argument("expression stack underflow");
+            }
+            depth += pushes - pops;
+            if (depth > config::MAX_EXPRESSION_STACK) {
+                throw std::invalid_argument("expression too complex");
+            }
+        }
+
+        if (depth != static_cast<std::size_t>(results)) {
+            throw std::invalid_argument("unbalanced expression stack");
+        }
+    }
+
+    bool valid_const(int index, int count) const
+    {
+        return index >= 0 && count >= 0 &&
+               static_cast<std::size_t>(index) + count <= _consts.size();
+    }
+
+    static bool valid_attribute(int attr)
+    {
+        return attr <= EVENT_ATTRIBUTE_PORT && attr >= EVENT_ATTRIBUTE_DATA2;
+    }
+
+    static void set_parameter(int attr, MidiEvent & ev, int value)
+    {
+        switch (attr) {
+          case EVENT_ATTRIBUTE_PORT:
+            ev.port = value;
+            break;
+          case EVENT_ATTRIBUTE_CHANNEL:
+            ev.channel = value;
+            break;
+          case EVENT_ATTRIBUTE_DATA1:
+            ev.data1 = value;
+            break;
+          case EVENT_ATTRIBUTE_DATA2:
+            ev.data2 = value;
+            break;
+          default:
+            FAIL();
+        }
+    }
+
+    // modulo with the sign of the divisor, as in Python
+    static double modulo(double a, double b)
+    {
+        if (!b) {
+            return 0.0;
+        }
+        double r = std::fmod(a, b);
+        if (r && ((r < 0) != (b < 0))) {
+            r += b;
+        }
+        return r;
+    }
+
+    static double truncate(double a)
+    {
+        return a < 0 ? std::ceil(a) : std::floor(a);
+    }
+
+    // converts the result of an assignment, clipping values outside the
+    // range of int (and NaN) instead of invoking undefined behaviour
+    static int to_int(double a)
+    {
+        if (!(a == a)) {
+            return 0;
+        }
+        double const lower = std::numeric_limits<int>::min();
+        double const upper = std::numeric_limits<int>::max();
+        return static_cast<int>(std::min(std::max(a, lower), upper));
+    }
+
+    std::vector<int> const _code;
+    std::vector<double> const _consts;
+};
+
+
+class ExpressionFilter
+  : public Filter
+{
+  public:
+    ExpressionFilter(MidiEventType types, std::vector<int> const & code,
+                     std::vector<double> const & consts)
+      : Filter(types, true)
+      , _expr(code, consts, 1)
+    { }
+
+    virtual bool process_filter(MidiEvent & ev) const
+    {
+        return _expr.run(ev) != 0.0;
+    }
+
+  private:
+    Expression const _expr;
+};
+
+
+class Transform
+  : public Unit
+{
+  public:
+    Transform(MidiEventType types, std::vector<int> const & code,
+              std::vector<double> const & consts)
+      : _types(types)
+      , _expr(code, consts, 0)
+    { }
+
+    virtual bool process(MidiEvent & ev) const
+    {
+        if (ev.type & _types) {
+            _expr.run(ev);
+        }
+        return true;
+    }
+
+  private:
+    MidiEventType const _types;
+    Expression const _expr;
+};
+
+
+} // units
+} // mididings
+
+
+#endif // MIDIDINGS_UNITS_EXPRESSION_HH
@@ -13,6 +13,7 @@
 #define MIDIDINGS_UNITS_FILTERS_HH
 
 #include "units/base.hh"
+#include "units/util.hh"
 
 #include <vector>
 #include <string>
@@ -71,7 +72,7 @@ class KeyFilter
       : Filter(MIDI_EVENT_NOTE | MIDI_EVENT_POLY_AFTERTOUCH, true)
       , _lower(lower)
       , _upper(upper)
-      , _notes(notes)
+      , _notes(make_table(notes))
     { }
 
     virtual bool process_filter(MidiEvent & ev) const
@@ -80,15 +81,30 @@ class KeyFilter
             return ((ev.note.note >= _lower || _lower == 0) &&
                     (ev.note.note <  _upper || _upper == 0));
         } else {
-            return (std::find(_notes.begin(), _notes.end(), ev.note.note)
-                                != _notes.end());
+            return _notes.contains(ev.note.note) && _notes[ev.note.note];
         }
     }
 
   private:
+    // a table mapping each note to 1 if it's in the list, 0 otherwise
+    static LookupTable make_table(std::vector<int> const & notes)
+    {
+        std::vector<int> table;
+        for (std::vector<int>::const_iterator it = notes.begin();
+                it != notes.end(); ++it) {
+            if (*it >= 0) {
+                if (*it >= static_cast<int>(table.size())) {
+                    table.resize(*it + 1);
+                }
+                table[*it] = 1;
+            }
+        }
+        return LookupTable(table);
+    }
+
     int const _lower;
     int const _upper;
-    std::vector<int> const _notes;
+    LookupTable const _notes;
 };
 
 
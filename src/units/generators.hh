@@ -14,6 +14,7 @@
 
 #include "units/base.hh"
 #include "units/util.hh"
+#include "sysex_pool.hh"
 
 
 namespace mididings {
@@ -63,7 +64,9 @@ class SysExGenerator
     SysExGenerator(int port, SysExDataConstPtr const & sysex)
       : _port(port)
       , _sysex(sysex)
-    { }
+    {
+        ASSERT(!_sysex->empty());
+    }
 
     virtual bool process(MidiEvent & ev) const
     {
@@ -72,7 +75,13 @@ class SysExGenerator
         ev.channel = 0;
         ev.data1 = 0;
         ev.data2 = 0;
-        ev.sysex = _sysex;
+
+        // each event gets its own copy from the sysex pool, like the events
+        // received by the backends. the copy is recycled as soon as the
+        // event is gone, and the unit's data is never released from the
+        // realtime thread
+        unsigned char const *data = &_sysex->front();
+        ev.sysex = sysex_pool::create(data, data + _sysex->size());
 
         return true;
     }
@@ -22,6 +22,16 @@ namespace mididings {
 namespace units {
 
 
+/*
+ * whether the given transform mode is expensive enough to be replaced by a
+ * lookup table
+ */
+inline bool use_table(TransformMode mode)
+{
+    return mode == TRANSFORM_MODE_GAMMA || mode == TRANSFORM_MODE_CURVE;
+}
+
+
 class Port
   : public Unit
 {
@@ -83,6 +93,56 @@ class Transpose
 };
 
 
+class NoteMap
+  : public Unit
+{
+  public:
+    // negative entries discard the event
+    NoteMap(std::vector<int> const & table)
+      : _table(table)
+    { }
+
+    virtual bool process(MidiEvent & ev) const
+    {
+        if ((ev.type & (MIDI_EVENT_NOTE | MIDI_EVENT_POLY_AFTERTOUCH)) &&
+                _table.contains(ev.note.note)) {
+            int note = _table[ev.note.note];
+            if (note < 0) {
+                return false;
+            }
+            ev.note.note = note;
+        }
+        return true;
+    }
+
+  private:
+    LookupTable const _table;
+};
+
+
+class ValueMap
+  : public Unit
+{
+  public:
+    ValueMap(MidiEventType types, std::vector<int> const & table, int offset)
+      : _types(types)
+      , _table(table, offset)
+    { }
+
+    virtual bool process(MidiEvent & ev) const
+    {
+        if (ev.type & _types) {
+            ev.data2 = _table.lookup(ev.data2);
+        }
+        return true;
+    }
+
+  private:
+    MidiEventType const _types;
+    LookupTable const _table;
+};
+
+
 class Key
   : public Unit
 {
@@ -111,13 +171,19 @@ class Velocity
     Velocity(float param, TransformMode mode)
       : _param(param)
       , _mode(mode)
+      , _table(use_table(mode) ? LookupTable::transform(param, mode)
+                               : LookupTable())
     { }
 
     virtual bool process(MidiEvent & ev) const
     {
         if (ev.type == MIDI_EVENT_NOTEON && ev.note.velocity > 0) {
-            ev.note.velocity = apply_transform(ev.note.velocity,
-                                               _param, _mode);
+            if (_table.contains(ev.note.velocity)) {
+                ev.note.velocity = _table[ev.note.velocity];
+            } else {
+                ev.note.velocity = apply_transform(ev.note.velocity,
+                                                   _param, _mode);
+            }
         }
         return true;
     }
@@ -125,6 +191,7 @@ class Velocity
   private:
     float const _param;
     TransformMode const _mode;
+    LookupTable const _table;
 };
 
 
@@ -231,12 +298,18 @@ class CtrlCurve
       : _ctrl(ctrl)
       , _param(param)
       , _mode(mode)
+      , _table(use_table(mode) ? LookupTable::transform(param, mode)
+                               : LookupTable())
     { }
 
     virtual bool process(MidiEvent & ev) const
     {
         if (ev.type == MIDI_EVENT_CTRL && ev.ctrl.param == _ctrl) {
-            ev.ctrl.value = apply_transform(ev.ctrl.value, _param, _mode);
+            if (_table.contains(ev.ctrl.value)) {
+                ev.ctrl.value = _table[ev.ctrl.value];
+            } else {
+                ev.ctrl.value = apply_transform(ev.ctrl.value, _param, _mode);
+            }
         }
         return true;
     }
@@ -245,6 +318,7 @@ class CtrlCurve
     int const _ctrl;
     float const _param;
     TransformMode const _mode;
+    LookupTable const _table;
 };
 
 
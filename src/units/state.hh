@@ -0,0 +1,293 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_UNITS_STATE_HH
+#define MIDIDINGS_UNITS_STATE_HH
+
+#include "midi_event.hh"
+#include "patch.hh"
+
+#include <vector>
+#include <algorithm>
+#include <cstddef>
+
+
+namespace mididings {
+namespace units {
+
+
+/*
+ * building blocks for units that need to remember something about the
+ * events they've seen, usually separately for each port and channel.
+ * everything here works without allocating memory while processing events.
+ */
+
+
+/*
+ * one instance of T for each port/channel combination, preallocated for the
+ * given number of ports. events from any other port, as well as invalid
+ * events, all share one additional instance.
+ */
+template <typename T>
+class ChannelState
+{
+  public:
+    static int const NUM_CHANNELS = 16;
+
+    explicit ChannelState(int num_ports)
+      : _states(std::max(num_ports, 0) * NUM_CHANNELS)
+    { }
+
+    T & operator[](MidiEvent const & ev)
+    {
+        if (ev.port < 0 || ev.channel < 0 || ev.channel >= NUM_CHANNELS) {
+            return _other;
+        }
+        std::size_t i = ev.port * NUM_CHANNELS + ev.channel;
+        if (i >= _states.size()) {
+            return _other;
+        }
+        return _states[i];
+    }
+
+  private:
+    std::vector<T> _states;
+    T _other;
+};
+
+
+/*
+ * a set of note numbers. notes outside the MIDI range are never contained
+ * in the set.
+ */
+class NoteSet
+{
+  public:
+    static int const NUM_NOTES = 128;
+
+    NoteSet() {
+        clear();
+    }
+
+    static bool valid(int note) {
+        return note >= 0 && note < NUM_NOTES;
+    }
+
+    bool contains(int note) const {
+        return valid(note) && _notes[note];
+    }
+
+    void add(int note) {
+        if (valid(note)) {
+            _notes[note] = true;
+        }
+    }
+
+    void remove(int note) {
+        if (valid(note)) {
+            _notes[note] = false;
+        }
+    }
+
+    void clear() {
+        std::fill(_notes, _notes + NUM_NOTES, false);
+    }
+
+  private:
+    bool _notes[NUM_NOTES];
+};
+
+
+/*
+ * a list of notes and their velocities, in the order they were added.
+ * the same note may be contained more than once.
+ */
+class NoteList
+{
+  public:
+    static std::size_t const CAPACITY = 128;
+
+    struct Entry {
+        int note;
+        int velocity;
+    };
+
+    NoteList()
+      : _size(0)
+    { }
+
+    std::size_t size() const { return _size; }
+    bool empty() const { return _size == 0; }
+
+    Entry const & operator[](std::size_t n) const { return _entries[n]; }
+    Entry const & front() const { return _entries[0]; }
+    Entry const & back() const { return _entries[_size - 1]; }
+
+    // returns the index of the first entry for the given note, or -1
+    int find(int note) const {
+        for (std::size_t n = 0; n != _size; ++n) {
+            if (_entries[n].note == note) {
+                return n;
+            }
+        }
+        return -1;
+    }
+
+    bool contains(int note) const {
+        return find(note) != -1;
+    }
+
+    // inserts a note at the given index. if the list is full, the oldest
+    // note is dropped to make room
+    void insert(std::size_t pos, int note, int velocity = 0) {
+        if (_size == CAPACITY) {
+            erase(0);
+            if (pos) {
+                --pos;
+            }
+        }
+        std::copy_backward(_entries + pos, _entries + _size,
+                           _entries + _size + 1);
+        _entries[pos].note = note;
+        _entries[pos].velocity = velocity;
+        ++_size;
+    }
+
+    void push_back(int note, int velocity = 0) {
+        insert(_size, note, velocity);
+    }
+
+    void erase(std::size_t pos) {
+        std::copy(_entries + pos + 1, _entries + _size, _entries + pos);
+        --_size;
+    }
+
+    // removes the first entry for the given note, returns false if the
+    // note wasn't found
+    bool remove(int note) {
+        int n = find(note);
+        if (n == -1) {
+            return false;
+        }
+        erase(n);
+        return true;
+    }
+
+    // removes all entries for the given note
+    void remove_all(int note) {
+        std::size_t k = 0;
+        for (std::size_t n = 0; n != _size; ++n) {
+            if (_entries[n].note != note) {
+                _entries[k++] = _entries[n];
+            }
+        }
+        _size = k;
+    }
+
+    void clear() {
+        _size = 0;
+    }
+
+  private:
+    Entry _entries[CAPACITY];
+    std::size_t _size;
+};
+
+
+/*
+ * a note event with the given type, note and velocity, and everything else
+ * copied from ev.
+ */
+inline MidiEvent make_note_event(MidiEvent const & ev, MidiEventType type,
+                                 int note, int velocity)
+{
+    MidiEvent r(ev);
+    r.type = type;
+    r.note.note = note;
+    r.note.velocity = velocity;
+    return r;
+}
+
+
+/*
+ * replaces the event being processed with any number of events, which are
+ * inserted into the buffer right away. the original event can be kept
+ * between them.
+ */
+template <typename B>
+class EventReplacer
+{
+  public:
+    EventReplacer(B & buffer, typename B::Iterator it)
+      : _buffer(buffer)
+      , _it(it)
+      , _pos(it)
+      , _first(it)
+      , _empty(true)
+      , _keep(false)
+    { }
+
+    void add(MidiEvent const & ev) {
+        typename B::Iterator i = _buffer.insert(_pos, ev);
+        if (_empty) {
+            _first = i;
+            _empty = false;
+        }
+    }
+
+    void note_on(MidiEvent const & ev, int note, int velocity) {
+        add(make_note_event(ev, MIDI_EVENT_NOTEON, note, velocity));
+    }
+
+    void note_off(MidiEvent const & ev, int note) {
+        add(make_note_event(ev, MIDI_EVENT_NOTEOFF, note, 0));
+    }
+
+    // keeps the original event, after all events added so far and before
+    // all events added later
+    void keep() {
+        if (_empty) {
+            _first = _it;
+            _empty = false;
+        }
+        _keep = true;
+        _pos = _it;
+        ++_pos;
+    }
+
+    // returns the range of all events added, removing the original event
+    // unless it's being kept
+    typename B::Range finish() {
+        if (_keep) {
+            return typename B::Range(_first, _pos);
+        }
+        typename B::Iterator end = _buffer.erase(_it);
+        if (_empty) {
+            return typename B::Range(end);
+        }
+        return typename B::Range(_first, end);
+    }
+
+  private:
+    B & _buffer;
+    typename B::Iterator const _it;
+    typename B::Iterator _pos;
+    typename B::Iterator _first;
+    bool _empty;
+    bool _keep;
+};
+
+
+} // units
+} // mididings
+
+
+#endif // MIDIDINGS_UNITS_STATE_HH
@@ -0,0 +1,507 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_UNITS_STATEFUL_HH
+#define MIDIDINGS_UNITS_STATEFUL_HH
+
+#include "units/base.hh"
+#include "units/state.hh"
+#include "engine.hh"
+#include "patch.hh"
+
+#include <algorithm>
+
+#include <boost/shared_ptr.hpp>
+#include <boost/noncopyable.hpp>
+
+
+namespace mididings {
+namespace units {
+
+
+/*
+ * the stateful units below only ever see note events (and, for
+ * PedalToNoteoff, the pedal's control changes). the Python code wraps them
+ * in a selector that lets everything else bypass them.
+ */
+
+
+class LimitPolyphony
+  : public UnitExImpl<LimitPolyphony>
+{
+  public:
+    LimitPolyphony(int max_polyphony, bool remove_oldest, int num_ports)
+      : _max_polyphony(max_polyphony)
+      , _remove_oldest(remove_oldest)
+      , _notes(num_ports)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        NoteList & notes = _notes[*it];
+        EventReplacer<B> r(buffer, it);
+
+        if (it->type == MIDI_EVENT_NOTEON) {
+            if (static_cast<int>(notes.size()) < _max_polyphony) {
+                // polyphony not exceeded, allow note
+                notes.push_back(it->note.note);
+                r.keep();
+            }
+            else if (_remove_oldest && !notes.empty()) {
+                // allow note, but send note-off for oldest first
+                r.note_off(*it, notes.front().note);
+                notes.erase(0);
+                notes.push_back(it->note.note);
+                r.keep();
+            }
+        }
+        else if (it->type == MIDI_EVENT_NOTEOFF) {
+            if (notes.remove(it->note.note)) {
+                r.keep();
+            }
+        }
+
+        return r.finish();
+    }
+
+  private:
+    int const _max_polyphony;
+    bool const _remove_oldest;
+
+    mutable ChannelState<NoteList> _notes;
+};
+
+
+class MakeMonophonic
+  : public UnitExImpl<MakeMonophonic>
+{
+  public:
+    // which of the held notes is sounding
+    enum Priority {
+        // the most recently played note
+        PRIORITY_LAST,
+        // the lowest note
+        PRIORITY_LOW,
+        // the highest note
+        PRIORITY_HIGH,
+    };
+
+    MakeMonophonic(Priority priority, int num_ports)
+      : _priority(priority)
+      , _notes(num_ports)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        NoteList & notes = _notes[*it];
+        EventReplacer<B> r(buffer, it);
+
+        if (it->type == MIDI_EVENT_NOTEON) {
+            int prev = notes.empty() ? -1 : notes[sounding(notes)].note;
+            notes.push_back(it->note.note, it->note.velocity);
+
+            if (sounding(notes) == notes.size() - 1) {
+                // the new note takes over, send note-off for previous note
+                if (prev != -1) {
+                    r.note_off(*it, prev);
+                }
+                r.keep();
+            }
+            // otherwise the new note is held, but remains silent
+        }
+        else if (it->type == MIDI_EVENT_NOTEOFF) {
+            bool current = !notes.empty() &&
+                           it->note.note == notes[sounding(notes)].note;
+
+            // remove released note from list
+            notes.remove_all(it->note.note);
+
+            if (current) {
+                // note-off for currently sounding note
+                r.keep();
+                if (!notes.empty()) {
+                    // retrigger the note that takes over
+                    NoteList::Entry const & next = notes[sounding(notes)];
+                    r.note_on(*it, next.note, next.velocity);
+                }
+            }
+            // otherwise the note isn't sounding, discard note-off
+        }
+
+        return r.finish();
+    }
+
+  private:
+    // returns the index of the sounding note in a non-empty list. of
+    // several entries for the same note, the most recent one counts
+    std::size_t sounding(NoteList const & notes) const
+    {
+        std::size_t best = notes.size() - 1;
+        if (_priority == PRIORITY_LAST) {
+            return best;
+        }
+        for (std::size_t n = 0; n != notes.size(); ++n) {
+            int note = notes[n].note;
+            int best_note = notes[best].note;
+            if (_priority == PRIORITY_LOW ? note < best_note
+                                          : note > best_note) {
+                best = n;
+            }
+        }
+        return best;
+    }
+
+    Priority const _priority;
+
+    mutable ChannelState<NoteList> _notes;
+};
+
+
+class LatchNotes
+  : public UnitExImpl<LatchNotes>
+{
+  public:
+    // reset is -1 if there's no reset key
+    LatchNotes(bool polyphonic, int reset, int num_ports)
+      : _polyphonic(polyphonic)
+      , _reset(reset)
+      , _notes(num_ports)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        NoteList & notes = _notes[*it];
+        EventReplacer<B> r(buffer, it);
+
+        // note-offs are always discarded
+        if (it->type != MIDI_EVENT_NOTEON) {
+            return r.finish();
+        }
+
+        if (_reset != -1 && it->note.note == _reset) {
+            // reset all notes
+            for (std::size_t n = 0; n != notes.size(); ++n) {
+                r.note_off(*it, notes[n].note);
+            }
+            notes.clear();
+        }
+        else if (_polyphonic) {
+            if (notes.remove(it->note.note)) {
+                // turn note off
+                r.note_off(*it, it->note.note);
+            } else {
+                // turn note on
+                notes.push_back(it->note.note);
+                r.keep();
+            }
+        }
+        else {
+            // monophonic: turn off previous note, play new note
+            if (!notes.empty()) {
+                r.note_off(*it, notes.front().note);
+            }
+            notes.clear();
+            notes.push_back(it->note.note);
+            r.keep();
+        }
+
+        return r.finish();
+    }
+
+  private:
+    bool const _polyphonic;
+    int const _reset;
+
+    mutable ChannelState<NoteList> _notes;
+};
+
+
+class PedalToNoteoff
+  : public UnitExImpl<PedalToNoteoff>
+{
+  public:
+    PedalToNoteoff(int ctrl, bool sostenuto, int num_ports)
+      : _ctrl(ctrl)
+      , _sostenuto(sostenuto)
+      , _state(num_ports)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        State & state = _state[*it];
+        EventReplacer<B> r(buffer, it);
+
+        if (it->type == MIDI_EVENT_CTRL && it->ctrl.param == _ctrl) {
+            state.pedal = (it->ctrl.value >= 64);
+            if (state.pedal) {
+                if (_sostenuto) {
+                    // pedal pressed, remember currently held notes
+                    for (int n = 0; n != NoteSet::NUM_NOTES; ++n) {
+                        if (state.held.contains(n)) {
+                            state.sustained.add(n);
+                        }
+                    }
+                }
+            } else {
+                // pedal released, send note-offs for all sustained notes
+                // that aren't still being held
+                for (int n = 0; n != NoteSet::NUM_NOTES; ++n) {
+                    if (state.sustained.contains(n) &&
+                            !(_sostenuto && state.held.contains(n))) {
+                        r.note_off(*it, n);
+                    }
+                }
+                state.sustained.clear();
+            }
+        }
+        else if (_sostenuto) {
+            if (it->type == MIDI_EVENT_NOTEON) {
+                state.held.add(it->note.note);
+                r.keep();
+            }
+            else if (it->type == MIDI_EVENT_NOTEOFF) {
+                state.held.remove(it->note.note);
+                // send note-off only if the note is not being sustained
+                if (!state.sustained.contains(it->note.note)) {
+                    r.keep();
+                }
+            }
+            else {
+                r.keep();
+            }
+        }
+        else if (it->type == MIDI_EVENT_NOTEON && state.pedal) {
+            // note-on while pedal is held
+            if (state.sustained.contains(it->note.note)) {
+                state.sustained.remove(it->note.note);
+                r.note_off(*it, it->note.note);
+            }
+            r.keep();
+        }
+        else if (it->type == MIDI_EVENT_NOTEOFF && state.pedal) {
+            // delay note-off until pedal released
+            state.sustained.add(it->note.note);
+        }
+        else {
+            r.keep();
+        }
+
+        return r.finish();
+    }
+
+  private:
+    struct State
+    {
+        State()
+          : pedal(false)
+        { }
+
+        bool pedal;
+        // notes whose note-off is delayed
+        NoteSet sustained;
+        // notes currently held (sostenuto only)
+        NoteSet held;
+    };
+
+    int const _ctrl;
+    bool const _sostenuto;
+
+    mutable ChannelState<State> _state;
+};
+
+
+/*
+ * the notes played in the regions below and above the split point, shared
+ * by the units that make up a FloatingKeySplit().
+ */
+class FloatingSplitState
+  : boost::noncopyable
+{
+  public:
+    FloatingSplitState(int threshold_lower, int threshold_upper,
+                       double hold_time, int margin_lower, int margin_upper)
+      : _threshold_lower(threshold_lower)
+      , _threshold_upper(threshold_upper)
+      , _hold_time(hold_time)
+      , _margin_lower(margin_lower)
+      , _margin_upper(margin_upper)
+      , _threshold(threshold_lower)
+    { }
+
+    int threshold() const {
+        return _threshold;
+    }
+
+    void update(MidiEvent const & ev, double now)
+    {
+        // remove old notes if hold_time has elapsed
+        _lower.expire(now - _hold_time);
+        _upper.expire(now - _hold_time);
+
+        // the lower reference point is the highest note played in the region
+        // below the split point, but never below the lower threshold by more
+        // than the set margin
+        int lower = std::max(_lower.highest(),
+                             _threshold_lower - _margin_lower);
+
+        // the upper reference point is the lowest note played in the region
+        // above the split point, but never above the upper threshold by more
+        // than the set margin
+        int upper = std::min(_upper.lowest(),
+                             _threshold_upper + _margin_upper);
+
+        // calculate new threshold as the center between upper and lower
+        // reference point, but confined by the given thresholds
+        int center = lower + upper + 1;
+        center = (center - (center < 0)) / 2;
+        _threshold = std::min(std::max(center, _threshold_lower),
+                              _threshold_upper);
+
+        if (ev.type == MIDI_EVENT_NOTEON) {
+            // add notes to the appropriate region
+            if (ev.note.note < _threshold) {
+                _lower.press(ev.note.note);
+            } else {
+                _upper.press(ev.note.note);
+            }
+        }
+        else if (ev.type == MIDI_EVENT_NOTEOFF) {
+            // mark notes for removal
+            _lower.release(ev.note.note, now);
+            _upper.release(ev.note.note, now);
+        }
+    }
+
+  private:
+    class Region
+    {
+      public:
+        Region() {
+            std::fill(_present, _present + NoteSet::NUM_NOTES, false);
+        }
+
+        void press(int note) {
+            if (NoteSet::valid(note)) {
+                _present[note] = true;
+                _released[note] = 0.0;
+            }
+        }
+
+        void release(int note, double now) {
+            if (NoteSet::valid(note) && _present[note]) {
+                _released[note] = now;
+            }
+        }
+
+        void expire(double before) {
+            for (int n = 0; n != NoteSet::NUM_NOTES; ++n) {
+                if (_present[n] && _released[n] &&
+                        _released[n] < before) {
+                    _present[n] = false;
+                }
+            }
+        }
+
+        // the highest note, or a value lower than any note
+        int highest() const {
+            for (int n = NoteSet::NUM_NOTES - 1; n >= 0; --n) {
+                if (_present[n]) {
+                    return n;
+                }
+            }
+            return -NoteSet::NUM_NOTES;
+        }
+
+        // the lowest note, or a value higher than any note
+        int lowest() const {
+            for (int n = 0; n != NoteSet::NUM_NOTES; ++n) {
+                if (_present[n]) {
+                    return n;
+                }
+            }
+            return 2 * NoteSet::NUM_NOTES;
+        }
+
+      private:
+        bool _present[NoteSet::NUM_NOTES];
+        // the time each note was released, or 0 if it's still held
+        double _released[NoteSet::NUM_NOTES];
+    };
+
+    int const _threshold_lower;
+    int const _threshold_upper;
+    double const _hold_time;
+    int const _margin_lower;
+    int const _margin_upper;
+
+    Region _lower;
+    Region _upper;
+    int _threshold;
+};
+
+
+class FloatingSplitAnalyzer
+  : public UnitExImpl<FloatingSplitAnalyzer>
+{
+  public:
+    FloatingSplitAnalyzer(boost::shared_ptr<FloatingSplitState> const & state)
+      : _state(state)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        _state->update(*it, buffer.engine().time());
+        return Patch::keep_event(buffer, it);
+    }
+
+  private:
+    boost::shared_ptr<FloatingSplitState> const _state;
+};
+
+
+class FloatingSplitFilter
+  : public UnitExImpl<FloatingSplitFilter>
+{
+  public:
+    FloatingSplitFilter(boost::shared_ptr<FloatingSplitState> const & state,
+                        bool upper)
+      : _state(state)
+      , _upper(upper)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        // the split point can never move past a note that's still being
+        // held, so this is valid for both note-on and note-off events
+        if ((it->note.note >= _state->threshold()) == _upper) {
+            return Patch::keep_event(buffer, it);
+        } else {
+            return Patch::delete_event(buffer, it);
+        }
+    }
+
+  private:
+    boost::shared_ptr<FloatingSplitState> const _state;
+    bool const _upper;
+};
+
+
+} // units
+} // mididings
+
+
+#endif // MIDIDINGS_UNITS_STATEFUL_HH
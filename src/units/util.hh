@@ -12,6 +12,7 @@
 #ifndef MIDIDINGS_UNITS_UTIL_HH
 #define MIDIDINGS_UNITS_UTIL_HH
 
+#include <vector>
 #include <cmath>
 #include <algorithm>
 
@@ -83,6 +84,56 @@ inline int apply_transform(int value, float param, TransformMode mode)
 }
 
 
+/*
+ * table mapping the values [offset ... offset + size - 1] to arbitrary
+ * values, precomputed once so that looking up a value is cheap.
+ */
+class LookupTable
+{
+  public:
+    LookupTable()
+      : _offset(0)
+    { }
+
+    LookupTable(std::vector<int> const & table, int offset = 0)
+      : _table(table)
+      , _offset(offset)
+    { }
+
+    // the result of apply_transform() for each value from 0 to 127
+    static LookupTable transform(float param, TransformMode mode)
+    {
+        std::vector<int> table(128);
+        for (int n = 0; n != 128; ++n) {
+            table[n] = apply_transform(n, param, mode);
+        }
+        return LookupTable(table);
+    }
+
+    bool empty() const {
+        return _table.empty();
+    }
+
+    bool contains(int value) const {
+        return static_cast<unsigned int>(value - _offset) < _table.size();
+    }
+
+    // value must be within the table
+    int operator[](int value) const {
+        return _table[value - _offset];
+    }
+
+    // returns the value itself if it's not within the table
+    int lookup(int value) const {
+        return contains(value) ? (*this)[value] : value;
+    }
+
+  private:
+    std::vector<int> _table;
+    int _offset;
+};
+
+
 /*
  * maps the input range [arg_lower ... arg_upper] to the
  * output range [val_lower ... val_upper]
@@ -0,0 +1,238 @@
+/*
+ * mididings
+ *
+ * Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef MIDIDINGS_UNITS_VOICES_HH
+#define MIDIDINGS_UNITS_VOICES_HH
+
+#include "config.hh"
+#include "units/base.hh"
+#include "units/state.hh"
+#include "engine.hh"
+#include "patch.hh"
+
+#include <boost/shared_ptr.hpp>
+#include <boost/noncopyable.hpp>
+
+
+namespace mididings {
+namespace units {
+
+
+/*
+ * the notes currently being held, separately for each port/channel
+ * combination. one instance is shared by all voices of a VoiceSplit(), so
+ * that each note event only needs to be added or removed once.
+ */
+class VoiceState
+  : boost::noncopyable
+{
+  public:
+    struct Notes
+    {
+        bool is_held(int note) const {
+            return held.contains(note);
+        }
+
+        // note numbers in ascending order
+        NoteList sorted;
+        NoteSet held;
+        int velocity[NoteSet::NUM_NOTES];
+        double time[NoteSet::NUM_NOTES];
+    };
+
+    explicit VoiceState(int num_ports)
+      : _notes(num_ports)
+    { }
+
+    Notes & notes(MidiEvent const & ev) {
+        return _notes[ev];
+    }
+
+    void update(MidiEvent const & ev, double t)
+    {
+        int const note = ev.note.note;
+        if (!NoteSet::valid(note)) {
+            return;
+        }
+
+        Notes & n = notes(ev);
+        std::size_t pos = 0;
+        while (pos != n.sorted.size() && n.sorted[pos].note < note) {
+            ++pos;
+        }
+
+        if (ev.type == MIDI_EVENT_NOTEON) {
+            // store new note, its velocity, and its time
+            if (!n.held.contains(note)) {
+                n.sorted.insert(pos, note);
+                n.held.add(note);
+            }
+            n.velocity[note] = ev.note.velocity;
+            n.time[note] = t;
+        }
+        else if (ev.type == MIDI_EVENT_NOTEOFF) {
+            // ignore unmatched note-offs
+            if (n.held.contains(note)) {
+                n.sorted.erase(pos);
+                n.held.remove(note);
+            }
+        }
+    }
+
+  private:
+    ChannelState<Notes> _notes;
+};
+
+
+/*
+ * adds and removes notes to/from the shared state, and passes all events
+ * through unchanged.
+ */
+class VoiceTracker
+  : public UnitExImpl<VoiceTracker>
+{
+  public:
+    VoiceTracker(boost::shared_ptr<VoiceState> const & state)
+      : _state(state)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        if (it->type & MIDI_EVENT_NOTE) {
+            _state->update(*it, buffer.engine().time());
+        }
+        return Patch::keep_event(buffer, it);
+    }
+
+  private:
+    boost::shared_ptr<VoiceState> const _state;
+};
+
+
+/*
+ * replaces each note event with the note-on/off events needed to make a
+ * single voice follow the notes being held. the state must already have
+ * been updated by a VoiceTracker.
+ */
+class VoiceFilter
+  : public UnitExImpl<VoiceFilter>
+{
+  public:
+    VoiceFilter(boost::shared_ptr<VoiceState> const & state,
+                int voice, double time, bool retrigger, int num_ports)
+      : _state(state)
+      , _voice(voice)
+      , _time(time)
+      , _retrigger(retrigger)
+      , _current(num_ports)
+    { }
+
+    template <typename B>
+    typename B::Range process(B & buffer, typename B::Iterator it) const
+    {
+        if (!(it->type & MIDI_EVENT_NOTE)) {
+            return Patch::keep_event(buffer, it);
+        }
+
+        double const t = buffer.engine().time();
+        VoiceState::Notes const & notes = _state->notes(*it);
+        Current & cur = _current[*it];
+
+        int const size = notes.sorted.size();
+        int n = -1;
+        bool d = false;
+
+        if (size) {
+            int index = _voice < 0 ? size + _voice : _voice;
+            if (index >= 0 && index < size) {
+                n = notes.sorted[index].note;
+            } else {
+                // use the next best note:
+                // lowest for negative index, otherwise highest
+                n = notes.sorted[_voice < 0 ? 0 : size - 1].note;
+                d = true;
+            }
+        }
+
+        double dt = notes.is_held(cur.note) ? t - notes.time[cur.note] : 0.0;
+
+        EventReplacer<B> r(buffer, it);
+
+        // change current note if...
+        if (
+            // note number changed and...
+            n != cur.note && (
+                // we're always retriggering notes
+                _retrigger ||
+                // lowest/highest voice are a bit of a special case
+                _voice == 0 || _voice == -1 ||
+                // current note is no longer held
+                !notes.is_held(cur.note) ||
+                // our previous note is very recent
+                (it->type == MIDI_EVENT_NOTEON && dt < _time) ||
+                // the new note is "better" than previous one
+                (cur.diverted && !d)
+        )) {
+            // note-off for previous note (if any)
+            if (cur.note != -1) {
+                r.note_off(*it, cur.note);
+                cur.note = -1;
+            }
+
+            dt = notes.is_held(n) ? t - notes.time[n] : 0.0;
+
+            // note-on for new note (if any)
+            if (n != -1 && (
+                // this is the note being played right now
+                it->data1 == n ||
+                // we're retriggering whenever a key is pressed or released
+                _retrigger ||
+                // our previous note is very recent
+                dt < _time
+            )) {
+                r.note_on(*it, n, notes.velocity[n]);
+                cur.note = n;
+                cur.diverted = d;
+            }
+        }
+
+        return r.finish();
+    }
+
+  private:
+    // the note this voice is playing on one port/channel
+    struct Current
+    {
+        Current()
+          : note(-1)
+          , diverted(false)
+        { }
+
+        int note;
+        // if we had to fall back to a different voice
+        bool diverted;
+    };
+
+    boost::shared_ptr<VoiceState> const _state;
+    int const _voice;
+    double const _time;
+    bool const _retrigger;
+
+    mutable ChannelState<Current> _current;
+};
+
+
+} // units
+} // mididings
+
+
+#endif // MIDIDINGS_UNITS_VOICES_HH
@@ -0,0 +1,295 @@
+/*
+ * Copyright (C) 2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef DAS_UTIL_ARENA_LIST_HH
+#define DAS_UTIL_ARENA_LIST_HH
+
+#include <vector>
+#include <iterator>
+#include <cstddef>
+#include <new>
+
+#include <boost/type_traits/aligned_storage.hpp>
+#include <boost/type_traits/alignment_of.hpp>
+
+
+namespace das {
+
+
+template <typename T>
+class arena_list_base
+{
+  public:
+    static std::size_t max_utilization() {
+        return max_utilization_;
+    }
+    static std::size_t fallback_count() {
+        return fallback_count_;
+    }
+
+  protected:
+    static std::size_t max_utilization_;
+    static std::size_t fallback_count_;
+};
+
+template <typename T>
+std::size_t arena_list_base<T>::max_utilization_ = 0;
+
+template <typename T>
+std::size_t arena_list_base<T>::fallback_count_ = 0;
+
+
+/*
+ * a doubly linked list with (mostly) the interface of std::list, storing
+ * its elements in the slots of a contiguous arena of N elements.
+ * slots never move, so iterators stay valid just like with std::list.
+ * unlike curious_alloc, freed slots are reused immediately. only if the
+ * arena is full, another block of N slots is allocated (not RT-safe!).
+ */
+template <typename T, std::size_t N>
+class arena_list
+  : public arena_list_base<T>
+{
+    struct node {
+        node * prev;
+        node * next;
+        typename boost::aligned_storage<
+            sizeof(T), boost::alignment_of<T>::value
+        >::type storage;
+
+        T & value() {
+            return *reinterpret_cast<T *>(&storage);
+        }
+    };
+
+  public:
+
+    typedef T value_type;
+    typedef T & reference;
+    typedef T const & const_reference;
+    typedef std::size_t size_type;
+    typedef std::ptrdiff_t difference_type;
+
+    template <typename V>
+    class iterator_base
+    {
+        friend class arena_list;
+
+        // iterator needs access to const_iterator's members and vice versa
+        template <typename> friend class iterator_base;
+
+      public:
+        typedef std::bidirectional_iterator_tag iterator_category;
+        typedef T value_type;
+        typedef std::ptrdiff_t difference_type;
+        typedef V * pointer;
+        typedef V & reference;
+
+        iterator_base()
+          : _node(NULL)
+        { }
+
+        // allow conversion from iterator to const_iterator
+        iterator_base(iterator_base<T> const & other)
+          : _node(other._node)
+        { }
+
+        reference operator*() const {
+            return _node->value();
+        }
+        pointer operator->() const {
+            return &_node->value();
+        }
+
+        iterator_base & operator++() {
+            _node = _node->next;
+            return *this;
+        }
+        iterator_base operator++(int) {
+            iterator_base tmp(*this);
+            _node = _node->next;
+            return tmp;
+        }
+        iterator_base & operator--() {
+            _node = _node->prev;
+            return *this;
+        }
+        iterator_base operator--(int) {
+            iterator_base tmp(*this);
+            _node = _node->prev;
+            return tmp;
+        }
+
+        bool operator==(iterator_base const & other) const {
+            return _node == other._node;
+        }
+        bool operator!=(iterator_base const & other) const {
+            return _node != other._node;
+        }
+
+      private:
+        explicit iterator_base(node * n)
+          : _node(n)
+        { }
+
+        node * _node;
+    };
+
+    typedef iterator_base<T> iterator;
+    typedef iterator_base<T const> const_iterator;
+
+
+    arena_list()
+      : _block(0)
+      , _top(0)
+      , _free(NULL)
+      , _size(0)
+    {
+        _blocks.push_back(new node[N]);
+
+        // the sentinel node marks both the beginning and the end of the list
+        _head.prev = &_head;
+        _head.next = &_head;
+    }
+
+    ~arena_list() {
+        clear();
+        for (typename std::vector<node *>::iterator it = _blocks.begin();
+                it != _blocks.end(); ++it) {
+            delete[] *it;
+        }
+    }
+
+    iterator begin() { return iterator(_head.next); }
+    iterator end() { return iterator(&_head); }
+    const_iterator begin() const { return const_iterator(_head.next); }
+    const_iterator end() const { return const_iterator(sentinel()); }
+
+    bool empty() const {
+        return _size == 0;
+    }
+
+    size_type size() const {
+        return _size;
+    }
+
+    reference front() { return *begin(); }
+    reference back() { return *--end(); }
+
+    iterator insert(iterator pos, T const & value) {
+        node * n = allocate();
+        ::new (static_cast<void *>(&n->storage)) T(value);
+
+        // link new node before pos
+        n->next = pos._node;
+        n->prev = pos._node->prev;
+        n->prev->next = n;
+        n->next->prev = n;
+
+        ++_size;
+        return iterator(n);
+    }
+
+    template <typename IterT>
+    void insert(iterator pos, IterT first, IterT last) {
+        for (; first != last; ++first) {
+            insert(pos, *first);
+        }
+    }
+
+    void push_back(T const & value) {
+        insert(end(), value);
+    }
+
+    iterator erase(iterator pos) {
+        node * n = pos._node;
+        node * next = n->next;
+        n->prev->next = next;
+        next->prev = n->prev;
+
+        n->value().~T();
+        deallocate(n);
+
+        --_size;
+        return iterator(next);
+    }
+
+    iterator erase(iterator first, iterator last) {
+        while (first != last) {
+            first = erase(first);
+        }
+        return last;
+    }
+
+    void clear() {
+        erase(begin(), end());
+        // all slots are free again, start over with a clean arena
+        _block = 0;
+        _top = 0;
+        _free = NULL;
+    }
+
+  private:
+    // not copyable. not using boost::noncopyable here, as that would be an
+    // ambiguous base of Patch::EventBufferType
+    arena_list(arena_list const &);
+    arena_list & operator=(arena_list const &);
+
+    node * sentinel() const {
+        return const_cast<node *>(&_head);
+    }
+
+    node * allocate() {
+        if (_free) {
+            // reuse most recently freed slot
+            node * n = _free;
+            _free = n->next;
+            return n;
+        }
+
+        if (_top == N) {
+            // current block is full, continue with the next one
+            if (++_block == _blocks.size()) {
+                // arena is full, fall back to allocating another block
+                ++this->fallback_count_;
+                _blocks.push_back(new node[N]);
+            }
+            _top = 0;
+        }
+
+        std::size_t used = _block * N + _top + 1;
+        if (used > this->max_utilization_) {
+            this->max_utilization_ = used;
+        }
+
+        return &_blocks[_block][_top++];
+    }
+
+    void deallocate(node * n) {
+        n->next = _free;
+        _free = n;
+    }
+
+    std::vector<node *> _blocks;
+    // the block currently being filled, and the first slot in that block that
+    // has never been used since the last clear()
+    std::size_t _block;
+    std::size_t _top;
+    // list of freed slots, linked via their next pointers
+    node * _free;
+
+    node _head;
+    size_type _size;
+};
+
+
+} // namespace das
+
+
+#endif // DAS_UTIL_ARENA_LIST_HH
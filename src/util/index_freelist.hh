@@ -0,0 +1,132 @@
+/*
+ * Copyright (C) 2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef DAS_UTIL_INDEX_FREELIST_HH
+#define DAS_UTIL_INDEX_FREELIST_HH
+
+#include <cstddef>
+
+#include <boost/noncopyable.hpp>
+#include <boost/scoped_array.hpp>
+
+
+#if __cplusplus >= 201103L || defined(__GXX_EXPERIMENTAL_CXX0X__)
+    #include <atomic>
+#else
+    #include <glib.h>
+#endif
+
+
+namespace das {
+
+
+/*
+ * the minimal set of atomic operations needed below, using either std::atomic
+ * or glib.
+ */
+class atomic_uint
+{
+  public:
+    atomic_uint() {
+        store(0);
+    }
+
+#if __cplusplus >= 201103L || defined(__GXX_EXPERIMENTAL_CXX0X__)
+    unsigned int load() const {
+        return _value.load();
+    }
+    void store(unsigned int v) {
+        _value.store(v);
+    }
+    bool compare_exchange(unsigned int expected, unsigned int desired) {
+        return _value.compare_exchange_weak(expected, desired);
+    }
+
+  private:
+    std::atomic<unsigned int> _value;
+#else
+    unsigned int load() const {
+        return g_atomic_int_get(&_value);
+    }
+    void store(unsigned int v) {
+        g_atomic_int_set(&_value, v);
+    }
+    bool compare_exchange(unsigned int expected, unsigned int desired) {
+        return g_atomic_int_compare_and_exchange(&_value, expected, desired);
+    }
+
+  private:
+    mutable gint _value;
+#endif
+};
+
+
+/*
+ * lock-free stack of the indices 0 to size-1, for recycling the slots of a
+ * fixed-size pool. any number of threads may push and pop concurrently.
+ * the head of the stack is tagged with a counter to avoid the ABA problem,
+ * which limits the size to 65535 indices.
+ */
+class index_freelist
+  : boost::noncopyable
+{
+  public:
+    // initially, all indices are on the stack
+    index_freelist(std::size_t size)
+      : _next(new atomic_uint[size])
+    {
+        for (std::size_t i = 0; i != size; ++i) {
+            _next[i].store(i);
+        }
+        _head.store(size);
+    }
+
+    bool pop(std::size_t & index) {
+        for (;;) {
+            unsigned int head = _head.load();
+            unsigned int top = head & 0xffff;
+            if (!top) {
+                return false;
+            }
+            unsigned int next = _next[top - 1].load();
+            if (_head.compare_exchange(head, tag(head) | next)) {
+                index = top - 1;
+                return true;
+            }
+        }
+    }
+
+    void push(std::size_t index) {
+        for (;;) {
+            unsigned int head = _head.load();
+            _next[index].store(head & 0xffff);
+            if (_head.compare_exchange(head, tag(head) | (index + 1))) {
+                return;
+            }
+        }
+    }
+
+  private:
+    // the incremented tag of the given head value
+    static unsigned int tag(unsigned int head) {
+        return ((head >> 16) + 1) << 16;
+    }
+
+    // top index plus one (zero if empty) in the lower 16 bits, tag in the
+    // upper 16 bits
+    atomic_uint _head;
+    // for each index on the stack, the index below it, plus one
+    boost::scoped_array<atomic_uint> _next;
+};
+
+
+} // namespace das
+
+
+#endif // DAS_UTIL_INDEX_FREELIST_HH
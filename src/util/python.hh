@@ -54,6 +54,18 @@ class scoped_gil_release
 };
 
 
+// returns true if the current thread holds the GIL
+inline bool gil_held()
+{
+#if PY_VERSION_HEX >= 0x03040000
+    return PyGILState_Check();
+#else
+    PyThreadState *state = PyGILState_GetThisThreadState();
+    return state && state == _PyThreadState_Current;
+#endif
+}
+
+
 } // namespace python
 } // namespace das
 
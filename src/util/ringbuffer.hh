@@ -12,6 +12,8 @@
 
 #include <boost/noncopyable.hpp>
 
+#include <algorithm>
+
 
 #if __cplusplus >= 201103L || defined(__GXX_EXPERIMENTAL_CXX0X__)
     #include <atomic>
@@ -120,6 +122,22 @@ class ringbuffer : boost::noncopyable
         }
     }
 
+    // reads up to count elements at once, returns the number of elements
+    // read
+    template <typename OutputIterator>
+    std::size_t read(OutputIterator dst, std::size_t count) {
+        std::size_t const n = std::min(read_space(), count);
+        std::size_t priv_read_idx = _read_idx;
+        for (std::size_t i = 0; i != n; ++i) {
+            T *p = _buf + priv_read_idx;
+            *dst++ = *p;
+            p->~T();
+            priv_read_idx = (priv_read_idx + 1) % _size;
+        }
+        _read_idx = priv_read_idx;
+        return n;
+    }
+
   private:
     atomic_size_t _write_idx;
     atomic_size_t _read_idx;
@@ -0,0 +1,79 @@
+/*
+ * Copyright (C) 2014  Dominic Sacré  <dominic.sacre@gmx.de>
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ */
+
+#ifndef DAS_UTIL_SEMAPHORE_HH
+#define DAS_UTIL_SEMAPHORE_HH
+
+#include <boost/noncopyable.hpp>
+
+#ifdef __APPLE__
+#include <dispatch/dispatch.h>
+#else
+#include <semaphore.h>
+#include <cerrno>
+#endif
+
+
+namespace das {
+
+
+/*
+ * counting semaphore. unlike a condition variable, posting it doesn't
+ * require a mutex and is safe to do from a realtime thread.
+ */
+class semaphore : boost::noncopyable
+{
+  public:
+#ifdef __APPLE__
+    // unnamed POSIX semaphores are not supported on macOS, sem_init() fails
+    semaphore(unsigned int value = 0)
+      : _sem(::dispatch_semaphore_create(value))
+    { }
+
+    ~semaphore() {
+        ::dispatch_release(_sem);
+    }
+
+    void post() {
+        ::dispatch_semaphore_signal(_sem);
+    }
+
+    void wait() {
+        ::dispatch_semaphore_wait(_sem, DISPATCH_TIME_FOREVER);
+    }
+
+  private:
+    ::dispatch_semaphore_t _sem;
+#else
+    semaphore(unsigned int value = 0) {
+        ::sem_init(&_sem, 0, value);
+    }
+
+    ~semaphore() {
+        ::sem_destroy(&_sem);
+    }
+
+    void post() {
+        ::sem_post(&_sem);
+    }
+
+    void wait() {
+        while (::sem_wait(&_sem) == -1 && errno == EINTR) { }
+    }
+
+  private:
+    ::sem_t _sem;
+#endif
+};
+
+
+} // namespace das
+
+
+#endif // DAS_UTIL_SEMAPHORE_HH
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+from tests.helpers import *
+
+import time
+
+import _mididings
+
+
+class SysExTransmitterTestCase(MididingsTestCase):
+
+    def run_transmitter(self, num_ports, chunk_size, messages, rates):
+        """
+        Send the given (port, data) messages, and return the chunks sent as
+        (port, data, time) tuples.
+        """
+        chunks = []
+
+        def send(port, chunk):
+            chunks.append((port, bytes(chunk), time.time()))
+
+        t = _mididings.SysExTransmitter(num_ports, chunk_size, 0.0, send)
+        for port, rate in enumerate(rates):
+            t.set_rate(port, rate)
+        for port, data in messages:
+            t.send(port, bytearray(data))
+        t.wait()
+        del t
+        return chunks
+
+    def test_chunks(self):
+        a = b'\xf0' + bytes(bytearray(range(1, 10))) + b'\xf7'
+        b = b'\xf0\x7e\x01\xf7'
+
+        chunks = self.run_transmitter(2, 4, [(0, a), (1, b), (0, b)], [0, 0])
+
+        # messages are split into chunks of at most chunk_size bytes, and
+        # each port's chunks are sent in order
+        self.assertEqual([c[1] for c in chunks if c[0] == 0],
+                         [a[0:4], a[4:8], a[8:11], b])
+        self.assertEqual([c[1] for c in chunks if c[0] == 1], [b])
+
+    def test_pacing(self):
+        data = b'\xf0' + b'\x00' * 48 + b'\xf7'
+
+        # 10 byte chunks at 2000 bytes per second, 5 ms apart. the unpaced
+        # port isn't held up by the other one
+        chunks = self.run_transmitter(2, 10, [(0, data), (1, data[:10])],
+                                      [2000, 0])
+
+        paced = [c for c in chunks if c[0] == 0]
+        self.assertEqual(b''.join(c[1] for c in paced), data)
+        self.assertEqual(len(paced), 5)
+        for prev, cur in zip(paced, paced[1:]):
+            # allow for the clock used here being a little off
+            self.assertGreater(cur[2] - prev[2], 0.004)
+
+        unpaced = [c for c in chunks if c[0] == 1]
+        self.assertEqual(len(unpaced), 1)
+        self.assertLess(unpaced[0][2], paced[-1][2])
+
+    def test_invalid_port(self):
+        t = _mididings.SysExTransmitter(1, 4, 0.0, lambda port, chunk: None)
+        with self.assertRaises(IndexError):
+            t.send(1, bytearray(b'\xf0\xf7'))
+        with self.assertRaises(IndexError):
+            t.set_rate(-1, 1000)
@@ -13,7 +13,22 @@
 from tests.helpers import *
 
 from mididings import *
-from mididings import engine
+from mididings import engine, setup
+
+import os
+import struct
+import tempfile
+
+
+def smf(tracks):
+    """
+    Return the contents of a standard MIDI file with the given tracks.
+    """
+    data = b'MThd' + struct.pack('>LHHH', 6, 1, len(tracks), 96)
+    for track in tracks:
+        t = bytes(bytearray(track))
+        data += b'MTrk' + struct.pack('>L', len(t)) + t
+    return data
 
 
 class EngineTestCase(MididingsTestCase):
@@ -41,3 +56,249 @@ class EngineTestCase(MididingsTestCase):
             self.assertTrue(engine.active())
 
         self.run_patch(Process(foo), self.make_event())
+
+    def test_event_buffer(self):
+        ev = self.make_event(NOTEON, 0, 0, 60, 100)
+        # more events than fit into the preallocated buffer memory
+        p = Fork([
+            Fork([Transpose(k) for k in range(-20, 20)]) >>
+                Channel(n % 16) >> Port(n // 16)
+            for n in range(40)
+        ])
+
+        config(event_buffer='list')
+        r1 = self.run_patch(p, ev)
+        config(event_buffer='arena')
+        r2 = self.run_patch(p, ev)
+
+        self.assertEqual(len(r1), 1600)
+        self.assertEqual(r1, r2)
+
+    def test_process_events(self):
+        setup._config_impl(backend='dummy', silent=True)
+
+        def make_engine():
+            e = engine.Engine()
+            e.setup({
+                0: Scene('a', [Filter(NOTE) >> Channel(0),
+                               Filter(PROGRAM) >> SceneSwitch()],
+                         init_patch=Ctrl(7, 0)),
+                1: Scene('b', [Filter(NOTE) >> Channel(1),
+                               Filter(PROGRAM) >> SceneSwitch()],
+                         init_patch=Ctrl(7, 1)),
+            }, None, None, None)
+            e.process_event(self.make_event(PROGRAM, 0, 0, 0, 0))
+            return e
+
+        events = [
+            self.make_event(NOTEON, 0, 0, 60, 100),
+            self.make_event(PROGRAM, 0, 0, 0, 1),
+            self.make_event(NOTEON, 0, 0, 62, 100),
+            self.make_event(NOTEOFF, 0, 0, 60, 0),
+            self.make_event(PROGRAM, 0, 0, 0, 0),
+            self.make_event(NOTEON, 0, 0, 64, 100),
+        ]
+
+        e = make_engine()
+        r1 = []
+        for ev in events:
+            r1.extend(e.process_event(ev))
+
+        e = make_engine()
+        r2 = e.process_events(events)
+
+        for ev in r1 + r2:
+            ev.__class__ = MidiEvent
+        self.assertEqual(r1, r2)
+
+        # note-offs go to the same scene as their note-ons, init patches
+        # run in between
+        self.assertEqual([ev.type for ev in r2],
+                         [NOTEON, CTRL, NOTEON, NOTEOFF, CTRL, NOTEON])
+        self.assertEqual([ev.channel for ev in r2], [0, 0, 1, 0, 0, 0])
+        self.assertEqual([r2[1].value, r2[4].value], [1, 0])
+
+    def test_switch_scene_request(self):
+        setup._config_impl(backend='dummy', silent=True)
+
+        e = engine.Engine()
+        e.setup({
+            0: Scene('a', Channel(0), init_patch=Ctrl(7, 0)),
+            1: Scene('b', Channel(1), init_patch=Ctrl(7, 1)),
+        }, None, None, None)
+        ev = self.make_event(NOTEON, 0, 0, 60, 100)
+        e.process_event(ev)
+
+        # the switch is queued, and handled along with the next event
+        e.switch_scene(1)
+        r = e.process_event(ev)
+        for x in r:
+            x.__class__ = MidiEvent
+        self.assertEqual([x.type for x in r], [NOTEON, CTRL])
+        self.assertEqual([r[0].channel, r[1].value], [0, 1])
+        self.assertEqual(e.current_scene(), 1)
+
+        r = e.process_event(ev)
+        for x in r:
+            x.__class__ = MidiEvent
+        self.assertEqual([(x.type, x.channel) for x in r], [(NOTEON, 1)])
+
+    def test_note_routing(self):
+        setup._config_impl(backend='dummy', silent=True)
+
+        e = engine.Engine()
+        e.setup({
+            0: Scene('a', [Channel(0), Filter(PROGRAM) >> SceneSwitch()]),
+            1: Scene('b', [Channel(1), Filter(PROGRAM) >> SceneSwitch()]),
+        }, None, None, None)
+        switch = lambda n: self.make_event(PROGRAM, 0, 0, 0, n)
+        e.process_event(switch(0))
+
+        # many more held notes than the old hash table was sized for, on
+        # different ports
+        notes = [(port, 30 + n) for port in range(8) for n in range(32)]
+        noteons = [self.make_event(NOTEON, port, 0, note, 100)
+                   for port, note in notes]
+        noteoffs = [self.make_event(NOTEOFF, port, 0, note, 0)
+                    for port, note in notes]
+        pedal = lambda v: self.make_event(CTRL, 3, 0, 64, v)
+
+        r = e.process_events(noteons + [pedal(127), switch(1), pedal(40),
+                                        pedal(0), pedal(60)] + noteoffs)
+        for ev in r:
+            ev.__class__ = MidiEvent
+        r = [ev for ev in r if ev.type != PROGRAM]
+
+        # note-offs and pedal movements go to the scene the pedal was
+        # originally pressed in, until it's released
+        self.assertEqual([ev.channel for ev in r],
+                         [0] * len(noteons) + [0, 0, 0, 1] +
+                         [0] * len(noteoffs))
+
+    def test_offload_types(self):
+        from mididings.extra import (PedalToNoteoff, LimitPolyphony,
+                                     MakeMonophonic)
+        setup._config_impl(backend='dummy', silent=True)
+
+        e = engine.Engine()
+        f = lambda ev: ev
+
+        self.assertEqual(e._offload_types([Transpose(12)]), 0)
+        self.assertEqual(e._offload_types([Filter(CTRL) >> Process(f)]),
+                         CTRL)
+        # only the pedal reaches Python, but the notes must be processed in
+        # the same thread, since they share the unit's state
+        self.assertEqual(e._offload_types([PedalToNoteoff() >>
+                                           Filter(CTRL) >> Process(f)]),
+                         NOTE | CTRL)
+        # stateful units in the pre patch, Python in the scene patch
+        self.assertEqual(e._offload_types([LimitPolyphony(2),
+                                           Filter(NOTEON) >> Process(f)]),
+                         NOTE)
+        # no offloaded events reach the stateful unit
+        self.assertEqual(e._offload_types([[MakeMonophonic(),
+                                            Filter(PROGRAM) >> Process(f)]]),
+                         PROGRAM)
+        self.assertEqual(e._offload_types([MakeMonophonic()],
+                                          Filter(CTRL) >> Process(f)),
+                         CTRL)
+        self.assertEqual(e._offload_types([PedalToNoteoff()],
+                                          Filter(CTRL) >> Process(f)),
+                         NOTE | CTRL)
+
+    def test_shared_offload_types(self):
+        from mididings.extra import LimitPolyphony
+        from mididings.scene import _parse_scene
+        setup._config_impl(backend='dummy', silent=True)
+
+        e = engine.Engine()
+        f = lambda ev: ev
+        post = LimitPolyphony(2)
+        python = _parse_scene(Process(f))
+        native = _parse_scene(Pass())
+
+        # the post patch is shared by both scenes, so the native scene must
+        # offload notes as well
+        self.assertEqual(e._shared_offload_types([python, native],
+                                                 None, None, post), NOTE)
+        self.assertEqual(e._shared_offload_types([native, native],
+                                                 None, None, post), 0)
+        # python code that never sees the stateful unit's events
+        self.assertEqual(e._shared_offload_types(
+                            [_parse_scene(Filter(CTRL) >> Process(f)),
+                             native], None, None, post), 0)
+        # stateful unit in one scene, python code in the control patch
+        self.assertEqual(e._shared_offload_types(
+                            [_parse_scene(LimitPolyphony(1)), native],
+                            Filter(NOTE) >> Process(f), None, None), NOTE)
+
+    def test_input_stats(self):
+        setup._config_impl(backend='dummy', silent=True)
+
+        e = engine.Engine()
+        e.setup({0: Pass()}, None, None, None)
+        e.process_event(self.make_event(NOTEON, 0, 0, 60, 100))
+
+        # only counted by backends that receive input in their own thread
+        self.assertEqual(e.input_stats(),
+                         {'periods': 0, 'events': 0, 'wakeups': 0})
+
+    def test_process_file(self):
+        infile = tempfile.NamedTemporaryFile(suffix='.mid', delete=False)
+        outfile = tempfile.NamedTemporaryFile(suffix='.mid', delete=False)
+        try:
+            infile.write(smf([
+                # tempo, note on and off (using running status), sysex
+                [0x00, 0xff, 0x51, 0x03, 0x07, 0xa1, 0x20,
+                 0x00, 0x90, 60, 100,
+                 0x60, 60, 0,
+                 0x10, 0xf0, 0x03, 0x7e, 0x01, 0xf7,
+                 0x00, 0xff, 0x2f, 0x00],
+                # program change, and a note that gets filtered
+                [0x00, 0xc1, 5,
+                 0x81, 0x00, 0x91, 40, 100,
+                 0x00, 0xff, 0x2f, 0x00],
+            ]))
+            infile.close()
+            outfile.close()
+
+            n = engine.process_file(infile.name, outfile.name,
+                                    KeyFilter(50, 70) >> Transpose(12))
+            self.assertEqual(n, 5)
+
+            with open(outfile.name, 'rb') as f:
+                data = f.read()
+
+            self.assertEqual(data, smf([
+                [0x00, 0xff, 0x51, 0x03, 0x07, 0xa1, 0x20,
+                 0x00, 0x90, 72, 100,
+                 0x60, 0x80, 72, 0,
+                 0x10, 0xf0, 0x03, 0x7e, 0x01, 0xf7,
+                 0x00, 0xff, 0x2f, 0x00],
+                # the end of track is still at the original position
+                [0x00, 0xc1, 5,
+                 0x81, 0x00, 0xff, 0x2f, 0x00],
+            ]))
+        finally:
+            os.unlink(infile.name)
+            os.unlink(outfile.name)
+
+    def test_process_file_truncated(self):
+        infile = tempfile.NamedTemporaryFile(suffix='.mid', delete=False)
+        outfile = tempfile.NamedTemporaryFile(suffix='.mid', delete=False)
+        try:
+            # the track (and the file) ends right after a delta time, with
+            # no event and no end of track
+            infile.write(smf([
+                [0x00, 0x90, 60, 100,
+                 0x60, 60, 0,
+                 0x10],
+            ]))
+            infile.close()
+            outfile.close()
+
+            n = engine.process_file(infile.name, outfile.name, Pass())
+            self.assertEqual(n, 2)
+        finally:
+            os.unlink(infile.name)
+            os.unlink(outfile.name)
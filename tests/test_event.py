@@ -188,6 +188,33 @@ class EventTestCase(MididingsTestCase):
         with self.assertRaises(AttributeError): ev.value
         with self.assertRaises(AttributeError): ev.program
 
+    def test_sysex_pool(self):
+        import _mididings
+
+        def convert(n):
+            buf = [0xf0] + [n % 128] * n + [0xf7]
+            ev = _mididings.buffer_to_midi_event(buf, 0, 0)
+            self.assertEqual(ev.sysex_, bytearray(buf))
+            return ev
+
+        allocated, fallback = _mididings.sysex_pool_stats()
+
+        # objects are returned to the pool, so this never runs out
+        for n in range(4 * 64):
+            convert(n * 64)
+        self.assertEqual(_mididings.sysex_pool_stats(),
+                         (allocated + 4 * 64, fallback))
+
+        # larger than the largest block
+        convert(65536)
+        self.assertEqual(_mididings.sysex_pool_stats(),
+                         (allocated + 4 * 64, fallback + 1))
+
+        # all blocks of all sizes in use
+        events = [convert(100) for n in range(4 * 16 + 1)]
+        self.assertEqual(_mididings.sysex_pool_stats(),
+                         (allocated + 4 * 64 + 4 * 16, fallback + 2))
+
     @data_offsets
     def test_SysExEvent_modify(self, off):
         sysex1 = '\xf0\x04\x08\x15\x16\x23\x42\xf7'
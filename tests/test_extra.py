@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# mididings
+#
+# Copyright (C) 2008-2014  Dominic Sacré  <dominic.sacre@gmx.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+
+from tests.helpers import *
+
+import itertools
+
+from mididings import *
+from mididings.extra import *
+
+
+class ExtraTestCase(MididingsTestCase):
+
+    def on(self, note, velocity=100, channel=0):
+        return self.make_event(NOTEON, 0, channel, note, velocity)
+
+    def off(self, note, channel=0):
+        return self.make_event(NOTEOFF, 0, channel, note, 0)
+
+    def ctrl(self, param, value):
+        return self.make_event(CTRL, 0, 0, param, value)
+
+    def run_notes(self, patch, events):
+        # native extras can't be rebuilt from their repr(), so this bypasses
+        # run_patch()
+        r = self._run_scenes_impl({0: patch}, events)
+        return [(ev.type, ev.channel, ev.data1, ev.data2)
+                for ev in itertools.chain(*r)]
+
+    def test_LimitPolyphony(self):
+        events = [self.on(60), self.on(62), self.on(64),
+                  self.off(60), self.off(62), self.off(64)]
+
+        # the oldest note is stopped to make room
+        self.assertEqual(self.run_notes(LimitPolyphony(2), events), [
+            (NOTEON, 0, 60, 100), (NOTEON, 0, 62, 100),
+            (NOTEOFF, 0, 60, 0), (NOTEON, 0, 64, 100),
+            (NOTEOFF, 0, 62, 0), (NOTEOFF, 0, 64, 0),
+        ])
+        # the new note is rejected, along with its note-off
+        self.assertEqual(self.run_notes(LimitPolyphony(2, False), events), [
+            (NOTEON, 0, 60, 100), (NOTEON, 0, 62, 100),
+            (NOTEOFF, 0, 60, 0), (NOTEOFF, 0, 62, 0),
+        ])
+        # channels are independent of each other
+        self.assertEqual(self.run_notes(LimitPolyphony(1), [
+            self.on(60), self.on(62, channel=1),
+        ]), [
+            (NOTEON, 0, 60, 100), (NOTEON, 1, 62, 100),
+        ])
+        # other events are not affected
+        self.assertEqual(self.run_notes(LimitPolyphony(1),
+                                        [self.ctrl(7, 42)]),
+                         [(CTRL, 0, 7, 42)])
+
+    def test_MakeMonophonic(self):
+        events = [self.on(60, 10), self.on(62, 20), self.on(55, 30),
+                  self.off(62), self.off(55), self.off(60)]
+
+        self.assertEqual(self.run_notes(MakeMonophonic(), events), [
+            (NOTEON, 0, 60, 10),
+            (NOTEOFF, 0, 60, 0), (NOTEON, 0, 62, 20),
+            (NOTEOFF, 0, 62, 0), (NOTEON, 0, 55, 30),
+            # 62 was silent
+            (NOTEOFF, 0, 55, 0), (NOTEON, 0, 60, 10),
+            (NOTEOFF, 0, 60, 0),
+        ])
+        self.assertEqual(self.run_notes(MakeMonophonic('low'), events), [
+            (NOTEON, 0, 60, 10),
+            # 62 is higher, and remains silent
+            (NOTEOFF, 0, 60, 0), (NOTEON, 0, 55, 30),
+            (NOTEOFF, 0, 55, 0), (NOTEON, 0, 60, 10),
+            (NOTEOFF, 0, 60, 0),
+        ])
+        self.assertEqual(self.run_notes(MakeMonophonic('high'), events), [
+            (NOTEON, 0, 60, 10),
+            (NOTEOFF, 0, 60, 0), (NOTEON, 0, 62, 20),
+            (NOTEOFF, 0, 62, 0), (NOTEON, 0, 60, 10),
+            (NOTEOFF, 0, 60, 0),
+        ])
+
+        # channels are independent of each other
+        self.assertEqual(self.run_notes(MakeMonophonic(), [
+            self.on(60), self.on(62, channel=1),
+        ]), [
+            (NOTEON, 0, 60, 100), (NOTEON, 1, 62, 100),
+        ])
+
+        self.assertRaises(ValueError, MakeMonophonic, 'middle')
+
+    def test_PedalToNoteoff(self):
+        # note-offs are delayed until the pedal is released
+        self.assertEqual(self.run_notes(PedalToNoteoff(), [
+            self.on(60), self.ctrl(64, 127), self.off(60), self.on(62),
+            self.off(62), self.ctrl(64, 0), self.on(64), self.off(64),
+        ]), [
+            (NOTEON, 0, 60, 100), (NOTEON, 0, 62, 100),
+            (NOTEOFF, 0, 60, 0), (NOTEOFF, 0, 62, 0),
+            (NOTEON, 0, 64, 100), (NOTEOFF, 0, 64, 0),
+        ])
+        # a sustained note is stopped before it's played again
+        self.assertEqual(self.run_notes(PedalToNoteoff(), [
+            self.on(60), self.ctrl(64, 127), self.off(60), self.on(60),
+        ]), [
+            (NOTEON, 0, 60, 100), (NOTEOFF, 0, 60, 0), (NOTEON, 0, 60, 100),
+        ])
+        # sostenuto only holds the notes played before the pedal
+        self.assertEqual(self.run_notes(PedalToNoteoff(66, sostenuto=True), [
+            self.on(60), self.ctrl(66, 127), self.on(62), self.off(60),
+            self.off(62), self.ctrl(66, 0),
+        ]), [
+            (NOTEON, 0, 60, 100), (NOTEON, 0, 62, 100),
+            (NOTEOFF, 0, 62, 0), (NOTEOFF, 0, 60, 0),
+        ])
+        # other controllers are not affected
+        self.assertEqual(self.run_notes(PedalToNoteoff(),
+                                        [self.ctrl(7, 42)]),
+                         [(CTRL, 0, 7, 42)])
+
+    def test_SuppressPC(self):
+        def pc(program, channel=0):
+            return self.make_event(PROGRAM, 0, channel, 0, program)
+
+        r = self.run_patch(SuppressPC(), [
+            pc(5), pc(5), pc(6), pc(5), pc(5, channel=1), pc(5),
+        ])
+        self.assertEqual([(ev.channel, ev.program) for ev in r],
+                         [(0, 5), (0, 6), (0, 5), (1, 5)])
+        # other events are not affected
+        ev = self.ctrl(7, 42)
+        self.check_patch(SuppressPC(), {ev: [ev]})
@@ -47,3 +47,139 @@ class PatchTestCase(MididingsTestCase):
         self.run_patch(p, self.make_event())
         self.assertEqual(order, [1, 2, 3, 3, 4, 5, 6, 7, 8, 8,
                                  4, 5, 6, 7, 8, 8, 9, 9, 9, 9, 9, 9])
+
+    def test_fork_remove_duplicates(self):
+        ev = self.make_event(CTRL, 0, 0, 1, 87)
+
+        # the first event returned by the inner fork is a duplicate
+        p = Fork([Pass(), Fork([Pass(), NoteOn(60, 100)])])
+        self.check_patch(p, {
+            ev: [ev, NoteOnEvent(0, 0, 60, 100)],
+        })
+
+    def test_fork_many_branches(self):
+        ev = self.make_event(NOTEON, 0, 0, 60, 100)
+
+        # branches processed in place, mixed with ones that aren't, and with
+        # multiple identical events returned by the same branch
+        p = Fork(
+            [Transpose(n % 4) for n in range(32)] +
+            [Fork([Transpose(n % 8), Transpose(n % 8)],
+                  remove_duplicates=False) for n in range(32)] +
+            [KeyFilter(61) >> Channel(n) for n in range(16)]
+        )
+        self.check_patch(p, {
+            ev: ([self.modify_event(ev, note=60 + n) for n in range(4)] +
+                 [self.modify_event(ev, note=64 + n // 2) for n in range(8)]),
+        })
+
+        p = Fork([Transpose(n % 4) for n in range(32)],
+                 remove_duplicates=False)
+        self.check_patch(p, {
+            ev: [self.modify_event(ev, note=60 + n % 4) for n in range(32)],
+        })
+
+    def run_optimized(self, patch, events):
+        r = []
+        for opt in (False, True):
+            config(optimize=opt)
+            r.append(self.run_patch(patch, events))
+        return r
+
+    def test_optimize(self):
+        events = [
+            self.make_event(NOTEON, 0, 0, 60, 100),
+            self.make_event(NOTEOFF, 0, 1, 66, 0),
+            self.make_event(CTRL, 1, 0, 7, 42),
+            self.make_event(PROGRAM, 0, 2, 0, 3),
+            self.make_event(PITCHBEND, 1, 1, 0, 1234),
+        ]
+
+        patches = [
+            Filter(NOTE) >> Filter(NOTEON) >> Transpose(12),
+            Filter(CTRL) >> KeyFilter(60),
+            Filter(NOTE) >> [Transpose(12), Transpose(12) >> Channel(1),
+                             Transpose(12) >> Discard()],
+            [Channel(0), Pass() >> Channel(0), Discard() >> Port(1)],
+            Fork([Velocity(fixed=64), Velocity(fixed=64)],
+                 remove_duplicates=False),
+            { NOTE: Filter(NOTE) >> Transpose(3),
+              CTRL: ~Filter(CTRL),
+              None: [Pass(), Filter(CTRL)] },
+            ChannelSplit({0: Filter(PROGRAM), 1: KeyFilter(60),
+                          None: Channel(3)}),
+            Filter(CTRL) >> Process(lambda ev: ev) >> Discard(),
+        ]
+
+        for p in patches:
+            r = self.run_optimized(p, events)
+            self.assertEqual(r[0], r[1], repr(p))
+
+    def test_optimize_size(self):
+        import mididings.optimize
+
+        def size(p):
+            return (mididings.optimize.count_modules(p),
+                    mididings.optimize.count_modules(
+                        mididings.optimize.optimize(p)))
+
+        a, b = size(Filter(NOTE) >> [Filter(CTRL), Pass()] >> Pass())
+        self.assertLess(b, a)
+        self.assertEqual(b, 1)
+
+        # identical branches are removed, common prefixes are hoisted
+        p = mididings.optimize.optimize([
+                Transpose(12) >> Channel(1), Transpose(12) >> Port(1),
+                Transpose(12) >> Channel(1)])
+        self.assertEqual(repr(p),
+                         repr(Transpose(12) >> [Channel(1), Port(1)]))
+
+        a, b = size(Filter(CTRL) >> [KeyFilter(60), VelocityFilter(64)])
+        self.assertEqual(b, 1)
+
+        # units with side effects are never removed
+        p = Filter(CTRL) >> Process(lambda ev: ev) >> Discard()
+        self.assertEqual(size(p), (4, 4))
+
+    def test_fused_units(self):
+        import mididings.optimize
+
+        p = (Filter(NOTE) >> Transpose(12) >> KeyFilter(60, 80) >>
+             Process(lambda ev: ev) >> Velocity(fixed=64) >> Channel(1))
+        self.assertEqual(mididings.optimize.count_modules(p), 4)
+
+        ev1 = self.make_event(NOTEON, 0, 0, 50, 100)
+        ev2 = self.make_event(NOTEON, 0, 0, 70, 100)
+        ev3 = self.make_event(CTRL, 0, 0, 50, 100)
+        self.check_patch(p, {
+            ev1: [self.modify_event(ev1, note=62, velocity=64, channel=1)],
+            ev2: [],
+            ev3: [],
+        })
+
+    def test_python_types(self):
+        import mididings.optimize
+        import mididings.patch
+        from mididings.optimize import python_types
+
+        f = lambda ev: ev
+
+        self.assertEqual(python_types(Transpose(12) >> Channel(1)), 0)
+        self.assertEqual(python_types(Filter(NOTE) >> Process(f)), NOTE)
+        self.assertEqual(python_types(Fork([Filter(CTRL) >> Process(f),
+                                            Pass()])), CTRL)
+        self.assertEqual(python_types(Filter(NOTE) >> Discard() >>
+                                      Process(f)), 0)
+        self.assertEqual(python_types({NOTEON: Process(f),
+                                       CTRL: Pass()}), NOTEON)
+        self.assertEqual(python_types(Filter(CTRL) >> Call(f) >>
+                                      Discard()), CTRL)
+        # events that went through Python code may have any type
+        self.assertEqual(python_types(Filter(CTRL) >> Process(f) >>
+                                      Filter(NOTE) >> Process(f)), CTRL)
+        self.assertEqual(python_types(Process(f), PROGRAM), PROGRAM)
+
+        p = mididings.patch.Patch(Process(f), int(NOTE))
+        self.assertEqual(p.offload_types(), NOTE)
+        p = mididings.patch.Patch(Pass())
+        self.assertEqual(p.offload_types(), 0)
@@ -81,6 +81,35 @@ class SetupTestCase(MididingsTestCase):
         config(start_delay=0)
         config(start_delay=1.23)
 
+    def test_config_optimize(self):
+        config(optimize=True)
+        config(optimize=False)
+        config(optimize='debug')
+        with self.assertRaises(ValueError):
+            config(optimize='foo')
+
+    def test_config_event_buffer(self):
+        config(event_buffer='list')
+        config(event_buffer='arena')
+        with self.assertRaises(ValueError):
+            config(event_buffer='vector')
+
+    def test_config_batch_processing(self):
+        config(batch_processing=True)
+        config(batch_processing=False)
+        with self.assertRaises(TypeError):
+            config(batch_processing='yes')
+
+    def test_config_sysex_rate(self):
+        config(sysex_rate=None)
+        config(sysex_rate=0)
+        config(sysex_rate=1500.5)
+        config(sysex_rate=[3000, None, 0])
+        with self.assertRaises(TypeError):
+            config(sysex_rate=-1)
+        with self.assertRaises(TypeError):
+            config(sysex_rate='fast')
+
     @data_offsets
     def test_named_ports(self, off):
         config(out_ports = ['foo', 'bar', 'baz'])
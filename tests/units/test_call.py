@@ -13,8 +13,12 @@
 from tests.helpers import *
 
 from mididings import *
+from mididings import engine, setup
 
 import threading
+import time
+import sys
+import unittest
 
 
 class CallTestCase(MididingsTestCase):
@@ -62,6 +66,116 @@ class CallTestCase(MididingsTestCase):
             ev: [ev, ev]
         })
 
+    def test_Process_batch(self):
+        ev = self.make_event(NOTEON, 0, 0, 60, 100)
+        calls = []
+
+        def foo(evs):
+            calls.append([e.note for e in evs])
+            for e in evs:
+                e.velocity = 42
+            return evs
+
+        chord = Fork([Transpose(0), Transpose(4), Transpose(7)])
+        self.check_patch(chord >> Process(foo, batch=True), {
+            ev: [self.modify_event(ev, note=n, velocity=42)
+                 for n in (60, 64, 67)],
+        })
+        # one call per incoming event, not per event in the chord
+        self.assertTrue(all(c == [60, 64, 67] for c in calls))
+
+        # more, fewer or no events returned
+        for f, notes in [
+                (lambda evs: evs + evs[:1], [60, 64, 67, 60]),
+                (lambda evs: evs[1:], [64, 67]),
+                (lambda evs: (e for e in evs if e.note > 62), [64, 67]),
+                (lambda evs: [], []),
+                (lambda evs: None, []),
+            ]:
+            self.check_patch(chord >> Process(f, batch=True) >> Channel(3), {
+                ev: [self.modify_event(ev, note=n, channel=3)
+                     for n in notes],
+            })
+
+    @data_offsets
+    def test_Process_view(self, off):
+        ev = self.make_event(NOTEON, off(0), off(0), 60, 100)
+        views = []
+
+        def foo(v):
+            views.append(v)
+            # values are never adjusted by the data offset
+            self.assertEqual(v.type, NOTEON)
+            self.assertEqual((v.port, v.channel), (0, 0))
+            self.assertEqual((v.note, v.velocity), (60, 100))
+            v.velocity = 42
+            v.channel = 3
+            return v
+
+        self.check_patch(Process(foo, view=True), {
+            ev: [self.modify_event(ev, channel=off(3), velocity=42)],
+        })
+        # the same view is reused for every call, and can't be used once
+        # the function has returned
+        self.assertTrue(all(v is views[0] for v in views))
+        self.assertRaises(RuntimeError, lambda: views[0].note)
+
+        # copies, new events, generators, or nothing
+        for f, notes in [
+                (lambda v: [v, v.copy()], [60, 60]),
+                (lambda v: v.copy(), [60]),
+                (lambda v: NoteOnEvent(off(0), off(0), 61, 100), [61]),
+                (lambda v: (v for n in range(3)), [60, 60, 60]),
+                (lambda v: [], []),
+                (lambda v: None, []),
+            ]:
+            self.check_patch(Process(f, view=True) >> Channel(off(2)), {
+                ev: [self.modify_event(ev, note=n, channel=off(2))
+                     for n in notes],
+            })
+
+        self.assertRaises(ValueError, Process, foo, batch=True, view=True)
+
+    def test_Process_pure(self):
+        calls = []
+
+        def foo(ev):
+            calls.append(ev.note)
+            if ev.note > 64:
+                return None
+            ev.velocity = ev.note
+            return [ev, NoteOnEvent(ev.port, ev.channel, ev.note + 12, 1)]
+
+        p = Process(foo, pure=True, cache_size=2)
+        evs = [self.make_event(NOTEON, 0, 0, n, 100) for n in (60, 70, 60)]
+        r = [[self.modify_event(evs[0], velocity=60),
+              self.modify_event(evs[0], note=72, velocity=1)], [],
+             [self.modify_event(evs[0], velocity=60),
+              self.modify_event(evs[0], note=72, velocity=1)]]
+        self.assertEqual(self.run_scenes({0: p}, evs)[:3], r)
+        # the function is only called for events it hasn't seen yet
+        self.assertEqual(calls, [60, 70])
+        self.assertEqual(p.cache_stats()['hits'], 1)
+
+        # the least recently used event (70) is evicted
+        del calls[:]
+        ev = self.make_event(NOTEON, 0, 0, 62, 100)
+        self.run_scenes({0: p}, [ev, evs[0], evs[1]])
+        self.assertEqual(calls, [62, 70])
+
+        # events with different (relevant) values are cached separately
+        del calls[:]
+        self.run_scenes({0: p}, [self.modify_event(evs[0], velocity=99),
+                                 self.modify_event(evs[0], channel=3)])
+        self.assertEqual(calls, [60, 60])
+
+        p.invalidate()
+        del calls[:]
+        self.run_scenes({0: p}, [evs[0]])
+        self.assertEqual(calls, [60])
+
+        self.assertRaises(ValueError, Process, foo, pure=True, batch=True)
+
     @data_offsets
     def test_Call(self, off):
         event = threading.Event()
@@ -132,3 +246,156 @@ class CallTestCase(MididingsTestCase):
         ev = self.make_event(NOTEON)
         self.check_patch(Call(obj), { ev: [] })
         self.assertTrue(event.wait(1.0))
+
+    def test_Call_workers(self):
+        setup._config_impl(backend='dummy', async_workers=3)
+        calls = {'a': [], 'b': []}
+        running = {'a': 0, 'b': 0}
+        concurrent = []
+        done = threading.Event()
+
+        def foo(ev, name):
+            running[name] += 1
+            concurrent.append(running[name])
+            time.sleep(0.001)
+            calls[name].append(ev.note)
+            running[name] -= 1
+            if len(calls['a']) == 20 and len(calls['b']) == 20:
+                done.set()
+
+        e = engine.Engine()
+        e.setup({0: [Call(foo, 'a'), Call(foo, 'b')]}, None, None, None)
+        for n in range(20):
+            e.process_event(self.make_event(NOTEON, 0, 0, n, 100))
+
+        self.assertTrue(done.wait(5.0))
+        # each function sees its events in order, and is never called
+        # concurrently
+        self.assertEqual(calls['a'], list(range(20)))
+        self.assertEqual(calls['b'], list(range(20)))
+        self.assertEqual(max(concurrent), 1)
+
+    def run_overflow(self, overflow, events, release_after=None):
+        setup._config_impl(backend='dummy', async_queue_size=4)
+        calls = []
+        started = threading.Event()
+        gate = threading.Event()
+
+        def foo(ev):
+            started.set()
+            gate.wait(5.0)
+            calls.append(ev.data2)
+
+        e = engine.Engine()
+        e.setup({0: Call(foo, overflow=overflow)}, None, None, None)
+
+        # wait until the first call is running, then queue the rest
+        e.process_event(events[0])
+        self.assertTrue(started.wait(1.0))
+        if release_after is not None:
+            threading.Timer(release_after, gate.set).start()
+        for ev in events[1:]:
+            e.process_event(ev)
+
+        # overflow policies are applied as the workers take the calls
+        gate.set()
+        for n in range(500):
+            stats = e.async_stats()
+            if not stats['queued']:
+                break
+            time.sleep(0.01)
+
+        # the engine waits for all pending calls when it's destroyed
+        del e
+        return calls, stats
+
+    def test_Call_overflow(self):
+        notes = [self.make_event(NOTEON, 0, 0, 60, n) for n in range(11)]
+        ctrls = [self.make_event(CTRL, 0, 0, 7, n) for n in range(11)]
+
+        calls, stats = self.run_overflow('drop-newest', notes)
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+        self.assertEqual((stats['max_queued'], stats['dropped']), (4, 6))
+
+        calls, stats = self.run_overflow('drop-oldest', notes)
+        self.assertEqual(calls, [0, 7, 8, 9, 10])
+        self.assertEqual((stats['max_queued'], stats['dropped']), (4, 6))
+
+        # controller changes replace each other, notes don't
+        calls, stats = self.run_overflow('coalesce', ctrls)
+        self.assertEqual(calls, [0, 10])
+        self.assertEqual((stats['coalesced'], stats['dropped']), (9, 0))
+        calls, stats = self.run_overflow('coalesce', notes)
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+
+        calls, stats = self.run_overflow('block', notes, release_after=0.1)
+        self.assertEqual(calls, list(range(11)))
+        self.assertEqual(stats['dropped'], 0)
+        self.assertTrue(stats['blocked'] > 0)
+
+        self.assertRaises(ValueError, Call, lambda ev: None, overflow='foo')
+
+    @unittest.skipIf(sys.version_info < (3, 5), "requires Python 3.5")
+    def test_Call_coroutine(self):
+        setup._config_impl(backend='dummy')
+        calls = []
+        done = threading.Event()
+        release = threading.Event()
+
+        # defined as a string, so the module still compiles on Python 2
+        code = (
+            "async def foo(ev):\n"
+            "    calls.append(('start', ev.note))\n"
+            "    while not release.is_set():\n"
+            "        await asyncio.sleep(0.001)\n"
+            "    calls.append(('end', ev.note))\n"
+            "    if len(calls) == 6:\n"
+            "        done.set()\n"
+        )
+        import asyncio
+        ns = {'asyncio': asyncio, 'calls': calls, 'done': done,
+              'release': release}
+        exec(code, ns)
+
+        e = engine.Engine()
+        e.setup({0: Call(ns['foo'])}, None, None, None)
+        for n in range(3):
+            e.process_event(self.make_event(NOTEON, 0, 0, 60 + n, 100))
+
+        # all calls are waiting concurrently, on the same event loop
+        while len(calls) < 3:
+            time.sleep(0.001)
+        release.set()
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(sorted(calls[:3]),
+                         [('start', 60), ('start', 61), ('start', 62)])
+        self.assertEqual(sorted(calls[3:]),
+                         [('end', 60), ('end', 61), ('end', 62)])
+
+        e._stop_event_loop()
+
+    @unittest.skipIf(sys.version_info < (3, 5), "requires Python 3.5")
+    def test_hook_coroutine(self):
+        setup._config_impl(backend='dummy', silent=True)
+        switched = []
+        done = threading.Event()
+
+        code = (
+            "class Hook(object):\n"
+            "    async def on_switch_scene(self, scene, subscene):\n"
+            "        switched.append(scene)\n"
+            "        done.set()\n"
+        )
+        ns = {'switched': switched, 'done': done}
+        exec(code, ns)
+        setup.hook(ns['Hook']())
+
+        e = engine.Engine()
+        e.setup({0: Pass(), 1: Pass()}, None, None, None)
+        e.switch_scene(1)
+        e.process_event(self.make_event())
+
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(switched, [1])
+
+        e._stop_event_loop()
@@ -291,3 +291,56 @@ class FiltersTestCase(MididingsTestCase):
             SysExEvent(off(0), [0xf0, 4, 8, 15, 16, 23, 42, 0xf7]):
                 (False, True),
         })
+
+    @data_offsets
+    def test_Filter_expression(self, off):
+        self.check_filter(Filter('note % 12 in (0, 4, 7)'), {
+            self.make_event(NOTEON, note=60): (True, False),
+            self.make_event(NOTEON, note=64): (True, False),
+            self.make_event(NOTEOFF, note=67): (True, False),
+            self.make_event(NOTEON, note=61): (False, True),
+            self.make_event(CTRL, ctrl=60): (True, True),
+        })
+
+        self.check_filter(Filter('ctrl == 7 and not 32 <= value < 96'), {
+            self.make_event(CTRL, ctrl=7, value=31): (True, False),
+            self.make_event(CTRL, ctrl=7, value=32): (False, True),
+            self.make_event(CTRL, ctrl=7, value=96): (True, False),
+            self.make_event(CTRL, ctrl=8, value=0): (False, True),
+            self.make_event(NOTEON): (True, True),
+        })
+
+        self.check_filter(Filter('channel == %d' % off(1)), {
+            self.make_event(channel=off(1)): (True, False),
+            self.make_event(channel=off(2)): (False, True),
+        })
+
+        self.check_filter(Filter('program // 2 == 3 if port == %d '
+                                 'else program == %d' % (off(1), off(0))), {
+            self.make_event(PROGRAM, port=off(0), program=off(0)):
+                (True, False),
+            self.make_event(PROGRAM, port=off(0), program=off(6)):
+                (False, True),
+            self.make_event(PROGRAM, port=off(1), program=6): (True, False),
+            self.make_event(PROGRAM, port=off(1), program=8): (False, True),
+        })
+
+        p = Filter('abs(velocity - 64) > min(note, 20)')
+        self.assertEqual(repr(eval(repr(p))), repr(p))
+
+        with self.assertRaises(ValueError):
+            Filter('note > foo')
+        with self.assertRaises(ValueError):
+            Filter('note > ')
+        with self.assertRaises(ValueError):
+            Filter('note in [x for x in (1, 2)]')
+        with self.assertRaises(ValueError):
+            Filter('__import__("os")')
+        with self.assertRaises(ValueError):
+            Filter('note and ctrl')
+        with self.assertRaises(ValueError):
+            Filter('note = 60')
+        with self.assertRaises(ValueError):
+            Filter(' + '.join(['(note'] * 40) + ')' * 40)
+        with self.assertRaises(TypeError):
+            Filter('note > 60', NOTE)
@@ -107,3 +107,18 @@ class GeneratorsTestCase(MididingsTestCase):
         self.check_patch(p, {
             ev: [SysExEvent(off(2), [0xf0, 4, 8, 15, 16, 23, 42, 0xf7])],
         })
+
+    def test_SysEx_pool(self):
+        import _mididings
+
+        sysex = [0xf0, 4, 8, 15, 16, 23, 42, 0xf7]
+        allocated, fallback = _mididings.sysex_pool_stats()
+
+        # each generated event's data is taken from the sysex pool
+        r = self._run_scenes_impl({setup.get_config('data_offset'):
+                                        SysEx(sysex)},
+                                  [self.make_event(NOTEON)] * 3)
+        self.assertEqual([ev.sysex for evs in r for ev in evs],
+                         [bytearray(sysex)] * 3)
+        self.assertEqual(_mididings.sysex_pool_stats(),
+                         (allocated + 3, fallback))
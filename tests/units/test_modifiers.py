@@ -313,3 +313,115 @@ class ModifiersTestCase(MididingsTestCase):
             ev2: [self.modify_event(ev2, value=0)],
             ev3: [self.modify_event(ev3, value=1365)],
         })
+
+    @data_offsets
+    def test_Transform(self, off):
+        ev1 = self.make_event(NOTEON, note=60, velocity=100)
+        ev2 = self.make_event(NOTEON, note=80, velocity=10)
+        ev3 = self.make_event(CTRL, ctrl=7, value=100)
+
+        p = Transform('velocity = clamp(velocity * 0.8 + note / 8, 1, 127)')
+        self.check_patch(p, {
+            ev1: [self.modify_event(ev1, velocity=87)],
+            ev2: [self.modify_event(ev2, velocity=18)],
+            ev3: [ev3],
+        })
+
+        self.check_patch(Transform('note += 12; velocity = note'), {
+            ev1: [self.modify_event(ev1, note=72, velocity=72)],
+            ev3: [ev3],
+        })
+
+        self.check_patch(Transform('channel = %d\nvalue = 127 - value'
+                                   % off(3)), {
+            ev1: [ev1],
+            ev3: [self.modify_event(ev3, channel=off(3), value=27)],
+        })
+
+        self.check_patch(Transform('data2 = data1 % -7 + 10 if data1 > 70 '
+                                   'else -data1 // 7 + 20'), {
+            ev1: [self.modify_event(ev1, velocity=11)],
+            ev2: [self.modify_event(ev2, velocity=6)],
+            ev3: [self.modify_event(ev3, value=19)],
+        })
+
+        with self.assertRaises(ValueError):
+            Transform('velocity')
+        with self.assertRaises(ValueError):
+            Transform('velocity = note = 60')
+        with self.assertRaises(ValueError):
+            Transform('velocity = unknown(note)')
+        with self.assertRaises(ValueError):
+            Transform('velocity = min(note)')
+        with self.assertRaises(ValueError):
+            Transform('type = 1')
+        with self.assertRaises(TypeError):
+            Transform(42)
+
+    @data_offsets
+    def test_NoteMap(self, off):
+        ev1 = self.make_event(NOTEON, note=60)
+        ev2 = self.make_event(NOTEOFF, note=61)
+        ev3 = self.make_event(POLY_AFTERTOUCH, note=60)
+        ev4 = self.make_event(CTRL, ctrl=60)
+
+        self.check_patch(NoteMap({60: 67, 61: None}), {
+            ev1: [self.modify_event(ev1, note=67)],
+            ev2: [],
+            ev3: [self.modify_event(ev3, note=67)],
+            ev4: [ev4],
+        })
+
+        self.check_patch(NoteMap([n - 12 if n % 2 else n + 12
+                                  for n in range(128)]), {
+            ev1: [self.modify_event(ev1, note=72)],
+            ev2: [self.modify_event(ev2, note=49)],
+        })
+
+        self.check_patch(NoteMap([0] * 61), {
+            ev1: [self.modify_event(ev1, note=0)],
+            ev2: [ev2],
+        })
+
+        with self.assertRaises(ValueError):
+            NoteMap(list(range(129)))
+        with self.assertRaises(TypeError):
+            NoteMap({60: 'blah'})
+
+    @data_offsets
+    def test_ValueMap(self, off):
+        ev1 = self.make_event(NOTEON, velocity=42)
+        ev2 = self.make_event(NOTEOFF, velocity=42)
+        ev3 = self.make_event(CTRL, value=42)
+        ev4 = self.make_event(AFTERTOUCH, value=0)
+        ev5 = self.make_event(PITCHBEND, value=-8192)
+        ev6 = self.make_event(PITCHBEND, value=8191)
+
+        self.check_patch(ValueMap('velocity', [127 - v for v in range(128)]), {
+            ev1: [self.modify_event(ev1, velocity=85)],
+            ev2: [ev2],
+            ev3: [ev3],
+        })
+
+        self.check_patch(ValueMap('value', {42: 23, 0: 12.6}), {
+            ev1: [ev1],
+            ev3: [self.modify_event(ev3, value=23)],
+            ev4: [self.modify_event(ev4, value=13)],
+            ev5: [ev5],
+        })
+
+        self.check_patch(ValueMap('pitchbend', {-8192: -4096, 8191: 4095}), {
+            ev3: [ev3],
+            ev5: [self.modify_event(ev5, value=-4096)],
+            ev6: [self.modify_event(ev6, value=4095)],
+        })
+
+        # the lookup table gives the same results as the gamma function
+        evs = [self.make_event(NOTEON, velocity=v) for v in range(1, 128, 6)]
+        gamma = lambda v: max(1, int(round(127 * (v / 127.0) ** (1 / 2.0))))
+        self.check_patch(Velocity(gamma=2.0), dict(
+            (ev, [self.modify_event(ev, velocity=gamma(ev.velocity))])
+            for ev in evs))
+
+        with self.assertRaises(ValueError):
+            ValueMap('note', [])
@@ -83,3 +83,93 @@ class SplitsTestCase(MididingsTestCase):
             ev2: True,
             ev3: True,
         })
+
+    @data_offsets
+    def test_KeySplit_overlapping(self, off):
+        ev1 = self.make_event(NOTEON, note=60)
+        ev2 = self.make_event(NOTEON, note=30)
+        ev3 = self.make_event(CTRL)
+
+        p = KeySplit({
+            (0, 64): Channel(off(1)),
+            (48, 72): Channel(off(2)),
+            None: Channel(off(3)),
+        })
+        self.check_patch(p, {
+            ev1: [self.modify_event(ev1, channel=off(1)),
+                  self.modify_event(ev1, channel=off(2))],
+            ev2: [self.modify_event(ev2, channel=off(1))],
+            ev3: [self.modify_event(ev3, channel=off(1)),
+                  self.modify_event(ev3, channel=off(2)),
+                  self.modify_event(ev3, channel=off(3))],
+        })
+
+    def test_CtrlSplit(self):
+        ev1 = self.make_event(CTRL, ctrl=7)
+        ev2 = self.make_event(CTRL, ctrl=10)
+        ev3 = self.make_event(NOTEON)
+
+        p = CtrlSplit({
+            7: Pass(),
+            (1, 2): Discard(),
+        })
+        self.check_patch(p, {
+            ev1: True,
+            ev2: False,
+            ev3: False,
+        })
+
+        p = CtrlSplit({
+            7: Discard(),
+            None: Pass(),
+        })
+        self.check_patch(p, {
+            ev1: False,
+            ev2: True,
+            ev3: False,
+        })
+
+    @data_offsets
+    def test_ProgramSplit(self, off):
+        ev1 = self.make_event(PROGRAM, channel=off(0), program=off(3))
+        ev2 = self.make_event(PROGRAM, program=off(4))
+        ev3 = self.make_event(NOTEON)
+
+        p = ProgramSplit({
+            off(3): Channel(off(5)),
+            (off(3), off(4)): Pass(),
+            None: Discard(),
+        })
+        self.check_patch(p, {
+            ev1: [self.modify_event(ev1, channel=off(5)), ev1],
+            ev2: [ev2],
+            ev3: [],
+        })
+
+    def test_Split(self):
+        ev1 = self.make_event(NOTEON)
+        ev2 = self.make_event(CTRL)
+        ev3 = self.make_event(PITCHBEND)
+
+        p = Split({
+            NOTE: Transpose(12),
+            (NOTEON, CTRL): Pass(),
+            None: Discard(),
+        })
+        self.check_patch(p, {
+            ev1: [self.modify_event(ev1, note=ev1.note + 12), ev1],
+            ev2: [ev2],
+            ev3: [],
+        })
+
+    def test_split_else_only(self):
+        ev1 = self.make_event(NOTEON)
+        ev2 = self.make_event(SYSRT_CLOCK)
+
+        p = ChannelSplit({
+            None: Pass(),
+        })
+        self.check_patch(p, {
+            ev1: True,
+            ev2: True,
+        })